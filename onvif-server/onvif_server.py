@@ -3,10 +3,34 @@
 Simple ONVIF Server for RTSP Cameras
 Provides ONVIF device discovery and media service for RTSP streams
 
-Version: 1.9.0
+Version: 1.14.1
 Target: Raspberry Pi OS Trixie (64-bit)
 
 Changelog:
+  1.14.1 - SOAP response cache refreshes a stale address table before building its key
+          (a cache hit no longer serves old IPs until RESPONSE_CACHE_TTL expires)
+  1.14.0 - GET /health: stream health (fps, bitrate, first-frame latency) from the
+          web manager's shared RTSP probe file, re-read only when it changes
+  1.13.0 - GetSnapshotUri points at /api/video/snapshot (cached JPEG from the
+          running pipeline, ETag support) instead of the missing /api/camera/snapshot
+  1.12.0 - Streaming SOAP request parsing
+        - do_POST feeds the body to an XMLPullParser in chunks and stops at the end
+          of soap:Body (WS-Security UsernameToken collected on the way)
+        - Requests above MAX_SOAP_REQUEST_SIZE are refused (413) without being read
+        - Public actions and the action -> handler table are built once
+  1.11.0 - Fork-free local IP lookup
+        - InterfaceAddressTable: IPv4 addresses from a rtnetlink dump, refreshed
+          on RTM_NEWADDR/RTM_DELADDR/link events (SIOCGIFADDR + TTL fallback)
+        - get_local_ip, interface priority and WS-Discovery ProbeMatches no longer
+          run `ip -4 addr`; NETWORK_INTERFACE_PRIORITY is read with config.env
+        - Address table generation is part of the SOAP response cache key
+  1.10.0 - Concurrent server with cached SOAP responses
+        - ThreadingHTTPServer: one thread per connection (NVR polls no longer queue)
+        - config.env is re-read only when its (inode, mtime, size) changes
+          instead of on every GetProfiles/GetVideoSources/... request
+        - Read-only responses (GetProfiles, GetStreamUri, GetCapabilities, ...)
+          are served pre-rendered from a cache keyed by (action, client subnet,
+          config version), with a TTL bounding local IP changes
   1.9.0 - Dynamic Quality level support (1-5 like Synology)
         - Read STREAM_QUALITY from config.env
         - Report quality level in GetProfiles, GetVideoEncoderConfiguration
@@ -63,8 +87,10 @@ Changelog:
 import os
 import sys
 import json
+import errno
 import socket
 import struct
+import time
 import threading
 import argparse
 import hashlib
@@ -76,7 +102,7 @@ import urllib.request
 import urllib.error
 from datetime import datetime, timezone
 from urllib.parse import quote
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from xml.etree import ElementTree as ET
 
 # ONVIF Namespaces
@@ -97,6 +123,99 @@ NAMESPACES = {
 for prefix, uri in NAMESPACES.items():
     ET.register_namespace(prefix, uri)
 
+# Actions whose response only depends on the configuration and the client subnet
+# (never the request content, the clock or live camera state): served from
+# SOAPResponseCache. Set*/Create*/Add* and live getters are always rendered.
+CACHEABLE_ACTIONS = frozenset({
+    'GetDeviceInformation', 'GetCapabilities', 'GetServices', 'GetScopes',
+    'GetHostname', 'GetNetworkInterfaces', 'GetNTP', 'GetServiceCapabilities',
+    'GetProfiles', 'GetProfile', 'GetStreamUri', 'GetSnapshotUri',
+    'GetVideoSources', 'GetVideoSourceConfigurations', 'GetVideoSourceConfigurationOptions',
+    'GetVideoEncoderConfigurations', 'GetVideoEncoderConfiguration',
+    'GetVideoEncoderConfigurationOptions', 'GetGuaranteedNumberOfVideoEncoderInstances',
+    'GetAudioSources', 'GetAudioSourceConfigurations', 'GetAudioEncoderConfigurations',
+    'GetAudioEncoderConfigurationOptions', 'GetCompatibleAudioSourceConfigurations',
+    'GetCompatibleVideoSourceConfigurations', 'GetCompatibleVideoEncoderConfigurations',
+    'GetCompatibleAudioEncoderConfigurations', 'GetRelayOutputOptions', 'GetImagingOptions',
+})
+RESPONSE_CACHE_TTL = 30  # seconds - evicts unused entries; config/address changes change the key right away
+RESPONSE_CACHE_MAX = 256
+
+# Last RTSP stream probe written by the web manager (GET /health)
+RTSP_PROBE_STATE_FILE = '/tmp/rpi-cam-rtsp-probe.json'
+STREAM_HEALTH_MAX_AGE = 120  # older probes are reported as unknown
+
+# SOAP request parsing (do_POST)
+MAX_SOAP_REQUEST_SIZE = 64 * 1024  # ONVIF requests are a few KB at most
+SOAP_READ_CHUNK = 4096
+SOAP_BODY_TAGS = frozenset({
+    '{http://www.w3.org/2003/05/soap-envelope}Body',
+    '{http://schemas.xmlsoap.org/soap/envelope/}Body',
+})
+WSSE_NS = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd'
+WSU_NS = 'http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd'
+USERNAME_TOKEN_TAG = f'{{{WSSE_NS}}}UsernameToken'
+
+# ONVIF standard: Some actions must be accessible without authentication
+# for device discovery and initial connection
+# Synology sends each request twice: with auth and without auth
+# We allow all "Get" read operations without auth for compatibility
+PUBLIC_ACTIONS = frozenset({
+    # Device Service - Discovery & Info
+    'GetSystemDateAndTime',  # Required for time sync before auth
+    'GetCapabilities',       # Required for capability discovery
+    'GetServices',           # Required for service discovery
+    'GetServiceCapabilities', # Required for service discovery
+    'GetScopes',             # Required for WS-Discovery
+    'GetDeviceInformation',  # Often needed for initial setup
+    'GetHostname',           # Basic device info
+    'GetNetworkInterfaces',  # Basic network info
+    'GetNTP',                # Time config
+    'GetRelayOutputs',       # Relay info
+    'GetRelayOutputOptions',
+
+    # Media Service - Read operations (needed by Synology)
+    'GetProfiles',           # Profile list
+    'GetProfile',            # Single profile
+    'GetVideoSources',       # Video source info
+    'GetVideoSourceConfigurations',      # Video source configs
+    'GetVideoEncoderConfigurations',     # Encoder configs
+    'GetVideoEncoderConfiguration',      # Single encoder config
+    'GetVideoEncoderConfigurationOptions', # Encoder options
+    'GetVideoSourceConfigurationOptions', # Source options
+    'GetAudioSources',                   # Audio source info
+    'GetAudioSourceConfigurations',      # Audio source configs
+    'GetAudioEncoderConfigurations',     # Audio encoder configs
+    'GetAudioEncoderConfigurationOptions', # Audio encoder options
+    'GetStreamUri',          # RTSP URL (contains auth in URL if needed)
+    'GetSnapshotUri',        # Snapshot URL
+    'GetGuaranteedNumberOfVideoEncoderInstances',
+    'GetCompatibleAudioSourceConfigurations',
+    'GetCompatibleVideoSourceConfigurations',
+    'GetCompatibleVideoEncoderConfigurations',
+    'GetCompatibleAudioEncoderConfigurations',
+
+    # Write actions - allowed without auth for Synology compatibility
+    # Some actions apply to config.env (encoder/source) for real changes
+    'CreateProfile',         # Returns existing profile (read-only camera)
+    'DeleteProfile',         # Accepted but ignored (we keep MainProfile)
+    'SetNTP',                # Accepted but ignored (NTP managed by OS)
+    'AddVideoSourceConfiguration',   # Returns existing config
+    'AddVideoEncoderConfiguration',  # Returns existing config
+    'AddAudioSourceConfiguration',   # Returns existing config
+    'AddAudioEncoderConfiguration',  # Returns existing config
+    'SetVideoEncoderConfiguration',  # Accepted but ignored (read-only camera)
+    'SetVideoSourceConfiguration',   # Accepted but ignored (read-only camera)
+    'SetAudioEncoderConfiguration',  # Accepted but ignored (read-only camera)
+    'SetAudioSourceConfiguration',   # Accepted but ignored (read-only camera)
+    # Imaging service
+    'GetImagingSettings',
+    'SetImagingSettings',
+    'GetImagingOptions',
+    # Relay write
+    'SetRelayOutputState',
+})
+
 def _get_localname(tag):
     if not tag:
         return ''
@@ -185,6 +304,50 @@ def _update_config_env(path, updates):
     os.replace(temp_path, path)
     return True
 
+def _file_signature(path):
+    """(inode, mtime_ns, size) of path, None if missing."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+_stream_health_cache = {'signature': None, 'result': None}
+
+def read_stream_health():
+    """
+    Last RTSP stream probe of the web manager (re-read only when the file changes).
+
+    Returns:
+        dict: {status: healthy|unhealthy|unknown, age, stream}
+    """
+    signature = _file_signature(RTSP_PROBE_STATE_FILE)
+    if signature != _stream_health_cache['signature']:
+        result = None
+        if signature is not None:
+            try:
+                with open(RTSP_PROBE_STATE_FILE, 'r') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = None
+        _stream_health_cache.update(signature=signature, result=result)
+
+    result = _stream_health_cache['result']
+    if not isinstance(result, dict):
+        return {'status': 'unknown', 'age': None, 'stream': None}
+    age = max(0.0, time.time() - result.get('checked_ts', 0))
+    if age > STREAM_HEALTH_MAX_AGE:
+        status = 'unknown'
+    else:
+        status = 'healthy' if result.get('healthy') else 'unhealthy'
+    return {'status': status, 'age': round(age, 1), 'stream': result}
+
+def _client_subnet(client_ip):
+    """Cache key part for a client: its /24 (the granularity get_local_ip matches on)."""
+    if client_ip and client_ip.count('.') == 3:
+        return client_ip.rsplit('.', 1)[0]
+    return client_ip or ''
+
 def _run_cmd(cmd, timeout=5):
     try:
         result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
@@ -248,6 +411,204 @@ def _csi_set_controls(controls):
         return False
 
 
+# rtnetlink (linux/netlink.h, linux/rtnetlink.h, linux/if_addr.h)
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+RT_SCOPE_UNIVERSE = 0
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891b
+
+DEFAULT_INTERFACE_PRIORITY = ['eth0', 'wlan1', 'wlan0', 'enp0s3', 'end0']
+ADDRESS_TABLE_TTL = 10  # seconds - only used when rtnetlink events are unavailable
+
+
+def _netlink_dump_ipv4():
+    """Global IPv4 addresses from a RTM_GETADDR dump.
+    
+    Returns:
+        List of (ifname, ip, prefixlen), kernel order (primary address first)
+    """
+    entries = []
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.settimeout(2)
+        sock.bind((0, 0))
+        ifaddrmsg = struct.pack('=BBBBI', socket.AF_INET, 0, 0, 0, 0)
+        sock.send(struct.pack('=IHHII', 16 + len(ifaddrmsg), RTM_GETADDR,
+                              NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + ifaddrmsg)
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                msg_len, msg_type, _, _, _ = struct.unpack_from('=IHHII', data, offset)
+                if msg_len < 16:
+                    return entries
+                if msg_type == NLMSG_DONE:
+                    return entries
+                if msg_type == NLMSG_ERROR:
+                    raise OSError('RTM_GETADDR dump failed')
+                if msg_type == RTM_NEWADDR:
+                    family, prefixlen, _, scope, index = struct.unpack_from('=BBBBI', data, offset + 16)
+                    attrs = {}
+                    pos = offset + 24
+                    end = offset + msg_len
+                    while pos + 4 <= end:
+                        attr_len, attr_type = struct.unpack_from('=HH', data, pos)
+                        if attr_len < 4:
+                            break
+                        attrs[attr_type] = data[pos + 4:pos + attr_len]
+                        pos += (attr_len + 3) & ~3
+                    address = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+                    if family == socket.AF_INET and scope == RT_SCOPE_UNIVERSE and address:
+                        try:
+                            ifname = socket.if_indextoname(index)
+                        except OSError:
+                            ifname = attrs.get(IFA_LABEL, b'').rstrip(b'\0').decode(errors='replace')
+                        entries.append((ifname, socket.inet_ntoa(address), prefixlen))
+                offset += (msg_len + 3) & ~3
+    finally:
+        sock.close()
+
+
+def _ioctl_dump_ipv4():
+    """Primary IPv4 address of each interface via SIOCGIFADDR (non-netlink fallback)."""
+    import fcntl
+    entries = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for _, ifname in socket.if_nameindex():
+            ifreq = struct.pack('256s', ifname[:15].encode())
+            try:
+                address = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, ifreq)[20:24]
+                netmask = fcntl.ioctl(sock.fileno(), SIOCGIFNETMASK, ifreq)[20:24]
+            except OSError:
+                continue  # No IPv4 address
+            prefixlen = bin(struct.unpack('!I', netmask)[0]).count('1')
+            entries.append((ifname, socket.inet_ntoa(address), prefixlen))
+    finally:
+        sock.close()
+    return entries
+
+
+class InterfaceAddressTable:
+    """In-process table of the global IPv4 addresses of this host.
+    
+    Filled from a rtnetlink dump (SIOCGIFADDR ioctls as fallback) and marked
+    stale by RTM_NEWADDR/RTM_DELADDR/link events once start() is called;
+    without the listener it is refreshed after ADDRESS_TABLE_TTL seconds.
+    Replaces the `ip -4 addr` forks of get_local_ip and WS-Discovery.
+    """
+    
+    def __init__(self, ttl=ADDRESS_TABLE_TTL):
+        self.ttl = ttl
+        self.generation = 0  # Bumped when the address set changes
+        self._entries = []   # (ifname, ip, network, netmask, prefix24)
+        self._loaded_at = None
+        self._stale = True
+        self._listening = False
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """Subscribe to rtnetlink address/link events (no-op if unavailable)."""
+        if self._listening:
+            return True
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+        except (AttributeError, OSError) as e:
+            print(f"[ONVIF] rtnetlink events unavailable, refreshing addresses every {self.ttl}s: {e}")
+            return False
+        self._listening = True
+        threading.Thread(target=self._watch, args=(sock,), daemon=True).start()
+        return True
+    
+    def _watch(self, sock):
+        """Mark the table stale on every address/link event (re-dumped lazily)."""
+        while self._listening:
+            try:
+                sock.recv(65536)
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:  # Overflow: events lost, table already marked stale
+                    print(f"[ONVIF] rtnetlink listener stopped: {e}")
+                    self._listening = False
+            self._stale = True
+        sock.close()
+    
+    def _refresh(self):
+        try:
+            dump = _netlink_dump_ipv4()
+        except (AttributeError, OSError):
+            dump = _ioctl_dump_ipv4()
+        entries = []
+        for ifname, ip, prefixlen in dump:
+            # Skip loopback and link-local (as `scope global` filtering did)
+            if ip.startswith('127.') or ip.startswith('169.254.'):
+                continue
+            value = struct.unpack('!I', socket.inet_aton(ip))[0]
+            netmask = (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF if prefixlen else 0
+            entries.append((ifname, ip, value & netmask, netmask, ip.rsplit('.', 1)[0]))
+        if [e[:2] for e in entries] != [e[:2] for e in self._entries]:
+            self.generation += 1
+        self._entries = entries
+        self._loaded_at = time.monotonic()
+    
+    def entries(self):
+        """Current (ifname, ip, network, netmask, prefix24) tuples."""
+        if self._stale or (not self._listening and time.monotonic() - self._loaded_at > self.ttl):
+            with self._lock:
+                if self._stale or (not self._listening and time.monotonic() - self._loaded_at > self.ttl):
+                    # Clear first: an event arriving during the dump re-marks it
+                    self._stale = False
+                    try:
+                        self._refresh()
+                    except Exception as e:
+                        print(f"[ONVIF] Error reading interface addresses: {e}")
+                        self._loaded_at = time.monotonic()
+        return self._entries
+    
+    def ip_for_client(self, client_ip):
+        """Local IP on the same subnet as client_ip, None if none.
+        
+        Prefers an interface whose network contains the client, then one
+        sharing the client's /24 (previous matching rule).
+        """
+        try:
+            client = struct.unpack('!I', socket.inet_aton(client_ip))[0]
+        except (OSError, TypeError):
+            return None
+        client_prefix = client_ip.rsplit('.', 1)[0]
+        same_24 = None
+        for _, ip, network, netmask, prefix24 in self.entries():
+            if netmask and client & netmask == network:
+                return ip
+            if same_24 is None and prefix24 == client_prefix:
+                same_24 = ip
+        return same_24
+    
+    def ip_by_priority(self, priority_order):
+        """(ifname, ip) of the first interface of priority_order with an address,
+        else of the first interface found, else None."""
+        by_iface = {}
+        for ifname, ip, _, _, _ in self.entries():
+            by_iface.setdefault(ifname, ip)
+        for ifname in priority_order:
+            if ifname in by_iface:
+                return ifname, by_iface[ifname]
+        for ifname, ip in by_iface.items():
+            return ifname, ip
+        return None
+
+
 class ONVIFConfig:
     """ONVIF Server Configuration"""
     
@@ -281,6 +642,14 @@ class ONVIFConfig:
         self.meeting_api_url = ''
         self.meeting_device_key = ''
         self.meeting_token_code = ''
+        # Network interface priority (NETWORK_INTERFACE_PRIORITY) and address table
+        self.interface_priority = list(DEFAULT_INTERFACE_PRIORITY)
+        self.addresses = InterfaceAddressTable()
+        self._preferred_iface = None
+        # Bumped whenever config.env is reloaded (part of the response cache key)
+        self.version = 0
+        self._settings_signature = None
+        self._refresh_lock = threading.Lock()
         self.load()
     
     def load(self):
@@ -299,6 +668,7 @@ class ONVIFConfig:
             print(f"[ONVIF] Error loading config: {e}")
         
         # Load video settings and Meeting API settings from RTSP config
+        self._settings_signature = _file_signature(self.rtsp_config_file)
         self.load_video_settings()
         self.load_relay_settings()
         
@@ -316,6 +686,7 @@ class ONVIFConfig:
         legacy_height = None
         legacy_fps = None
         legacy_device = None
+        interface_priority = list(DEFAULT_INTERFACE_PRIORITY)
         
         try:
             if os.path.exists(self.rtsp_config_file):
@@ -383,7 +754,11 @@ class ONVIFConfig:
                             self.meeting_device_key = value
                         elif key == 'MEETING_TOKEN_CODE' and value:
                             self.meeting_token_code = value
+                        # Ethernet first, then WiFi by default
+                        elif key == 'NETWORK_INTERFACE_PRIORITY' and value:
+                            interface_priority = [iface.strip() for iface in value.split(',') if iface.strip()]
                 
+                self.interface_priority = interface_priority
                 # Apply legacy fallback if VIDEOIN_* not set
                 if self.video_width == 640 and legacy_width:
                     self.video_width = legacy_width
@@ -400,6 +775,24 @@ class ONVIFConfig:
         except Exception as e:
             print(f"[ONVIF] Error loading video settings: {e}")
 
+    def refresh_if_changed(self):
+        """Reload config.env settings if the file changed since the last load.
+        
+        Returns:
+            True if the settings were reloaded (and version bumped)
+        """
+        signature = _file_signature(self.rtsp_config_file)
+        if signature == self._settings_signature:
+            return False
+        with self._refresh_lock:
+            if signature == self._settings_signature:
+                return False
+            self.load_video_settings()
+            self.load_relay_settings()
+            self._settings_signature = signature
+            self.version += 1
+        return True
+
     def load_relay_settings(self):
         """Load relay configuration from main config file."""
         data = _read_config_env(self.rtsp_config_file)
@@ -480,22 +873,14 @@ class ONVIFConfig:
         2. Otherwise: Ethernet first if connected, then WiFi by priority
         
         Interface priority order: eth0 > wlan1 > wlan0 (configurable via NETWORK_INTERFACE_PRIORITY)
+        Addresses come from the in-process InterfaceAddressTable (no fork).
         """
         try:
-            import subprocess
-            
             # If client IP provided, try to find IP on same subnet first
             if client_ip and client_ip not in ('127.0.0.1', 'localhost'):
-                result = subprocess.run(['ip', '-4', 'addr'], capture_output=True, text=True)
-                if result.returncode == 0:
-                    client_prefix = '.'.join(client_ip.split('.')[:3])
-                    for line in result.stdout.split('\n'):
-                        if 'inet ' in line and 'scope global' in line:
-                            parts = line.strip().split()
-                            if len(parts) >= 2:
-                                ip = parts[1].split('/')[0]
-                                if ip.startswith(client_prefix + '.'):
-                                    return ip
+                ip = self.addresses.ip_for_client(client_ip)
+                if ip:
+                    return ip
             
             # Get preferred IP based on interface priority (Ethernet first, then WiFi)
             preferred_ip = self._get_preferred_ip_by_priority()
@@ -518,69 +903,164 @@ class ONVIFConfig:
         Returns the IP of the highest priority interface that is UP and has an IP.
         Priority: eth0 (Ethernet) > wlan1 (USB WiFi) > wlan0 (built-in WiFi)
         """
-        import subprocess
-        
-        # Default priority order - Ethernet first, then WiFi interfaces
-        # This can be overridden by NETWORK_INTERFACE_PRIORITY in config
-        priority_order = ['eth0', 'wlan1', 'wlan0', 'enp0s3', 'end0']
-        
-        # Try to read custom priority from config file
-        try:
-            if os.path.exists(self.rtsp_config_file):
-                with open(self.rtsp_config_file, 'r') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line.startswith('NETWORK_INTERFACE_PRIORITY='):
-                            value = line.split('=', 1)[1].strip().strip('"').strip("'")
-                            if value:
-                                priority_order = [iface.strip() for iface in value.split(',')]
-                            break
-        except Exception as e:
-            print(f"[ONVIF] Error reading interface priority: {e}")
-        
-        # Get all interface IPs
-        interface_ips = {}
-        try:
-            result = subprocess.run(['ip', '-4', 'addr'], capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                current_iface = None
-                for line in result.stdout.split('\n'):
-                    # Match interface line: "2: eth0: <BROADCAST,MULTICAST,UP,..."
-                    if ': ' in line and not line.startswith(' '):
-                        parts = line.split(': ')
-                        if len(parts) >= 2:
-                            current_iface = parts[1].split('@')[0]  # Handle eth0@if2 format
-                    # Match IP line: "    inet 192.168.1.191/24 ..."
-                    elif 'inet ' in line and 'scope global' in line and current_iface:
-                        parts = line.strip().split()
-                        if len(parts) >= 2:
-                            ip = parts[1].split('/')[0]
-                            # Skip loopback and link-local
-                            if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                                interface_ips[current_iface] = ip
-        except Exception as e:
-            print(f"[ONVIF] Error getting interface IPs: {e}")
+        selected = self.addresses.ip_by_priority(self.interface_priority)
+        if not selected:
             return None
-        
-        # Return IP of highest priority interface that has one
-        for iface in priority_order:
-            if iface in interface_ips:
-                print(f"[ONVIF] Using {iface} IP: {interface_ips[iface]}")
-                return interface_ips[iface]
-        
-        # If no priority interface found, return any available
-        if interface_ips:
-            first_iface = list(interface_ips.keys())[0]
-            print(f"[ONVIF] Fallback to {first_iface} IP: {interface_ips[first_iface]}")
-            return interface_ips[first_iface]
-        
-        return None
+        # Log only when the selection changes (this runs on every request)
+        if selected != self._preferred_iface:
+            self._preferred_iface = selected
+            if selected[0] in self.interface_priority:
+                print(f"[ONVIF] Using {selected[0]} IP: {selected[1]}")
+            else:
+                print(f"[ONVIF] Fallback to {selected[0]} IP: {selected[1]}")
+        return selected[1]
+
+
+class SOAPRequestError(Exception):
+    """Malformed SOAP request (reported to the client as a SOAP fault)."""
+
+
+def _parse_soap_request(read, length):
+    """Stream-parse a SOAP request until the end of its soap:Body.
+    
+    The body is fed to an XMLPullParser SOAP_READ_CHUNK bytes at a time
+    (only 'end' events: cheapest for expat) and parsing stops at </Body>,
+    whose first child is the action. The WS-Security UsernameToken (in the
+    header, before the body) is collected on the way.
+    
+    Args:
+        read: callable(n) returning up to n bytes (rfile.read)
+        length: request Content-Length
+    
+    Returns:
+        (request_element, username_token or None, unread byte count)
+    
+    Raises:
+        SOAPRequestError: no soap:Body or empty soap:Body
+        ET.ParseError: invalid XML
+    """
+    parser = ET.XMLPullParser(events=('end',))
+    username_token = None
+    remaining = length
+    while remaining > 0:
+        chunk = read(min(SOAP_READ_CHUNK, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            tag = element.tag
+            if tag in SOAP_BODY_TAGS:
+                if len(element) == 0:
+                    raise SOAPRequestError("Empty SOAP body")
+                return element[0], username_token, remaining
+            if tag == USERNAME_TOKEN_TAG:
+                username_token = element
+    parser.close()  # ParseError on truncated XML
+    raise SOAPRequestError("Missing SOAP body")
+
+
+class SOAPResponseCache:
+    """Encoded SOAP responses keyed by (request tag, client subnet, config version,
+    address table generation)."""
+    
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Cached body for key, or None if missing/expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+    
+    def put(self, key, body):
+        """Store an encoded response (the whole cache is dropped when full)."""
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (time.monotonic(), body)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None
+            }
 
 
 class ONVIFHandler(BaseHTTPRequestHandler):
     """HTTP Handler for ONVIF requests"""
     
     config = None
+    response_cache = None  # SOAPResponseCache, set by main()
+    
+    # Action -> handler method name (built once, dispatched with getattr)
+    ACTION_HANDLERS = {
+        # Device Service
+        'GetSystemDateAndTime': 'get_system_date_time',
+        'GetDeviceInformation': 'get_device_information',
+        'GetCapabilities': 'get_capabilities',
+        'GetServices': 'get_services',
+        'GetScopes': 'get_scopes',
+        'GetHostname': 'get_hostname',
+        'GetNetworkInterfaces': 'get_network_interfaces',
+        
+        # Media Service
+        'GetProfiles': 'get_profiles',
+        'GetProfile': 'get_profile',
+        'GetStreamUri': 'get_stream_uri',
+        'GetVideoSources': 'get_video_sources',
+        'GetVideoSourceConfigurations': 'get_video_source_configurations',
+        'GetVideoEncoderConfigurations': 'get_video_encoder_configurations',
+        'GetVideoEncoderConfiguration': 'get_video_encoder_configuration',
+        'SetVideoEncoderConfiguration': 'set_video_encoder_configuration',
+        'SetVideoSourceConfiguration': 'set_video_source_configuration',
+        'GetVideoEncoderConfigurationOptions': 'get_video_encoder_configuration_options',
+        'GetGuaranteedNumberOfVideoEncoderInstances': 'get_guaranteed_encoder_instances',
+        'GetSnapshotUri': 'get_snapshot_uri',
+        'GetAudioSources': 'get_audio_sources',
+        'GetAudioSourceConfigurations': 'get_audio_source_configurations',
+        'GetAudioEncoderConfigurations': 'get_audio_encoder_configurations',
+        'GetAudioEncoderConfigurationOptions': 'get_audio_encoder_configuration_options',
+        'GetVideoSourceConfigurationOptions': 'get_video_source_configuration_options',
+        'GetServiceCapabilities': 'get_service_capabilities',
+        'GetRelayOutputs': 'get_relay_outputs',
+        'GetRelayOutputOptions': 'get_relay_output_options',
+        'SetRelayOutputState': 'set_relay_output_state',
+        'GetNTP': 'get_ntp',
+        'SetNTP': 'set_ntp',
+        'CreateProfile': 'create_profile',
+        'DeleteProfile': 'delete_profile',
+        'AddVideoSourceConfiguration': 'add_video_source_configuration',
+        'AddVideoEncoderConfiguration': 'add_video_encoder_configuration',
+        'AddAudioSourceConfiguration': 'add_audio_source_configuration',
+        'AddAudioEncoderConfiguration': 'add_audio_encoder_configuration',
+        'GetCompatibleAudioSourceConfigurations': 'get_compatible_audio_source_configurations',
+        'GetCompatibleVideoSourceConfigurations': 'get_compatible_video_source_configurations',
+        'GetCompatibleVideoEncoderConfigurations': 'get_compatible_video_encoder_configurations',
+        'GetCompatibleAudioEncoderConfigurations': 'get_compatible_audio_encoder_configurations',
+        # Imaging Service
+        'GetImagingSettings': 'get_imaging_settings',
+        'SetImagingSettings': 'set_imaging_settings',
+        'GetImagingOptions': 'get_imaging_options',
+    }
     
     def log_message(self, format, *args):
         """Custom log format."""
@@ -591,8 +1071,16 @@ class ONVIFHandler(BaseHTTPRequestHandler):
         print(f"[ONVIF] {client_ip} -> {action}")
     
     def do_GET(self):
-        """Handle GET requests (for WSDL)."""
-        if self.path.endswith('.wsdl') or self.path.endswith('.xsd'):
+        """Handle GET requests (WSDL, /health)."""
+        if self.path.split('?', 1)[0] == '/health':
+            health = read_stream_health()
+            body = json.dumps(health).encode('utf-8')
+            self.send_response(503 if health['status'] == 'unhealthy' else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path.endswith('.wsdl') or self.path.endswith('.xsd'):
             self.send_response(200)
             self.send_header('Content-Type', 'application/xml')
             self.end_headers()
@@ -604,27 +1092,24 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def do_POST(self):
         """Handle POST requests (ONVIF SOAP)."""
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            content_length = -1
+        if content_length < 0 or content_length > MAX_SOAP_REQUEST_SIZE:
+            # Refuse without reading the body
+            self.close_connection = True
+            if content_length < 0:
+                self.send_soap_fault("Invalid Content-Length", "soap:Sender", status=400)
+            else:
+                self.send_soap_fault("Request too large", "soap:Sender", status=413)
+            return
         
-        # Parse SOAP request
+        # Parse SOAP request (streamed, stops after the action element)
         try:
-            root = ET.fromstring(body)
-            soap_body = root.find('.//{http://www.w3.org/2003/05/soap-envelope}Body')
-            
-            if soap_body is None:
-                soap_body = root.find('.//{http://schemas.xmlsoap.org/soap/envelope/}Body')
-            
-            if soap_body is None:
-                self.send_soap_fault("Missing SOAP body")
-                return
-            
-            # Get the first child element (the actual request)
-            request_element = list(soap_body)[0] if len(soap_body) > 0 else None
-            
-            if request_element is None:
-                self.send_soap_fault("Empty SOAP body")
-                return
+            request_element, username_token, unread = _parse_soap_request(self.rfile.read, content_length)
+            if unread:
+                self.rfile.read(unread)  # Closing tags: drain so the client gets our response
             
             # Extract action from element tag
             action = request_element.tag.split('}')[-1] if '}' in request_element.tag else request_element.tag
@@ -632,107 +1117,44 @@ class ONVIFHandler(BaseHTTPRequestHandler):
             # Log the action for debugging
             self.log_action(action, self.address_string())
             
-            # ONVIF standard: Some actions must be accessible without authentication
-            # for device discovery and initial connection
-            # Synology sends each request twice: with auth and without auth
-            # We allow all "Get" read operations without auth for compatibility
-            PUBLIC_ACTIONS = {
-                # Device Service - Discovery & Info
-                'GetSystemDateAndTime',  # Required for time sync before auth
-                'GetCapabilities',       # Required for capability discovery
-                'GetServices',           # Required for service discovery
-                'GetServiceCapabilities', # Required for service discovery
-                'GetScopes',             # Required for WS-Discovery
-                'GetDeviceInformation',  # Often needed for initial setup
-                'GetHostname',           # Basic device info
-                'GetNetworkInterfaces',  # Basic network info
-                'GetNTP',                # Time config
-                'GetRelayOutputs',       # Relay info
-                'GetRelayOutputOptions',
-                
-                # Media Service - Read operations (needed by Synology)
-                'GetProfiles',           # Profile list
-                'GetProfile',            # Single profile
-                'GetVideoSources',       # Video source info
-                'GetVideoSourceConfigurations',      # Video source configs
-                'GetVideoEncoderConfigurations',     # Encoder configs
-                'GetVideoEncoderConfiguration',      # Single encoder config
-                'GetVideoEncoderConfigurationOptions', # Encoder options
-                'GetVideoSourceConfigurationOptions', # Source options
-                'GetAudioSources',                   # Audio source info
-                'GetAudioSourceConfigurations',      # Audio source configs
-                'GetAudioEncoderConfigurations',     # Audio encoder configs
-                'GetAudioEncoderConfigurationOptions', # Audio encoder options
-                'GetStreamUri',          # RTSP URL (contains auth in URL if needed)
-                'GetSnapshotUri',        # Snapshot URL
-                'GetGuaranteedNumberOfVideoEncoderInstances',
-                'GetCompatibleAudioSourceConfigurations',
-                'GetCompatibleVideoSourceConfigurations',
-                'GetCompatibleVideoEncoderConfigurations',
-                'GetCompatibleAudioEncoderConfigurations',
-                
-                # Write actions - allowed without auth for Synology compatibility
-                # Some actions apply to config.env (encoder/source) for real changes
-                'CreateProfile',         # Returns existing profile (read-only camera)
-                'DeleteProfile',         # Accepted but ignored (we keep MainProfile)
-                'SetNTP',                # Accepted but ignored (NTP managed by OS)
-                'AddVideoSourceConfiguration',   # Returns existing config
-                'AddVideoEncoderConfiguration',  # Returns existing config
-                'AddAudioSourceConfiguration',   # Returns existing config
-                'AddAudioEncoderConfiguration',  # Returns existing config
-                'SetVideoEncoderConfiguration',  # Accepted but ignored (read-only camera)
-                'SetVideoSourceConfiguration',   # Accepted but ignored (read-only camera)
-                'SetAudioEncoderConfiguration',  # Accepted but ignored (read-only camera)
-                'SetAudioSourceConfiguration',   # Accepted but ignored (read-only camera)
-                # Imaging service
-                'GetImagingSettings',
-                'SetImagingSettings',
-                'GetImagingOptions',
-                # Relay write
-                'SetRelayOutputState',
-            }
-            
             # Check authentication if required (skip for public actions)
             if self.config.username and self.config.password:
                 if action not in PUBLIC_ACTIONS:
-                    if not self.verify_auth(root):
+                    if not self.verify_auth(username_token):
                         print(f"[ONVIF] Auth required for action: {action}")
                         self.send_soap_fault("Not Authorized", "ter:NotAuthorized")
                         return
             
-            # Route to handler
-            response = self.handle_action(action, request_element)
+            # Route to handler (cacheable actions are served pre-rendered)
+            response = self.get_response(action, request_element)
             
             if response:
                 self.send_response(200)
                 self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
+                self.send_header('Content-Length', str(len(response)))
                 self.end_headers()
-                self.wfile.write(response.encode('utf-8'))
+                self.wfile.write(response)
             else:
                 self.send_soap_fault(f"Unknown action: {action}")
                 
+        except SOAPRequestError as e:
+            self.send_soap_fault(str(e))
         except ET.ParseError as e:
             self.send_soap_fault(f"XML Parse Error: {e}")
         except Exception as e:
             print(f"[ONVIF] Error: {e}")
             self.send_soap_fault(str(e))
     
-    def verify_auth(self, root):
-        """Verify WS-Security authentication."""
+    def verify_auth(self, username_token):
+        """Verify WS-Security authentication (UsernameToken from the Security header)."""
         try:
-            # Find Security header
-            security = root.find('.//{http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd}Security')
-            if security is None:
-                return False
-            
-            username_token = security.find('.//{http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd}UsernameToken')
             if username_token is None:
                 return False
             
-            username = username_token.findtext('.//{http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd}Username', '')
-            password = username_token.findtext('.//{http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd}Password', '')
-            nonce = username_token.findtext('.//{http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd}Nonce', '')
-            created = username_token.findtext('.//{http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd}Created', '')
+            username = username_token.findtext(f'{{{WSSE_NS}}}Username', '')
+            password = username_token.findtext(f'{{{WSSE_NS}}}Password', '')
+            nonce = username_token.findtext(f'{{{WSSE_NS}}}Nonce', '')
+            created = username_token.findtext(f'{{{WSU_NS}}}Created', '')
             
             if username != self.config.username:
                 return False
@@ -756,61 +1178,34 @@ class ONVIFHandler(BaseHTTPRequestHandler):
             print(f"[ONVIF] Auth error: {e}")
             return False
     
+    def get_response(self, action, request_element):
+        """Encoded SOAP response for action, from the response cache when possible."""
+        self.config.refresh_if_changed()
+        cache_key = None
+        if self.response_cache is not None and action in CACHEABLE_ACTIONS:
+            # Re-dumps the table if an rtnetlink event (or its TTL) marked it stale,
+            # so the generation below is current even when the response is cached
+            self.config.addresses.entries()
+            # Full tag: GetServiceCapabilities answers per service namespace
+            cache_key = (request_element.tag, _client_subnet(self.client_address[0]),
+                         self.config.version, self.config.addresses.generation)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        response = self.handle_action(action, request_element)
+        if not response:
+            return None
+        body = response.encode('utf-8')
+        if cache_key is not None:
+            self.response_cache.put(cache_key, body)
+        return body
+    
     def handle_action(self, action, request_element):
         """Route action to appropriate handler."""
-        handlers = {
-            # Device Service
-            'GetSystemDateAndTime': self.get_system_date_time,
-            'GetDeviceInformation': self.get_device_information,
-            'GetCapabilities': self.get_capabilities,
-            'GetServices': self.get_services,
-            'GetScopes': self.get_scopes,
-            'GetHostname': self.get_hostname,
-            'GetNetworkInterfaces': self.get_network_interfaces,
-            
-            # Media Service
-            'GetProfiles': self.get_profiles,
-            'GetProfile': self.get_profile,
-            'GetStreamUri': self.get_stream_uri,
-            'GetVideoSources': self.get_video_sources,
-            'GetVideoSourceConfigurations': self.get_video_source_configurations,
-            'GetVideoEncoderConfigurations': self.get_video_encoder_configurations,
-            'GetVideoEncoderConfiguration': self.get_video_encoder_configuration,
-            'SetVideoEncoderConfiguration': self.set_video_encoder_configuration,
-            'SetVideoSourceConfiguration': self.set_video_source_configuration,
-            'GetVideoEncoderConfigurationOptions': self.get_video_encoder_configuration_options,
-            'GetGuaranteedNumberOfVideoEncoderInstances': self.get_guaranteed_encoder_instances,
-            'GetSnapshotUri': self.get_snapshot_uri,
-            'GetAudioSources': self.get_audio_sources,
-            'GetAudioSourceConfigurations': self.get_audio_source_configurations,
-            'GetAudioEncoderConfigurations': self.get_audio_encoder_configurations,
-            'GetAudioEncoderConfigurationOptions': self.get_audio_encoder_configuration_options,
-            'GetVideoSourceConfigurationOptions': self.get_video_source_configuration_options,
-            'GetServiceCapabilities': self.get_service_capabilities,
-            'GetRelayOutputs': self.get_relay_outputs,
-            'GetRelayOutputOptions': self.get_relay_output_options,
-            'SetRelayOutputState': self.set_relay_output_state,
-            'GetNTP': self.get_ntp,
-            'SetNTP': self.set_ntp,
-            'CreateProfile': self.create_profile,
-            'DeleteProfile': self.delete_profile,
-            'AddVideoSourceConfiguration': self.add_video_source_configuration,
-            'AddVideoEncoderConfiguration': self.add_video_encoder_configuration,
-            'AddAudioSourceConfiguration': self.add_audio_source_configuration,
-            'AddAudioEncoderConfiguration': self.add_audio_encoder_configuration,
-            'GetCompatibleAudioSourceConfigurations': self.get_compatible_audio_source_configurations,
-            'GetCompatibleVideoSourceConfigurations': self.get_compatible_video_source_configurations,
-            'GetCompatibleVideoEncoderConfigurations': self.get_compatible_video_encoder_configurations,
-            'GetCompatibleAudioEncoderConfigurations': self.get_compatible_audio_encoder_configurations,
-            # Imaging Service
-            'GetImagingSettings': self.get_imaging_settings,
-            'SetImagingSettings': self.set_imaging_settings,
-            'GetImagingOptions': self.get_imaging_options,
-        }
-        
-        handler = handlers.get(action)
+        handler = self.ACTION_HANDLERS.get(action)
         if handler:
-            return handler(request_element)
+            return getattr(self, handler)(request_element)
         
         print(f"[ONVIF] Unhandled action: {action}")
         return None
@@ -829,7 +1224,7 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     </soap:Body>
 </soap:Envelope>'''
     
-    def send_soap_fault(self, reason, code="soap:Receiver"):
+    def send_soap_fault(self, reason, code="soap:Receiver", status=500):
         """Send SOAP fault response."""
         fault = f'''<?xml version="1.0" encoding="UTF-8"?>
 <soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">
@@ -845,7 +1240,7 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     </soap:Body>
 </soap:Envelope>'''
         
-        self.send_response(500)
+        self.send_response(status)
         self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
         self.end_headers()
         self.wfile.write(fault.encode('utf-8'))
@@ -1032,8 +1427,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def get_profiles(self, request):
         """Handle GetProfiles request."""
-        # Reload video settings to get latest values
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         fps = self.config.video_fps
@@ -1117,7 +1510,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def get_video_sources(self, request):
         """Handle GetVideoSources request."""
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         fps = self.config.video_fps
@@ -1135,7 +1527,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def get_video_source_configurations(self, request):
         """Handle GetVideoSourceConfigurations request."""
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         
@@ -1151,7 +1542,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def get_video_encoder_configurations(self, request):
         """Handle GetVideoEncoderConfigurations request."""
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         fps = self.config.video_fps
@@ -1194,7 +1584,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def get_video_encoder_configuration(self, request):
         """Handle GetVideoEncoderConfiguration request (single config)."""
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         fps = self.config.video_fps
@@ -1278,7 +1667,7 @@ class ONVIFHandler(BaseHTTPRequestHandler):
         if updates:
             try:
                 _update_config_env(self.config.rtsp_config_file, updates)
-                self.config.load_video_settings()
+                self.config.refresh_if_changed()
                 _run_cmd(['systemctl', 'restart', 'rpi-av-rtsp-recorder'], timeout=10)
             except Exception as e:
                 print(f"[ONVIF] Failed to apply encoder config: {e}")
@@ -1308,7 +1697,7 @@ class ONVIFHandler(BaseHTTPRequestHandler):
         
         content = f'''<trt:GetSnapshotUriResponse>
             <trt:MediaUri>
-                <tt:Uri>http://{ip}:5000/api/camera/snapshot</tt:Uri>
+                <tt:Uri>http://{ip}:5000/api/video/snapshot</tt:Uri>
                 <tt:InvalidAfterConnect>false</tt:InvalidAfterConnect>
                 <tt:InvalidAfterReboot>false</tt:InvalidAfterReboot>
                 <tt:Timeout>PT60S</tt:Timeout>
@@ -1323,7 +1712,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
         Surveillance Station uses this to populate the camera settings UI.
         """
         # Read current config for reasonable defaults
-        self.config.load_video_settings()
         current_bitrate = self.config.video_bitrate
         
         content = f'''<trt:GetVideoEncoderConfigurationOptionsResponse>
@@ -1782,7 +2170,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     def create_profile(self, request):
         """Handle CreateProfile request - return the main profile."""
         # We don't actually create new profiles, just return our existing one
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         fps = self.config.video_fps
@@ -1880,7 +2267,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def get_compatible_video_source_configurations(self, request):
         """Handle GetCompatibleVideoSourceConfigurations request."""
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         
@@ -1896,7 +2282,6 @@ class ONVIFHandler(BaseHTTPRequestHandler):
     
     def get_compatible_video_encoder_configurations(self, request):
         """Handle GetCompatibleVideoEncoderConfigurations request."""
-        self.config.load_video_settings()
         w = self.config.video_width
         h = self.config.video_height
         fps = self.config.video_fps
@@ -2130,18 +2515,9 @@ class WSDDiscovery:
     def _get_ip_for_client(self, client_ip):
         """Get the local IP that can reach the client on the same subnet."""
         try:
-            # First try to find an IP on the same /24 subnet as the client
-            import subprocess
-            result = subprocess.run(['ip', '-4', 'addr'], capture_output=True, text=True)
-            if result.returncode == 0:
-                client_prefix = '.'.join(client_ip.split('.')[:3])
-                for line in result.stdout.split('\n'):
-                    if 'inet ' in line and 'scope global' in line:
-                        parts = line.strip().split()
-                        if len(parts) >= 2:
-                            ip = parts[1].split('/')[0]
-                            if ip.startswith(client_prefix + '.'):
-                                return ip
+            ip = self.config.addresses.ip_for_client(client_ip)
+            if ip:
+                return ip
             
             # Fallback: use socket to determine route
             s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -2168,6 +2544,7 @@ def main():
     
     # Share config with handler
     ONVIFHandler.config = config
+    config.addresses.start()
     
     # Start WS-Discovery
     discovery = WSDDiscovery(config)
@@ -2175,7 +2552,9 @@ def main():
     
     # Start HTTP server
     server_address = ('0.0.0.0', config.port)
-    httpd = HTTPServer(server_address, ONVIFHandler)
+    ONVIFHandler.response_cache = SOAPResponseCache()
+    httpd = ThreadingHTTPServer(server_address, ONVIFHandler)
+    httpd.daemon_threads = True
     
     print(f"[ONVIF] Server starting on port {config.port}")
     print(f"[ONVIF] Device name: {config.name}")
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 rpi_csi_rtsp_server.py
-Version: 1.4.14
+Version: 1.7.4
 
 Python-based RTSP Server for CSI Cameras (Picamera2) on Raspberry Pi.
 - Uses Picamera2 H264Encoder for HARDWARE video encoding (not x264enc!)
@@ -25,6 +25,8 @@ import io
 import shutil
 import subprocess
 import tempfile
+import urllib.request
+from collections import deque
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from typing import Dict, Any, Optional
 
@@ -40,7 +42,7 @@ logger = logging.getLogger(__name__)
 try:
     from picamera2 import Picamera2
     from picamera2.encoders import H264Encoder
-    from picamera2.outputs import FileOutput
+    from picamera2.outputs import Output
 except ImportError:
     logger.error("Picamera2 module not found. Please install python3-picamera2")
     sys.exit(1)
@@ -80,6 +82,13 @@ CONF = {
     'OVERLAY_FONT_SIZE': int(os.environ['VIDEO_OVERLAY_FONT_SIZE']) if os.environ.get('VIDEO_OVERLAY_FONT_SIZE', '').isdigit() else 24,
     'CSI_OVERLAY_MODE': os.environ.get('CSI_OVERLAY_MODE', 'software').strip().lower(),
     'CSI_RPICAM_UDP_PORT': int(os.environ.get('CSI_RPICAM_UDP_PORT', 5000)),
+    'RECORD_ENABLE': os.environ.get('RECORD_ENABLE', 'no').lower() in ('yes', 'true', '1', 'on'),
+    'RECORD_DIR': os.environ.get('RECORD_DIR', '/var/cache/rpi-cam/recordings'),
+    'SEGMENT_SECONDS': int(os.environ.get('SEGMENT_SECONDS', 300)),
+    'CSI_RECORD_MODE': os.environ.get('CSI_RECORD_MODE', 'rtsp').strip().lower(),
+    'WEBMANAGER_PORT': int(os.environ.get('WEBMANAGER_PORT', 5000)),
+    # Snapshot captures from the running camera (GET /snapshot.jpg on the control API)
+    'SNAPSHOT_MAX_FPS': max(0.1, min(10.0, float(os.environ.get('SNAPSHOT_MAX_FPS') or 1))),
     'CONTROL_PORT': 8085
 }
 
@@ -166,6 +175,25 @@ def load_config_from_file():
                             logger.info(f"Config: AUDIO_ENABLE={CONF['AUDIO_ENABLE']}")
                         elif key == 'AUDIO_RATE' and value.isdigit():
                             CONF['AUDIO_RATE'] = int(value)
+                        elif key == 'RECORD_ENABLE':
+                            CONF['RECORD_ENABLE'] = value.lower() in ('yes', 'true', '1', 'on')
+                        elif key == 'RECORD_DIR' and value:
+                            CONF['RECORD_DIR'] = value
+                        elif key == 'SEGMENT_SECONDS' and value.isdigit():
+                            CONF['SEGMENT_SECONDS'] = max(1, int(value))
+                        elif key == 'WEBMANAGER_PORT' and value.isdigit():
+                            CONF['WEBMANAGER_PORT'] = int(value)
+                        elif key == 'SNAPSHOT_MAX_FPS' and value:
+                            try:
+                                CONF['SNAPSHOT_MAX_FPS'] = max(0.1, min(10.0, float(value)))
+                            except ValueError:
+                                logger.warning(f"Invalid SNAPSHOT_MAX_FPS '{value}', ignoring")
+                        elif key == 'CSI_RECORD_MODE':
+                            mode_value = value.strip().lower()
+                            if mode_value in ('rtsp', 'inprocess'):
+                                CONF['CSI_RECORD_MODE'] = mode_value
+                            else:
+                                logger.warning(f"Invalid CSI_RECORD_MODE '{value}', using default")
             logger.info(f"Loaded config from {config_path}")
         except Exception as e:
             logger.warning(f"Could not load config from {config_path}: {e}")
@@ -272,31 +300,156 @@ def resolve_audio_device():
 # ==============================================================================
 # Streaming Output - Collects H.264 data from encoder
 # ==============================================================================
+# Bounded queue of access units between the encoder callback and the push thread.
+# A few frames absorb scheduling hiccups of the push thread without letting the
+# RTSP latency grow unbounded.
+FRAME_QUEUE_SIZE = 8
+# appsrc enough-data lasting longer than this (paused or stalled client): the
+# push loop drains the encoder queue, dropping until the next keyframe
+PUSH_GATE_DRAIN_AFTER = 0.5  # seconds
+
+# H.264 NAL unit types (ITU-T H.264 table 7-1)
+NAL_TYPE_IDR = 5
+NAL_TYPE_SPS = 7
+
+
+def h264_is_keyframe(data) -> bool:
+    """Return True if an Annex B access unit contains an IDR slice (or SPS).
+
+    Only the first few NAL headers are inspected: the encoder places SPS/PPS
+    (repeat=True) and the IDR slice at the start of a keyframe access unit.
+    """
+    view = memoryview(data)
+    limit = min(len(view), 256)
+    pos = 0
+    while pos + 3 < limit:
+        if view[pos] == 0 and view[pos + 1] == 0:
+            if view[pos + 2] == 1:
+                nal_type = view[pos + 3] & 0x1F
+                pos += 3
+            elif view[pos + 2] == 0 and pos + 4 < limit and view[pos + 3] == 1:
+                nal_type = view[pos + 4] & 0x1F
+                pos += 4
+            else:
+                pos += 1
+                continue
+            if nal_type in (NAL_TYPE_IDR, NAL_TYPE_SPS):
+                return True
+            if 1 <= nal_type <= 4:
+                # Non-IDR slice: no keyframe in this access unit
+                return False
+        pos += 1
+    return False
+
+
 class StreamingOutput(io.BufferedIOBase):
     """
-    Output that collects H.264 NAL units from Picamera2 encoder.
+    Output that collects H.264 access units from Picamera2 encoder.
     Data is read by the GStreamer push thread.
+
+    Access units are kept in a bounded FIFO. When the push thread falls behind
+    and the queue is full, frames are never dropped at random (that breaks the
+    reference chain and produces "ghost" artifacts until the next IDR): the
+    rest of the current GOP is discarded and queuing resumes at the next
+    keyframe.
     """
-    def __init__(self):
+    def __init__(self, max_frames: int = FRAME_QUEUE_SIZE):
         self.lock = threading.Lock()
         self.condition = threading.Condition(self.lock)
-        self.frame_data = None
-        
-    def write(self, data):
+        self.max_frames = max(2, int(max_frames))
+        self.frames = deque()
+        self._waiting_for_keyframe = False
+        self.on_gop_dropped = None  # Optional callback (e.g. request a keyframe)
+
+        # Statistics (exposed through the control API)
+        self.frames_produced = 0
+        self.frames_consumed = 0
+        self.frames_dropped = 0
+        self.gops_dropped = 0
+        self.keyframes = 0
+        self.bytes_produced = 0
+        self.max_depth = 0
+
+    def write(self, data, keyframe=None, timestamp=None):
+        """Queue one access unit.
+
+        Args:
+            data: Annex B H.264 access unit
+            keyframe: Encoder keyframe flag (parsed from the NAL headers if None)
+            timestamp: Encoder timestamp in microseconds (None if unknown)
+        """
+        if keyframe is None:
+            keyframe = h264_is_keyframe(data)
+        gop_dropped = False
         with self.condition:
-            self.frame_data = data
-            self.condition.notify_all()
+            self.frames_produced += 1
+            self.bytes_produced += len(data)
+            if keyframe:
+                self.keyframes += 1
+                self._waiting_for_keyframe = False
+                if len(self.frames) >= self.max_frames:
+                    # Whole backlog is stale: restart cleanly from this IDR
+                    self.frames_dropped += len(self.frames)
+                    self.frames.clear()
+            elif self._waiting_for_keyframe:
+                self.frames_dropped += 1
+                return len(data)
+            elif len(self.frames) >= self.max_frames:
+                # Keep the queued (decodable) prefix, skip the rest of the GOP
+                self._waiting_for_keyframe = True
+                self.frames_dropped += 1
+                self.gops_dropped += 1
+                gop_dropped = True
+
+            if not gop_dropped:
+                self.frames.append((data, keyframe, timestamp))
+                if len(self.frames) > self.max_depth:
+                    self.max_depth = len(self.frames)
+                self.condition.notify_all()
+
+        if gop_dropped:
+            logger.warning(
+                f"StreamingOutput: push thread late ({self.max_frames} frames queued), "
+                f"skipping to next keyframe"
+            )
+            if self.on_gop_dropped:
+                try:
+                    self.on_gop_dropped()
+                except Exception as e:
+                    logger.debug(f"on_gop_dropped callback failed: {e}")
         return len(data)
-    
-    def read_frame(self, timeout=1.0):
-        """Read the next H.264 frame/NAL unit."""
+
+    def read_access_unit(self, timeout=1.0):
+        """Read the next access unit as (data, keyframe, timestamp_us), or None on timeout."""
         with self.condition:
-            if self.condition.wait_for(lambda: self.frame_data is not None, timeout=timeout):
-                data = self.frame_data
-                self.frame_data = None
-                return data
+            if self.condition.wait_for(lambda: len(self.frames) > 0, timeout=timeout):
+                self.frames_consumed += 1
+                return self.frames.popleft()
             return None
-    
+
+    def read_frame(self, timeout=1.0):
+        """Read the next H.264 access unit (oldest first)."""
+        access_unit = self.read_access_unit(timeout)
+        return access_unit[0] if access_unit else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue counters (produced/consumed/dropped)."""
+        with self.condition:
+            produced = self.frames_produced
+            return {
+                "queue_size": self.max_frames,
+                "queue_depth": len(self.frames),
+                "max_depth": self.max_depth,
+                "frames_produced": produced,
+                "frames_consumed": self.frames_consumed,
+                "frames_dropped": self.frames_dropped,
+                "gops_dropped": self.gops_dropped,
+                "keyframes": self.keyframes,
+                "bytes_produced": self.bytes_produced,
+                "drop_ratio": round(self.frames_dropped / produced, 4) if produced else 0.0,
+                "waiting_for_keyframe": self._waiting_for_keyframe,
+            }
+
     def readable(self):
         return True
     
@@ -304,6 +457,342 @@ class StreamingOutput(io.BufferedIOBase):
         return True
 
 
+class EncoderOutput(Output):
+    """Picamera2 output forwarding encoded frames to a StreamingOutput.
+
+    Unlike FileOutput, the encoder's keyframe flag and timestamp are kept, so
+    the push loop can timestamp buffers with the real capture time.
+    """
+    def __init__(self, sink: StreamingOutput):
+        super().__init__()
+        self.sink = sink
+        self.recorder = None  # Optional SegmentRecorder tee
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        if audio:
+            return
+        self.sink.write(frame, keyframe=keyframe, timestamp=timestamp)
+        recorder = self.recorder
+        if recorder is not None:
+            try:
+                recorder.write(frame, bool(keyframe), timestamp)
+            except Exception as e:
+                logger.error(f"In-process recorder write failed: {e}")
+
+
+# ==============================================================================
+# Buffer Pool - Reusable Gst.Buffer memory for encoder access units
+# ==============================================================================
+POOL_MIN_CLASS = 16 * 1024        # smallest size class (P-frames are a few KB)
+POOL_MAX_CLASS = 4 * 1024 * 1024  # larger access units fall back to new_allocate
+
+
+class H264BufferPool:
+    """
+    Size-classed Gst.BufferPool set for H.264 access units.
+
+    The encoder hands us Python bytes (already copied out of the V4L2 mmap),
+    and PyGObject cannot wrap that memory without copying it again, so
+    new_wrapped() saves nothing. What costs is new_allocate() per frame: a
+    malloc/free of up to several hundred KB per IDR (mmap/munmap + page
+    faults above the glibc threshold). Buffers here come from power-of-two
+    size-class pools and go back to their pool once the payloader releases
+    them, leaving one memcpy (fill) per access unit.
+    """
+    def __init__(self, max_buffers: int = 32):
+        self.max_buffers = max(4, int(max_buffers))
+        self.pools: Dict[int, Any] = {}
+        self._acquire_params = Gst.BufferPoolAcquireParams()
+        self._acquire_params.flags = Gst.BufferPoolAcquireFlags.DONTWAIT
+        self.pooled = 0
+        self.fallback_allocations = 0
+        self.bytes_copied = 0
+
+    @staticmethod
+    def size_class(size: int) -> int:
+        """Return the pool size class (next power of two, >= POOL_MIN_CLASS)."""
+        return max(POOL_MIN_CLASS, 1 << (max(1, size) - 1).bit_length())
+
+    def _get_pool(self, size_class: int):
+        pool = self.pools.get(size_class)
+        if pool is None:
+            pool = Gst.BufferPool.new()
+            config = pool.get_config()
+            Gst.BufferPool.config_set_params(config, None, size_class, 0, self.max_buffers)
+            if not pool.set_config(config) or not pool.set_active(True):
+                logger.warning(f"Could not activate buffer pool for {size_class} bytes")
+                pool = False
+            else:
+                logger.debug(f"Buffer pool created for {size_class} byte access units")
+            self.pools[size_class] = pool
+        return pool
+
+    def buffer_for(self, data) -> "Gst.Buffer":
+        """Return a Gst.Buffer holding a copy of data (pooled when possible)."""
+        size = len(data)
+        self.bytes_copied += size
+        size_class = self.size_class(size)
+        if size_class <= POOL_MAX_CLASS:
+            pool = self._get_pool(size_class)
+            if pool:
+                ret, buf = pool.acquire_buffer(self._acquire_params)
+                if ret == Gst.FlowReturn.OK and buf is not None:
+                    buf.fill(0, data)
+                    buf.set_size(size)
+                    self.pooled += 1
+                    return buf
+        # Oversized access unit or pool exhausted (DONTWAIT)
+        buf = Gst.Buffer.new_allocate(None, size, None)
+        buf.fill(0, data)
+        self.fallback_allocations += 1
+        return buf
+
+    def stop(self):
+        for pool in self.pools.values():
+            if pool:
+                pool.set_active(False)
+        self.pools.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "size_classes": sorted(k for k, v in self.pools.items() if v),
+            "pooled_buffers": self.pooled,
+            "fallback_allocations": self.fallback_allocations,
+            "bytes_copied": self.bytes_copied,
+        }
+
+
+# ==============================================================================
+# In-process Segment Recorder - Encoder access units -> MPEG-TS segments
+# ==============================================================================
+class SegmentRecorder:
+    """
+    Records the encoder's H.264 access units straight to MPEG-TS segments.
+
+    Replaces the camera -> RTSP -> ffmpeg (rtsp_recorder.sh) loopback for CSI
+    cameras when CSI_RECORD_MODE=inprocess: no RTP packetisation/depacketisation
+    and no ffmpeg process. Pipeline:
+        appsrc ! h264parse ! splitmuxsink (mpegtsmux, rec_%Y%m%d_%H%M%S.ts)
+    Segments start on an IDR; a keyframe is requested from the encoder when a
+    segment reaches SEGMENT_SECONDS so boundaries land on time. Each closed
+    segment is reported to the web manager (/api/recordings/thumbnail/notify).
+
+    Video only: the ALSA device is already owned by the RTSP pipeline.
+    """
+    def __init__(self, conf: Dict[str, Any], request_keyframe=None):
+        self.record_dir = conf['RECORD_DIR']
+        self.segment_seconds = max(1, int(conf['SEGMENT_SECONDS']))
+        self.notify_url = (
+            f"http://127.0.0.1:{conf['WEBMANAGER_PORT']}/api/recordings/thumbnail/notify"
+        )
+        self.caps = (
+            f"video/x-h264,stream-format=byte-stream,alignment=au,"
+            f"width={conf['WIDTH']},height={conf['HEIGHT']},framerate={conf['FPS']}/1"
+        )
+        self.frame_duration_ns = int(1e9 / conf['FPS'])
+        self.request_keyframe = request_keyframe
+        self.buffer_pool = H264BufferPool(max_buffers=conf['FPS'] + 8)
+
+        self.pipeline = None
+        self.appsrc = None
+        self.active = False
+        self._base_ts_ns: Optional[int] = None
+        self._segment_start_ns = 0
+        self._keyframe_requested = False
+        self._last_pts = -1
+
+        self.segments_closed = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.frames_dropped = 0
+        self.notify_failures = 0
+        self.current_segment: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+    def start(self) -> bool:
+        """Build and start the recording pipeline. Returns False on failure."""
+        try:
+            os.makedirs(self.record_dir, exist_ok=True)
+            pipeline = Gst.parse_launch(
+                f"appsrc name=recsrc is-live=true do-timestamp=false format=time caps={self.caps} "
+                f"! h264parse config-interval=-1 "
+                f"! splitmuxsink name=recsink async-finalize=false"
+            )
+            sink = pipeline.get_by_name("recsink")
+            muxer = Gst.ElementFactory.make("mpegtsmux", None)
+            if muxer is None:
+                raise RuntimeError("mpegtsmux not available (gstreamer1.0-plugins-bad)")
+            sink.set_property("muxer", muxer)
+            sink.set_property("max-size-time", self.segment_seconds * Gst.SECOND)
+            sink.connect("format-location", self._on_format_location)
+
+            appsrc = pipeline.get_by_name("recsrc")
+            appsrc.set_property("block", False)
+            appsrc.set_property("max-bytes", 4 * 1024 * 1024)
+
+            bus = pipeline.get_bus()
+            bus.add_signal_watch()
+            bus.connect("message::element", self._on_element_message)
+            bus.connect("message::error", self._on_error_message)
+
+            if pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+                raise RuntimeError("recording pipeline refused to start")
+
+            self.pipeline = pipeline
+            self.appsrc = appsrc
+            self._base_ts_ns = None
+            self.active = True
+            if self.request_keyframe:
+                self.request_keyframe()
+            logger.info(
+                f"In-process recorder started: {self.record_dir}, "
+                f"segments of {self.segment_seconds}s (MPEG-TS)"
+            )
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"In-process recorder failed to start: {e}")
+            self.active = False
+            return False
+
+    def write(self, data, keyframe: bool, timestamp_us: Optional[int]):
+        """Queue one access unit (called from the encoder thread)."""
+        appsrc = self.appsrc
+        if not self.active or appsrc is None:
+            return
+        if self._base_ts_ns is None:
+            if not keyframe:
+                # A segment must start on an IDR
+                self.frames_dropped += 1
+                return
+            self._base_ts_ns = int(timestamp_us) * 1000 if timestamp_us is not None else 0
+            self._segment_start_ns = 0
+
+        if timestamp_us is not None:
+            pts = int(timestamp_us) * 1000 - self._base_ts_ns
+        else:
+            pts = self._last_pts + self.frame_duration_ns
+        if pts <= self._last_pts:
+            pts = self._last_pts + 1
+        self._last_pts = pts
+
+        # splitmuxsink cuts at the first IDR past max-size-time: ask for one
+        # right at the boundary instead of waiting up to a full GOP
+        segment_elapsed = pts - self._segment_start_ns
+        if keyframe:
+            if segment_elapsed >= self.segment_seconds * Gst.SECOND:
+                self._segment_start_ns = pts
+            self._keyframe_requested = False
+        elif (not self._keyframe_requested and self.request_keyframe
+              and segment_elapsed >= self.segment_seconds * Gst.SECOND):
+            self._keyframe_requested = True
+            try:
+                self.request_keyframe()
+            except Exception as e:
+                logger.debug(f"Recorder keyframe request failed: {e}")
+
+        buf = self.buffer_pool.buffer_for(data)
+        buf.pts = pts
+        buf.dts = pts
+        buf.duration = self.frame_duration_ns
+        if not keyframe:
+            buf.set_flags(Gst.BufferFlags.DELTA_UNIT)
+        ret = appsrc.emit("push-buffer", buf)
+        if ret == Gst.FlowReturn.OK:
+            self.frames_written += 1
+            self.bytes_written += len(data)
+        else:
+            self.frames_dropped += 1
+
+    def _unique_path(self, prefix: str, taken=()) -> str:
+        # Same naming as rtsp_segmenter: second resolution, _1, _2... on collision
+        name = time.strftime(f'{prefix}_%Y%m%d_%H%M%S')
+        path = os.path.join(self.record_dir, f"{name}.ts")
+        suffix = 1
+        while os.path.exists(path) or path in taken:
+            path = os.path.join(self.record_dir, f"{name}_{suffix}.ts")
+            suffix += 1
+        return path
+
+    def _on_format_location(self, splitmux, fragment_id):
+        # A keyframe-forced split (or a restart) can land within the same second
+        path = self._unique_path('rec', taken=(self.current_segment,))
+        self.current_segment = path
+        logger.info(f"Recording segment #{fragment_id}: {os.path.basename(path)}")
+        return path
+
+    def _on_element_message(self, bus, message):
+        structure = message.get_structure()
+        if structure is None or structure.get_name() != "splitmuxsink-fragment-closed":
+            return
+        location = structure.get_string("location")
+        self.segments_closed += 1
+        if location:
+            threading.Thread(target=self._notify_segment, args=(location,), daemon=True).start()
+
+    def _on_error_message(self, bus, message):
+        err, debug = message.parse_error()
+        self.last_error = str(err)
+        logger.error(f"In-process recorder error: {err} ({debug})")
+        # Stop so rtsp_recorder.sh falls back to the RTSP/ffmpeg recorder
+        GLib.idle_add(self.stop)
+
+    def _notify_segment(self, filepath: str):
+        """Tell the web manager a segment is complete (thumbnail + index)."""
+        payload = json.dumps({"filepath": filepath}).encode()
+        for attempt in range(1, 4):
+            try:
+                req = urllib.request.Request(
+                    self.notify_url, data=payload, method='POST',
+                    headers={'Content-Type': 'application/json'}
+                )
+                with urllib.request.urlopen(req, timeout=30):
+                    pass
+                logger.info(f"Thumbnail notification sent for: {os.path.basename(filepath)}")
+                return
+            except Exception as e:
+                logger.debug(f"Thumbnail notification failed (attempt {attempt}/3): {e}")
+                time.sleep(5)
+        self.notify_failures += 1
+        logger.warning(f"Failed to notify thumbnail generation for: {os.path.basename(filepath)}")
+
+    def stop(self):
+        """Finish the current segment (EOS) and tear the pipeline down."""
+        if not self.pipeline:
+            return False
+        self.active = False
+        pipeline, self.pipeline = self.pipeline, None
+        try:
+            if self.appsrc:
+                self.appsrc.emit("end-of-stream")
+            pipeline.get_bus().timed_pop_filtered(
+                3 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR
+            )
+        except Exception as e:
+            logger.debug(f"Recorder EOS failed: {e}")
+        pipeline.set_state(Gst.State.NULL)
+        self.appsrc = None
+        self.buffer_pool.stop()
+        if self.current_segment and os.path.exists(self.current_segment):
+            threading.Thread(target=self._notify_segment, args=(self.current_segment,), daemon=True).start()
+        logger.info("In-process recorder stopped.")
+        return False  # GLib.idle_add: run once
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "record_dir": self.record_dir,
+            "segment_seconds": self.segment_seconds,
+            "current_segment": os.path.basename(self.current_segment) if self.current_segment else None,
+            "segments_closed": self.segments_closed,
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "bytes_written": self.bytes_written,
+            "notify_failures": self.notify_failures,
+            "last_error": self.last_error,
+        }
+
+
 # ==============================================================================
 # Control API Handler (IPC)
 # ==============================================================================
@@ -345,6 +834,34 @@ class ControlRequestHandler(BaseHTTPRequestHandler):
             except Exception as e:
                 logger.error(f"Error handling controls GET: {e}")
                 self.send_error(500, str(e))
+        elif self.path.split('?', 1)[0] == '/snapshot.jpg':
+            try:
+                jpeg = self.server_instance.capture_snapshot() if self.server_instance else None
+                if jpeg:
+                    self.send_response(200)
+                    self.send_header('Content-type', 'image/jpeg')
+                    self.send_header('Content-Length', str(len(jpeg)))
+                    self.end_headers()
+                    self.wfile.write(jpeg)
+                else:
+                    # Camera not owned by Picamera2 (rpicam overlay mode) or not started
+                    self.send_error(503, "Snapshot not available")
+            except Exception as e:
+                logger.error(f"Error handling snapshot GET: {e}")
+                self.send_error(500, str(e))
+        elif self.path == '/stats':
+            try:
+                if self.server_instance:
+                    stats = self.server_instance.get_stream_stats()
+                    self.send_response(200)
+                    self.send_header('Content-type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps(stats).encode())
+                else:
+                    self.send_error(500, "Server instance not ready")
+            except Exception as e:
+                logger.error(f"Error handling stats GET: {e}")
+                self.send_error(500, str(e))
         else:
             self.send_error(404)
             
@@ -361,6 +878,8 @@ class Picam2RtspServer:
         self.picam2: Optional[Picamera2] = None
         self.encoder: Optional[H264Encoder] = None
         self.h264_output: Optional[StreamingOutput] = None
+        self.encoder_output: Optional[EncoderOutput] = None
+        self.recorder: Optional[SegmentRecorder] = None
         self.appsrc = None
         self.rpicam_proc: Optional[subprocess.Popen] = None
         self.rpicam_udp_port = int(self.conf.get('CSI_RPICAM_UDP_PORT', 5000))
@@ -380,10 +899,25 @@ class Picam2RtspServer:
         self._push_thread: Optional[threading.Thread] = None
         self._push_loop_last_frame_time: float = 0.0  # Track if push loop is alive
         self._push_loop_error_count: int = 0  # Count consecutive errors
+        # appsrc flow control: set on need-data, cleared on enough-data
+        self._appsrc_need_data = threading.Event()
+        self._pts_base: Optional[tuple] = None  # (encoder ts ns, running time ns)
+        self.buffer_pool: Optional[H264BufferPool] = None
+        self._push_stats = {
+            "buffers_pushed": 0,
+            "bytes_pushed": 0,
+            "enough_data_events": 0,
+            "frames_skipped_no_client": 0,
+            "frames_dropped_backpressure": 0,
+        }
         
         self.control_server = None
         self.control_thread = None
         self.main_loop = None
+        
+        # Latest snapshot (monotonic time, JPEG bytes), refreshed at most SNAPSHOT_MAX_FPS
+        self._snapshot: Optional[tuple] = None
+        self._snapshot_lock = threading.Lock()
 
         # Initialize GStreamer
         Gst.init(None)
@@ -417,7 +951,7 @@ class Picam2RtspServer:
             logger.warning("CSI overlay enabled: software decode/encode path used (CPU intensive).")
             encoder = self._select_overlay_encoder()
             video_pipeline = (
-                f"appsrc name=src is-live=true do-timestamp=true format=time caps={video_caps} "
+                f"appsrc name=src is-live=true do-timestamp=false format=time caps={video_caps} "
                 f"! h264parse "
                 f"! avdec_h264 "
                 f"! videoconvert "
@@ -429,7 +963,7 @@ class Picam2RtspServer:
             )
         else:
             video_pipeline = (
-                f"appsrc name=src is-live=true do-timestamp=true format=time caps={video_caps} "
+                f"appsrc name=src is-live=true do-timestamp=false format=time caps={video_caps} "
                 f"! h264parse config-interval=1 "
                 f"! rtph264pay name=pay0 pt=96 config-interval=1 "
                 f"timestamp-offset=0 seqnum-offset=0 perfect-rtptime=true"
@@ -691,15 +1225,58 @@ class Picam2RtspServer:
         
         logger.info("Configuring RTSP factory for first client...")
         element = media.get_element()
-        self.appsrc = element.get_child_by_name("src")
-        if self.appsrc:
-            self.appsrc.set_property("block", False)
-            self.appsrc.set_property("max-bytes", 2*1024*1024)
+        appsrc = element.get_child_by_name("src")
+        if appsrc:
+            # Non-blocking: backpressure comes from need-data/enough-data, so the
+            # push thread never stalls inside push-buffer (watchdog stays fed).
+            # max-bytes ~ 1s of stream, enough-data fires before latency builds up.
+            max_bytes = max(512 * 1024, int(self.conf['BITRATE_KBPS']) * 1000 // 8)
+            appsrc.set_property("block", False)
+            appsrc.set_property("max-bytes", max_bytes)
+            appsrc.connect("need-data", self._on_appsrc_need_data)
+            appsrc.connect("enough-data", self._on_appsrc_enough_data)
+            self._pts_base = None
+            self._appsrc_need_data.set()
+            self.appsrc = appsrc
             self._rtsp_factory_configured = True
-            logger.info("appsrc configured for hardware H.264 stream (shared pipeline).")
+            # Last client gone: the shared media (and this appsrc) is torn down
+            media.connect("unprepared", self._on_media_unprepared)
+            logger.info(f"appsrc configured for hardware H.264 stream (shared pipeline, max-bytes={max_bytes}).")
         else:
             logger.error("Could not find appsrc element in pipeline!")
 
+    def _on_media_unprepared(self, media):
+        """Shared media released: the next client gets a new appsrc from media-configure."""
+        logger.info("RTSP media unprepared (no client left), appsrc released.")
+        self.appsrc = None
+        self._rtsp_factory_configured = False
+        self._appsrc_need_data.set()
+
+    def _on_appsrc_need_data(self, appsrc, length):
+        self._appsrc_need_data.set()
+
+    def _on_appsrc_enough_data(self, appsrc):
+        self._appsrc_need_data.clear()
+        self._push_stats["enough_data_events"] += 1
+
+    def _buffer_pts(self, timestamp_us: Optional[int]) -> int:
+        """Map an encoder timestamp (µs) to appsrc running time (ns).
+
+        The first buffer anchors the encoder clock on the pipeline running time;
+        later buffers keep the encoder's own spacing (no synthetic frame counter).
+        """
+        if timestamp_us is None:
+            running_time = self.appsrc.get_current_running_time()
+            return running_time if running_time != Gst.CLOCK_TIME_NONE else 0
+        ts_ns = int(timestamp_us) * 1000
+        if self._pts_base is None:
+            running_time = self.appsrc.get_current_running_time()
+            if running_time == Gst.CLOCK_TIME_NONE:
+                running_time = 0
+            self._pts_base = (ts_ns, running_time)
+        base_ts, base_running = self._pts_base
+        return max(0, base_running + ts_ns - base_ts)
+
     def _push_loop_watchdog(self):
         """Watchdog thread that monitors the H.264 push loop and restarts if it dies.
         
@@ -738,56 +1315,81 @@ class Picam2RtspServer:
     def _push_loop(self):
         """Push H.264 data from Picamera2 hardware encoder to GStreamer appsrc.
         
-        CRITICAL FIXES (v1.4.2):
+        Event-driven (v1.5.1): the loop blocks on the encoder queue and is paced
+        by the encoder itself, no sleep-based throttling. Buffers carry the
+        encoder timestamps. While appsrc reports enough-data, access units stay
+        in the StreamingOutput queue (which drops whole GOPs if it overflows);
+        past PUSH_GATE_DRAIN_AFTER the loop drains them itself, then resumes on
+        the next keyframe, so the watchdog keeps seeing the encoder alive.
+        
+        Still handled (v1.4.2):
         1. Comprehensive exception handling for libcamera timeouts
-        2. Check pipeline state before pushing buffers (avoid busy-wait when NULL)
-        3. Respect frame timing with proper sleep between pushes
-        4. Handle backpressure gracefully (FlowReturn.NOT_LINKED = no consumers)
-        5. Avoid memory bloat from unbounded buffer accumulation
-        6. Reduce read_frame timeout to 2.0s to catch stalls faster (was 0.1s but libcamera can timeout >1s)
+        2. Backpressure / no consumer (FlowReturn.NOT_LINKED)
+        3. read timeout of 2.0s to catch stalls (libcamera can timeout >1s)
         """
-        logger.info("Starting H.264 push loop (HARDWARE encoder).")
+        logger.info("Starting H.264 push loop (HARDWARE encoder, event-driven).")
         self._push_loop_last_frame_time = time.time()
         self._push_loop_error_count = 0
         
         frame_duration_ns = int(1e9 / self.conf['FPS'])
-        frame_duration_sec = frame_duration_ns / 1e9
-        pts = 0
-        last_push_time = time.time()
         consecutive_failures = 0
-        max_failures = 30
         had_no_consumers = True
+        last_pts = -1
+        gated_since = None  # monotonic time of the enough-data that is still pending
+        resync = False  # frames were drained: next push must start on a keyframe
 
         try:
             while self._running:
                 try:
-                    # Read H.264 frame from encoder output with timeout
-                    # IMPORTANT: Increased timeout to 2.0s to allow libcamera to work
-                    # but not so long that we become unresponsive
-                    h264_data = self.h264_output.read_frame(timeout=2.0)
+                    if self.appsrc and not self._appsrc_need_data.is_set():
+                        now = time.monotonic()
+                        if gated_since is None:
+                            gated_since = now
+                        if now - gated_since < PUSH_GATE_DRAIN_AFTER:
+                            # Downstream is full: leave frames queued until need-data
+                            self._appsrc_need_data.wait(timeout=0.1)
+                            continue
+                        # Paused/stalled client: drain instead of freezing the encoder queue
+                        access_unit = self.h264_output.read_access_unit(timeout=0.5)
+                        if access_unit is not None:
+                            self._push_loop_last_frame_time = time.time()
+                            self._push_stats["frames_dropped_backpressure"] += 1
+                            resync = True
+                        continue
+                    gated_since = None
+
+                    # Blocks until the encoder delivers an access unit
+                    access_unit = self.h264_output.read_access_unit(timeout=2.0)
+                    if access_unit is None:
+                        continue
+                    # Watchdog liveness: an access unit left the queue (pushed below,
+                    # or dropped while no client / no need-data)
                     self._push_loop_last_frame_time = time.time()
                     self._push_loop_error_count = 0  # Reset error counter on success
+                    h264_data, keyframe, timestamp_us = access_unit
                     
-                    if h264_data is None:
-                        # No frame available, short sleep to avoid busy-wait
-                        time.sleep(0.01)
-                        continue
+                    if resync and self.appsrc:
+                        if not keyframe:
+                            # Rest of a GOP whose start was drained: not decodable
+                            self._push_stats["frames_dropped_backpressure"] += 1
+                            if self._push_stats["frames_dropped_backpressure"] % 30 == 1:
+                                self._request_keyframe()
+                            continue
+                        resync = False
                     
-                    # Check if we have appsrc and it's ready to accept buffers
                     if not self.appsrc:
-                        # No client connected, throttle to avoid CPU waste
-                        time.sleep(0.05)
-                        consecutive_failures += 1
+                        # No client connected yet, frame is discarded
+                        self._push_stats["frames_skipped_no_client"] += 1
                         had_no_consumers = True
-                        if consecutive_failures > max_failures:
-                            logger.info("No active clients detected. Pausing push loop temporarily...")
-                            time.sleep(0.5)
                         continue
                     
                     try:
-                        # Create GStreamer buffer with the H.264 data
-                        buf = Gst.Buffer.new_allocate(None, len(h264_data), None)
-                        buf.fill(0, h264_data)
+                        # GStreamer buffer from the pool (no per-frame allocation)
+                        buf = self.buffer_pool.buffer_for(h264_data)
+                        pts = self._buffer_pts(timestamp_us)
+                        if pts <= last_pts:
+                            pts = last_pts + 1
+                        last_pts = pts
                         buf.pts = pts
                         buf.dts = pts
                         buf.duration = frame_duration_ns
@@ -799,45 +1401,33 @@ class Picam2RtspServer:
                             if had_no_consumers:
                                 had_no_consumers = False
                                 try:
-                                    if self.encoder and hasattr(self.encoder, "request_key_frame"):
-                                        self.encoder.request_key_frame()
+                                    if self._request_keyframe():
                                         logger.info("Requested keyframe on first consumer reconnect.")
                                 except Exception as e:
                                     logger.debug(f"Keyframe request failed: {e}")
-                            # Success - advance PTS
-                            pts += frame_duration_ns
                             consecutive_failures = 0
-                            # Throttle to maintain desired frame rate
-                            now = time.time()
-                            elapsed = now - last_push_time
-                            if elapsed < frame_duration_sec:
-                                time.sleep(frame_duration_sec - elapsed)
-                            last_push_time = time.time()
+                            self._push_stats["buffers_pushed"] += 1
+                            self._push_stats["bytes_pushed"] += len(h264_data)
                          
                         elif ret == Gst.FlowReturn.NOT_LINKED:
-                            # No consumer connected to appsrc, pause
+                            # No consumer connected to appsrc, frame dropped
                             consecutive_failures += 1
                             had_no_consumers = True
-                            if consecutive_failures < 5:
-                                time.sleep(0.02)
-                            else:
-                                logger.debug(f"appsrc has no consumer (attempt {consecutive_failures}), pausing...")
-                                time.sleep(0.1)
+                            if consecutive_failures % 100 == 5:
+                                logger.debug(f"appsrc has no consumer (attempt {consecutive_failures})")
                         
                         elif ret == Gst.FlowReturn.FLUSHING:
                             # Pipeline is being torn down, this is normal
-                            time.sleep(0.02)
+                            had_no_consumers = True
                         
                         else:
                             # Unexpected return value (ERROR, etc.)
-                            logger.warning(f"appsrc push returned: {ret}. Pausing temporarily...")
+                            logger.warning(f"appsrc push returned: {ret}.")
                             consecutive_failures += 1
-                            time.sleep(0.1)
                     
                     except Exception as e:
                         logger.error(f"Error pushing H.264 buffer: {e}")
                         consecutive_failures += 1
-                        time.sleep(0.05)
 
                 except Exception as e:
                     self._push_loop_error_count += 1
@@ -853,6 +1443,70 @@ class Picam2RtspServer:
         finally:
             logger.info("H.264 push loop stopped.")
 
+    def get_stream_stats(self) -> Dict[str, Any]:
+        """Return H.264 queue and push loop statistics (control API /stats)."""
+        stats = {
+            "mode": "rpicam-overlay" if self.using_rpicam_overlay else "picamera2",
+            "running": self._running,
+            "clients_configured": self._rtsp_factory_configured,
+            "push_loop": {
+                "last_frame_age_sec": round(time.time() - self._push_loop_last_frame_time, 3)
+                if self._push_loop_last_frame_time else None,
+                "error_count": self._push_loop_error_count,
+                "appsrc_need_data": self._appsrc_need_data.is_set(),
+                **self._push_stats,
+            },
+        }
+        if self.h264_output:
+            stats["queue"] = self.h264_output.get_stats()
+        if self.buffer_pool:
+            stats["buffer_pool"] = self.buffer_pool.get_stats()
+        # rtsp_recorder.sh checks this flag to skip its RTSP/ffmpeg recorder
+        stats["recording_inprocess"] = bool(self.recorder and self.recorder.active)
+        if self.recorder:
+            stats["recorder"] = self.recorder.get_stats()
+        return stats
+
+    def capture_snapshot(self) -> Optional[bytes]:
+        """
+        JPEG of the current frame from the running Picamera2 (main stream).
+        Captures while the H.264 encoder keeps running - no second process
+        opening the camera. Served from cache if the last capture is younger
+        than 1 / SNAPSHOT_MAX_FPS; concurrent callers share one capture.
+        """
+        if self.picam2 is None or not self._running:
+            return None
+        with self._snapshot_lock:
+            min_interval = 1.0 / self.conf.get('SNAPSHOT_MAX_FPS', 1)
+            if self._snapshot and time.monotonic() - self._snapshot[0] < min_interval:
+                return self._snapshot[1]
+            buf = io.BytesIO()
+            self.picam2.capture_file(buf, format='jpeg')
+            self._snapshot = (time.monotonic(), buf.getvalue())
+            return self._snapshot[1]
+
+    def _request_keyframe(self) -> bool:
+        """Ask the hardware encoder for an IDR (if supported)."""
+        if self.encoder and hasattr(self.encoder, "request_key_frame"):
+            self.encoder.request_key_frame()
+            return True
+        return False
+
+    def _start_inprocess_recorder(self):
+        """Tee encoder access units into MPEG-TS segments (CSI_RECORD_MODE=inprocess)."""
+        if self.conf.get('CSI_RECORD_MODE') != 'inprocess' or not self.conf.get('RECORD_ENABLE'):
+            return
+        if self.conf.get('OVERLAY_ENABLE'):
+            # Encoder output has no overlay (it is burned in after decode/re-encode)
+            logger.warning("In-process recording disabled with overlay enabled; using RTSP recorder.")
+            return
+        if self.conf.get('AUDIO_ENABLE'):
+            logger.info("In-process recording is video only (audio stays on the RTSP stream).")
+        recorder = SegmentRecorder(self.conf, request_keyframe=self._request_keyframe)
+        if recorder.start():
+            self.recorder = recorder
+            self.encoder_output.recorder = recorder
+
     def _load_saved_tunings(self) -> Dict[str, Any]:
         """Load saved tuning parameters from config file."""
         import os
@@ -1171,10 +1825,13 @@ class Picam2RtspServer:
         
         # Create output for H.264 stream
         self.h264_output = StreamingOutput()
+        self.h264_output.on_gop_dropped = self._request_keyframe
         
         # Start camera with encoder
-        # FileOutput wraps our StreamingOutput - encoder writes H.264 data to it
-        self.picam2.start_encoder(self.encoder, FileOutput(self.h264_output))
+        # EncoderOutput wraps our StreamingOutput - encoder writes H.264 data
+        # (with keyframe flag and timestamp) to it
+        self.encoder_output = EncoderOutput(self.h264_output)
+        self.picam2.start_encoder(self.encoder, self.encoder_output)
         self.picam2.start()
         logger.info("Picamera2 started with HARDWARE H.264 encoder.")
         
@@ -1189,6 +1846,10 @@ class Picam2RtspServer:
         except Exception as e:
             logger.warning(f"Could not re-apply saved tunings AFTER start: {e}")
         
+        # Optional in-process recording branch (before the control API so
+        # rtsp_recorder.sh sees recording_inprocess as soon as it can connect)
+        self._start_inprocess_recorder()
+        
         # Start control API
         self.setup_control_api()
         
@@ -1209,6 +1870,7 @@ class Picam2RtspServer:
         logger.info(f"RTSP Stream available at rtsp://0.0.0.0:{self.conf['RTSP_PORT']}/{self.conf['RTSP_PATH']}")
         
         # Start H.264 push thread
+        self.buffer_pool = H264BufferPool(max_buffers=self.conf['FPS'] + 8)
         self._running = True
         self._push_loop_last_frame_time = time.time()
         self._push_thread = threading.Thread(target=self._push_loop, daemon=True)
@@ -1233,10 +1895,18 @@ class Picam2RtspServer:
         
         if self._push_thread:
             self._push_thread.join(timeout=2)
+
+        if self.buffer_pool:
+            self.buffer_pool.stop()
         
         if self.main_loop:
             self.main_loop.quit()
         
+        if self.recorder:
+            if self.encoder_output:
+                self.encoder_output.recorder = None
+            self.recorder.stop()
+
         if self.picam2:
             try:
                 self.picam2.stop_encoder()
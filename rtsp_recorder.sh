@@ -9,9 +9,15 @@
 #   - Auto-prunes old recordings to maintain minimum free disk space
 #   - Enforces maximum recordings folder size (MAX_DISK_MB)
 #   - Notifies web manager when new recordings are created (thumbnail generation)
+#   - Optional segmenter mode (rtsp_segmenter.py): IDR-exact segments + event clips
 #
-# Version: 1.8.0
+# Version: 1.11.0
 # Changelog:
+#   - 1.11.0: Pruning uses retention_service.py (one scan, one sorted list, batch delete for
+#             MIN_FREE_DISK_MB + MAX_DISK_MB); legacy find/ls loops kept as fallback
+#   - 1.10.0: RECORDER_MODE=segmenter: ffmpeg remuxes to MPEG-TS on a pipe, rtsp_segmenter.py
+#             cuts IDR-exact segments and serves pre/post-roll event clips (CLIP_CONTROL_PORT)
+#   - 1.9.0: Skip ffmpeg recording while the CSI server records in-process (CSI_RECORD_MODE=inprocess)
 #   - 1.8.0: Added inotify watcher for immediate thumbnail generation on new recordings
 #   - 1.7.0: Added MAX_DISK_MB support to limit recordings folder size
 #===============================================================================
@@ -43,6 +49,11 @@ fi
 : "${LOG_DIR:=/var/log/rpi-cam}"
 : "${PRUNE_CHECK_INTERVAL:=60}"  # Check disk space every 60 seconds
 : "${WEBMANAGER_PORT:=5000}"     # Web manager port for thumbnail notifications
+: "${CSI_RECORD_MODE:=rtsp}"      # rtsp = ffmpeg over RTSP, inprocess = CSI server writes segments
+: "${CSI_CONTROL_PORT:=8085}"     # CSI server control API (reports in-process recording)
+: "${RECORDER_MODE:=ffmpeg}"      # ffmpeg = segment muxer, segmenter = rtsp_segmenter.py (IDR-exact + clips)
+: "${CLIP_CONTROL_PORT:=8086}"    # rtsp_segmenter.py clip API
+: "${CLIP_PREROLL_MAX_SECONDS:=30}"  # Rolling in-memory buffer kept for event clips
 
 LOG_FILE="${LOG_DIR}/rtsp_recorder.log"
 PRUNE_PID=""
@@ -256,6 +267,74 @@ prune_if_max_exceeded() {
     log "After max-size pruning: ${used_mb}MB used (limit: ${MAX_DISK_MB}MB)"
 }
 
+#---------------------------
+# Retention engine (web-manager/services/retention_service.py)
+# One scan + one sorted candidate list for both MIN_FREE_DISK_MB and
+# MAX_DISK_MB, batch delete, no find/ls/du/df per deleted file.
+#---------------------------
+find_retention_engine() {
+    local candidate
+    for candidate in "$(dirname "$0")/web-manager/services/retention_service.py" \
+                     /opt/rpi-cam-webmanager/services/retention_service.py; do
+        if [[ -f "$candidate" ]]; then
+            echo "$candidate"
+            return 0
+        fi
+    done
+    return 1
+}
+
+run_retention() {
+    local engine
+    engine="$(find_retention_engine)" || return 1
+    cmd_exists python3 || return 1
+
+    python3 "$engine" \
+        --record-dir "$RECORD_DIR" \
+        --min-free-mb "$MIN_FREE_DISK_MB" \
+        --max-dir-mb "$MAX_DISK_MB" 2>&1 | while read -r line; do
+            log "$line"
+        done
+    local code=${PIPESTATUS[0]}
+    # 0 = limits met, 2 = limits still exceeded (nothing left to delete)
+    [[ "$code" -eq 0 || "$code" -eq 2 ]]
+}
+
+enforce_retention() {
+    local free_mb=0
+    local low_space=""
+
+    if [[ "$MIN_FREE_DISK_MB" -gt 0 ]]; then
+        free_mb="$(get_free_disk_mb)" || free_mb=0
+        free_mb="${free_mb:-0}"
+        [[ "$free_mb" =~ ^[0-9]+$ ]] || free_mb=0
+        if [[ "$free_mb" -lt "$MIN_FREE_DISK_MB" ]]; then
+            log "Disk space low: ${free_mb}MB free < ${MIN_FREE_DISK_MB}MB required"
+            # Non-destructive first: logs and caches
+            prune_logs || true
+            free_mb="$(get_free_disk_mb)" || free_mb=0
+            free_mb="${free_mb:-0}"
+            [[ "$free_mb" =~ ^[0-9]+$ ]] || free_mb=0
+            if [[ "$free_mb" -lt "$MIN_FREE_DISK_MB" ]]; then
+                low_space="yes"
+            else
+                log "Space recovered from logs/cache: ${free_mb}MB free"
+            fi
+        fi
+    fi
+
+    # Nothing to enforce: skip the tree scan
+    [[ -n "$low_space" || "$MAX_DISK_MB" -gt 0 ]] || return 0
+
+    if run_retention; then
+        return 0
+    fi
+
+    # Fallback: legacy per-file loops
+    prune_if_needed
+    prune_if_max_exceeded
+}
+
 #---------------------------
 # Background pruning loop
 # Runs in background during recording to check disk space periodically
@@ -266,8 +345,7 @@ start_prune_loop() {
         exec </dev/null
         while true; do
             sleep "$PRUNE_CHECK_INTERVAL"
-            prune_if_needed       # Check MIN_FREE_DISK_MB (free space)
-            prune_if_max_exceeded # Check MAX_DISK_MB (folder size limit)
+            enforce_retention     # MIN_FREE_DISK_MB (free space) + MAX_DISK_MB (folder size)
         done
     ) &
     PRUNE_PID=$!
@@ -365,6 +443,17 @@ stop_inotify_watcher() {
     INOTIFY_PID=""
 }
 
+#---------------------------
+# In-process CSI recording
+# rpi_csi_rtsp_server.py writes the segments itself (and notifies the web
+# manager), so neither ffmpeg nor the inotify watcher are needed meanwhile.
+#---------------------------
+csi_inprocess_recording() {
+    [[ "$CSI_RECORD_MODE" == "inprocess" ]] || return 1
+    curl -s --connect-timeout 2 --max-time 3 "http://127.0.0.1:${CSI_CONTROL_PORT}/stats" 2>/dev/null | \
+        grep -q '"recording_inprocess": true'
+}
+
 #---------------------------
 # Wait for RTSP server
 #---------------------------
@@ -393,6 +482,64 @@ wait_for_rtsp() {
     return 1
 }
 
+#---------------------------
+# Segmenter mode helpers
+#---------------------------
+find_segmenter() {
+    local candidate
+    for candidate in "$(dirname "$0")/rtsp_segmenter.py" /usr/local/bin/rtsp_segmenter.py; do
+        if [[ -f "$candidate" ]]; then
+            echo "$candidate"
+            return 0
+        fi
+    done
+    return 1
+}
+
+use_segmenter() {
+    [[ "$RECORDER_MODE" == "segmenter" ]] && cmd_exists python3 && find_segmenter >/dev/null
+}
+
+#---------------------------
+# Record stream through rtsp_segmenter.py
+# ffmpeg remains the single RTSP client and only remuxes to MPEG-TS on stdout;
+# the segmenter splits on IDR frames, keeps the pre-roll buffer for clips and
+# notifies the web manager itself (no inotify watcher needed).
+#---------------------------
+record_stream_segmenter() {
+    local rtsp_url="$1"
+    local segmenter
+    segmenter="$(find_segmenter)"
+    log "Recorder mode: segmenter ($segmenter), clip API on 127.0.0.1:${CLIP_CONTROL_PORT}"
+
+    ffmpeg -hide_banner -loglevel warning \
+        -rtsp_transport tcp \
+        -analyzeduration 10000000 \
+        -probesize 10000000 \
+        -fflags +genpts \
+        -use_wallclock_as_timestamps 1 \
+        -i "$rtsp_url" \
+        -map 0:v -map 0:a? \
+        -c:v copy \
+        -c:a aac -b:a 64k \
+        -f mpegts \
+        -mpegts_flags +resend_headers \
+        pipe:1 \
+        2> >(while read -r line; do log "ffmpeg: $line"; done) | \
+    RECORD_DIR="$RECORD_DIR" \
+    SEGMENT_SECONDS="$SEGMENT_SECONDS" \
+    WEBMANAGER_PORT="$WEBMANAGER_PORT" \
+    CLIP_CONTROL_PORT="$CLIP_CONTROL_PORT" \
+    CLIP_PREROLL_MAX_SECONDS="$CLIP_PREROLL_MAX_SECONDS" \
+        python3 -u "$segmenter" 2>&1 | while read -r line; do
+            log "segmenter: $line"
+        done
+
+    local statuses=("${PIPESTATUS[@]}")
+    log "ffmpeg exited with code: ${statuses[0]}, segmenter: ${statuses[1]}"
+    return "${statuses[0]}"
+}
+
 #---------------------------
 # Record stream
 #---------------------------
@@ -408,6 +555,11 @@ record_stream() {
     log "Segment duration: ${SEGMENT_SECONDS}s"
     log "Disk limits: MIN_FREE=${MIN_FREE_DISK_MB}MB, MAX_FOLDER=${MAX_DISK_MB}MB (0=unlimited)"
     
+    if use_segmenter; then
+        record_stream_segmenter "$rtsp_url"
+        return $?
+    fi
+    
     # Use ffmpeg with segment muxer for robust recordings
     # - segment_time: duration of each segment
     # - segment_format: output format (mpegts for robustness)
@@ -463,7 +615,7 @@ main() {
     setup_fs
     
     log "=========================================="
-    log "RTSP Recorder v1.8.0"
+    log "RTSP Recorder v1.11.0"
     log "=========================================="
     
     # Check if recording is enabled
@@ -484,6 +636,10 @@ main() {
     log "Config: MIN_FREE_DISK_MB=${MIN_FREE_DISK_MB}"
     log "Config: MAX_DISK_MB=${MAX_DISK_MB}"
     log "Config: PRUNE_CHECK_INTERVAL=${PRUNE_CHECK_INTERVAL}s"
+    log "Config: RECORDER_MODE=${RECORDER_MODE}"
+    if [[ "$RECORDER_MODE" == "segmenter" ]] && ! use_segmenter; then
+        log_err "RECORDER_MODE=segmenter but python3/rtsp_segmenter.py unavailable - using ffmpeg segment muxer"
+    fi
 
     # Wait for RTSP server
     if ! wait_for_rtsp; then
@@ -491,16 +647,33 @@ main() {
     fi
 
     # Prune old recordings if needed (initial cleanup)
-    prune_if_needed
+    enforce_retention
     
     # Start background pruning loop
     start_prune_loop
     
-    # Start inotify watcher for thumbnail notifications
-    start_inotify_watcher
-
     # Main recording loop - restart on failure
+    local inprocess_logged=""
     while true; do
+        if csi_inprocess_recording; then
+            if [[ -z "$inprocess_logged" ]]; then
+                log "CSI server is recording in-process - ffmpeg recorder idle (pruning still active)"
+                inprocess_logged="yes"
+            fi
+            stop_inotify_watcher
+            sleep 30
+            continue
+        fi
+        inprocess_logged=""
+
+        # Start inotify watcher for thumbnail notifications
+        # (the segmenter notifies the web manager itself)
+        if use_segmenter; then
+            stop_inotify_watcher
+        elif [[ -z "$INOTIFY_PID" ]]; then
+            start_inotify_watcher
+        fi
+
         log "Starting recording session..."
         
         if record_stream; then
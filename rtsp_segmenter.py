@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""
+rtsp_segmenter.py
+Version: 1.0.0
+
+MPEG-TS segmenter for rtsp_recorder.sh (RECORDER_MODE=segmenter).
+
+ffmpeg stays the only RTSP client and remuxes the stream to MPEG-TS on
+stdout; this process reads the TS packets and:
+- splits segments exactly on IDR frames (random_access_indicator on the
+  video PID) once SEGMENT_SECONDS is reached, instead of ffmpeg's segment
+  muxer cutting at whatever keyframe follows the deadline,
+- keeps a rolling in-memory buffer of the last GOPs (CLIP_PREROLL_MAX_SECONDS),
+- writes event clips (pre-roll from that buffer + post-roll from the live
+  stream) on demand through a local HTTP API (POST /clip on CLIP_CONTROL_PORT),
+- notifies the web manager (/api/recordings/thumbnail/notify) for every
+  closed segment or clip.
+
+Usage: ffmpeg ... -f mpegts pipe:1 | rtsp_segmenter.py
+Configuration comes from the environment (rtsp_recorder.sh exports config.env).
+"""
+
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] [SEGMENTER] %(levelname)s: %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+# ==============================================================================
+# Configuration
+# ==============================================================================
+CONF = {
+    'RECORD_DIR': os.environ.get('RECORD_DIR', '/var/cache/rpi-cam/recordings'),
+    'SEGMENT_SECONDS': int(os.environ.get('SEGMENT_SECONDS', 300)),
+    'WEBMANAGER_PORT': int(os.environ.get('WEBMANAGER_PORT', 5000)),
+    'CLIP_CONTROL_PORT': int(os.environ.get('CLIP_CONTROL_PORT', 8086)),
+    'CLIP_PREROLL_MAX_SECONDS': int(os.environ.get('CLIP_PREROLL_MAX_SECONDS', 30)),
+    'CLIP_POSTROLL_MAX_SECONDS': int(os.environ.get('CLIP_POSTROLL_MAX_SECONDS', 300)),
+    # Hard cap on the rolling buffer, whatever the bitrate
+    'CLIP_BUFFER_MAX_MB': int(os.environ.get('CLIP_BUFFER_MAX_MB', 64)),
+}
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+READ_PACKETS = 348  # ~64 KB per read
+PTS_CLOCK = 90000
+PTS_WRAP = 1 << 33
+
+# PMT stream types carrying video with IDR/random access points
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24}
+
+
+# ==============================================================================
+# MPEG-TS parsing helpers
+# ==============================================================================
+def ts_pid(packet) -> int:
+    return ((packet[1] & 0x1F) << 8) | packet[2]
+
+
+def ts_payload_unit_start(packet) -> bool:
+    return bool(packet[1] & 0x40)
+
+
+def ts_payload_offset(packet) -> int:
+    """Offset of the payload in a TS packet (after the adaptation field)."""
+    afc = (packet[3] >> 4) & 0x03
+    if afc in (2, 3):
+        return 5 + packet[4]
+    return 4
+
+
+def ts_random_access(packet) -> bool:
+    """True if the adaptation field sets random_access_indicator (keyframe)."""
+    afc = (packet[3] >> 4) & 0x03
+    return afc in (2, 3) and packet[4] > 0 and bool(packet[5] & 0x40)
+
+
+def pes_pts(packet) -> Optional[int]:
+    """PTS (90 kHz) of the PES header starting in this packet, if any."""
+    offset = ts_payload_offset(packet)
+    if offset + 14 > TS_PACKET_SIZE:
+        return None
+    if packet[offset] != 0 or packet[offset + 1] != 0 or packet[offset + 2] != 1:
+        return None
+    if not packet[offset + 7] & 0x80:
+        return None
+    p = offset + 9
+    return (((packet[p] >> 1) & 0x07) << 30 | packet[p + 1] << 22 |
+            (packet[p + 2] >> 1) << 15 | packet[p + 3] << 7 | packet[p + 4] >> 1)
+
+
+def parse_pat(packet) -> Optional[int]:
+    """Return the first program's PMT PID from a PAT packet."""
+    offset = ts_payload_offset(packet)
+    offset += 1 + packet[offset]  # pointer_field
+    if packet[offset] != 0x00:
+        return None
+    section_length = ((packet[offset + 1] & 0x0F) << 8) | packet[offset + 2]
+    end = min(offset + 3 + section_length - 4, TS_PACKET_SIZE)
+    pos = offset + 8
+    while pos + 4 <= end:
+        program = (packet[pos] << 8) | packet[pos + 1]
+        pid = ((packet[pos + 2] & 0x1F) << 8) | packet[pos + 3]
+        if program != 0:
+            return pid
+        pos += 4
+    return None
+
+
+def parse_pmt_video_pid(packet) -> Optional[int]:
+    """Return the video elementary PID from a PMT packet."""
+    offset = ts_payload_offset(packet)
+    offset += 1 + packet[offset]
+    if packet[offset] != 0x02:
+        return None
+    section_length = ((packet[offset + 1] & 0x0F) << 8) | packet[offset + 2]
+    end = min(offset + 3 + section_length - 4, TS_PACKET_SIZE)
+    program_info_length = ((packet[offset + 10] & 0x0F) << 8) | packet[offset + 11]
+    pos = offset + 12 + program_info_length
+    while pos + 5 <= end:
+        stream_type = packet[pos]
+        pid = ((packet[pos + 1] & 0x1F) << 8) | packet[pos + 2]
+        es_info_length = ((packet[pos + 3] & 0x0F) << 8) | packet[pos + 4]
+        if stream_type in VIDEO_STREAM_TYPES:
+            return pid
+        pos += 5 + es_info_length
+    return None
+
+
+# ==============================================================================
+# GOP buffer, segments and clips
+# ==============================================================================
+class Gop:
+    """Packets from one IDR (inclusive) to the next (exclusive)."""
+    __slots__ = ('pts', 'data')
+
+    def __init__(self, pts: int):
+        self.pts = pts
+        self.data = bytearray()
+
+
+class TsOutputFile:
+    """A .ts file being written (segment or clip), always starting with PAT/PMT."""
+
+    def __init__(self, path: str, psi: bytes, start_pts: int):
+        self.path = path
+        self.start_pts = start_pts
+        self.handle = open(path, 'wb', buffering=256 * 1024)
+        self.handle.write(psi)
+        self.bytes_written = len(psi)
+
+    def write(self, data):
+        self.handle.write(data)
+        self.bytes_written += len(data)
+
+    def close(self) -> str:
+        self.handle.close()
+        return self.path
+
+
+class ClipJob:
+    def __init__(self, path: str, pre_seconds: float, post_seconds: float, requested_at: float):
+        self.path = path
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.requested_at = requested_at
+        self.output: Optional[TsOutputFile] = None
+        self.end_pts: Optional[int] = None
+
+
+class TsSegmenter:
+    """
+    Splits an MPEG-TS stream into IDR-aligned segments and event clips.
+
+    Packets are consumed by feed() from a single thread; clip requests come
+    from the control API thread and are picked up at the next GOP boundary.
+    """
+
+    def __init__(self, conf: Dict[str, Any], notify=None):
+        self.record_dir = conf['RECORD_DIR']
+        self.segment_ticks = max(1, int(conf['SEGMENT_SECONDS'])) * PTS_CLOCK
+        self.preroll_max_ticks = max(0, int(conf['CLIP_PREROLL_MAX_SECONDS'])) * PTS_CLOCK
+        self.postroll_max_seconds = max(0, int(conf['CLIP_POSTROLL_MAX_SECONDS']))
+        self.buffer_max_bytes = max(1, int(conf['CLIP_BUFFER_MAX_MB'])) * 1024 * 1024
+        self.notify = notify
+
+        self.pmt_pid: Optional[int] = None
+        self.video_pid: Optional[int] = None
+        self.pat_packet: Optional[bytes] = None
+        self.pmt_packet: Optional[bytes] = None
+
+        self.gops: deque = deque()   # closed GOPs (rolling pre-roll buffer)
+        self.gops_bytes = 0
+        self.current_gop: Optional[Gop] = None
+        self.segment: Optional[TsOutputFile] = None
+        self.clips: List[ClipJob] = []
+        self._pending_clips: List[ClipJob] = []
+        self._lock = threading.Lock()
+
+        self._last_pts_raw: Optional[int] = None
+        self._pts_offset = 0
+        self._partial = b''
+
+        self.packets = 0
+        self.segments_closed = 0
+        self.clips_written = 0
+        self.resyncs = 0
+
+    # --------------------------------------------------------------------------
+    # Input
+    # --------------------------------------------------------------------------
+    def feed(self, data: bytes):
+        """Consume raw TS bytes (any length)."""
+        if self._partial:
+            data = self._partial + data
+            self._partial = b''
+        view = memoryview(data)
+        pos = 0
+        end = len(view)
+        while pos + TS_PACKET_SIZE <= end:
+            if view[pos] != TS_SYNC_BYTE:
+                # Lost sync: skip to the next sync byte
+                next_sync = data.find(b'\x47', pos + 1)
+                self.resyncs += 1
+                if next_sync == -1:
+                    pos = end
+                    break
+                pos = next_sync
+                continue
+            self._on_packet(view[pos:pos + TS_PACKET_SIZE])
+            pos += TS_PACKET_SIZE
+        if pos < end:
+            self._partial = bytes(view[pos:])
+
+    def _unwrap_pts(self, pts: int) -> int:
+        if self._last_pts_raw is not None and pts - self._last_pts_raw < -(PTS_WRAP // 2):
+            self._pts_offset += PTS_WRAP
+        self._last_pts_raw = pts
+        return pts + self._pts_offset
+
+    def _on_packet(self, packet):
+        self.packets += 1
+        pid = ts_pid(packet)
+
+        if pid == 0 and ts_payload_unit_start(packet):
+            self.pat_packet = bytes(packet)
+            self.pmt_pid = parse_pat(packet)
+            return
+        if pid == self.pmt_pid and self.pmt_pid is not None and ts_payload_unit_start(packet):
+            self.pmt_packet = bytes(packet)
+            video_pid = parse_pmt_video_pid(packet)
+            if video_pid is not None and video_pid != self.video_pid:
+                logger.info(f"Video PID: 0x{video_pid:04x}")
+                self.video_pid = video_pid
+            return
+
+        if (pid == self.video_pid and ts_payload_unit_start(packet)
+                and ts_random_access(packet)):
+            pts = pes_pts(packet)
+            if pts is not None:
+                self._on_keyframe(self._unwrap_pts(pts))
+
+        if self.current_gop is None:
+            return  # nothing is written before the first IDR
+        self.current_gop.data += packet
+        if self.segment:
+            self.segment.write(packet)
+        for clip in self.clips:
+            clip.output.write(packet)
+
+    # --------------------------------------------------------------------------
+    # GOP boundaries
+    # --------------------------------------------------------------------------
+    def _psi(self) -> bytes:
+        return (self.pat_packet or b'') + (self.pmt_packet or b'')
+
+    def _on_keyframe(self, pts: int):
+        """Called on each IDR before its first packet is stored."""
+        if self.current_gop is not None:
+            self._push_gop(self.current_gop)
+        self.current_gop = Gop(pts)
+
+        # Segment: cut exactly on this IDR once the duration is reached
+        if self.segment is None or pts - self.segment.start_pts >= self.segment_ticks:
+            self._rotate_segment(pts)
+
+        # Clips: finish the ones past their post-roll, start the pending ones
+        for clip in list(self.clips):
+            if pts >= clip.end_pts:
+                self._finish_clip(clip)
+        with self._lock:
+            pending, self._pending_clips = self._pending_clips, []
+        for clip in pending:
+            self._start_clip(clip, pts)
+
+    def _push_gop(self, gop: Gop):
+        self.gops.append(gop)
+        self.gops_bytes += len(gop.data)
+        # Keep enough GOPs to cover the max pre-roll from the newest IDR
+        while len(self.gops) > 1 and (
+                self.gops[1].pts <= gop.pts - self.preroll_max_ticks
+                or self.gops_bytes > self.buffer_max_bytes):
+            self.gops_bytes -= len(self.gops.popleft().data)
+
+    def _rotate_segment(self, pts: int):
+        if self.segment is not None:
+            path = self.segment.close()
+            self.segments_closed += 1
+            logger.info(f"Segment closed: {os.path.basename(path)} ({self.segment.bytes_written // 1024} KB)")
+            if self.notify:
+                self.notify(path)
+        path = self._unique_path('rec')
+        self.segment = TsOutputFile(path, self._psi(), pts)
+        logger.info(f"Recording segment: {os.path.basename(path)}")
+
+    def _unique_path(self, prefix: str, taken=()) -> str:
+        name = time.strftime(f'{prefix}_%Y%m%d_%H%M%S')
+        path = os.path.join(self.record_dir, f"{name}.ts")
+        suffix = 1
+        while os.path.exists(path) or path in taken:
+            path = os.path.join(self.record_dir, f"{name}_{suffix}.ts")
+            suffix += 1
+        return path
+
+    # --------------------------------------------------------------------------
+    # Clips
+    # --------------------------------------------------------------------------
+    def request_clip(self, pre_seconds: float, post_seconds: float) -> Dict[str, Any]:
+        """Queue an event clip (thread-safe). Returns the clip file name."""
+        pre_seconds = max(0.0, min(float(pre_seconds), self.preroll_max_ticks / PTS_CLOCK))
+        post_seconds = max(0.0, min(float(post_seconds), float(self.postroll_max_seconds)))
+        if self.video_pid is None:
+            return {'success': False, 'message': 'No video stream yet'}
+        with self._lock:
+            taken = {c.path for c in self._pending_clips + self.clips}
+            path = self._unique_path('clip', taken)
+            self._pending_clips.append(ClipJob(path, pre_seconds, post_seconds, time.time()))
+        logger.info(f"Clip requested: {os.path.basename(path)} (pre {pre_seconds}s, post {post_seconds}s)")
+        return {
+            'success': True,
+            'filename': os.path.basename(path),
+            'pre_seconds': pre_seconds,
+            'post_seconds': post_seconds,
+        }
+
+    def _start_clip(self, clip: ClipJob, pts: int):
+        """Write the pre-roll from the GOP buffer, then follow the live stream."""
+        # Trigger time in stream ticks, corrected for the wait until this IDR
+        waited = max(0.0, time.time() - clip.requested_at)
+        trigger_pts = pts - int(waited * PTS_CLOCK)
+        start_pts = trigger_pts - int(clip.pre_seconds * PTS_CLOCK)
+        clip.end_pts = trigger_pts + int(clip.post_seconds * PTS_CLOCK)
+
+        # Newest GOP starting at or before start_pts (or the oldest we have)
+        first = 0
+        for i, gop in enumerate(self.gops):
+            if gop.pts <= start_pts:
+                first = i
+        preroll = list(self.gops)[first:] if clip.pre_seconds > 0 else []
+
+        clip.output = TsOutputFile(clip.path, self._psi(), preroll[0].pts if preroll else pts)
+        for gop in preroll:
+            clip.output.write(gop.data)
+        if clip.post_seconds <= 0 or pts >= clip.end_pts:
+            self._finish_clip(clip, started=False)
+        else:
+            self.clips.append(clip)
+
+    def _finish_clip(self, clip: ClipJob, started: bool = True):
+        if started:
+            self.clips.remove(clip)
+        path = clip.output.close()
+        self.clips_written += 1
+        logger.info(f"Clip written: {os.path.basename(path)} ({clip.output.bytes_written // 1024} KB)")
+        if self.notify:
+            self.notify(path)
+
+    # --------------------------------------------------------------------------
+    # Shutdown / status
+    # --------------------------------------------------------------------------
+    def close(self):
+        """Flush the current segment and any clip in progress."""
+        for clip in list(self.clips):
+            self._finish_clip(clip)
+        if self.segment is not None:
+            path = self.segment.close()
+            self.segment = None
+            self.segments_closed += 1
+            if self.notify:
+                self.notify(path)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending_clips)
+        buffered = (self.gops[-1].pts - self.gops[0].pts) / PTS_CLOCK if len(self.gops) > 1 else 0.0
+        return {
+            'video_pid': self.video_pid,
+            'packets': self.packets,
+            'resyncs': self.resyncs,
+            'current_segment': os.path.basename(self.segment.path) if self.segment else None,
+            'segments_closed': self.segments_closed,
+            'preroll_buffer': {
+                'gops': len(self.gops),
+                'seconds': round(buffered, 2),
+                'bytes': self.gops_bytes,
+                'max_seconds': self.preroll_max_ticks // PTS_CLOCK,
+            },
+            'clips_in_progress': len(self.clips),
+            'clips_pending': pending,
+            'clips_written': self.clips_written,
+        }
+
+
+# ==============================================================================
+# Web manager notification
+# ==============================================================================
+def notify_web_manager(filepath: str):
+    """POST the closed file to the thumbnail/index hook (background thread)."""
+    url = f"http://127.0.0.1:{CONF['WEBMANAGER_PORT']}/api/recordings/thumbnail/notify"
+
+    def _send():
+        payload = json.dumps({'filepath': filepath}).encode()
+        for attempt in range(1, 4):
+            try:
+                req = urllib.request.Request(url, data=payload, method='POST',
+                                             headers={'Content-Type': 'application/json'})
+                with urllib.request.urlopen(req, timeout=30):
+                    pass
+                logger.info(f"Thumbnail notification sent for: {os.path.basename(filepath)}")
+                return
+            except Exception as e:
+                logger.debug(f"Thumbnail notification failed (attempt {attempt}/3): {e}")
+                time.sleep(5)
+        logger.warning(f"Failed to notify thumbnail generation for: {os.path.basename(filepath)}")
+
+    threading.Thread(target=_send, daemon=True).start()
+
+
+# ==============================================================================
+# Control API (clips)
+# ==============================================================================
+class ClipRequestHandler(BaseHTTPRequestHandler):
+    segmenter: Optional[TsSegmenter] = None
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != '/clip':
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            data = json.loads(self.rfile.read(length) or b'{}')
+            result = self.segmenter.request_clip(
+                data.get('pre_seconds', 10), data.get('post_seconds', 10)
+            )
+            self._send_json(202 if result['success'] else 503, result)
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {'success': False, 'message': str(e)})
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.segmenter.get_status())
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# ==============================================================================
+# Main
+# ==============================================================================
+def main() -> int:
+    os.makedirs(CONF['RECORD_DIR'], exist_ok=True)
+    segmenter = TsSegmenter(CONF, notify=notify_web_manager)
+
+    ClipRequestHandler.segmenter = segmenter
+    try:
+        control = ThreadingHTTPServer(('127.0.0.1', CONF['CLIP_CONTROL_PORT']), ClipRequestHandler)
+        control.daemon_threads = True
+        threading.Thread(target=control.serve_forever, daemon=True).start()
+        logger.info(f"Clip API listening on 127.0.0.1:{CONF['CLIP_CONTROL_PORT']}")
+    except OSError as e:
+        logger.error(f"Clip API unavailable: {e}")
+
+    def _stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _stop)
+    logger.info(
+        f"Segmenting to {CONF['RECORD_DIR']} every {CONF['SEGMENT_SECONDS']}s (IDR-aligned), "
+        f"pre-roll buffer {CONF['CLIP_PREROLL_MAX_SECONDS']}s"
+    )
+
+    stream = sys.stdin.buffer.raw
+    try:
+        while True:
+            chunk = stream.read(TS_PACKET_SIZE * READ_PACKETS)
+            if not chunk:
+                break
+            segmenter.feed(chunk)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        segmenter.close()
+        logger.info(f"Input closed: {segmenter.get_status()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -49,6 +49,15 @@ sed -i '1s/^\xEF\xBB\xBF//' /usr/local/bin/rtsp_recorder.sh
 # Convert line endings if needed
 sed -i 's/\r$//' /usr/local/bin/rtsp_recorder.sh
 
+# Optional segmenter (RECORDER_MODE=segmenter: IDR-exact segments + event clips)
+SEGMENTER_SRC="$(dirname "${RECORDER_SRC}")/rtsp_segmenter.py"
+if [[ -f "${SEGMENTER_SRC}" ]]; then
+    echo "Installing rtsp_segmenter.py from ${SEGMENTER_SRC}..."
+    cp "${SEGMENTER_SRC}" /usr/local/bin/rtsp_segmenter.py
+    chmod +x /usr/local/bin/rtsp_segmenter.py
+    sed -i 's/\r$//' /usr/local/bin/rtsp_segmenter.py
+fi
+
 # Create systemd service
 echo "Creating systemd service..."
 cat > /etc/systemd/system/rtsp-recorder.service << 'EOF'
@@ -107,4 +116,5 @@ echo "  - RECORD_ENABLE=yes|no"
 echo "  - RECORD_DIR=/var/cache/rpi-cam/recordings"
 echo "  - SEGMENT_SECONDS=300"
 echo "  - MIN_FREE_DISK_MB=1000 (0=disabled)"
+echo "  - RECORDER_MODE=ffmpeg|segmenter (segmenter = IDR-exact segments + event clips)"
 echo ""
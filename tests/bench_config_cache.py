@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: config_service.load_config with the parsed config cache
+
+Writes a config.env of the usual size in a temp dir, then compares:
+- the previous load_config (open + parse + type coercion + legacy mapping
+  on every call, now config_service._parse_config_file),
+- load_config (cached snapshot + dict copy),
+- get_config_snapshot (cached read-only mapping, no copy).
+
+Also checks that the cache is invalidated by save_config and by an external
+rewrite of the file, that subscribers receive the changed keys and that
+wait_for_config_change wakes up early.
+
+Usage: python3 tests/bench_config_cache.py [calls]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import config_service as cs  # noqa: E402
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    for _ in range(CALLS):
+        fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {CALLS:>7} calls  {elapsed:>7.3f} s  {elapsed / CALLS * 1e6:>8.1f} us/call")
+    return elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        cs.CONFIG_FILE = os.path.join(tmp, 'config.env')
+        cs.invalidate_config_cache()
+        config = dict(cs.DEFAULT_CONFIG)
+        config.update({f'EXTRA_SETTING_{i}': f'value {i}' for i in range(20)})
+        check("save_config", cs.save_config(config)['success'])
+        print(f"[BENCH] config.env: {os.path.getsize(cs.CONFIG_FILE)} bytes, {len(config)} keys\n")
+
+        legacy = timed('legacy: parse file per call', cs._parse_config_file)
+        cached = timed('load_config (cached, dict copy)', cs.load_config)
+        timed('get_config_snapshot (cached, no copy)', cs.get_config_snapshot)
+        print(f"\nspeedup load_config x{legacy / cached:.0f}\n")
+
+        check("cached load_config equals a fresh parse", cs.load_config() == cs._parse_config_file())
+        snapshot = cs.get_config_snapshot()
+        try:
+            snapshot['RTSP_PORT'] = '1'
+            check("snapshot is read-only", False)
+        except TypeError:
+            check("snapshot is read-only", True)
+        copy = cs.load_config()
+        copy['RTSP_PORT'] = '1'
+        check("load_config returns an independent copy", cs.load_config()['RTSP_PORT'] != '1')
+
+        events = []
+        callback = cs.subscribe_config_changes(lambda keys, snap: events.append(set(keys)))
+        cs.save_config({'EXTRA_SETTING_1': 'changed'})
+        check(f"save_config notifies subscribers ({events})", events == [{'EXTRA_SETTING_1'}])
+        check("save_config invalidates", cs.load_config()['EXTRA_SETTING_1'] == 'changed')
+
+        # External writer (same size, in place): picked up through the file signature
+        with open(cs.CONFIG_FILE) as f:
+            content = f.read()
+        time.sleep(0.01)
+        with open(cs.CONFIG_FILE, 'w') as f:
+            f.write(content.replace('EXTRA_SETTING_2="value 2"', 'EXTRA_SETTING_2="value X"'))
+        check("external edit picked up", cs.load_config()['EXTRA_SETTING_2'] == 'value X')
+        check(f"external edit notified ({events[-1]})", events[-1] == {'EXTRA_SETTING_2'})
+        cs.unsubscribe_config_changes(callback)
+
+        def edit_later():
+            time.sleep(0.3)
+            cs.save_config({'EXTRA_SETTING_3': 'woken'})
+        threading.Thread(target=edit_later).start()
+        started = time.monotonic()
+        changed = cs.wait_for_config_change(10, keys=['EXTRA_SETTING_3'])
+        waited = time.monotonic() - started
+        check(f"wait_for_config_change woke after {waited:.2f} s ({set(changed)})",
+              changed == {'EXTRA_SETTING_3'} and waited < 2)
+
+        stop = threading.Event()
+        threading.Timer(0.2, stop.set).start()
+        started = time.monotonic()
+        changed = cs.wait_for_config_change(10, stop_event=stop)
+        check("wait_for_config_change honours stop_event", not changed and time.monotonic() - started < 2)
+
+        stats = cs.get_config_cache_stats()
+        print(f"\n[STATS] {stats}")
+        check("hit ratio > 0.99", stats['hit_ratio'] > 0.99)
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
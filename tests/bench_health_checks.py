@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Benchmark: watchdog / status health sweep, shell commands vs fork-free backend
+
+Starts a private dbus-daemon with a fake org.freedesktop.systemd1 (unit
+properties served over the same minimal D-Bus client), points
+system_health_service at it, then times one full health sweep:
+- legacy: `systemctl is-active` + `systemctl show` per service,
+  `ss | grep`, `pgrep -f`, `rpicam-hello --list-cameras` / `v4l2-ctl`,
+- current: get_all_services_status + watchdog checks (D-Bus batch,
+  /proc/net/tcp, /proc/<pid>/stat, V4L2 ioctls).
+
+Also checks the D-Bus values (state, timestamp, memory, PID), the
+listening port / process helpers and the systemctl fallback when the bus
+is unreachable.
+
+Usage: python3 tests/bench_health_checks.py [sweeps]
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import system_health_service as health  # noqa: E402
+from services import config_service as cs  # noqa: E402
+from services.platform_service import run_command  # noqa: E402
+from config import SERVICE_NAME  # noqa: E402
+
+SWEEPS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+ENTER_USEC = 1767693600 * 1000000
+UNITS = {
+    f'{SERVICE_NAME}.service': {'ActiveState': ('s', 'active'), 'ActiveEnterTimestamp': ('t', ENTER_USEC),
+                                'MainPID': ('u', os.getpid()), 'MemoryCurrent': ('t', 52428800)},
+    'rpi-cam-onvif.service': {'ActiveState': ('s', 'active'), 'ActiveEnterTimestamp': ('t', ENTER_USEC),
+                              'MainPID': ('u', 1), 'MemoryCurrent': ('t', health.SYSTEMD_UINT64_UNSET)},
+}
+INACTIVE = {'ActiveState': ('s', 'inactive'), 'ActiveEnterTimestamp': ('t', 0),
+            'MainPID': ('u', 0), 'MemoryCurrent': ('t', health.SYSTEMD_UINT64_UNSET)}
+
+BUS_CONFIG = """<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-Bus Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>custom</type>
+  <listen>unix:path={socket}</listen>
+  <auth>EXTERNAL</auth>
+  <policy context="default">
+    <allow user="*"/>
+    <allow own="*"/>
+    <allow send_destination="*"/>
+    <allow receive_sender="*"/>
+  </policy>
+</busconfig>
+"""
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def fake_systemd(address, ready):
+    """Answer org.freedesktop.DBus.Properties.Get for the units above."""
+    paths = {health.systemd_unit_path(name): name for name in UNITS}
+    bus = health.SystemBus(address)
+    bus.connect()
+    bus.call('org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus',
+             'RequestName', 'su', health.SYSTEMD_BUS_NAME, 4)
+    ready.set()
+    while True:
+        try:
+            message = bus.read_message()
+        except (OSError, health.SystemBusError):
+            return
+        if message['type'] != health.DBUS_METHOD_CALL or message.get('member') != 'Get':
+            continue
+        interface, prop = message['body']
+        unit = paths.get(message['path'])
+        properties = UNITS[unit] if unit else INACTIVE  # systemd loads unknown units as not-found
+        value = properties.get(prop)
+        if value is None or not interface.startswith('org.freedesktop.systemd1.'):
+            reply = health.encode_message(health.DBUS_ERROR, bus.next_serial(), 's', [f'Unknown property {prop}'],
+                                          error_name='org.freedesktop.DBus.Error.UnknownProperty',
+                                          reply_serial=message['serial'], destination=message['sender'])
+        else:
+            reply = health.encode_message(health.DBUS_METHOD_RETURN, bus.next_serial(), 'v', [value],
+                                          reply_serial=message['serial'], destination=message['sender'])
+        bus.send(reply)
+
+
+def legacy_sweep(services):
+    """Previous watchdog iteration + status page: one or two forks per check."""
+    statuses = {name: cs._get_service_status_systemctl(name) for name in services}
+    run_command('ss -tuln | grep -q ":8554" && echo "OK"', timeout=3)
+    run_command('pgrep -f "test-launch|rpi_csi_rtsp_server" >/dev/null && echo "OK"', timeout=2)
+    run_command("rpicam-hello --list-cameras 2>&1", timeout=5)
+    for i in range(10):
+        if os.path.exists(f"/dev/video{i}"):
+            run_command(f"v4l2-ctl -d /dev/video{i} --info 2>/dev/null", timeout=5)
+    return statuses
+
+
+def current_sweep():
+    statuses = cs.get_all_services_status()
+    main = statuses[SERVICE_NAME]
+    health.is_port_listening(8554)
+    health.is_process_running(int(main.get('pid') or 0))
+    health.detect_camera()
+    return statuses
+
+
+def timed(label, fn):
+    fn()  # warm-up (connection, imports)
+    started = time.perf_counter()
+    for _ in range(SWEEPS):
+        result = fn()
+    elapsed = (time.perf_counter() - started) / SWEEPS
+    print(f"{label:<48} {elapsed * 1000:>8.2f} ms/sweep")
+    return elapsed, result
+
+
+def main():
+    daemon = shutil.which('dbus-daemon')
+    if not daemon:
+        print("✗ dbus-daemon not found")
+        sys.exit(1)
+    tmp = tempfile.mkdtemp(prefix='bench_health_')
+    bus_socket = os.path.join(tmp, 'bus')
+    with open(os.path.join(tmp, 'bus.conf'), 'w') as f:
+        f.write(BUS_CONFIG.format(socket=bus_socket))
+    process = subprocess.Popen([daemon, f'--config-file={tmp}/bus.conf', '--nofork', '--print-address'],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        address = process.stdout.readline().strip()
+        os.environ['DBUS_SYSTEM_BUS_ADDRESS'] = address
+        ready = threading.Event()
+        threading.Thread(target=fake_systemd, args=(address, ready), daemon=True).start()
+        check(f"private bus + fake systemd ({address})", ready.wait(5))
+
+        # D-Bus values
+        states = health.get_unit_states([SERVICE_NAME, 'rpi-cam-onvif', 'no-such-unit'])
+        main_state = states[SERVICE_NAME]
+        check(f"main unit: active, pid, 50 MB ({main_state})", main_state['active_state'] == 'active'
+              and main_state['main_pid'] == os.getpid() and main_state['memory_bytes'] == 52428800)
+        check(f"ActiveEnterTimestamp formatted like systemctl ({main_state['since']})",
+              main_state['since'] == time.strftime('%a %Y-%m-%d %H:%M:%S %Z', time.localtime(ENTER_USEC / 1e6)))
+        check("MemoryCurrent unset -> None", states['rpi-cam-onvif']['memory_bytes'] is None)
+        check("unknown unit -> inactive", states['no-such-unit']['active_state'] == 'inactive')
+        status = cs.get_service_status()
+        check(f"get_service_status over D-Bus ({status})", status['active'] and status['memory'] == '50.0 MB'
+              and status['pid'] == str(os.getpid()))
+
+        # /proc helpers
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        check(f"port {port} listening (/proc/net/tcp)", health.is_port_listening(port) is True)
+        listener.close()
+        check(f"port {port} closed", health.is_port_listening(port) is False)
+        sleeper = subprocess.Popen(['sleep', '29.75'])
+        deadline = time.monotonic() + 2  # /proc/<pid>/cmdline can lag the exec slightly
+        pids = health.find_pids(r'^sleep 29\.75$')
+        while not pids and time.monotonic() < deadline:
+            time.sleep(0.01)
+            pids = health.find_pids(r'^sleep 29\.75$')
+        check(f"find_pids('sleep 29.75') -> {pids} (child {sleeper.pid})", pids == [sleeper.pid])
+        stat = health.read_process_stat(sleeper.pid)
+        check(f"/proc/<pid>/stat: {stat}", stat and stat['name'] == 'sleep' and stat['ppid'] == os.getpid())
+        sleeper.kill()
+        time.sleep(0.1)
+        check("killed child not reaped -> zombie, not running", not health.is_process_running(sleeper.pid))
+        sleeper.wait()
+        check("reaped -> gone", health.read_process_stat(sleeper.pid) is None)
+        camera = health.detect_camera()
+        print(f"[BENCH] detect_camera: {camera}, /dev/video*: {health.query_video_devices()}\n")
+
+        services = list(cs.get_all_services_status())
+        legacy, _ = timed(f'legacy: {len(services)} services x systemctl + ss/pgrep/camera',
+                          lambda: legacy_sweep(services))
+        current, statuses = timed('current: D-Bus batch + /proc + V4L2 ioctl', current_sweep)
+        print(f"\nspeedup x{legacy / current:.0f}")
+        check("current sweep read over D-Bus", statuses[SERVICE_NAME]['active'])
+
+        # Bus unreachable: systemctl fallback, retried only after DBUS_RETRY_INTERVAL
+        process.terminate()
+        process.wait()
+        health._bus.close()
+        fallback = cs.get_service_status()
+        check(f"bus down -> systemctl fallback ({fallback['status']})", not fallback['active'])
+        started = time.perf_counter()
+        cs.get_service_status()
+        print(f"[BENCH] fallback get_service_status: {(time.perf_counter() - started) * 1000:.2f} ms")
+        check("bus marked unavailable", health._bus_failed_at is not None)
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Meeting heartbeat bandwidth, full payloads vs delta + offline spool
+
+Runs send_heartbeat() against a fake Meeting API on 127.0.0.1 with simulated
+metrics and a simulated clock (one beat = 60 s), then:
+- compares the JSON bytes posted over a day with the previous behaviour
+  (full payload every beat),
+- takes the API down for a while (503), checks that the metrics of every
+  failed beat are spooled on disk, that the first beat after the outage is
+  a full snapshot and that the next one (sent right away) carries them in
+  one compressed telemetry_batch,
+- checks the spool bound (oldest samples dropped) and the batch split.
+
+Usage: python3 tests/bench_heartbeat_telemetry.py [beats]
+"""
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import meeting_service as ms  # noqa: E402
+from services import config_service as cs  # noqa: E402
+from services import network_service as ns  # noqa: E402
+from services import telemetry_service as ts  # noqa: E402
+
+BEATS = int(sys.argv[1]) if len(sys.argv) > 1 else 1440
+INTERVAL = 60
+
+failures = 0
+api = {'up': True, 'bodies': []}
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1767693600.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class MeetingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if not api['up']:
+            self.send_response(503)
+            self.end_headers()
+            return
+        api['bodies'].append(json.loads(body))
+        reply = b'{"ok":true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class Metrics:
+    """Plausible Pi metrics: noisy load, slowly drifting memory/disk, sensor jitter on temperature."""
+
+    def __init__(self):
+        self.rng = random.Random(42)
+        self.load, self.memory, self.disk, self.temp = 0.8, 41.0, 63.0, 54.0
+        self.minutes = 0
+
+    def __call__(self):
+        self.minutes += 1
+        self.load = max(0.0, self.load + self.rng.gauss(0, 0.08))
+        self.memory = min(90.0, max(20.0, self.memory + self.rng.gauss(0, 0.15)))
+        self.disk = min(99.0, self.disk + 0.002)
+        self.temp = 54.0 + self.rng.gauss(0, 0.35)
+        return {
+            'uptime': f"{self.minutes // 60}h {self.minutes % 60}m",
+            'cpu': {'load_1m': round(self.load, 2)},
+            'memory': {'percent': round(self.memory, 1)},
+            'disk': {'percent': round(self.disk)},
+            'temperature': round(self.temp, 1),
+            'network': {'lo': '127.0.0.1', 'eth0': '192.0.2.2'}
+        }
+
+
+def beat(clock, **kwargs):
+    clock.now += INTERVAL
+    return ms.send_heartbeat(**kwargs)
+
+
+def main():
+    tmp = tempfile.mkdtemp(prefix='bench_telemetry_')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MeetingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        config_file = os.path.join(tmp, 'meeting.json')
+        config = {'enabled': True, 'api_url': f'http://127.0.0.1:{server.server_address[1]}',
+                  'device_key': 'bench0123456789', 'telemetry_spool_max': 1440}
+        with open(config_file, 'w') as f:
+            json.dump(config, f)
+        ms.MEETING_CONFIG_FILE = config_file
+        ns.PUBLIC_IP_SERVICES = []
+        cs.get_system_info = Metrics()
+        clock = FakeClock()
+        ts.time = clock
+        ts._spool = ts.TelemetrySpool(os.path.join(tmp, 'spool.jsonl'))
+
+        # One day online
+        legacy_bytes = 0
+        sent_bytes = 0
+        kinds = {'full': 0, 'delta': 0}
+        for _ in range(BEATS):
+            preview = ms.get_heartbeat_payload()['payload']
+            preview['ip_public'] = preview['ip_address']
+            preview['ip_addresses'] = {'lo': '127.0.0.1', 'eth0': '192.0.2.2'}
+            result = beat(clock)
+            legacy_bytes += len(json.dumps(preview))  # previous json.dumps() of the full payload
+            sent_bytes += result['payload_bytes']
+            kinds[result['payload_type']] += 1
+        check(f"{BEATS} beats acknowledged", len(api['bodies']) == BEATS)
+        check(f"full snapshot every 600 s ({kinds['full']} full, {kinds['delta']} delta)",
+              kinds['full'] == -(-BEATS // 10))
+        delta = next(b for b in api['bodies'] if b.get('delta'))
+        check(f"delta keeps ip_address + timestamp ({sorted(delta)})",
+              'ip_address' in delta and 'timestamp' in delta and 'note' not in delta and 'uptime' not in delta)
+        print(f"\n[BENCH] {BEATS} beats: legacy {legacy_bytes / 1024:.1f} KB, "
+              f"current {sent_bytes / 1024:.1f} KB JSON ({legacy_bytes / sent_bytes:.1f}x less, "
+              f"{legacy_bytes / BEATS:.0f} -> {sent_bytes / BEATS:.0f} B/beat)\n")
+
+        # Outage: every failed beat is spooled
+        outage = 120
+        api['up'] = False
+        expected = []
+        for _ in range(outage):
+            result = beat(clock)
+            expected.append(ts.sample_from_payload(
+                {'cpu_load': cs.get_system_info.load}, ts=clock.now))
+        check(f"{outage} failed beats", not result['success'])
+        spooled = ts._spool.peek(limit=None)
+        check(f"{len(spooled)} samples spooled on disk", len(spooled) == outage
+              and [s['ts'] for s in spooled] == [e['ts'] for e in expected])
+        check("cpu_load samples recorded", [s['cpu_load'] for s in spooled]
+              == [round(e['cpu_load'], 2) for e in expected])
+
+        # Back online: a full beat, then right away one beat carrying the whole outage
+        api['up'] = True
+        api['bodies'].clear()
+        ms._immediate_heartbeat_event.clear()
+        result = beat(clock)
+        check(f"first beat after outage is full, without batch ({result['payload_type']})",
+              result['payload_type'] == 'full' and 'telemetry_batch' not in api['bodies'][-1])
+        check("immediate beat requested for the spooled samples", ms._immediate_heartbeat_event.is_set())
+        result = beat(clock)
+        body = api['bodies'][-1]
+        batch = body.get('telemetry_batch', {})
+        check(f"batch of {batch.get('count')} samples, {batch.get('encoding')}", batch.get('count') == outage)
+        check("decoded batch == spooled samples", ts.decode_batch(batch) == spooled)
+        raw = sum(len(json.dumps(s)) for s in spooled)
+        print(f"[BENCH] {outage} samples: {raw} B as JSON lines -> {len(batch['data'])} B in telemetry_batch")
+        check("spool emptied", ts._spool.pending() == 0)
+        check("next beat is a delta without batch", beat(clock)['payload_type'] == 'delta'
+              and 'telemetry_batch' not in api['bodies'][-1])
+
+        # Bound + split: a long outage keeps only the newest samples, uploaded in several beats
+        with open(config_file, 'w') as f:
+            json.dump({**config, 'telemetry_spool_max': 1000}, f)
+        api['up'] = False
+        for _ in range(1100):
+            beat(clock)
+        check(f"spool bounded to 1000 ({ts._spool.stats['dropped']} dropped)", ts._spool.pending() == 1000)
+        first_kept = ts._spool.peek(limit=1)[0]['ts']
+        api['up'] = True
+        api['bodies'].clear()
+        beat(clock)
+        ms._immediate_heartbeat_event.clear()
+        beat(clock)
+        check(f"first upload capped at {ts.SPOOL_BATCH_MAX}, immediate beat requested",
+              api['bodies'][-1]['telemetry_batch']['count'] == ts.SPOOL_BATCH_MAX
+              and ms._immediate_heartbeat_event.is_set())
+        check("upload starts with the oldest kept sample",
+              first_kept == api['bodies'][-1]['telemetry_batch']['first_ts'])
+        beat(clock)
+        check("remainder uploaded by the next beat", api['bodies'][-1]['telemetry_batch']['count'] == 280
+              and ts._spool.pending() == 0)
+        print(f"\n[BENCH] {ts.get_telemetry_status()}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
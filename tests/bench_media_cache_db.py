@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: media_cache_service SQLite layer on a synthetic cache
+
+Creates ROWS small .ts files and a media cache database in a temp dir, then
+compares:
+- writes: legacy (one connection + one commit per file) vs
+  cache_metadata_many (pooled connection, batched executemany),
+- reads: legacy get_cached_metadata (one connection + PRAGMAs per file),
+  pooled get_cached_metadata per file, and get_cached_metadata_many.
+
+Legacy writes run on a LEGACY_WRITE_SAMPLE subset (rows/s is what matters).
+
+Usage: python3 tests/bench_media_cache_db.py [rows]
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import media_cache_service as mc  # noqa: E402
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+LEGACY_WRITE_SAMPLE = min(ROWS, 5000)
+
+METADATA = {
+    'duration': 60.0, 'duration_human': '1:00', 'resolution': '1920x1080', 'width': 1920,
+    'height': 1080, 'codec': 'h264', 'bitrate': 4000000, 'fps': 25.0, 'has_audio': True
+}
+
+
+@contextmanager
+def legacy_connection():
+    """get_db_connection before connection pooling: new connection per call."""
+    conn = sqlite3.connect(mc.MEDIA_CACHE_DB, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def legacy_cache_metadata(filepath, metadata):
+    row = mc._metadata_row(filepath, metadata, os.stat(filepath), '2026-01-01T00:00:00')
+    with legacy_connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO media_cache (filepath, filename, file_size, file_mtime, "
+                     "duration, duration_human, resolution, width, height, codec, bitrate, fps, "
+                     "has_audio, thumbnail_path, thumbnail_generated, metadata_json, updated_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+        conn.commit()
+
+
+def legacy_get_cached_metadata(filepath):
+    file_mtime = os.path.getmtime(filepath)
+    with legacy_connection() as conn:
+        row = conn.execute("SELECT * FROM media_cache WHERE filepath = ?", (filepath,)).fetchone()
+        return dict(row) if row and row['file_mtime'] >= file_mtime else None
+
+
+def timed(label, count, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<44} {count:>7} rows  {elapsed:>8.3f} s  {count / elapsed:>10.0f} rows/s")
+    return result
+
+
+def main():
+    base = tempfile.mkdtemp(prefix='bench_media_cache_')
+    try:
+        mc.MEDIA_CACHE_DB = os.path.join(base, 'media_cache.db')
+        mc.THUMBNAIL_CACHE_DIR = os.path.join(base, 'thumbs')
+        mc.init_database()
+
+        files = []
+        for i in range(ROWS):
+            day_dir = os.path.join(base, 'rec', f"day{i // 1000:03d}")
+            if i % 1000 == 0:
+                os.makedirs(day_dir)
+            path = os.path.join(day_dir, f"rec_{i:06d}.ts")
+            with open(path, 'wb'):
+                pass
+            files.append(path)
+        print(f"[BENCH] {ROWS} recordings, database {mc.MEDIA_CACHE_DB}\n")
+
+        sample = files[:LEGACY_WRITE_SAMPLE]
+        timed('writes: legacy (connection + commit per row)', len(sample),
+              lambda: [legacy_cache_metadata(f, METADATA) for f in sample])
+        written = timed('writes: cache_metadata_many (batched)', ROWS,
+                        lambda: mc.cache_metadata_many([(f, METADATA) for f in files]))
+        print()
+
+        legacy = timed('reads: legacy get_cached_metadata per file', ROWS,
+                       lambda: sum(1 for f in files if legacy_get_cached_metadata(f)))
+        pooled = timed('reads: pooled get_cached_metadata per file', ROWS,
+                       lambda: sum(1 for f in files if mc.get_cached_metadata(f)))
+        page = files[:200]
+        timed('reads: get_cached_metadata_many (page, IN)', len(page),
+              lambda: mc.get_cached_metadata_many(page))
+        bulk = timed('reads: get_cached_metadata_many (all, join)', ROWS,
+                     lambda: mc.get_cached_metadata_many(files))
+
+        ok = written == ROWS and legacy == pooled == len(bulk) == ROWS
+        print(f"\n{'✓' if ok else '✗'} written={written} legacy={legacy} pooled={pooled} bulk={len(bulk)}")
+        if not ok:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+    print("[DONE]")
+
+
+if __name__ == '__main__':
+    main()
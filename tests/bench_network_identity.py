@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Meeting heartbeat network fields, per-beat lookups vs cached identity
+
+Serves a fake "what is my IP" endpoint on 127.0.0.1 (answering after
+--delay seconds) through network_service.PUBLIC_IP_SERVICES, then times
+the network part of one heartbeat:
+- legacy: get_preferred_ip (`ip -4 addr`) + get_network_interfaces
+  (`ip -o link` + `ip addr show` per interface + `ip route`) + get_public_ip,
+- current: NetworkIdentity.snapshot().
+
+Also checks that the public IP is looked up in the background (TTL, retry
+after failure, last value kept), that a default route change triggers a new
+lookup (needs root for `ip route add`), and that the local fields match the
+`ip` based implementation.
+
+Usage: python3 tests/bench_network_identity.py [beats] [delay]
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import network_service as ns  # noqa: E402
+from services import network_identity_service as nid  # noqa: E402
+
+BEATS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+DELAY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+
+failures = 0
+answer = {'ip': '203.0.113.7', 'fail': False, 'hits': 0}
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+class IpHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        answer['hits'] += 1
+        time.sleep(DELAY)
+        if answer['fail']:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = answer['ip'].encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def legacy_network():
+    """Network part of the previous get_heartbeat_payload / send_heartbeat."""
+    local_ip = ns.get_local_ip()
+    subprocess.run(['ip', '-4', 'addr'], capture_output=True, text=True, timeout=5)  # get_preferred_ip
+    interfaces = ns.get_network_interfaces()
+    ip_lan, primary_mac = local_ip, None
+    for iface in interfaces:
+        if iface.get('gateway') or iface.get('is_default'):
+            primary_mac = iface.get('mac', '').upper().replace('-', ':')
+            ip_lan = iface.get('ip') or ip_lan
+            break
+    return ip_lan, ns.get_public_ip(), primary_mac
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    for _ in range(BEATS):
+        result = fn()
+    elapsed = (time.perf_counter() - started) / BEATS
+    print(f"{label:<44} {elapsed * 1000:>9.2f} ms/beat")
+    return elapsed, result
+
+
+def wait_until(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), IpHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ns.PUBLIC_IP_SERVICES = [f'http://127.0.0.1:{server.server_address[1]}/ip']
+    nid.PUBLIC_IP_RETRY_INTERVAL = 0.5
+    nid.PUBLIC_IP_TTL_MIN = 0.5
+
+    # Local fields vs the `ip` based implementation
+    legacy_ifaces = {i['name']: i for i in ns.get_network_interfaces()}
+    current_ifaces = {i['name']: i for i in nid.read_interfaces()}
+    check(f"same interfaces ({sorted(current_ifaces)})", sorted(legacy_ifaces) == sorted(current_ifaces))
+    for name, iface in current_ifaces.items():
+        old = legacy_ifaces.get(name, {})
+        same = all(iface.get(k) == old.get(k) for k in ('ip', 'mac', 'gateway', 'type'))
+        check(f"{name}: ip={iface['ip']} mac={iface['mac']} gw={iface['gateway']} (ip: {old.get('ip')})", same)
+
+    identity = nid.NetworkIdentity(priority_loader=lambda: nid.DEFAULT_INTERFACE_PRIORITY)
+    started = time.perf_counter()
+    first = identity.snapshot(ttl=2)
+    first_ms = (time.perf_counter() - started) * 1000
+    check(f"first snapshot does not wait for the public IP ({first_ms:.1f} ms, ip_public={first['ip_public']})",
+          first['ip_public'] is None and first_ms < DELAY * 1000)
+    check(f"public IP fetched in background ({identity.wait_for_public_ip(5)})",
+          identity.snapshot()['ip_public'] == answer['ip'])
+    legacy_ip_lan, _, legacy_mac = legacy_network()
+    check(f"ip_lan / mac match ({first['ip_lan']}, {first['mac']})",
+          (first['ip_lan'], first['mac']) == (legacy_ip_lan, legacy_mac or None))
+
+    print()
+    legacy, _ = timed(f'legacy: ip x{len(legacy_ifaces) + 3} + public IP ({DELAY * 1000:.0f} ms)', legacy_network)
+    current, _ = timed('current: NetworkIdentity.snapshot()', identity.snapshot)
+    print(f"\nspeedup x{legacy / current:.0f}\n")
+
+    # TTL refresh + change detection
+    lookups = identity.stats['public_lookups']
+    answer['ip'] = '203.0.113.8'
+    check("new public IP after TTL (2 s)",
+          wait_until(lambda: identity.snapshot(ttl=2)['ip_public'] == '203.0.113.8', 5)
+          and identity.stats['public_lookups'] == lookups + 1)
+
+    # All services down: last value kept, retried after PUBLIC_IP_RETRY_INTERVAL
+    answer['fail'] = True
+    failures_before = identity.stats['public_failures']
+    identity.invalidate()
+    check("failed lookup keeps the last public IP",
+          wait_until(lambda: identity.stats['public_failures'] > failures_before, 5)
+          and identity.snapshot()['ip_public'] == '203.0.113.8')
+    check("retried after PUBLIC_IP_RETRY_INTERVAL",
+          wait_until(lambda: identity.stats['public_failures'] > failures_before + 1, 5))
+    answer['fail'] = False
+
+    # Default route change (failover): new lookup without waiting for the TTL
+    identity.snapshot(ttl=3600)
+    routes = nid.read_default_routes()
+    if not routes or os.geteuid() != 0:
+        print("[SKIP] route change test (needs root and a default route)")
+    else:
+        wait_until(lambda: identity.snapshot()['ip_public_age'] is not None
+                   and identity.snapshot()['ip_public_age'] < 1, 5)
+        time.sleep(nid.EVENT_DEBOUNCE * 2)
+        lookups = identity.stats['public_lookups']
+        changes = identity.stats['route_changes']
+        route = ['default', 'via', routes[0]['gateway'], 'dev', routes[0]['interface'], 'metric', '9999']
+        added = subprocess.run(['ip', 'route', 'add', *route], capture_output=True).returncode == 0
+        try:
+            check(f"rtnetlink watcher running ({identity.get_status()['netlink']})", identity.get_status()['netlink'])
+            check("route change detected without a snapshot() call",
+                  added and wait_until(lambda: identity.stats['route_changes'] == changes + 1, 3))
+            check("public IP looked up again right away (TTL 3600 s)",
+                  wait_until(lambda: identity.stats['public_lookups'] > lookups, 3))
+        finally:
+            if added:
+                subprocess.run(['ip', 'route', 'del', *route], capture_output=True)
+        check("route removal detected too", wait_until(lambda: identity.stats['route_changes'] == changes + 2, 3))
+
+    print(f"\n[BENCH] {identity.get_status()}, fake service hits: {answer['hits']}")
+    server.shutdown()
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
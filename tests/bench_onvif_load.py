@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ONVIF server throughput and latency under concurrent NVR polling
+
+Starts onvif_server in-process on a free port (temp onvif.conf/config.env)
+and hammers it with CLIENTS threads sending a mix of ONVIF actions
+(GetProfiles, GetStreamUri, GetCapabilities, GetSystemDateAndTime, ...).
+Compares:
+- legacy: single-threaded HTTPServer, config.env re-read, `ip -4 addr`
+  forked for the local IP and SOAP body rendered on every request,
+- current: ThreadingHTTPServer + refresh_if_changed + InterfaceAddressTable
+  + SOAPResponseCache.
+
+Also checks that cached responses equal freshly rendered ones and that an
+edit of config.env is visible on the next request.
+
+Usage: python3 tests/bench_onvif_load.py [requests_per_client] [clients]
+       python3 tests/bench_onvif_load.py --url http://camera:8080/onvif/device_service [requests] [clients]
+"""
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import HTTPServer
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'onvif-server'))
+import onvif_server as onvif  # noqa: E402
+
+args = sys.argv[1:]
+URL = None
+if args[:1] == ['--url']:
+    URL = args[1]
+    args = args[2:]
+REQUESTS = int(args[0]) if len(args) > 0 else 200
+CLIENTS = int(args[1]) if len(args) > 1 else 8
+
+ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body>{}</s:Body></s:Envelope>')
+TDS = 'http://www.onvif.org/ver10/device/wsdl'
+TRT = 'http://www.onvif.org/ver10/media/wsdl'
+
+# Roughly what an NVR sends while polling a camera
+ACTION_MIX = [
+    f'<GetProfiles xmlns="{TRT}"/>',
+    f'<GetProfiles xmlns="{TRT}"/>',
+    f'<GetStreamUri xmlns="{TRT}"><StreamSetup/><ProfileToken>MainProfile</ProfileToken></GetStreamUri>',
+    f'<GetSystemDateAndTime xmlns="{TDS}"/>',
+    f'<GetCapabilities xmlns="{TDS}"><Category>All</Category></GetCapabilities>',
+    f'<GetDeviceInformation xmlns="{TDS}"/>',
+    f'<GetVideoEncoderConfigurations xmlns="{TRT}"/>',
+    f'<GetVideoSources xmlns="{TRT}"/>',
+    f'<GetServiceCapabilities xmlns="{TRT}"/>',
+    f'<GetSnapshotUri xmlns="{TRT}"><ProfileToken>MainProfile</ProfileToken></GetSnapshotUri>',
+]
+
+CONFIG_ENV = '''VIDEOIN_WIDTH="1920"
+VIDEOIN_HEIGHT="1080"
+VIDEOIN_FPS="25"
+VIDEOIN_DEVICE="/dev/video0"
+H264_BITRATE_KBPS="4000"
+RTSP_PORT="8554"
+RTSP_PATH="stream"
+'''
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+class QuietHandler(onvif.ONVIFHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def log_action(self, action, client_ip):
+        pass
+
+
+class ForkingAddresses(onvif.InterfaceAddressTable):
+    """Pre-1.11 address lookup: `ip -4 addr` forked on every call."""
+
+    def entries(self):
+        self._stale = True
+        result = subprocess.run(['ip', '-4', 'addr'], capture_output=True, text=True, timeout=5)
+        if result.returncode != 0:
+            return []
+        return super().entries()
+
+
+class LegacyHandler(QuietHandler):
+    """Pre-1.10 request path: reload config.env and render every response."""
+
+    def get_response(self, action, request_element):
+        self.config.load_video_settings()
+        response = self.handle_action(action, request_element)
+        return response.encode('utf-8') if response else None
+
+
+def post(host, port, path, action_xml):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request('POST', path, ENVELOPE.format(action_xml),
+                     {'Content-Type': 'application/soap+xml; charset=utf-8'})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def run_load(label, host, port, path):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(index):
+        local = []
+        for i in range(REQUESTS):
+            started = time.perf_counter()
+            try:
+                status, _ = post(host, port, path, ACTION_MIX[(index + i) % len(ACTION_MIX)])
+                if status != 200:
+                    errors.append(status)
+            except OSError as e:
+                errors.append(str(e))
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(CLIENTS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    rate = len(latencies) / elapsed
+    print(f"{label:<34} {len(latencies):>6} req  {rate:>8.0f} req/s  p50 {p50:>7.2f} ms  "
+          f"p99 {p99:>7.2f} ms  errors {len(errors)}")
+    return rate, p99, errors
+
+
+def serve(server_class, handler):
+    httpd = server_class(('127.0.0.1', 0), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def main():
+    if URL:
+        parts = urlsplit(URL)
+        print(f"[BENCH] {URL}: {CLIENTS} clients x {REQUESTS} requests\n")
+        _, _, errors = run_load('remote', parts.hostname, parts.port or 80, parts.path or '/')
+        sys.exit(1 if errors else 0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        onvif_conf = os.path.join(tmp, 'onvif.conf')
+        with open(onvif_conf, 'w') as f:
+            f.write('{"port": 8080, "rtsp_port": 8554, "rtsp_path": "/stream"}')
+        config_env = os.path.join(tmp, 'config.env')
+        with open(config_env, 'w') as f:
+            f.write(CONFIG_ENV)
+
+        config = onvif.ONVIFConfig(onvif_conf)
+        config.rtsp_config_file = config_env
+        check("refresh_if_changed picks up config.env", config.refresh_if_changed() and config.video_width == 1920)
+        check("refresh_if_changed skips an unchanged file", not config.refresh_if_changed())
+        QuietHandler.config = config
+        onvif.print = lambda *args, **kwargs: None  # server logs every settings load / IP lookup
+        LegacyHandler.config = onvif.ONVIFConfig(onvif_conf)
+        LegacyHandler.config.rtsp_config_file = config_env
+        LegacyHandler.config.refresh_if_changed()
+        LegacyHandler.config.addresses = ForkingAddresses()
+        print(f"[BENCH] {CLIENTS} clients x {REQUESTS} requests, {len(ACTION_MIX)} actions in the mix\n")
+
+        legacy = serve(HTTPServer, LegacyHandler)
+        legacy_rate, legacy_p99, legacy_errors = run_load('legacy: HTTPServer, no cache', '127.0.0.1',
+                                                          legacy.server_port, '/onvif/device_service')
+
+        QuietHandler.response_cache = onvif.SOAPResponseCache()
+        current = serve(onvif.ThreadingHTTPServer, QuietHandler)
+        rate, p99, errors = run_load('current: threaded + response cache', '127.0.0.1',
+                                     current.server_port, '/onvif/device_service')
+        stats = QuietHandler.response_cache.get_stats()
+        print(f"\nthroughput x{rate / legacy_rate:.1f}, p99 x{legacy_p99 / p99:.1f} lower\n[STATS] {stats}\n")
+        check("no request errors", not legacy_errors and not errors)
+        check("response cache hit ratio > 0.9", stats['hit_ratio'] > 0.9)
+
+        mismatches = [action_xml for action_xml in ACTION_MIX
+                      if post('127.0.0.1', current.server_port, '/', action_xml)
+                      != post('127.0.0.1', legacy.server_port, '/', action_xml)]
+        check(f"cached responses equal freshly rendered ones {mismatches}", not mismatches)
+
+        profiles = ACTION_MIX[0]
+        time.sleep(0.01)
+        with open(config_env, 'w') as f:
+            f.write(CONFIG_ENV.replace('"1920"', '"1280"').replace('"1080"', '"720"'))
+        _, body = post('127.0.0.1', current.server_port, '/', profiles)
+        check("config.env edit visible on the next request", b'<tt:Width>1280</tt:Width>' in body)
+
+        legacy.shutdown()
+        current.shutdown()
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ONVIF local IP lookup (GetStreamUri / ProbeMatch path)
+
+Compares:
+- legacy: `ip -4 addr` forked and parsed on every lookup (get_local_ip,
+  _get_preferred_ip_by_priority and WSDDiscovery._get_ip_for_client),
+- InterfaceAddressTable: rtnetlink dump kept in process.
+
+Checks that both agree on this host, that no process is forked per lookup
+and, when allowed to add an address (root), that the rtnetlink listener
+picks up the change and bumps the table generation.
+
+Usage: python3 tests/bench_onvif_local_ip.py [lookups]
+"""
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'onvif-server'))
+import onvif_server as onvif  # noqa: E402
+
+LOOKUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+TEST_ADDRESS = '10.213.0.1/16'
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def legacy_addresses():
+    """{ifname: ip} as the pre-1.11 `ip -4 addr` parsing built it."""
+    interface_ips = {}
+    result = subprocess.run(['ip', '-4', 'addr'], capture_output=True, text=True, timeout=5)
+    current_iface = None
+    for line in result.stdout.split('\n'):
+        if ': ' in line and not line.startswith(' '):
+            current_iface = line.split(': ')[1].split('@')[0]
+        elif 'inet ' in line and 'scope global' in line and current_iface:
+            ip = line.strip().split()[1].split('/')[0]
+            if not ip.startswith('127.') and not ip.startswith('169.254.'):
+                interface_ips.setdefault(current_iface, ip)
+    return interface_ips
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    for _ in range(LOOKUPS):
+        fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<36} {LOOKUPS:>6} lookups  {elapsed:>7.3f} s  {elapsed / LOOKUPS * 1e6:>9.1f} us/lookup")
+    return elapsed
+
+
+def main():
+    table = onvif.InterfaceAddressTable()
+    listening = table.start()
+    entries = table.entries()
+    print(f"[BENCH] addresses: {[(e[0], e[1]) for e in entries]} (events: {listening})\n")
+    if not entries:
+        print("No global IPv4 address on this host, nothing to compare")
+        return
+    client_ip = entries[0][1].rsplit('.', 1)[0] + '.250'
+
+    try:
+        legacy = timed('legacy: fork `ip -4 addr` + parse', legacy_addresses)
+    except FileNotFoundError:
+        legacy = None
+        print("legacy: `ip` not installed")
+    current = timed('InterfaceAddressTable.ip_for_client', lambda: table.ip_for_client(client_ip))
+    if legacy:
+        print(f"\nspeedup x{legacy / current:.0f}\n")
+        check("same addresses as `ip -4 addr`",
+              {e[0]: e[1] for e in reversed(entries)} == legacy_addresses())
+    check(f"client {client_ip} -> {table.ip_for_client(client_ip)}", table.ip_for_client(client_ip) == entries[0][1])
+
+    forks = []
+    original_run = subprocess.run
+    subprocess.run = lambda *args, **kwargs: forks.append(args) or original_run(*args, **kwargs)
+    try:
+        config = onvif.ONVIFConfig('/nonexistent/onvif.conf')
+        config.addresses = table
+        ips = {config.get_local_ip(client_ip), config.get_local_ip(),
+               onvif.WSDDiscovery(config)._get_ip_for_client(client_ip)}
+    finally:
+        subprocess.run = original_run
+    check(f"get_local_ip / ProbeMatch without fork ({ips}, {len(forks)} forks)", not forks and None not in ips)
+
+    if listening and os.geteuid() == 0:
+        generation = table.generation
+        added = subprocess.run(['ip', 'addr', 'add', TEST_ADDRESS, 'dev', 'lo'], capture_output=True)
+        if added.returncode == 0:
+            try:
+                time.sleep(0.2)
+                check("rtnetlink event: new address matched on its /16",
+                      table.ip_for_client('10.213.7.7') == '10.213.0.1' and table.generation > generation)
+            finally:
+                subprocess.run(['ip', 'addr', 'del', TEST_ADDRESS, 'dev', 'lo'], capture_output=True)
+            time.sleep(0.2)
+            check("rtnetlink event: removed address dropped", table.ip_for_client('10.213.7.7') is None)
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
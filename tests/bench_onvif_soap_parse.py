@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ONVIF SOAP request parsing (ONVIFHandler.do_POST)
+
+Compares, per request, on typical NVR payloads:
+- legacy: decode + ET.fromstring of the whole body + `.//` searches for
+  soap:Body and the WS-Security header,
+- _parse_soap_request: XMLPullParser fed in chunks, stopping at the end of
+  the action element.
+
+Payloads: Synology Surveillance Station (WS-Security PasswordDigest,
+GetStreamUri), Milestone XProtect (WS-Addressing + WS-Security headers,
+GetProfiles), a SetVideoEncoderConfiguration and a SOAP 1.1 envelope.
+Also checks digest auth, malformed requests and the size limit against a
+live in-process server.
+
+Usage: python3 tests/bench_onvif_soap_parse.py [iterations]
+"""
+import base64
+import hashlib
+import http.client
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'onvif-server'))
+import onvif_server as onvif  # noqa: E402
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+USERNAME = 'admin'
+PASSWORD = 'secret'
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def security_header(password=PASSWORD):
+    nonce = b'0123456789abcdef'
+    created = '2026-10-17T10:00:00Z'
+    digest = base64.b64encode(hashlib.sha1(nonce + created.encode() + password.encode()).digest()).decode()
+    return f'''<wsse:Security s:mustUnderstand="1" xmlns:wsse="{onvif.WSSE_NS}" xmlns:wsu="{onvif.WSU_NS}">
+      <wsse:UsernameToken wsu:Id="UsernameToken-1">
+        <wsse:Username>{USERNAME}</wsse:Username>
+        <wsse:Password Type="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-username-token-profile-1.0#PasswordDigest">{digest}</wsse:Password>
+        <wsse:Nonce EncodingType="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-soap-message-security-1.0#Base64Binary">{base64.b64encode(nonce).decode()}</wsse:Nonce>
+        <wsu:Created>{created}</wsu:Created>
+      </wsse:UsernameToken>
+    </wsse:Security>'''
+
+
+SYNOLOGY = f'''<?xml version="1.0" encoding="UTF-8"?>
+<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope">
+  <s:Header>
+    {security_header()}
+  </s:Header>
+  <s:Body xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+    <GetStreamUri xmlns="http://www.onvif.org/ver10/media/wsdl">
+      <StreamSetup>
+        <Stream xmlns="http://www.onvif.org/ver10/schema">RTP-Unicast</Stream>
+        <Transport xmlns="http://www.onvif.org/ver10/schema"><Protocol>RTSP</Protocol></Transport>
+      </StreamSetup>
+      <ProfileToken>MainProfile</ProfileToken>
+    </GetStreamUri>
+  </s:Body>
+</s:Envelope>'''.encode()
+
+MILESTONE = f'''<?xml version="1.0" encoding="utf-8"?>
+<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" xmlns:a="http://www.w3.org/2005/08/addressing">
+  <s:Header>
+    <a:Action s:mustUnderstand="1">http://www.onvif.org/ver10/media/wsdl/GetProfiles</a:Action>
+    <a:MessageID>urn:uuid:5b7f0e4c-9a57-4a0a-8c43-3f0a1e2d9b61</a:MessageID>
+    <a:ReplyTo><a:Address>http://www.w3.org/2005/08/addressing/anonymous</a:Address></a:ReplyTo>
+    <a:To s:mustUnderstand="1">http://192.168.1.50:8080/onvif/media_service</a:To>
+    {security_header()}
+  </s:Header>
+  <s:Body xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
+    <GetProfiles xmlns="http://www.onvif.org/ver10/media/wsdl"/>
+  </s:Body>
+</s:Envelope>'''.encode()
+
+SET_ENCODER = f'''<?xml version="1.0" encoding="UTF-8"?>
+<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope" xmlns:tt="http://www.onvif.org/ver10/schema">
+  <s:Header>{security_header()}</s:Header>
+  <s:Body>
+    <SetVideoEncoderConfiguration xmlns="http://www.onvif.org/ver10/media/wsdl">
+      <Configuration token="VideoEncoderConfig">
+        <tt:Name>VideoEncoderConfig</tt:Name><tt:UseCount>1</tt:UseCount><tt:Encoding>H264</tt:Encoding>
+        <tt:Resolution><tt:Width>1280</tt:Width><tt:Height>720</tt:Height></tt:Resolution>
+        <tt:Quality>4</tt:Quality>
+        <tt:RateControl><tt:FrameRateLimit>25</tt:FrameRateLimit><tt:EncodingInterval>1</tt:EncodingInterval>
+          <tt:BitrateLimit>3000</tt:BitrateLimit></tt:RateControl>
+        <tt:H264><tt:GovLength>50</tt:GovLength><tt:H264Profile>High</tt:H264Profile></tt:H264>
+        <tt:Multicast><tt:Address><tt:Type>IPv4</tt:Type><tt:IPv4Address>0.0.0.0</tt:IPv4Address></tt:Address>
+          <tt:Port>0</tt:Port><tt:TTL>1</tt:TTL><tt:AutoStart>false</tt:AutoStart></tt:Multicast>
+        <tt:SessionTimeout>PT60S</tt:SessionTimeout>
+      </Configuration>
+      <ForcePersistence>true</ForcePersistence>
+    </SetVideoEncoderConfiguration>
+  </s:Body>
+</s:Envelope>'''.encode()
+
+SOAP11 = b'''<?xml version="1.0"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+  <soapenv:Body><GetSystemDateAndTime xmlns="http://www.onvif.org/ver10/device/wsdl"/></soapenv:Body>
+</soapenv:Envelope>'''
+
+
+def legacy_parse(body):
+    """Pre-1.12 do_POST + verify_auth lookups."""
+    root = ET.fromstring(body.decode('utf-8'))
+    soap_body = root.find('.//{http://www.w3.org/2003/05/soap-envelope}Body')
+    if soap_body is None:
+        soap_body = root.find('.//{http://schemas.xmlsoap.org/soap/envelope/}Body')
+    request_element = list(soap_body)[0]
+    security = root.find(f'.//{{{onvif.WSSE_NS}}}Security')
+    token = security.find(f'.//{{{onvif.WSSE_NS}}}UsernameToken') if security is not None else None
+    return request_element, token
+
+
+def streaming_parse(body):
+    request_element, token, _ = onvif._parse_soap_request(io.BytesIO(body).read, len(body))
+    return request_element, token
+
+
+def timed(label, fn, body):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        fn(body)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<12} {elapsed / ITERATIONS * 1e6:>8.1f} us/request")
+    return elapsed
+
+
+def post(port, body, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request('POST', '/onvif/device_service', body, headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def main():
+    handler = onvif.ONVIFHandler.__new__(onvif.ONVIFHandler)
+    handler.config = type('Config', (), {'username': USERNAME, 'password': PASSWORD})()
+
+    for name, body in (('Synology GetStreamUri', SYNOLOGY), ('Milestone GetProfiles', MILESTONE),
+                       ('SetVideoEncoderConfiguration', SET_ENCODER), ('SOAP 1.1 GetSystemDateAndTime', SOAP11)):
+        print(f"[BENCH] {name} ({len(body)} bytes)")
+        legacy = timed('legacy', legacy_parse, body)
+        current = timed('streaming', streaming_parse, body)
+        print(f"  speedup x{legacy / current:.2f}")
+        old_element, old_token = legacy_parse(body)
+        element, token = streaming_parse(body)
+        check(f"  same action {element.tag.split('}')[-1]}", element.tag == old_element.tag
+              and ET.tostring(element) == ET.tostring(old_element))
+        check("  same auth result", handler.verify_auth(token) == (old_token is not None))
+
+    element, token = streaming_parse(SYNOLOGY.replace(b'</s:Envelope>', b'<unclosed>'))
+    check("stops after the action element (trailing garbage never parsed)", element.tag.endswith('GetStreamUri'))
+    check("wrong password digest rejected",
+          not handler.verify_auth(streaming_parse(SYNOLOGY.replace(
+              security_header().encode(), security_header('wrong').encode()))[1]))
+    for label, body, expected in (
+            ('missing body', b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"/>', 'Missing SOAP body'),
+            ('empty body', b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body/></s:Envelope>',
+             'Empty SOAP body')):
+        try:
+            streaming_parse(body)
+            check(label, False)
+        except onvif.SOAPRequestError as e:
+            check(f"{label} -> {e}", str(e) == expected)
+    try:
+        streaming_parse(b'<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"><s:Body>')
+        check("truncated XML", False)
+    except ET.ParseError as e:
+        check(f"truncated XML -> ParseError ({e})", True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        onvif.print = lambda *args, **kwargs: None
+        config = onvif.ONVIFConfig(os.path.join(tmp, 'onvif.conf'))
+        config.rtsp_config_file = os.path.join(tmp, 'config.env')
+        config.username, config.password = USERNAME, PASSWORD
+        onvif.ONVIFHandler.config = config
+        onvif.ONVIFHandler.log_message = lambda *args: None
+        httpd = onvif.ThreadingHTTPServer(('127.0.0.1', 0), onvif.ONVIFHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        port = httpd.server_port
+
+        status, body = post(port, MILESTONE)
+        check(f"live: authenticated GetProfiles -> {status}", status == 200 and b'MainProfile' in body)
+        status, body = post(port, SOAP11.replace(b'GetSystemDateAndTime', b'SystemReboot'))
+        check(f"live: non-public action without UsernameToken -> {status}", b'Not Authorized' in body)
+        status, _ = post(port, b'<a/>', {'Content-Length': str(onvif.MAX_SOAP_REQUEST_SIZE + 1)})
+        check(f"live: Content-Length above {onvif.MAX_SOAP_REQUEST_SIZE} refused unread -> {status}", status == 413)
+        status, body = post(port, b'<not xml')
+        check(f"live: malformed XML -> SOAP fault {status}", status == 500 and b'XML Parse Error' in body)
+        httpd.shutdown()
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
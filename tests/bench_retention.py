@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: recordings retention (MAX_DISK_MB enforcement)
+
+Builds a synthetic recordings tree, then frees half of it twice:
+- legacy: the rtsp_recorder.sh loop (find | xargs ls -1t | tail -1, du, rm,
+  du again - per deleted file),
+- retention_service.apply_retention (one scan, one sort, batch unlink).
+
+Checks that both keep the newest files and reports time taken, then that the
+recordings cap (max_recordings_mb) ignores files that are not recordings.
+
+Usage: python3 tests/bench_retention.py [files] [file_kb]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services.retention_service import apply_retention, scan_recordings  # noqa: E402
+
+FILES = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+FILE_KB = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+LEGACY_LOOP = r'''
+RECORD_DIR="$1"; MAX_DISK_MB="$2"
+get_recordings_size_mb() { du -sm "$RECORD_DIR" 2>/dev/null | awk '{print $1}'; }
+used_mb="$(get_recordings_size_mb)"
+while [[ "$used_mb" -gt "$MAX_DISK_MB" ]]; do
+    oldest="$(find "$RECORD_DIR" \( -name "*.ts" -o -name "*.mp4" -o -name "*.mkv" \) -type f 2>/dev/null | \
+              xargs -r ls -1t 2>/dev/null | tail -1)" || oldest=""
+    [[ -z "$oldest" ]] && break
+    file_size="$(du -sm "$oldest" 2>/dev/null | awk '{print $1}')"
+    rm -f "$oldest"
+    used_mb="$(get_recordings_size_mb)"
+done
+'''
+
+
+def build_tree(root):
+    """FILES segments spread over daily sub-directories, distinct mtimes."""
+    now = time.time() - 3600
+    payload = os.urandom(FILE_KB * 1024)
+    for i in range(FILES):
+        day_dir = os.path.join(root, f"day{i // 100:02d}")
+        os.makedirs(day_dir, exist_ok=True)
+        path = os.path.join(day_dir, f"rec_{i:05d}.ts")
+        with open(path, 'wb') as handle:
+            handle.write(payload)
+        mtime = now - (FILES - i) * 60
+        os.utime(path, (mtime, mtime))
+
+
+def remaining(root):
+    return sorted(os.path.basename(c[3]) for c in scan_recordings(root)[0])
+
+
+base = tempfile.mkdtemp(prefix='bench_retention_')
+try:
+    build_tree(os.path.join(base, 'template'))
+    total_mb = scan_recordings(os.path.join(base, 'template'))[1] / 1024 / 1024
+    limit_mb = max(1, int(total_mb // 2))
+    print(f"[BENCH] {FILES} files of {FILE_KB} KB ({total_mb:.1f} MB), MAX_DISK_MB={limit_mb}\n")
+
+    legacy_dir = os.path.join(base, 'legacy')
+    engine_dir = os.path.join(base, 'engine')
+    shutil.copytree(os.path.join(base, 'template'), legacy_dir)
+    shutil.copytree(os.path.join(base, 'template'), engine_dir)
+
+    started = time.perf_counter()
+    subprocess.run(['bash', '-c', LEGACY_LOOP, 'legacy', legacy_dir, str(limit_mb)], check=True)
+    legacy_time = time.perf_counter() - started
+    legacy_left = remaining(legacy_dir)
+    print(f"legacy shell loop       {FILES - len(legacy_left):>6} deleted  {legacy_time:>9.3f} s")
+
+    started = time.perf_counter()
+    result = apply_retention(engine_dir, max_dir_mb=limit_mb)
+    engine_time = time.perf_counter() - started
+    engine_left = remaining(engine_dir)
+    print(f"retention_service       {result['deleted_count']:>6} deleted  {engine_time:>9.3f} s  "
+          f"(freed {result['freed_space'] / 1024 / 1024:.1f} MB, reported {result['duration_ms']} ms)")
+
+    # Names sort like mtimes: both must keep a newest-suffix of the tree. du
+    # rounds to whole MB in the legacy loop, so allow one file of difference.
+    newest = [f"rec_{i:05d}.ts" for i in range(FILES)]
+    if (engine_left != newest[FILES - len(engine_left):]
+            or legacy_left != newest[FILES - len(legacy_left):]
+            or abs(len(engine_left) - len(legacy_left)) > 1):
+        print(f"\n✗ Different files kept: legacy={len(legacy_left)} engine={len(engine_left)}")
+        sys.exit(1)
+    print(f"\n✓ Both kept the newest files (legacy {len(legacy_left)}, engine {len(engine_left)}), "
+          f"speedup x{legacy_time / max(engine_time, 1e-6):.0f}")
+
+    # max_recordings_mb (web manager max_size_gb): a large .part file next to
+    # 32 x 64 KB recordings must not count against a 1 MB recordings cap
+    stray_dir = os.path.join(base, 'stray')
+    os.makedirs(stray_dir)
+    payload = os.urandom(64 * 1024)
+    for i in range(32):
+        path = os.path.join(stray_dir, f"rec_{i:05d}.ts")
+        with open(path, 'wb') as handle:
+            handle.write(payload)
+        mtime = time.time() - 3600 + i * 60
+        os.utime(path, (mtime, mtime))
+    with open(os.path.join(stray_dir, 'rec_99999.mp4.part'), 'wb') as handle:
+        handle.write(os.urandom(4 * 1024 * 1024))
+    result = apply_retention(stray_dir, max_recordings_mb=1)
+    if (result['deleted_count'] != 16 or result['unmet']
+            or remaining(stray_dir) != [f"rec_{i:05d}.ts" for i in range(16, 32)]
+            or result['recordings_after'] != 16 * 64 * 1024):
+        print(f"✗ Recordings cap with a stray .part file: deleted {result['deleted_count']}, "
+              f"unmet {result['unmet']}, recordings_after {result['recordings_after']}")
+        sys.exit(1)
+    print(f"✓ Recordings cap ignores the .part file: 16/32 deleted, "
+          f"{result['recordings_after'] // 1024} KB of recordings left")
+finally:
+    shutil.rmtree(base, ignore_errors=True)
+
+print("[DONE]")
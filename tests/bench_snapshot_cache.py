@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark: snapshot_service latest-JPEG cache
+
+Feeds SnapshotCache from synthetic sources (no camera here):
+- a CSI control API stand-in returning a new JPEG per call,
+- a preview hub stand-in yielding frames at 10 fps (pipeline path, used
+  when the CSI API is unavailable),
+and checks: cold start wait, cached requests in microseconds, refresh
+rate capped by SNAPSHOT_MAX_FPS, ETag changing with the frame, feeder
+stopping after SNAPSHOT_IDLE_TIMEOUT, and that with a leader election only
+the leader runs a decoder while a follower process serves its frames.
+
+Usage: python3 tests/bench_snapshot_cache.py [requests]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import snapshot_service as snap  # noqa: E402
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def jpeg(n):
+    return b'\xff\xd8' + n.to_bytes(4, 'big') * 50000 + b'\xff\xd9'
+
+
+class CsiSource:
+    def __init__(self, available=True):
+        self.available = available
+        self.calls = 0
+
+    def __call__(self):
+        if not self.available:
+            return None
+        self.calls += 1
+        time.sleep(0.05)  # Picamera2 capture + JPEG encode
+        return jpeg(self.calls)
+
+
+class Hub:
+    """Preview hub stand-in: one subscription yielding frames at 10 fps."""
+
+    def __init__(self):
+        self.subscriptions = 0
+        self.closed = 0
+
+    def subscribe(self, source_type, rtsp_url, device, width, height, fps):
+        self.subscriptions += 1
+        hub = self
+
+        class Subscription:
+            def __iter__(self):
+                n = 0
+                while True:
+                    time.sleep(0.1)
+                    n += 1
+                    yield jpeg(1000 + n)
+
+            def close(self):
+                hub.closed += 1
+        return Subscription()
+
+
+FOLLOWER = r'''
+import json, os, sys, time
+sys.path.insert(0, sys.argv[1])
+from services import snapshot_service as snap
+snap.shared_state._election.update(started=True, leader=False, pid=0)
+hub_calls = []
+class Hub:
+    def subscribe(self, *args):
+        hub_calls.append(args)
+        raise OSError('follower must not decode')
+cache = snap.SnapshotCache(config_loader=lambda: {'CAMERA_TYPE': 'auto', 'SNAPSHOT_MAX_FPS': '5'},
+                           fetch_csi=lambda: None, hub=Hub())
+started = time.monotonic()
+first = cache.get(timeout=5)
+cold = time.monotonic() - started
+etags = set()
+deadline = time.monotonic() + 1.5
+while time.monotonic() < deadline:
+    result = cache.get()
+    etags.add(result.get('etag'))
+    time.sleep(0.01)
+print(json.dumps({'first': first['success'], 'source': first.get('source'), 'cold': cold,
+                  'etags': len(etags), 'hub_calls': len(hub_calls), 'stats': cache.stats}))
+'''
+
+
+def run(label, cache, seconds):
+    """Poll like several NVRs for `seconds`, return (requests, etags seen)."""
+    etags = set()
+    count = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        result = cache.get()
+        if result['success']:
+            etags.add(result['etag'])
+        count += 1
+        time.sleep(0.001)
+    print(f"  {label}: {count} requests, {len(etags)} distinct frames, status {cache.get_status()}")
+    return count, etags
+
+
+def main():
+    config = {'CAMERA_TYPE': 'csi', 'SNAPSHOT_MAX_FPS': '2'}
+
+    print("[BENCH] CSI source, SNAPSHOT_MAX_FPS=2")
+    csi = CsiSource()
+    cache = snap.SnapshotCache(config_loader=lambda: config, fetch_csi=csi, hub=Hub())
+    started = time.perf_counter()
+    first = cache.get()
+    cold = time.perf_counter() - started
+    check(f"cold start: first snapshot after {cold * 1000:.0f} ms", first['success'] and first['source'] == 'csi')
+
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        result = cache.get()
+    per_request = (time.perf_counter() - started) / REQUESTS
+    print(f"  cached get(): {per_request * 1e6:.1f} us/request ({len(result['jpeg'])} bytes)")
+    check("cached requests < 100 us", per_request < 100e-6)
+
+    _, etags = run('2 s of polling', cache, 2.0)
+    check(f"refresh capped at 2 fps ({len(etags)} frames in 2 s, {csi.calls} captures)", 3 <= len(etags) <= 6)
+    a, b = cache.get(), cache.get()
+    check("same frame -> same ETag", a['etag'] == b['etag'])
+
+    print("\n[BENCH] CSI API unavailable -> pipeline (preview hub), SNAPSHOT_MAX_FPS=5")
+    snap._resolve_pipeline_source = lambda config: ('rtsp', 'rtsp://127.0.0.1:8554/stream', None)
+    hub = Hub()
+    config5 = {'CAMERA_TYPE': 'auto', 'SNAPSHOT_MAX_FPS': '5'}
+    cache = snap.SnapshotCache(config_loader=lambda: config5, fetch_csi=CsiSource(available=False), hub=hub)
+    first = cache.get()
+    check(f"fallback to the preview hub (source {first.get('source')})", first['success'] and first['source'] == 'rtsp')
+    _, etags = run('2 s of polling', cache, 2.0)
+    check(f"hub frames at 10 fps published at <= 5 fps ({len(etags)} frames in 2 s)", 7 <= len(etags) <= 11)
+
+    print("\n[BENCH] idle timeout")
+    snap.SNAPSHOT_IDLE_TIMEOUT = 0.5
+    time.sleep(1.0)
+    check(f"feeder stopped after idle, subscription closed ({hub.closed})",
+          not cache.get_status()['feeder_running'] and hub.closed == 1)
+    result = cache.get()
+    check("next request restarts the feeder", result['success'] and cache.stats['feeder_starts'] == 2)
+
+    print("\n[BENCH] leader + follower worker (shared state election)")
+    time.sleep(1.0)  # feeders of the previous caches go idle (0.5 s) first
+    os.environ['RPI_CAM_SHARED_STATE_DIR'] = tempfile.mkdtemp(prefix='bench_snapshot_')
+    snap.SNAPSHOT_IDLE_TIMEOUT = 60.0
+    leader_hub = Hub()
+    snap._snapshot_cache = snap.SnapshotCache(config_loader=lambda: config5,
+                                              fetch_csi=CsiSource(available=False), hub=leader_hub)
+    snap.shared_state._election.update(started=True, leader=True, pid=os.getpid())
+    snap.shared_state._start_relay()
+    time.sleep(0.2)
+    follower = subprocess.run(
+        [sys.executable, '-c', FOLLOWER, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager')],
+        capture_output=True, text=True, timeout=30)
+    report = json.loads(follower.stdout.strip().splitlines()[-1]) if follower.returncode == 0 else {}
+    print(f"  follower: {report or follower.stderr.strip()[-300:]}")
+    check(f"follower woke the leader's feeder and served its frames (cold {report.get('cold', 0) * 1000:.0f} ms, "
+          f"{report.get('etags')} frames in 1.5 s)",
+          report.get('first') and report.get('source') == 'rtsp' and report.get('etags', 0) >= 4
+          and report.get('stats', {}).get('waited') == 1)
+    check(f"one decoder: leader hub {leader_hub.subscriptions}, follower hub {report.get('hub_calls')}",
+          leader_hub.subscriptions == 1 and report.get('hub_calls') == 0)
+    snap.shared_state._election.update(started=False, leader=False)
+
+    print("\n[BENCH] no source at all")
+    snap._resolve_pipeline_source = lambda config: (None, None, None)
+    cache = snap.SnapshotCache(config_loader=lambda: config5, fetch_csi=CsiSource(available=False), hub=Hub())
+    started = time.monotonic()
+    result = cache.get(timeout=5)
+    check(f"no camera -> failure without waiting the full timeout ({time.monotonic() - started:.2f} s)",
+          not result['success'] and time.monotonic() - started < 1)
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
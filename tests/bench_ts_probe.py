@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: recording metadata extraction, native TS probe vs ffprobe
+
+Probes the same files with:
+- ts_probe_service.probe_ts_file (head + tail reads, no fork),
+- media_cache_service._extract_metadata_ffprobe (nice/ionice ffprobe, the
+  previous extract_video_metadata path), skipped if ffprobe is not installed.
+
+Reports files/sec and CPU ms per file (ffprobe children included), and the
+fields where both methods disagree.
+
+Usage:
+  python3 tests/bench_ts_probe.py                  # 20 synthetic 60 s segments
+  python3 tests/bench_ts_probe.py /path/to/recordings [max_files]
+"""
+import glob
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'web-manager'))
+sys.path.insert(0, HERE)
+from services import media_cache_service  # noqa: E402
+from services.ts_probe_service import probe_ts_file  # noqa: E402
+
+COMPARED_FIELDS = ('duration', 'resolution', 'codec', 'fps', 'has_audio')
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def run(name, probe_fn, files):
+    results = {}
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    for path in files:
+        results[path] = probe_fn(path)
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_before
+    ok = sum(1 for r in results.values() if r)
+    print(f"{name:<18} {len(files) / elapsed:>9.1f} files/s  "
+          f"{cpu / len(files) * 1000:>8.2f} ms CPU/file  ({ok}/{len(files)} probed)")
+    return results
+
+
+def main():
+    tmp = None
+    if len(sys.argv) > 1:
+        max_files = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+        files = sorted(glob.glob(os.path.join(sys.argv[1], '**', '*.ts'), recursive=True))[:max_files]
+    else:
+        from test_ts_probe import build_stream
+        tmp = tempfile.mkdtemp(prefix='bench_ts_probe_')
+        segment = build_stream(60)
+        files = []
+        for i in range(20):
+            path = os.path.join(tmp, f"rec_{i:03d}.ts")
+            with open(path, 'wb') as handle:
+                handle.write(segment)
+            files.append(path)
+
+    if not files:
+        print("[BENCH] no .ts files found")
+        return
+    total_mb = sum(os.path.getsize(f) for f in files) / 1024 / 1024
+    print(f"[BENCH] {len(files)} files, {total_mb:.1f} MB\n")
+
+    try:
+        native = run('native TS probe', probe_ts_file, files)
+        if not shutil.which('ffprobe'):
+            print("ffprobe            not installed, skipped")
+            return
+        ffprobe = run('ffprobe', media_cache_service._extract_metadata_ffprobe, files)
+
+        mismatches = 0
+        for path in files:
+            a, b = native[path], ffprobe[path]
+            if not a or not b:
+                continue
+            for field in COMPARED_FIELDS:
+                left, right = a.get(field), b.get(field)
+                if field == 'duration' and left and right and abs(left - right) < 0.1:
+                    continue
+                if left != right:
+                    mismatches += 1
+                    print(f"  {os.path.basename(path)}: {field} native={left} ffprobe={right}")
+        print(f"\n{'✓' if not mismatches else '✗'} {mismatches} field mismatch(es)")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+        print("[DONE]")
+
+
+if __name__ == '__main__':
+    main()
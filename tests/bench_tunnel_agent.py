@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tunnel_agent throughput / CPU / interactive latency over loopback
+
+A stand-in Meeting proxy (handshake + N/D/C frames) runs in this process;
+the agent runs in a child process so that its CPU time can be read from
+/proc/<pid>/stat. Local services on 127.0.0.1: a bulk sender (recording
+download), a sink (upload) and an echo server (interactive SSH stand-in).
+
+Measured for the current agent and for the previous version of
+web-manager/tunnel_agent.py taken from git (skipped if unavailable):
+- download: bulk local -> proxy, MB/s and agent CPU%,
+- upload: proxy -> sink, MB/s and agent CPU%, EOF on the C frame,
+- echo round trip of 64-byte messages, idle and during a download.
+
+Usage: python3 tests/bench_tunnel_agent.py [size_mb]
+"""
+import os
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+AGENT_PATH = os.path.join(ROOT, 'web-manager', 'tunnel_agent.py')
+sys.path.insert(0, os.path.join(ROOT, 'web-manager'))
+import tunnel_agent  # noqa: E402
+
+SIZE = int(sys.argv[1]) * 1024 * 1024 if len(sys.argv) > 1 else 256 * 1024 * 1024
+PROXY_CHUNK = 64 * 1024
+ECHO_MESSAGES = 200
+HEADER = tunnel_agent.FRAME_HEADER
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+# ============================================================================
+# LOCAL SERVICES
+# ============================================================================
+
+def serve(handler):
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(16)
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handler, args=(conn,), daemon=True).start()
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def bulk_handler(conn):
+    """Send SIZE bytes then close (recording download)."""
+    block = memoryview(os.urandom(1024 * 1024))
+    remaining = SIZE
+    try:
+        while remaining:
+            count = min(remaining, len(block))
+            conn.sendall(block[:count])
+            remaining -= count
+    except OSError:
+        pass
+    conn.close()
+
+
+sink_done = {}
+
+
+def sink_handler(conn):
+    """Count bytes (upload): 'full' once SIZE bytes arrived, 'eof' when the agent closes."""
+    buffer = bytearray(256 * 1024)
+    total = 0
+    while True:
+        count = conn.recv_into(buffer)
+        if not count:
+            break
+        total += count
+        sink_done['bytes'] = total
+        if total >= SIZE and not sink_done['full'].is_set():
+            sink_done['at'] = time.perf_counter()
+            sink_done['full'].set()
+    sink_done['eof'].set()
+    conn.close()
+
+
+def echo_handler(conn):
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        conn.sendall(data)
+    conn.close()
+
+
+# ============================================================================
+# STAND-IN PROXY
+# ============================================================================
+
+class StandInProxy:
+    """Accepts one agent, then opens streams and counts what comes back."""
+
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.write_lock = threading.Lock()
+        self.streams = {}
+        self.next_id = 1
+
+    def accept(self, timeout=10):
+        self.listener.settimeout(timeout)
+        self.conn, _ = self.listener.accept()
+        self.conn.settimeout(None)
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = tunnel_agent.FrameReader(self.conn, 1024 * 1024)
+        line = self.reader.read_line()
+        self.conn.sendall(b'{"status":"authenticated","device_key":"bench"}\n')
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        return line
+
+    def _read_loop(self):
+        while True:
+            frame = self.reader.read_frame()
+            if frame is None:
+                return
+            frame_type, stream_id, payload = frame
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                continue
+            if frame_type == tunnel_agent.FRAME_DATA:
+                stream['bytes'] += len(payload)
+                if stream['echo'] is not None:
+                    stream['echo'].extend(payload)
+                    stream['event'].set()
+            elif frame_type == tunnel_agent.FRAME_CLOSE:
+                stream['closed_at'] = time.perf_counter()
+                stream['closed'].set()
+
+    def send(self, frame_type, stream_id, payload=b''):
+        with self.write_lock:
+            self.conn.sendall(HEADER.pack(frame_type, stream_id, len(payload)) + payload)
+
+    def open(self, port, echo=False):
+        stream_id = self.next_id
+        self.next_id += 1
+        self.streams[stream_id] = {'bytes': 0, 'closed': threading.Event(), 'closed_at': None,
+                                   'echo': bytearray() if echo else None, 'event': threading.Event()}
+        self.send(tunnel_agent.FRAME_NEW, stream_id, struct.pack('>H', port))
+        return stream_id
+
+    def close(self):
+        for sock in (getattr(self, 'conn', None), self.listener):
+            if sock is not None:
+                sock.close()
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+def echo_rtts(proxy, stream_id, count, stop=None):
+    stream = proxy.streams[stream_id]
+    message = b'x' * 64
+    rtts = []
+    for _ in range(count):
+        if stop is not None and stop.is_set():
+            break
+        stream['echo'].clear()
+        stream['event'].clear()
+        started = time.perf_counter()
+        proxy.send(tunnel_agent.FRAME_DATA, stream_id, message)
+        while len(stream['echo']) < len(message):
+            if not stream['event'].wait(5):
+                return rtts
+            stream['event'].clear()
+        rtts.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.005)
+    return rtts
+
+
+def run_agent(label, path, ports):
+    proxy = StandInProxy()
+    script = (
+        "import importlib.util, logging, sys\n"
+        "spec = importlib.util.spec_from_file_location('tunnel_agent_bench', sys.argv[1])\n"
+        "module = importlib.util.module_from_spec(spec)\n"
+        "spec.loader.exec_module(module)\n"
+        "logging.basicConfig(level=logging.WARNING)\n"
+        "module.TunnelAgent('benchdevicekey', 'token', '127.0.0.1', int(sys.argv[2]), use_ssl=False).start()\n"
+    )
+    process = subprocess.Popen([sys.executable, '-c', script, path, str(proxy.port)])
+    results = {}
+    try:
+        handshake = proxy.accept()
+        check(f"[{label}] handshake {handshake[:40]!r}...", b'benchdevicekey' in handshake)
+        time.sleep(0.2)
+
+        # Download
+        cpu = cpu_seconds(process.pid)
+        started = time.perf_counter()
+        stream_id = proxy.open(ports['bulk'])
+        stream = proxy.streams[stream_id]
+        stream['closed'].wait(120)
+        elapsed = stream['closed_at'] - started if stream['closed_at'] else float('inf')
+        used = cpu_seconds(process.pid) - cpu
+        results['download'] = (SIZE / elapsed / 1e6, used / elapsed * 100, used / (SIZE / 1e6) * 1000)
+        check(f"[{label}] download: {stream['bytes'] / 1e6:.0f} MB received then C",
+              stream['bytes'] == SIZE and stream['closed'].is_set())
+
+        # Upload
+        sink_done.update({'full': threading.Event(), 'eof': threading.Event(), 'bytes': 0})
+        stream_id = proxy.open(ports['sink'])
+        time.sleep(0.1)
+        block = os.urandom(PROXY_CHUNK)
+        cpu = cpu_seconds(process.pid)
+        started = time.perf_counter()
+        for _ in range(SIZE // PROXY_CHUNK):
+            proxy.send(tunnel_agent.FRAME_DATA, stream_id, block)
+        proxy.send(tunnel_agent.FRAME_CLOSE, stream_id)
+        sink_done['full'].wait(120)
+        elapsed = sink_done.get('at', float('inf')) - started
+        used = cpu_seconds(process.pid) - cpu
+        results['upload'] = (SIZE / elapsed / 1e6, used / elapsed * 100, used / (SIZE / 1e6) * 1000)
+        check(f"[{label}] upload: {sink_done.get('bytes', 0) / 1e6:.0f} MB written to the local sink",
+              sink_done.get('bytes') == SIZE)
+        # C frame -> the local service sees EOF (the previous agent closed the socket under
+        # its blocked reader thread: no FIN, an scp upload never completed)
+        results['eof'] = sink_done['eof'].wait(2)
+        if label == 'current':
+            check(f"[{label}] C frame delivers EOF to the local service", results['eof'])
+
+        # Interactive latency, idle then during a download
+        echo_id = proxy.open(ports['echo'], echo=True)
+        time.sleep(0.1)
+        idle = echo_rtts(proxy, echo_id, ECHO_MESSAGES)
+        bulk_id = proxy.open(ports['bulk'])
+        time.sleep(0.05)
+        loaded = echo_rtts(proxy, echo_id, ECHO_MESSAGES, stop=proxy.streams[bulk_id]['closed'])
+        proxy.streams[bulk_id]['closed'].wait(120)
+        check(f"[{label}] echo answered idle ({len(idle)}) and during the download ({len(loaded)})",
+              len(idle) == ECHO_MESSAGES and len(loaded) > 10)
+        # Nothing listening: the stream is refused with a C frame
+        unused = socket.socket()
+        unused.bind(('127.0.0.1', 0))
+        refused_id = proxy.open(unused.getsockname()[1])
+        unused.close()
+        check(f"[{label}] N to a closed local port -> C", proxy.streams[refused_id]['closed'].wait(5))
+        results['rtt_idle'] = idle
+        results['rtt_loaded'] = loaded
+    finally:
+        process.kill()
+        process.wait()
+        proxy.close()
+    return results
+
+
+def previous_version():
+    """Most recent committed tunnel_agent.py that differs from the working copy."""
+    with open(AGENT_PATH, 'rb') as f:
+        current = f.read()
+    try:
+        revisions = subprocess.run(['git', '-C', ROOT, 'log', '--format=%H', '--', 'web-manager/tunnel_agent.py'],
+                                   capture_output=True, text=True, timeout=30).stdout.split()
+    except (OSError, subprocess.TimeoutExpired):
+        return None, None
+    for revision in revisions:
+        content = subprocess.run(['git', '-C', ROOT, 'show', f'{revision}:web-manager/tunnel_agent.py'],
+                                 capture_output=True, timeout=30).stdout
+        if content and content != current:
+            path = os.path.join(tempfile.mkdtemp(prefix='bench_tunnel_'), 'tunnel_agent_previous.py')
+            with open(path, 'wb') as f:
+                f.write(content)
+            return path, revision[:7]
+    return None, None
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else float('nan')
+
+
+def rtt_summary(values):
+    """p50/p99 in ms, n/a when no round trip completed (e.g. download too short)."""
+    if not values:
+        return 'n/a'
+    return f"{statistics.median(values):.2f}/{percentile(values, 99):.2f}"
+
+
+def main():
+    ports = {'bulk': serve(bulk_handler), 'sink': serve(sink_handler), 'echo': serve(echo_handler)}
+    runs = []
+    legacy_path, legacy_rev = previous_version()
+    if legacy_path:
+        runs.append((f'previous ({legacy_rev})', legacy_path))
+    else:
+        print("[SKIP] previous tunnel_agent.py not found in git")
+    runs.append(('current', AGENT_PATH))
+
+    results = {label: run_agent(label, path, ports) for label, path in runs}
+
+    print(f"\n{'':<20} {'download MB/s':>14} {'CPU%':>6} {'CPU ms/MB':>10} {'upload MB/s':>12} {'CPU%':>6} "
+          f"{'CPU ms/MB':>10} {'EOF':>4} {'echo p50/p99 idle':>18} {'p50/p99 loaded':>16}")
+    for label, r in results.items():
+        idle, loaded = r['rtt_idle'], r['rtt_loaded']
+        print(f"{label:<20} {r['download'][0]:>14.0f} {r['download'][1]:>6.0f} {r['download'][2]:>10.1f} "
+              f"{r['upload'][0]:>12.0f} {r['upload'][1]:>6.0f} {r['upload'][2]:>10.1f} "
+              f"{'yes' if r['eof'] else 'no':>4} "
+              f"{rtt_summary(idle):>15} ms {rtt_summary(loaded):>13} ms")
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Test: rtsp_probe_service against an in-process RTSP server
+
+The fake server answers DESCRIBE/SETUP/PLAY/TEARDOWN with Digest
+authentication (with and without qop) and streams interleaved H.264 RTP:
+STAP-A SPS/PPS + FU-A IDR every GOP frames, single-NAL P frames, a known
+payload size per frame and optional dropped packets. It can refuse TCP
+(461) and stream to the client_port over UDP instead. Checks:
+- fps, bitrate, keyframe interval / GOP length, lost packets, first frame,
+- wrong password -> unhealthy, session without RTP -> unhealthy,
+- RTSP_PROTOCOLS: UDP fallback on 461, UDP only, every transport refused ->
+  healthy but not probed,
+- keyframe detection for H.264/H.265 single, fragmented and aggregated NALs,
+- get_stream_health: one probe shared through the state file (cache + single-flight).
+
+Usage: python3 tests/test_rtsp_probe.py
+"""
+import hashlib
+import os
+import re
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import rtsp_probe_service as probe  # noqa: E402
+
+USER = 'admin'
+PASSWORD = 'secret'
+REALM = 'RPi Camera'
+NONCE = 'a1b2c3d4e5f6'
+SPS = b'\x67\x64\x00\x28\xac\xd9\x40\x78'
+PPS = b'\x68\xee\x3c\x80'
+
+
+def md5(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class FakeRtspServer:
+    """Minimal RTSP server: one session per connection, RTP interleaved or over UDP."""
+
+    def __init__(self, fps=25, gop=25, frame_bytes=2000, qop=True, send_rtp=True, drop_every=0,
+                 transports=('tcp',)):
+        self.fps = fps
+        self.gop = gop
+        self.frame_bytes = frame_bytes
+        self.qop = qop
+        self.send_rtp = send_rtp
+        self.drop_every = drop_every
+        self.transports = transports
+        self.setups = []  # Transport header of every SETUP
+        self.sessions = 0
+        self.teardowns = 0
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(8)
+        self.port = self.listener.getsockname()[1]
+        self.url = f'rtsp://127.0.0.1:{self.port}/stream'
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self.listener.close()
+
+    def _authorized(self, method, headers):
+        value = headers.get('authorization', '')
+        if not value.startswith('Digest '):
+            return False
+        params = {k: (q or p) for k, q, p in re.findall(r'(\w+)=(?:"([^"]*)"|([^,\s]*))', value)}
+        ha1 = md5(f"{USER}:{REALM}:{PASSWORD}")
+        ha2 = md5(f"{method}:{params.get('uri')}")
+        if self.qop:
+            expected = md5(f"{ha1}:{NONCE}:{params.get('nc')}:{params.get('cnonce')}:auth:{ha2}")
+        else:
+            expected = md5(f"{ha1}:{NONCE}:{ha2}")
+        return params.get('username') == USER and params.get('response') == expected
+
+    def _serve(self, conn):
+        buffer = b''
+        streamer = None
+        client_port = None
+        stop = threading.Event()
+        try:
+            while True:
+                while b'\r\n\r\n' not in buffer:
+                    data = conn.recv(4096)
+                    if not data:
+                        return
+                    buffer += data
+                head, buffer = buffer.split(b'\r\n\r\n', 1)
+                lines = head.decode().split('\r\n')
+                method, uri, _ = lines[0].split(' ')
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                reply = [f"CSeq: {headers.get('cseq')}"]
+                body = b''
+                if method == 'TEARDOWN':
+                    self.teardowns += 1
+                    stop.set()
+                    conn.sendall(('RTSP/1.0 200 OK\r\n' + '\r\n'.join(reply) + '\r\n\r\n').encode())
+                    return
+                if not self._authorized(method, headers):
+                    challenge = f'Digest realm="{REALM}", nonce="{NONCE}"' + (', qop="auth"' if self.qop else '')
+                    reply += [f'WWW-Authenticate: {challenge}', 'WWW-Authenticate: Basic realm="RPi Camera"']
+                    conn.sendall(('RTSP/1.0 401 Unauthorized\r\n' + '\r\n'.join(reply) + '\r\n\r\n').encode())
+                    continue
+                if method == 'DESCRIBE':
+                    body = (f"v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=Stream\r\nt=0 0\r\n"
+                            f"a=control:*\r\nm=video 0 RTP/AVP 96\r\na=rtpmap:96 H264/90000\r\n"
+                            f"a=control:stream=0\r\nm=audio 0 RTP/AVP 97\r\na=rtpmap:97 MPEG4-GENERIC/48000\r\n"
+                            f"a=control:stream=1\r\n").encode()
+                    reply += [f'Content-Base: {self.url}/', 'Content-Type: application/sdp',
+                              f'Content-Length: {len(body)}']
+                elif method == 'SETUP':
+                    if uri != f'{self.url}/stream=0':
+                        conn.sendall(('RTSP/1.0 404 Not Found\r\n' + '\r\n'.join(reply) + '\r\n\r\n').encode())
+                        continue
+                    transport = headers.get('transport', '')
+                    self.setups.append(transport)
+                    match = re.search(r'client_port=(\d+)', transport)
+                    if '/TCP' in transport and 'tcp' in self.transports:
+                        client_port = None
+                    elif match and 'udp' in self.transports:
+                        client_port = int(match.group(1))
+                    else:
+                        conn.sendall(('RTSP/1.0 461 Unsupported Transport\r\n' + '\r\n'.join(reply)
+                                      + '\r\n\r\n').encode())
+                        continue
+                    reply += ['Session: 12345678;timeout=60', f'Transport: {transport};server_port=6970-6971']
+                elif method == 'PLAY':
+                    self.sessions += 1
+                    reply += ['Session: 12345678', 'Range: npt=now-']
+                conn.sendall(('RTSP/1.0 200 OK\r\n' + '\r\n'.join(reply) + '\r\n\r\n').encode() + body)
+                if method == 'PLAY' and self.send_rtp:
+                    streamer = threading.Thread(target=self._stream, args=(conn, stop, client_port), daemon=True)
+                    streamer.start()
+        except OSError:
+            pass
+        finally:
+            stop.set()
+            if streamer:
+                streamer.join(1)
+            conn.close()
+
+    def _stream(self, conn, stop, client_port=None):
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if client_port else None
+        seq = 1000
+        timestamp = 0xFFFFFFFF - 90000  # wraps during the probe
+        frame = 0
+        started = time.monotonic()
+        while not stop.is_set():
+            if frame % self.gop == 0:
+                stap = b'\x18' + struct.pack('!H', len(SPS)) + SPS + struct.pack('!H', len(PPS)) + PPS
+                idr = b'\x65' + b'\x00' * (self.frame_bytes - len(stap) - 1)
+                half = len(idr) // 2
+                payloads = [stap,
+                            bytes([0x7C, 0x85]) + idr[1:half],
+                            bytes([0x7C, 0x45]) + idr[half:]]
+                # keep the frame's total payload size at frame_bytes
+                payloads[-1] += b'\x00' * (self.frame_bytes - sum(map(len, payloads)))
+            else:
+                payloads = [b'\x41' + b'\x00' * (self.frame_bytes - 1)]
+            try:
+                for i, payload in enumerate(payloads):
+                    seq = (seq + 1) & 0xFFFF
+                    if self.drop_every and seq % self.drop_every == 0:
+                        continue
+                    marker = 0x80 if i == len(payloads) - 1 else 0
+                    rtp = struct.pack('!BBHII', 0x80, marker | 96, seq, timestamp, 0x1234) + payload
+                    if udp:
+                        udp.sendto(rtp, ('127.0.0.1', client_port))
+                    else:
+                        conn.sendall(b'$\x00' + struct.pack('!H', len(rtp)) + rtp)
+            except OSError:
+                break
+            frame += 1
+            timestamp = (timestamp + 90000 // self.fps) & 0xFFFFFFFF
+            delay = started + frame / self.fps - time.monotonic()
+            if delay > 0:
+                stop.wait(delay)
+        if udp:
+            udp.close()
+
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def main():
+    # Keyframe detection on RTP payloads
+    check("H.264 IDR / SPS / P slice", probe.is_keyframe_payload(b'\x65\x88', 'h264')
+          and probe.is_keyframe_payload(SPS, 'h264') and not probe.is_keyframe_payload(b'\x41\x9a', 'h264'))
+    check("H.264 FU-A: IDR start only", probe.is_keyframe_payload(b'\x7c\x85\x00', 'h264')
+          and not probe.is_keyframe_payload(b'\x7c\x45\x00', 'h264')
+          and not probe.is_keyframe_payload(b'\x5c\x81\x00', 'h264'))
+    check("H.264 STAP-A with SPS", probe.is_keyframe_payload(
+        b'\x18' + struct.pack('!H', len(SPS)) + SPS, 'h264'))
+    check("H.265 IDR_W_RADL / TRAIL_R", probe.is_keyframe_payload(b'\x26\x01\x00', 'h265')
+          and not probe.is_keyframe_payload(b'\x02\x01\x00', 'h265'))
+    check("H.265 FU start of IDR / AP with VPS", probe.is_keyframe_payload(b'\x62\x01\x93', 'h265')
+          and probe.is_keyframe_payload(b'\x60\x01\x00\x03\x40\x01\x0c', 'h265'))
+
+    # Healthy stream, Digest with qop, 25 fps, GOP 25, 2000 B/frame = 400 kb/s
+    server = FakeRtspServer()
+    result = probe.probe_rtsp_stream(server.url, USER, PASSWORD, duration=2.0)
+    print(f"[TEST] {result}")
+    check(f"healthy: {result['message']}", result['healthy'])
+    check(f"fps ~25 ({result.get('fps')})", result.get('fps') and abs(result['fps'] - 25) < 0.5)
+    check(f"bitrate ~400 kb/s ({result.get('bitrate_kbps')})",
+          result.get('bitrate_kbps') and abs(result['bitrate_kbps'] - 400) < 25)
+    check(f"keyframe interval 1 s, GOP 25 frames ({result.get('keyframe_interval')}, {result.get('gop_frames')})",
+          result.get('keyframe_interval') == 1.0 and result.get('gop_frames') == 25)
+    check(f"first frame latency measured ({result.get('first_frame_ms')} ms)",
+          result.get('first_frame_ms') is not None and result['first_frame_ms'] < 1000)
+    check("codec h264, no loss, no credentials in url", result.get('codec') == 'h264'
+          and result.get('lost_packets') == 0 and PASSWORD not in result['url'])
+    time.sleep(0.2)
+    check(f"TEARDOWN sent ({server.teardowns})", server.teardowns == 1)
+
+    # Credentials embedded in the URL, Digest without qop, 10 fps, GOP 5, packet loss
+    lossy = FakeRtspServer(fps=10, gop=5, frame_bytes=1000, qop=False, drop_every=7)
+    url = lossy.url.replace('rtsp://', f'rtsp://{USER}:{PASSWORD}@')
+    result = probe.probe_rtsp_stream(url, duration=2.0)
+    print(f"[TEST] {result}")
+    check(f"no-qop Digest, URL credentials: healthy ({result['message']})", result['healthy'])
+    check(f"10 fps, keyframe every 0.5 s ({result.get('fps')}, {result.get('keyframe_interval')})",
+          result.get('fps') and abs(result['fps'] - 10) < 0.5 and result.get('keyframe_interval') == 0.5)
+    check(f"lost packets counted ({result.get('lost_packets')})", result.get('lost_packets', 0) > 0)
+
+    result = probe.probe_rtsp_stream(server.url, USER, 'wrong', duration=1.0)
+    check(f"wrong password -> unhealthy ({result['message']})", not result['healthy'] and '401' in result['message'])
+
+    stalled = FakeRtspServer(send_rtp=False)
+    started = time.monotonic()
+    result = probe.probe_rtsp_stream(stalled.url, USER, PASSWORD, duration=0.5, timeout=1.0)
+    check(f"session without RTP -> unhealthy in {time.monotonic() - started:.1f} s ({result['message']})",
+          not result['healthy'] and time.monotonic() - started < 3)
+
+    # RTSP_PROTOCOLS: transport order, UDP fallback, refusal
+    check("transport order from RTSP_PROTOCOLS", probe.probe_transports('udp,tcp') == ('tcp', 'udp')
+          and probe.probe_transports('udp') == ('udp',) and probe.probe_transports('udp-mcast') == ('udp',)
+          and probe.probe_transports('') == ('tcp', 'udp'))
+    udp_only = FakeRtspServer(fps=10, gop=10, frame_bytes=1000, transports=('udp',))
+    result = probe.probe_rtsp_stream(udp_only.url, USER, PASSWORD, duration=1.5)
+    print(f"[TEST] {result}")
+    check(f"TCP refused (461) -> UDP fallback healthy ({result['message']})",
+          result['healthy'] and result.get('probed') and result.get('transport') == 'udp'
+          and len(udp_only.setups) == 2 and '/TCP' in udp_only.setups[0])
+    check(f"UDP: 10 fps, keyframe every 1 s ({result.get('fps')}, {result.get('keyframe_interval')})",
+          result.get('fps') and abs(result['fps'] - 10) < 0.5 and result.get('keyframe_interval') == 1.0)
+    result = probe.probe_rtsp_stream(udp_only.url, USER, PASSWORD, duration=1.0, protocols='udp')
+    check("RTSP_PROTOCOLS=udp -> UDP SETUP only", result['healthy'] and result.get('transport') == 'udp'
+          and len(udp_only.setups) == 3 and 'client_port=' in udp_only.setups[2])
+    mcast_only = FakeRtspServer(transports=())
+    result = probe.probe_rtsp_stream(mcast_only.url, USER, PASSWORD, duration=1.0, protocols='udp-mcast')
+    check(f"every transport refused -> alive, not probed ({result['message']})",
+          result['healthy'] and result.get('probed') is False)
+
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    port = closed.getsockname()[1]
+    closed.close()
+    result = probe.probe_rtsp_stream(f'rtsp://127.0.0.1:{port}/stream', duration=0.5)
+    check(f"connection refused -> unhealthy ({result['message']})", not result['healthy'])
+
+    # Shared result: one probe for concurrent callers, reused from the state file
+    with tempfile.TemporaryDirectory() as tmp:
+        probe.RTSP_PROBE_STATE_FILE = os.path.join(tmp, 'rtsp-probe.json')
+        probe.RTSP_PROBE_DURATION = 1.0
+        probe._local_stream_url = lambda config: (server.url, USER, PASSWORD)
+        sessions = server.sessions
+        check("nothing cached yet", probe.get_cached_stream_health() is None)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(probe.get_stream_health())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        check(f"4 concurrent callers -> 1 RTSP session ({server.sessions - sessions})",
+              server.sessions - sessions == 1 and len(results) == 4 and all(r['healthy'] for r in results))
+        check("state file written", os.path.exists(probe.RTSP_PROBE_STATE_FILE))
+
+        probe._last_result = None  # another process: only the state file is known
+        started = time.perf_counter()
+        cached = probe.get_stream_health()
+        elapsed = time.perf_counter() - started
+        check(f"fresh state file reused in {elapsed * 1e3:.2f} ms (age {cached['age']} s)",
+              server.sessions - sessions == 1 and cached['healthy'])
+        check("refresh_stream_health_async skips a fresh result", probe.refresh_stream_health_async() is False)
+        probe.get_stream_health(max_age=0)
+        check("max_age=0 probes again", server.sessions - sessions == 2)
+
+    for fake in (server, lossy, stalled):
+        fake.close()
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test: rtsp_segmenter.py on a synthetic MPEG-TS stream
+
+Feeds a generated stream (PAT/PMT, H.264 video PID with an IDR every
+GOP_FRAMES frames, audio PID) in odd-sized chunks and checks that:
+- every segment starts with PAT/PMT followed by an IDR packet,
+- segments are cut on the first IDR past SEGMENT_SECONDS,
+- a clip contains the requested pre-roll and post-roll.
+
+Usage: python3 tests/test_rtsp_segmenter.py
+"""
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import rtsp_segmenter as seg  # noqa: E402
+
+FPS = 25
+GOP_FRAMES = 25          # 1 IDR per second
+SEGMENT_SECONDS = 4
+PMT_PID = 0x1000
+VIDEO_PID = 0x100
+AUDIO_PID = 0x101
+
+
+def psi_packet(pid, section):
+    payload = b'\x00' + section
+    return bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10]) + payload + b'\xff' * (184 - len(payload))
+
+
+def pat():
+    body = bytes([0x00, 0x01, 0xC1, 0x00, 0x00, 0x00, 0x01, 0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF])
+    return psi_packet(0, bytes([0x00, 0xB0, len(body) + 4]) + body + b'\x00' * 4)
+
+
+def pmt():
+    streams = bytes([0x1B, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00,
+                     0x0F, 0xE0 | (AUDIO_PID >> 8), AUDIO_PID & 0xFF, 0xF0, 0x00])
+    body = bytes([0x00, 0x01, 0xC1, 0x00, 0x00, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00]) + streams
+    return psi_packet(PMT_PID, bytes([0x02, 0xB0, len(body) + 4]) + body + b'\x00' * 4)
+
+
+def encode_pts(pts):
+    return bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, 0x01 | ((pts >> 14) & 0xFE),
+                  (pts >> 7) & 0xFF, 0x01 | ((pts << 1) & 0xFE)])
+
+
+def video_frame(pts, keyframe, n_packets=6):
+    pes = b'\x00\x00\x01\xe0\x00\x00\x80\x80\x05' + encode_pts(pts)
+    packets = []
+    # First packet: adaptation field (RAI on keyframes) + PES header
+    flags = 0x40 if keyframe else 0x00
+    head = bytes([0x47, 0x40 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0x30, 7, flags]) + b'\xff' * 6
+    packets.append(head + pes + b'\x00' * (188 - len(head) - len(pes)))
+    for _ in range(n_packets - 1):
+        packets.append(bytes([0x47, VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0x10]) + b'\x00' * 184)
+    return b''.join(packets)
+
+
+def audio_packet():
+    return bytes([0x47, 0x40 | (AUDIO_PID >> 8), AUDIO_PID & 0xFF, 0x10]) + b'\x00' * 184
+
+
+def build_stream(seconds):
+    out = bytearray()
+    for frame in range(seconds * FPS):
+        if frame % GOP_FRAMES == 0:
+            out += pat() + pmt()
+        out += video_frame(frame * 90000 // FPS, frame % GOP_FRAMES == 0)
+        out += audio_packet()
+    return bytes(out)
+
+
+def segment_duration(path):
+    """Seconds covered by a segment (first to last video PTS)."""
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    pts = []
+    for pos in range(0, len(data), 188):
+        packet = data[pos:pos + 188]
+        if seg.ts_pid(packet) == VIDEO_PID and seg.ts_payload_unit_start(packet):
+            pts.append(seg.pes_pts(packet))
+    return data, (pts[-1] - pts[0]) / 90000 + 1 / FPS if pts else 0
+
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    notified = []
+    conf = dict(seg.CONF, RECORD_DIR=tmp, SEGMENT_SECONDS=SEGMENT_SECONDS, CLIP_PREROLL_MAX_SECONDS=5)
+    segmenter = seg.TsSegmenter(conf, notify=notified.append)
+    stream = build_stream(20)
+    half = len(stream) // 2
+
+    # Feed the first half in odd-sized chunks, request a clip, feed the rest
+    rng = random.Random(1)
+    pos = 0
+    while pos < half:
+        step = rng.randint(1, 5000)
+        segmenter.feed(stream[pos:pos + step])
+        pos += step
+    clip = segmenter.request_clip(pre_seconds=3, post_seconds=2)
+    while pos < len(stream):
+        step = rng.randint(1, 5000)
+        segmenter.feed(stream[pos:pos + step])
+        pos += step
+    segmenter.close()
+
+    status = segmenter.get_status()
+    print(f"[TEST] status: {status}\n")
+
+    check("video PID detected from PMT", status['video_pid'] == VIDEO_PID)
+    check("no resync needed", status['resyncs'] == 0)
+
+    segments = sorted(p for p in notified if os.path.basename(p).startswith('rec_'))
+    clips = [p for p in notified if os.path.basename(p).startswith('clip_')]
+    check(f"{len(segments)} segments notified (20s / {SEGMENT_SECONDS}s = 5)", len(segments) == 5)
+
+    for path in segments:
+        data, duration = segment_duration(path)
+        starts_ok = (seg.ts_pid(data[0:188]) == 0 and seg.ts_pid(data[188:376]) == PMT_PID
+                     and seg.ts_random_access(data[376:564]))
+        check(f"{os.path.basename(path)}: PAT/PMT + IDR first, {duration:.2f}s", starts_ok
+              and abs(duration - SEGMENT_SECONDS) < 1e-6)
+
+    check("clip request accepted", clip['success'])
+    check("one clip written", len(clips) == 1)
+    if clips:
+        data, duration = segment_duration(clips[0])
+        check(f"clip covers pre-roll + post-roll ({duration:.2f}s >= 5s)", duration >= 5)
+        check("clip starts on an IDR", seg.ts_random_access(data[376:564]))
+
+if failures:
+    print(f"\n✗ {failures} check(s) failed")
+    sys.exit(1)
+print("\n[DONE]")
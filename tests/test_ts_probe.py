@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Test: ts_probe_service (native MPEG-TS probe) on synthetic recordings
+
+Generates .ts files (PAT/PMT, H.264 video PID carrying PCR, AUD/SPS/PPS
+before every IDR, optional AAC PID) and checks the probed duration,
+resolution, profile, frame rate and audio presence, including:
+- a long file (head + tail reads) and a short one (single read),
+- a PTS wrap-around (33-bit) inside the file,
+- a truncated last packet (segment still being written),
+- an HEVC file (unsupported -> None, caller falls back to ffprobe),
+- extract_first_idr: first IDR access unit with its SPS/PPS (thumbnails).
+
+Usage: python3 tests/test_ts_probe.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web-manager'))
+from services import ts_probe_service as probe  # noqa: E402
+
+PMT_PID = 0x1000
+VIDEO_PID = 0x100
+AUDIO_PID = 0x101
+
+
+class BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def u(self, bits, value):
+        self.bits += [(value >> (bits - 1 - i)) & 1 for i in range(bits)]
+
+    def ue(self, value):
+        code = value + 1
+        length = code.bit_length()
+        self.u(length - 1, 0)
+        self.u(length, code)
+
+    def rbsp(self):
+        bits = self.bits + [1]
+        bits += [0] * (-len(bits) % 8)
+        return bytes(int(''.join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8))
+
+
+def escape(rbsp):
+    """Insert emulation prevention bytes."""
+    out = bytearray()
+    zeros = 0
+    for byte in rbsp:
+        if zeros >= 2 and byte <= 3:
+            out.append(3)
+            zeros = 0
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(out)
+
+
+def make_sps(width, height, fps, profile_idc=100, level_idc=40):
+    w = BitWriter()
+    w.u(8, profile_idc)
+    w.u(8, 0)
+    w.u(8, level_idc)
+    w.ue(0)                          # seq_parameter_set_id
+    if profile_idc == 100:
+        w.ue(1)                      # chroma_format_idc 4:2:0
+        w.ue(0)
+        w.ue(0)
+        w.u(1, 0)
+        w.u(1, 0)                    # no scaling matrix
+    w.ue(0)                          # log2_max_frame_num_minus4
+    w.ue(0)                          # pic_order_cnt_type
+    w.ue(4)
+    w.ue(1)                          # max_num_ref_frames
+    w.u(1, 0)
+    mbs_w, mbs_h = (width + 15) // 16, (height + 15) // 16
+    w.ue(mbs_w - 1)
+    w.ue(mbs_h - 1)
+    w.u(1, 1)                        # frame_mbs_only_flag
+    w.u(1, 1)                        # direct_8x8_inference_flag
+    crop_bottom = (mbs_h * 16 - height) // 2
+    w.u(1, 1 if crop_bottom else 0)
+    if crop_bottom:
+        w.ue(0)
+        w.ue(0)
+        w.ue(0)
+        w.ue(crop_bottom)
+    w.u(1, 1)                        # vui_parameters_present_flag
+    w.u(1, 0)
+    w.u(1, 0)
+    w.u(1, 0)
+    w.u(1, 0)
+    w.u(1, 1)                        # timing_info_present_flag
+    w.u(32, 1000)
+    w.u(32, fps * 2000)
+    w.u(1, 1)
+    return b'\x67' + escape(w.rbsp())
+
+
+def psi_packet(pid, section):
+    payload = b'\x00' + section
+    return bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10]) + payload + b'\xff' * (184 - len(payload))
+
+
+def pat():
+    body = bytes([0x00, 0x01, 0xC1, 0x00, 0x00, 0x00, 0x01, 0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF])
+    return psi_packet(0, bytes([0x00, 0xB0, len(body) + 4]) + body + b'\x00' * 4)
+
+
+def pmt(video_type=0x1B, audio=True):
+    streams = bytes([video_type, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00])
+    if audio:
+        streams += bytes([0x0F, 0xE0 | (AUDIO_PID >> 8), AUDIO_PID & 0xFF, 0xF0, 0x00])
+    body = bytes([0x00, 0x01, 0xC1, 0x00, 0x00, 0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0xF0, 0x00]) + streams
+    return psi_packet(PMT_PID, bytes([0x02, 0xB0, len(body) + 4]) + body + b'\x00' * 4)
+
+
+def encode_pts(pts):
+    return bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, 0x01 | ((pts >> 14) & 0xFE),
+                  (pts >> 7) & 0xFF, 0x01 | ((pts << 1) & 0xFE)])
+
+
+def video_frame(pts, es, n_packets):
+    """PES split over n_packets; the first one carries a PCR (= PTS - 0.1 s)."""
+    pes = b'\x00\x00\x01\xe0\x00\x00\x80\x80\x05' + encode_pts(pts) + es
+    pcr = (pts - 9000) % (1 << 33)
+    adaptation = bytes([0x10, (pcr >> 25) & 0xFF, (pcr >> 17) & 0xFF, (pcr >> 9) & 0xFF,
+                        (pcr >> 1) & 0xFF, ((pcr & 1) << 7) | 0x7E, 0x00])
+    head = bytes([0x47, 0x40 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0x30, len(adaptation)]) + adaptation
+    first = 188 - len(head)
+    packets = [head + pes[:first]]
+    rest = pes[first:]
+    for _ in range(n_packets - 1):
+        chunk = rest[:184]
+        rest = rest[184:]
+        packets.append(bytes([0x47, VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0x10]) + chunk + b'\x00' * (184 - len(chunk)))
+    return b''.join(packets)
+
+
+def audio_packet():
+    return bytes([0x47, 0x40 | (AUDIO_PID >> 8), AUDIO_PID & 0xFF, 0x10]) + b'\x00' * 184
+
+
+def build_stream(seconds, fps=25, gop=25, width=1920, height=1080, start_pts=126000,
+                 video_type=0x1B, audio=True, packets_per_frame=8):
+    sps = make_sps(width, height, fps)
+    step = 90000 // fps
+    out = bytearray()
+    for frame in range(seconds * fps):
+        pts = (start_pts + frame * step) % (1 << 33)
+        if frame % gop == 0:
+            out += pat() + pmt(video_type, audio)
+            es = b'\x00\x00\x00\x01\x09\xf0' + b'\x00\x00\x00\x01' + sps + b'\x00\x00\x00\x01\x68\xce\x38\x80' \
+                + b'\x00\x00\x00\x01\x65\x88'
+        else:
+            es = b'\x00\x00\x00\x01\x09\xf0\x00\x00\x00\x01\x41\x9a'
+        out += video_frame(pts, es, packets_per_frame)
+        if audio:
+            out += audio_packet()
+    return bytes(out)
+
+
+failures = 0
+
+
+def check(label, condition):
+    global failures
+    print(f"{'✓' if condition else '✗'} {label}")
+    if not condition:
+        failures += 1
+
+
+def write(tmp, name, data):
+    path = os.path.join(tmp, name)
+    with open(path, 'wb') as handle:
+        handle.write(data)
+    return path
+
+
+def main():
+    sps = probe.parse_h264_sps(make_sps(1920, 1080, 30))
+    check(f"SPS 1920x1080 High 4.0 @30: {sps}", sps == {
+        'width': 1920, 'height': 1080, 'profile': 'High', 'level': 4.0, 'fps': 30.0})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        long_file = write(tmp, 'long.ts', build_stream(120))
+        meta = probe.probe_ts_file(long_file)
+        print(f"[TEST] long.ts ({os.path.getsize(long_file) // 1024} KB): {meta}")
+        check("long file: 120 s", meta and abs(meta['duration'] - 120) < 0.01)
+        check("long file: 1920x1080 h264 High, 25 fps, audio", meta and meta['resolution'] == '1920x1080'
+              and meta['codec'] == 'h264' and meta['profile'] == 'High' and meta['fps'] == 25.0
+              and meta['has_audio'] is True)
+        check("long file: bitrate = size / duration", meta and meta['bitrate'] == int(
+            os.path.getsize(long_file) * 8 / meta['duration']))
+
+        short = probe.probe_ts_file(write(tmp, 'short.ts', build_stream(3, fps=30, gop=30, width=1280,
+                                                                         height=720, audio=False)))
+        check(f"short file: 3 s 1280x720 30 fps, no audio ({short})", short and abs(short['duration'] - 3) < 0.01
+              and short['resolution'] == '1280x720' and short['fps'] == 30.0 and not short['has_audio'])
+
+        wrapped = probe.probe_ts_file(write(tmp, 'wrap.ts', build_stream(60, start_pts=(1 << 33) - 90000 * 20)))
+        check(f"PTS wrap-around: 60 s ({wrapped and wrapped['duration']})",
+              wrapped and abs(wrapped['duration'] - 60) < 0.01)
+
+        truncated = build_stream(30)
+        truncated = truncated[:len(truncated) - 100]
+        partial = probe.probe_ts_file(write(tmp, 'partial.ts', truncated))
+        check(f"truncated last packet: ~30 s ({partial and partial['duration']})",
+              partial and 29.9 < partial['duration'] <= 30)
+
+        access_unit = probe.extract_first_idr(long_file)
+        nal_types = [t for t, _, _ in probe._iter_nals(access_unit or b'')]
+        check(f"first IDR access unit: NAL types {nal_types}", nal_types == [9, 7, 8, 5])
+        check("first IDR SPS decodes to 1920x1080", access_unit and probe._find_sps(access_unit)['width'] == 1920)
+
+        hevc = probe.probe_ts_file(write(tmp, 'hevc.ts', build_stream(5, video_type=0x24)))
+        check("HEVC -> None (ffprobe fallback)", hevc is None)
+        check("not a TS file -> None", probe.probe_ts_file(write(tmp, 'junk.ts', os.urandom(100000))) is None)
+
+    if failures:
+        print(f"\n✗ {failures} check(s) failed")
+        sys.exit(1)
+    print("\n[DONE]")
+
+
+if __name__ == '__main__':
+    main()
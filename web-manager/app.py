@@ -4,7 +4,7 @@
 RTSP Recorder Web Manager - Main Application
 Modular Flask application with blueprints architecture.
 
-Version: 2.35.00
+Version: 2.35.01
 """
 
 import os
@@ -47,7 +47,7 @@ from services.watchdog_service import (
 )
 from services.camera_service import load_camera_profiles, profiles_scheduler_loop
 from services.network_service import manage_wifi_based_on_ethernet
-from services import media_cache_service
+from services import media_cache_service, shared_state_service
 
 # ============================================================================
 # LOGGING CONFIGURATION
@@ -78,17 +78,30 @@ logger = setup_logging()
 
 # Flag to track if background tasks have been initialized
 _background_tasks_started = False
+_background_tasks_lock = threading.Lock()
 _startup_thread = None
 
+def start_background_tasks_once(reason):
+    """
+    Join the leader election once per worker.
+
+    Only the elected Gunicorn worker runs start_background_tasks(); the others
+    serve requests and take over if the leader exits.
+    """
+    global _background_tasks_started
+    with _background_tasks_lock:
+        if _background_tasks_started:
+            return
+        _background_tasks_started = True
+    logger.info(f"Joining background tasks leader election ({reason})")
+    if not shared_state_service.start_leader_election(start_background_tasks):
+        logger.info(f"Worker {os.getpid()} is a follower, background tasks run in the leader")
+
 def _delayed_startup():
     """Start background tasks after a short delay (allows Gunicorn to fully initialize)."""
-    global _background_tasks_started
     import time
     time.sleep(2)  # Wait for Gunicorn workers to be ready
-    if not _background_tasks_started:
-        _background_tasks_started = True
-        logger.info("Starting background tasks (delayed startup)")
-        start_background_tasks()
+    start_background_tasks_once("delayed startup")
 
 def create_app():
     """Create and configure the Flask application."""
@@ -112,11 +125,8 @@ def create_app():
     # Start background tasks on first request (fallback) AND via delayed startup
     @app.before_request
     def init_once():
-        global _background_tasks_started
         if not _background_tasks_started:
-            _background_tasks_started = True
-            logger.info("Initializing background tasks (first request)")
-            start_background_tasks()
+            start_background_tasks_once("first request")
     
     # Also start a delayed startup thread (ensures tasks start even without HTTP requests)
     # This is critical for network failover when the device boots without connectivity
@@ -201,12 +211,12 @@ def enrich_system_info(info):
     
     # Recording info - calculate from actual files
     try:
-        from services.recording_service import get_recordings_list, get_recording_dir
+        from services.recording_service import get_recordings_summary
         from services.config_service import load_config as load_conf
         cfg = load_conf()
-        recordings = get_recordings_list(cfg, pattern='*.ts')
-        enriched['recording_count'] = len(recordings)
-        total_bytes = sum(r.get('size', 0) for r in recordings)
+        summary = get_recordings_summary(cfg, pattern='*.ts')
+        enriched['recording_count'] = summary['count']
+        total_bytes = summary['total_size']
         enriched['recording_size_mb'] = round(total_bytes / (1024 * 1024), 1)
         enriched['recording_size_human'] = format_bytes(total_bytes)
     except Exception as e:
@@ -351,7 +361,9 @@ def register_main_routes(app):
         return jsonify({
             'status': 'healthy',
             'version': APP_VERSION,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            'worker_pid': os.getpid(),
+            'leader': shared_state_service.is_leader()
         })
     
     @app.route('/api')
@@ -389,16 +401,17 @@ stop_events = {
 background_threads = {}
 
 def start_background_tasks():
-    """Start background worker threads."""
+    """Start background worker threads (leader worker only, see start_background_tasks_once)."""
     global background_threads
     
     # Load saved states
     load_watchdog_state()
     load_camera_profiles()
     
-    # Initialize media cache (SQLite + thumbnail worker)
+    # Initialize media cache (SQLite + thumbnail worker + recordings index)
     try:
-        media_cache_service.init_media_cache()
+        from services.recording_service import get_recording_dir
+        media_cache_service.init_media_cache(get_recording_dir())
         logger.info("Media cache service initialized")
     except Exception as e:
         logger.warning(f"Failed to initialize media cache: {e}")
@@ -509,7 +522,7 @@ if __name__ == '__main__':
     logger.info(f"Platform: {PLATFORM['model']}")
     
     # Start background tasks
-    start_background_tasks()
+    start_background_tasks_once("main")
     
     # Run Flask development server
     # In production, use gunicorn or similar
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 """
 Config Blueprint - Configuration and service management routes
-Version: 2.30.1
+Version: 2.30.2
+
+Changes in 2.30.2:
+- Added GET /api/config/cache (parsed config cache hit/miss counters)
 """
 
 from flask import Blueprint, request, jsonify
@@ -9,7 +12,8 @@ from flask import Blueprint, request, jsonify
 from services.config_service import (
     load_config, save_config, get_config_metadata, validate_config,
     get_service_status, control_service, get_all_services_status,
-    get_system_info, get_hostname, set_hostname, sync_recorder_service
+    get_system_info, get_hostname, set_hostname, sync_recorder_service,
+    get_config_cache_stats
 )
 from config import APP_VERSION, DEFAULT_CONFIG, CONFIG_METADATA
 
@@ -103,6 +107,14 @@ def get_config_meta():
         'defaults': DEFAULT_CONFIG
     })
 
+@config_bp.route('/config/cache', methods=['GET'])
+def get_config_cache():
+    """Get parsed config cache statistics (this worker)."""
+    return jsonify({
+        'success': True,
+        'cache': get_config_cache_stats()
+    })
+
 @config_bp.route('/config/reset', methods=['POST'])
 def reset_config():
     """Reset configuration to defaults."""
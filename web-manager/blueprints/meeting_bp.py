@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """
 Meeting Blueprint - Meeting API integration routes
-Version: 2.30.12
+Version: 2.30.13
 
 Conforms to Meeting API integration guide (docs/MEETING - integration.md):
 - Heartbeat: POST /api/devices/{device_key}/online
@@ -154,8 +154,8 @@ def disable():
 
 @meeting_bp.route('/heartbeat', methods=['POST'])
 def manual_heartbeat():
-    """Send a manual heartbeat."""
-    result = send_heartbeat()
+    """Send a manual heartbeat (always a full snapshot)."""
+    result = send_heartbeat(force_full=True)
     
     status_code = 200 if result['success'] else 400
     return jsonify(result), status_code
@@ -183,8 +183,8 @@ def debug_heartbeat():
     # First get the payload
     payload_result = get_heartbeat_payload()
     
-    # Then send the heartbeat
-    send_result = send_heartbeat()
+    # Then send the heartbeat (full snapshot, so that it matches the payload)
+    send_result = send_heartbeat(force_full=True)
     
     return jsonify({
         'success': send_result.get('success', False),
@@ -1,20 +1,34 @@
 # -*- coding: utf-8 -*-
 """
 Recordings Blueprint - Recording management routes
-Version: 2.30.7
+Version: 2.36.0
 
 Changelog:
+  - 2.36.0: Keyset cursors are after=<sort key>,<relative path> (file names repeat
+            across recording subdirectories)
+  - 2.35.1: GET '' passes its limit to get_recordings_list (only the returned
+            recordings are queued as visible thumbnail jobs)
+  - 2.35.0: Thumbnail jobs carry their priority class (visible page / fresh segment)
+  - 2.34.0: /thumbnail/notify validates and queues (202) instead of sleeping and
+            generating the thumbnail inside the request
+  - 2.33.0: Added /clip (pre/post-roll event clips) and /clip/status (RECORDER_MODE=segmenter)
+  - 2.32.0: /list supports keyset pagination (after=<mtime,name>) and server-side filters
+            (date_from/date_to, ext, min_size/max_size, min_duration/max_duration)
+  - 2.31.0: /list, /recent and /stats use the indexed recordings queries (one page + SQL aggregates)
   - 2.30.7: Added /thumbnail/notify endpoint for immediate thumbnail generation
 """
 
 import os
 import subprocess
+from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, send_file, Response
 
 from services.recording_service import (
     get_recordings_list, get_recording_info, delete_recording,
     delete_old_recordings, cleanup_recordings, get_disk_usage,
-    get_recording_dir
+    get_recording_dir, get_recordings_page, get_recordings_summary,
+    get_recordings_after, parse_recordings_cursor,
+    request_event_clip, get_clip_recorder_status
 )
 from services.config_service import load_config
 from services import media_cache_service
@@ -36,10 +50,7 @@ def list_recordings():
     limit = request.args.get('limit', type=int)
     
     config = load_config()
-    recordings = get_recordings_list(config, pattern, sort_by, reverse)
-    
-    if limit:
-        recordings = recordings[:limit]
+    recordings = get_recordings_list(config, pattern, sort_by, reverse, limit=limit or None)
     
     return jsonify({
         'success': True,
@@ -47,9 +58,57 @@ def list_recordings():
         'count': len(recordings)
     })
 
+def _parse_recording_filters(args):
+    """
+    Parse server-side listing filters from query parameters.
+    
+    Returns:
+        tuple: (filters dict, error message or None)
+    """
+    filters = {}
+    
+    ext = args.get('ext', '').strip()
+    if ext:
+        filters['extensions'] = [e.strip().lower().lstrip('.') for e in ext.split(',') if e.strip()]
+    
+    for name, key in (('date_from', 'mtime_from'), ('date_to', 'mtime_to')):
+        value = args.get(name, '').strip()
+        if not value:
+            continue
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None, f'Invalid {name} (expected ISO date/datetime)'
+        # A bare date as upper bound includes the whole day
+        if name == 'date_to' and len(value) == 10:
+            parsed = parsed + timedelta(days=1) - timedelta(microseconds=1)
+        filters[key] = parsed.timestamp()
+    
+    for name, cast in (('min_size', int), ('max_size', int),
+                       ('min_duration', float), ('max_duration', float)):
+        value = args.get(name, '').strip()
+        if not value:
+            continue
+        try:
+            filters[name] = cast(value)
+        except ValueError:
+            return None, f'Invalid {name}'
+    
+    return filters, None
+
 @recordings_bp.route('/list', methods=['GET'])
 def list_recordings_paginated():
-    """Get list of recordings with pagination, filtering and sorting."""
+    """
+    Get list of recordings with pagination, filtering and sorting.
+    
+    Two paging modes:
+        - page/per_page (offset paging, used by the web UI)
+        - after=<sort key>,<relative path> (keyset paging): pass after= (empty) for the first
+          page, then the returned pagination.next_cursor. Cost stays O(page).
+    
+    Server-side filters: search, filter (ts/mp4/all), ext (comma list),
+    date_from/date_to (ISO), min_size/max_size (bytes), min_duration/max_duration (s).
+    """
     # Parse query parameters
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
@@ -75,24 +134,63 @@ def list_recordings_paginated():
     else:
         sort_field, reverse = 'date', True
     
-    # Get all recordings
     pattern = '*.mp4' if filter_type == 'mp4' else '*.ts' if filter_type == 'ts' else '*.*'
-    all_recordings = get_recordings_list(config, pattern, sort_field, reverse)
-    
-    # Apply search filter
-    if search:
-        search_lower = search.lower()
-        all_recordings = [r for r in all_recordings if search_lower in r['name'].lower()]
-    
-    # Calculate pagination
-    total = len(all_recordings)
-    total_pages = max(1, (total + per_page - 1) // per_page)
-    page = min(max(1, page), total_pages)
-    start_idx = (page - 1) * per_page
-    end_idx = min(start_idx + per_page, total)
-    
-    # Get page slice
-    page_recordings = all_recordings[start_idx:end_idx]
+    per_page = max(1, min(per_page, 500))
+    
+    filters, error = _parse_recording_filters(request.args)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    if 'after' in request.args:
+        # Keyset paging: only one page of rows is read
+        after_param = request.args.get('after', '')
+        after = parse_recordings_cursor(after_param, sort_field) if after_param else None
+        if after_param and after is None:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+        
+        result = get_recordings_after(
+            config, after, pattern, sort_field, reverse, search,
+            limit=per_page, filters=filters
+        )
+        page_recordings = result['recordings']
+        total = result['total']
+        total_size = result['total_size']
+        pagination = {
+            'mode': 'cursor',
+            'per_page': per_page,
+            'after': after_param or None,
+            'next_cursor': result['next_cursor'],
+            'has_next': result['has_next'],
+            'total': total,
+            'total_filtered': total
+        }
+    else:
+        # One page of rows + aggregates over the filtered set (offset clamped to the last page)
+        result = get_recordings_page(
+            config, pattern, sort_field, reverse, search,
+            offset=(max(1, page) - 1) * per_page, limit=per_page, filters=filters
+        )
+        page_recordings = result['recordings']
+        total = result['total']
+        total_size = result['total_size']
+        
+        # Calculate pagination
+        total_pages = max(1, (total + per_page - 1) // per_page)
+        start_idx = result['offset']
+        page = start_idx // per_page + 1
+        end_idx = min(start_idx + per_page, total)
+        pagination = {
+            'mode': 'page',
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'total_filtered': total,
+            'total_pages': total_pages,
+            'has_prev': page > 1,
+            'has_next': page < total_pages,
+            'start_index': start_idx + 1,
+            'end_index': end_idx
+        }
     
     # Transform recordings to add frontend-expected fields
     for rec in page_recordings:
@@ -102,9 +200,6 @@ def list_recordings_paginated():
         rec['modified_iso'] = rec.get('modified', '')
         rec['locked'] = False  # TODO: implement file locking
     
-    # Calculate total size
-    total_size = sum(r.get('size', 0) for r in all_recordings)
-    
     # Get disk info
     disk = get_disk_usage(config)
 
@@ -135,17 +230,7 @@ def list_recordings_paginated():
     return jsonify({
         'success': True,
         'recordings': page_recordings,
-        'pagination': {
-            'page': page,
-            'per_page': per_page,
-            'total': total,
-            'total_filtered': total,
-            'total_pages': total_pages,
-            'has_prev': page > 1,
-            'has_next': page < total_pages,
-            'start_index': start_idx + 1,
-            'end_index': end_idx
-        },
+        'pagination': pagination,
         'total_size_display': format_size(total_size),
         'disk_info': {
             'total': disk.get('total', 0),
@@ -178,12 +263,13 @@ def recent_recordings():
     limit = request.args.get('limit', 10, type=int)
     config = load_config()
     
-    recordings = get_recordings_list(config, sort_by='date', reverse=True)
+    result = get_recordings_page(config, pattern='*.ts', sort_by='date', reverse=True,
+                                 offset=0, limit=max(0, limit))
     
     return jsonify({
         'success': True,
-        'recordings': recordings[:limit],
-        'count': len(recordings)
+        'recordings': result['recordings'],
+        'count': result['total']
     })
 
 # ============================================================================
@@ -374,6 +460,44 @@ def cleanup_by_size():
     
     return jsonify(result)
 
+# ============================================================================
+# EVENT CLIP ROUTES
+# ============================================================================
+
+@recordings_bp.route('/clip', methods=['POST'])
+def create_event_clip():
+    """
+    Save a pre-roll + post-roll clip around now (RECORDER_MODE=segmenter).
+    
+    Request body:
+        {"pre_seconds": 10, "post_seconds": 20}
+    
+    Returns:
+        - 202: Clip scheduled ({filename} written after the post-roll)
+        - 400: Invalid parameters
+        - 503: Segmenter unavailable
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        pre_seconds = float(data.get('pre_seconds', 10))
+        post_seconds = float(data.get('post_seconds', 10))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'pre_seconds/post_seconds must be numbers'}), 400
+    
+    if pre_seconds < 0 or post_seconds < 0 or pre_seconds + post_seconds <= 0:
+        return jsonify({'success': False, 'message': 'Clip duration must be positive'}), 400
+    
+    result = request_event_clip(pre_seconds, post_seconds, load_config())
+    return jsonify(result), (202 if result.get('success') else 503)
+
+@recordings_bp.route('/clip/status', methods=['GET'])
+def event_clip_status():
+    """Get segmenter status (pre-roll buffer, clips in progress)."""
+    return jsonify({
+        'success': True,
+        **get_clip_recorder_status(load_config())
+    })
+
 # ============================================================================
 # DISK USAGE ROUTES
 # ============================================================================
@@ -393,16 +517,15 @@ def disk_usage():
 def recording_stats():
     """Get recording statistics."""
     config = load_config()
-    recordings = get_recordings_list(config, pattern='*.ts')
+    summary = get_recordings_summary(config, pattern='*.ts')
     usage = get_disk_usage(config)
     
-    # Calculate stats
-    total_size = sum(r['size'] for r in recordings)
-    total_duration = sum(r.get('duration') or 0 for r in recordings)
+    total_size = summary['total_size']
+    total_duration = summary['total_duration']
     
     return jsonify({
         'success': True,
-        'count': len(recordings),
+        'count': summary['count'],
         'total_size': total_size,
         'total_size_human': usage['recordings_size_human'],
         'total_duration': total_duration,
@@ -460,7 +583,7 @@ def get_thumbnail(filename):
                 thumb_mtime = os.path.getmtime(thumb_path)
                 if thumb_mtime < video_mtime:
                     worker = media_cache_service.get_thumbnail_worker()
-                    worker.enqueue(video_path)
+                    worker.enqueue(video_path, priority='visible')
 
                 return send_file(
                     thumb_path,
@@ -470,7 +593,7 @@ def get_thumbnail(filename):
 
             # Thumbnail missing: queue generation in background (deduplicated)
             worker = media_cache_service.get_thumbnail_worker()
-            worker.enqueue(video_path)
+            worker.enqueue(video_path, priority='visible')
 
             # Do not generate synchronously: it can spawn N ffmpeg processes when the UI loads,
             # which can destabilize RTSP on Pi 3B+.
@@ -576,15 +699,15 @@ def notify_recording_complete():
     """
     Notify that a new recording file is complete.
     
-    Called by rtsp_recorder.sh when a new segment is created.
-    Generates thumbnail immediately (high priority) instead of on-demand.
+    Called by rtsp_recorder.sh (and the in-process recorders) when a new
+    segment is created. The file is queued for the background worker
+    (metadata + thumbnail from its first IDR frame); the request never waits.
     
     Request body:
         {"filepath": "/var/cache/rpi-cam/recordings/rec_20260122_143000.ts"}
     
     Returns:
-        - 200: Thumbnail generated successfully
-        - 202: Thumbnail generation queued (file too new, will retry)
+        - 202: Thumbnail and metadata queued
         - 400: Invalid request
         - 404: File not found
         - 500: Error
@@ -614,42 +737,15 @@ def notify_recording_complete():
         if not is_valid_recording_filename(filename):
             return jsonify({'success': False, 'message': 'Invalid filename'}), 400
         
-        # Wait a moment for file to be fully written (ffmpeg may still be flushing)
-        import time
-        file_age = time.time() - os.path.getmtime(filepath)
-        if file_age < 2:
-            # File is very new, wait a bit
-            time.sleep(2)
+        worker = media_cache_service.get_thumbnail_worker()
+        worker.enqueue(filepath, priority='fresh')
         
-        # Generate thumbnail immediately (synchronous, high priority)
-        thumb_path = media_cache_service.get_thumbnail_path(filename)
-        
-        # Generate thumbnail
-        success = media_cache_service.generate_thumbnail(filepath, thumb_path)
-        
-        if success:
-            # Also extract and cache metadata
-            metadata = media_cache_service.extract_video_metadata(filepath)
-            if metadata:
-                media_cache_service.cache_metadata(filepath, metadata)
-            
-            print(f"[Recordings] Thumbnail generated for new recording: {filename}")
-            return jsonify({
-                'success': True,
-                'message': 'Thumbnail generated',
-                'filepath': filepath,
-                'thumbnail': thumb_path
-            })
-        else:
-            # Queue for background generation (fallback)
-            worker = media_cache_service.get_thumbnail_worker()
-            worker.enqueue(filepath)
-            
-            return jsonify({
-                'success': True,
-                'message': 'Thumbnail queued for generation',
-                'filepath': filepath
-            }), 202
+        return jsonify({
+            'success': True,
+            'message': 'Thumbnail queued for generation',
+            'filepath': filepath,
+            'thumbnail': media_cache_service.get_thumbnail_path(filename)
+        }), 202
             
     except Exception as e:
         print(f"[Recordings] Error in notify_recording_complete: {e}")
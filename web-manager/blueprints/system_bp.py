@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """
 System Blueprint - Diagnostics, logs, updates, NTP and info routes
-Version: 2.30.12
+Version: 2.31.0
 """
 
 from flask import Blueprint, request, jsonify, Response, send_file, after_this_request
@@ -26,6 +26,7 @@ from services.power_service import (
     reboot_system, shutdown_system
 )
 from services.platform_service import detect_platform
+from services.rtsp_probe_service import get_cached_stream_health, refresh_stream_health_async
 
 system_bp = Blueprint('system', __name__, url_prefix='/api/system')
 
@@ -170,10 +171,21 @@ def diagnostic_info():
 
 @system_bp.route('/health', methods=['GET'])
 def health_check():
-    """Simple health check endpoint."""
+    """
+    Health check endpoint with the last RTSP stream probe.
+    
+    Never probes inline: the shared result (watchdog loop or any worker) is
+    returned and a background probe is started when it is too old.
+    """
+    stream = get_cached_stream_health()
+    refresh_stream_health_async()
+    status = 'healthy'
+    if stream is not None and not stream.get('healthy'):
+        status = 'degraded'
     return jsonify({
         'success': True,
-        'status': 'healthy',
+        'status': status,
+        'stream': stream,
         'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
     })
 
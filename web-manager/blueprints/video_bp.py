@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 """
 Video Blueprint - Video preview and streaming routes
-Version: 2.30.3
+Version: 2.32.0
+
+Changelog:
+  - 2.32.0: /snapshot served from the latest-JPEG cache fed by the running pipeline
+            (ETag / If-None-Match, SNAPSHOT_MAX_FPS); no more fswebcam/ffmpeg on the device
+  - 2.31.0: /preview/stream served by the shared preview hub (one ffmpeg per source/size/fps)
 """
 
 import os
@@ -13,6 +18,8 @@ from flask import Blueprint, request, jsonify, Response
 from services.camera_service import find_camera_device
 from services.config_service import load_config, get_service_status
 from services.platform_service import run_command
+from services.preview_service import get_preview_hub
+from services.snapshot_service import get_snapshot_cache
 
 video_bp = Blueprint('video', __name__, url_prefix='/api/video')
 
@@ -38,7 +45,8 @@ def preview_status():
         return jsonify({
             'success': True,
             'active': preview_state['active'],
-            'port': preview_state['port'] if preview_state['active'] else None
+            'port': preview_state['port'] if preview_state['active'] else None,
+            'hub': get_preview_hub().get_status()
         })
 
 @video_bp.route('/preview/start', methods=['POST'])
@@ -188,84 +196,24 @@ def preview_stream():
 
 def generate_mjpeg_stream(source_type='camera', rtsp_url=None, device='/dev/video0', width=640, height=480, fps=10):
     """
-    Generate MJPEG stream from camera or RTSP source using ffmpeg.
+    Generate MJPEG stream from camera or RTSP source.
     Yields MJPEG frames in multipart format for browser display.
-    """
-    
-    if source_type == 'rtsp' and rtsp_url:
-        # Stream from RTSP source (relay the existing RTSP stream)
-        cmd = [
-            'ffmpeg',
-            '-rtsp_transport', 'tcp',
-            '-i', rtsp_url,
-            '-f', 'mjpeg',
-            '-q:v', '5',  # Quality (2-31, lower is better)
-            '-r', str(fps),
-            '-s', f'{width}x{height}',
-            '-an',  # No audio
-            '-'
-        ]
-    else:
-        # Stream directly from camera device
-        cmd = [
-            'ffmpeg',
-            '-f', 'v4l2',
-            '-input_format', 'mjpeg',
-            '-video_size', f'{width}x{height}',
-            '-framerate', str(fps),
-            '-i', device,
-            '-f', 'mjpeg',
-            '-q:v', '5',
-            '-r', str(fps),
-            '-'
-        ]
     
-    process = None
+    Viewers of the same (source, size, fps) share a single ffmpeg decoder
+    through the preview hub; slow viewers skip frames instead of lagging.
+    """
+    subscription = None
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,  # Suppress ffmpeg logs
-            bufsize=10**6
-        )
-        
-        # Read JPEG frames from ffmpeg output
-        # MJPEG frames start with FFD8 and end with FFD9
-        buffer = b''
-        while True:
-            chunk = process.stdout.read(4096)
-            if not chunk:
-                break
-            buffer += chunk
-            
-            # Find complete JPEG frames
-            while True:
-                start = buffer.find(b'\xff\xd8')
-                if start == -1:
-                    buffer = b''
-                    break
-                    
-                end = buffer.find(b'\xff\xd9', start + 2)
-                if end == -1:
-                    buffer = buffer[start:]
-                    break
-                
-                frame = buffer[start:end + 2]
-                buffer = buffer[end + 2:]
-                
-                # Yield as multipart MJPEG
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                       
+        subscription = get_preview_hub().subscribe(source_type, rtsp_url, device, width, height, fps)
+        for frame in subscription:
+            # Yield as multipart MJPEG
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
     except Exception as e:
         print(f"[Preview] Error in MJPEG stream: {e}")
     finally:
-        if process:
-            process.terminate()
-            try:
-                process.wait(timeout=2)
-            except:
-                process.kill()
+        if subscription:
+            subscription.close()
 
 # ============================================================================
 # SNAPSHOT ROUTES
@@ -273,75 +221,53 @@ def generate_mjpeg_stream(source_type='camera', rtsp_url=None, device='/dev/vide
 
 @video_bp.route('/snapshot', methods=['GET'])
 def take_snapshot():
-    """Take a snapshot from the camera."""
-    device = find_camera_device()
+    """
+    Latest camera snapshot (JPEG), served from the snapshot cache.
+    Supports If-None-Match: 304 while the cached frame has not changed.
+    """
+    snapshot = get_snapshot_cache().get()
     
-    if not device:
+    if not snapshot['success']:
         return jsonify({
             'success': False,
-            'error': 'No camera found'
-        }), 404
-    
-    # Create temporary file
-    import tempfile
-    fd, temp_path = tempfile.mkstemp(suffix='.jpg')
-    os.close(fd)
-    
-    try:
-        # Use fswebcam or v4l2-ctl for snapshot
-        result = run_command(
-            f"fswebcam -d {device} --no-banner -r 1280x720 {temp_path}",
-            timeout=10
-        )
-        
-        if not result['success']:
-            # Try with v4l2-ctl + ffmpeg
-            result = run_command(
-                f"ffmpeg -y -f v4l2 -i {device} -vframes 1 {temp_path}",
-                timeout=10
-            )
-        
-        if os.path.exists(temp_path) and os.path.getsize(temp_path) > 0:
-            with open(temp_path, 'rb') as f:
-                image_data = f.read()
-            
-            os.unlink(temp_path)
-            
-            return Response(
-                image_data,
-                mimetype='image/jpeg',
-                headers={
-                    'Content-Disposition': f'inline; filename=snapshot-{int(time.time())}.jpg'
-                }
-            )
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to capture snapshot'
-            }), 500
-    
-    except Exception as e:
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
-        
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+            'error': snapshot['message']
+        }), 503
+    
+    response = Response(
+        snapshot['jpeg'],
+        mimetype='image/jpeg',
+        headers={
+            'Content-Disposition': f"inline; filename=snapshot-{int(snapshot['captured_at'])}.jpg",
+            'Cache-Control': 'no-cache',
+            'X-Snapshot-Age': str(snapshot['age']),
+            'X-Snapshot-Source': snapshot['source'] or ''
+        }
+    )
+    response.set_etag(snapshot['etag'])
+    response.last_modified = snapshot['captured_at']
+    return response.make_conditional(request)
+
+@video_bp.route('/snapshot/status', methods=['GET'])
+def snapshot_status():
+    """Snapshot cache status (feeder, source, frame age, hit counters)."""
+    return jsonify({
+        'success': True,
+        'snapshot': get_snapshot_cache().get_status()
+    })
 
 @video_bp.route('/snapshot/save', methods=['POST'])
 def save_snapshot():
-    """Take a snapshot and save it to disk."""
+    """Save the latest snapshot to disk."""
     data = request.get_json(silent=True) or {}
-    filename = data.get('filename', f'snapshot-{int(time.time())}.jpg')
+    filename = os.path.basename(data.get('filename') or f'snapshot-{int(time.time())}.jpg')
     
-    device = find_camera_device()
+    snapshot = get_snapshot_cache().get()
     
-    if not device:
+    if not snapshot['success']:
         return jsonify({
             'success': False,
-            'error': 'No camera found'
-        }), 404
+            'error': snapshot['message']
+        }), 503
     
     # Get snapshots directory from config
     config = load_config()
@@ -352,30 +278,21 @@ def save_snapshot():
     
     filepath = os.path.join(snapshots_dir, filename)
     
-    result = run_command(
-        f"fswebcam -d {device} --no-banner -r 1920x1080 {filepath}",
-        timeout=10
-    )
-    
-    if not result['success'] or not os.path.exists(filepath):
-        # Fallback to ffmpeg
-        result = run_command(
-            f"ffmpeg -y -f v4l2 -i {device} -vframes 1 {filepath}",
-            timeout=10
-        )
-    
-    if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-        return jsonify({
-            'success': True,
-            'message': 'Snapshot saved',
-            'path': filepath,
-            'filename': filename
-        })
-    else:
+    try:
+        with open(filepath, 'wb') as f:
+            f.write(snapshot['jpeg'])
+    except OSError as e:
         return jsonify({
             'success': False,
-            'error': 'Failed to save snapshot'
+            'error': f'Failed to save snapshot: {e}'
         }), 500
+    
+    return jsonify({
+        'success': True,
+        'message': 'Snapshot saved',
+        'path': filepath,
+        'filename': filename
+    })
 
 # ============================================================================
 # STREAM INFO ROUTES
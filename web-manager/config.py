@@ -3,7 +3,7 @@
 RTSP Recorder Web Manager - Configuration
 Central configuration file for constants, defaults, and metadata.
 
-Version: 1.2.0
+Version: 1.3.3
 """
 
 import os
@@ -57,6 +57,9 @@ SCHEDULER_STATE_FILE = '/tmp/rpi-cam-scheduler-state.json'
 # Recordings
 LOCKED_FILES_PATH = '/etc/rpi-cam/locked_recordings.json'
 THUMBNAIL_CACHE_DIR = '/var/cache/rpi-cam/thumbnails'
+# Thumbnail/metadata worker threads (extra ones pause under high load/temperature;
+# .ts decodes share one ffmpeg, extra workers overlap probes and the ffmpeg fallback)
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
 
 # ONVIF
 ONVIF_CONFIG_FILE = '/etc/rpi-cam/onvif.conf'
@@ -64,9 +67,13 @@ ONVIF_SERVICE_NAME = 'rpi-cam-onvif'
 
 # Meeting API
 MEETING_CONFIG_FILE = '/etc/rpi-cam/meeting.json'
+# Heartbeat samples collected while the Meeting API is unreachable (survives reboots)
+MEETING_TELEMETRY_SPOOL_FILE = '/var/cache/rpi-cam/meeting-telemetry.jsonl'
 
 # Watchdog
 WATCHDOG_STATE_FILE = '/tmp/rpi-cam-watchdog-state.json'
+# Last RTSP stream probe (shared by gunicorn workers and the ONVIF server)
+RTSP_PROBE_STATE_FILE = '/tmp/rpi-cam-rtsp-probe.json'
 
 # Log Files
 LOG_FILES = {
@@ -203,6 +210,9 @@ DEFAULT_CONFIG = {
     # Stream Quality Level (1-5 like Synology, or 'custom')
     "STREAM_QUALITY": "3",  # 1=very low, 2=low, 3=medium, 4=high, 5=very high, custom=manual
 
+    # Snapshots (/api/video/snapshot, ONVIF GetSnapshotUri)
+    "SNAPSHOT_MAX_FPS": "1",  # max refreshes per second of the cached snapshot
+
     # Relay / GPIO
     "RELAY_ENABLE": "no",
     "RELAY_GPIO_PIN": "0",
@@ -217,6 +227,10 @@ DEFAULT_CONFIG = {
     "SEGMENT_SECONDS": "300",
     "MIN_FREE_DISK_MB": "1000",
     "MAX_DISK_MB": "0",  # 0 = no limit, otherwise max storage in MB
+    "CSI_RECORD_MODE": "rtsp",  # rtsp = ffmpeg via RTSP, inprocess = CSI server writes segments
+    "RECORDER_MODE": "ffmpeg",  # ffmpeg = segment muxer, segmenter = IDR-exact segments + event clips
+    "CLIP_PREROLL_MAX_SECONDS": "30",  # In-memory pre-roll kept by the segmenter
+    "CLIP_CONTROL_PORT": "8086",
     
     # Audio Settings
     "AUDIO_ENABLE": "auto",
@@ -548,6 +562,36 @@ CONFIG_METADATA = {
         "help": "Durée de chaque fichier en secondes",
         "category": "recording"
     },
+    "CSI_RECORD_MODE": {
+        "label": "Mode d'enregistrement CSI",
+        "type": "select",
+        "options": ["rtsp", "inprocess"],
+        "help": "rtsp = ffmpeg relit le flux RTSP, inprocess = segments écrits directement par le serveur CSI (vidéo seule, sans overlay)",
+        "category": "recording"
+    },
+    "RECORDER_MODE": {
+        "label": "Mode de l'enregistreur",
+        "type": "select",
+        "options": ["ffmpeg", "segmenter"],
+        "help": "ffmpeg = découpage ffmpeg, segmenter = segments coupés exactement sur IDR + clips d'événement (pré/post-roll)",
+        "category": "recording"
+    },
+    "CLIP_PREROLL_MAX_SECONDS": {
+        "label": "Pré-roll max des clips (s)",
+        "type": "number",
+        "min": 0,
+        "max": 120,
+        "help": "Secondes gardées en mémoire pour les clips d'événement (mode segmenter)",
+        "category": "recording"
+    },
+    "CLIP_CONTROL_PORT": {
+        "label": "Port de contrôle des clips",
+        "type": "number",
+        "min": 1,
+        "max": 65535,
+        "help": "Port local de l'API de clips du segmenter (mode segmenter)",
+        "category": "recording"
+    },
     "MIN_FREE_DISK_MB": {
         "label": "Espace libre minimum (Mo)",
         "type": "number",
@@ -627,6 +671,14 @@ CONFIG_METADATA = {
         "help": "Intervalle entre images clés (défaut: 30)",
         "category": "video"
     },
+    "SNAPSHOT_MAX_FPS": {
+        "label": "Rafraîchissement snapshot",
+        "type": "number",
+        "min": 0.1,
+        "max": 10,
+        "help": "Images par seconde max du snapshot en cache (ONVIF/NVR, défaut: 1)",
+        "category": "video"
+    },
     "H264_PROFILE": {
         "label": "Profil H264 (CSI)",
         "type": "select",
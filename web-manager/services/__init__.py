@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
 """
 Services module - Business logic separated from Flask routes
-Version: 2.30.8
+Version: 2.30.11
+
+Changes in 2.30.11:
+- Added get_config_snapshot, subscribe_config_changes, wait_for_config_change,
+  get_config_cache_stats (cached config parsing)
+
+Changes in 2.30.10:
+- Added shared_state_service (leader election and state shared by Gunicorn workers)
+
+Changes in 2.30.9:
+- Added get_recordings_page, get_recordings_summary (indexed recordings listing)
 
 Changes in 2.30.8:
 - Added get_ssh_keys_status, ensure_ssh_keys_configured for SSH key management
@@ -23,6 +33,10 @@ from .platform_service import (
 from .config_service import (
     load_config,
     save_config,
+    get_config_snapshot,
+    subscribe_config_changes,
+    wait_for_config_change,
+    get_config_cache_stats,
     get_service_status,
     control_service,
     get_system_info
@@ -90,6 +104,8 @@ from .power_service import (
 
 from .recording_service import (
     get_recordings_list,
+    get_recordings_page,
+    get_recordings_summary,
     get_recording_info,
     delete_recording,
     get_disk_usage
@@ -153,6 +169,7 @@ from .watchdog_service import (
 
 # Media cache service (lazy-loaded to avoid circular imports)
 from . import media_cache_service
+from . import shared_state_service
 
 # CSI camera service (lazy-loaded for Picamera2 controls)
 from . import csi_camera_service
@@ -184,9 +201,12 @@ __all__ = [
     'get_led_boot_config', 'save_led_boot_config',
     'get_gpu_mem', 'set_gpu_mem',
     # Recording
-    'get_recordings_list', 'get_recording_info', 'delete_recording', 'get_disk_usage',
+    'get_recordings_list', 'get_recordings_page', 'get_recordings_summary',
+    'get_recording_info', 'delete_recording', 'get_disk_usage',
     # Media Cache
     'media_cache_service',
+    # Shared state (multi-worker)
+    'shared_state_service',
     # CSI Camera (Picamera2)
     'csi_camera_service',
     # Meeting
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """
 Camera Service - Camera controls, profiles, and detection
-Version: 2.30.11
+Version: 2.30.13
 
 Changes in 2.30.4:
 - Added libcamera/CSI camera support (PiCam)
@@ -10,6 +10,12 @@ Changes in 2.30.4:
 - New function get_libcamera_formats() for CSI camera resolution detection
 Changes in 2.30.10:
 - Added get_hw_encoder_capabilities() for v4l2h264enc limits
+Changes in 2.30.12:
+- get_scheduler_state reports the scheduler's last_check from any Gunicorn
+  worker (published by the leader worker through shared_state_service)
+Changes in 2.30.13:
+- profiles_scheduler_loop reads the cached config snapshot and wakes up as soon
+  as CAMERA_PROFILES_ENABLED changes instead of waiting for its next period
 """
 
 import os
@@ -21,6 +27,7 @@ import subprocess
 from datetime import datetime
 
 from .platform_service import run_command, is_raspberry_pi
+from . import shared_state_service as shared_state
 from config import (
     CAMERA_PROFILES_FILE, SCHEDULER_STATE_FILE,
     DEFAULT_CAMERA_PROFILES
@@ -1188,8 +1195,10 @@ def _restart_rtsp_for_csi_overlay_if_needed():
     except Exception:
         pass
 
+SCHEDULER_CONFIG_KEYS = ('CAMERA_PROFILES_ENABLED',)
+
 def profiles_scheduler_loop(stop_event=None, interval_sec=30):
-    from .config_service import load_config
+    from .config_service import get_config_snapshot, wait_for_config_change
     import logging
     _logger = logging.getLogger('camera_service.scheduler')
 
@@ -1201,7 +1210,7 @@ def profiles_scheduler_loop(stop_event=None, interval_sec=30):
             break
 
         try:
-            config = load_config()
+            config = get_config_snapshot()
             scheduler_enabled = config.get('CAMERA_PROFILES_ENABLED', 'no') == 'yes'
             scheduler_state['enabled'] = scheduler_enabled
 
@@ -1247,13 +1256,12 @@ def profiles_scheduler_loop(stop_event=None, interval_sec=30):
         except Exception as e:
             _logger.error(f"[Scheduler] Loop error (will retry in {interval_sec}s): {e}")
 
-        # Interruptible sleep
-        if stop_event:
-            stop_event.wait(interval_sec)
-            if stop_event.is_set():
-                break
-        else:
-            time.sleep(interval_sec)
+        # Interruptible sleep, cut short when the scheduler settings change
+        changed = wait_for_config_change(interval_sec, keys=SCHEDULER_CONFIG_KEYS, stop_event=stop_event)
+        if stop_event and stop_event.is_set():
+            break
+        if changed:
+            _logger.info(f"[Scheduler] Config changed ({', '.join(sorted(changed))}), re-evaluating")
 
 def apply_active_scheduled_profile(force: bool = False) -> dict:
     """
@@ -1353,13 +1361,20 @@ def save_scheduler_state():
 def get_scheduler_state():
     """Get current scheduler state."""
     load_scheduler_state()
+    last_check = scheduler_state['last_check']
+    if shared_state.is_follower():
+        # The scheduler loop runs in the leader worker
+        last_check = shared_state.get(SCHEDULER_LAST_CHECK_KEY)
     return {
         'enabled': scheduler_state['enabled'],
         'schedules': scheduler_state['schedules'],
         'current_schedule': scheduler_state['current_schedule'],
-        'last_check': scheduler_state['last_check']
+        'last_check': last_check
     }
 
+SCHEDULER_LAST_CHECK_KEY = 'camera:scheduler_last_check'
+shared_state.register_publisher(SCHEDULER_LAST_CHECK_KEY, lambda: scheduler_state['last_check'], interval=10)
+
 def set_scheduler_enabled(enabled):
     """Enable or disable the profile scheduler."""
     global scheduler_state
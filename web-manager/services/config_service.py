@@ -1,7 +1,19 @@
 # -*- coding: utf-8 -*-
 """
 Config Service - Configuration management and service control
-Version: 2.36.11
+Version: 2.38.0
+
+Changes in 2.38.0:
+- get_service_status / get_all_services_status read systemd units over D-Bus
+  (system_health_service, one pipelined round trip for all services) instead
+  of two systemctl forks per service; systemctl remains the fallback
+
+Changes in 2.37.0:
+- load_config is served from a parsed snapshot cached on the config file's
+  (inode, mtime, size); get_config_snapshot returns the read-only snapshot
+  without copying, save_config invalidates it
+- Change subscriptions (subscribe_config_changes / wait_for_config_change)
+  and hit/miss counters (get_config_cache_stats)
 """
 
 import os
@@ -9,9 +21,12 @@ import json
 import re
 import time
 import logging
+import threading
+from types import MappingProxyType
 from datetime import datetime, timedelta
 
 from .platform_service import run_command, is_raspberry_pi, PLATFORM
+from .system_health_service import get_unit_states, SystemBusError
 from config import (
     CONFIG_FILE, SERVICE_NAME, DEFAULT_CONFIG, SYSTEM_DEFAULTS,
     CONFIG_METADATA, OPTIONAL_SERVICES
@@ -43,16 +58,28 @@ VIDEOOUT_LEGACY_MAP = {
 # CONFIGURATION FILE MANAGEMENT
 # ============================================================================
 
-def load_config():
-    """
-    Load configuration from the config file.
-    
-    Handles VIDEOIN_*/VIDEOOUT_* with fallback to legacy VIDEO_*/OUTPUT_*.
-    Also provides VIDEO_* aliases from VIDEOIN_* for template compatibility.
-    
-    Returns:
-        dict: Configuration dictionary with all settings
-    """
+# ============================================================================
+# PARSED CONFIG CACHE
+# ============================================================================
+
+CONFIG_POLL_INTERVAL = 1.0  # seconds between file checks in wait_for_config_change
+
+_INVALIDATED = object()
+_config_cache = {'signature': _INVALIDATED, 'snapshot': None}
+_config_cache_lock = threading.Lock()
+_config_cache_stats = {'hits': 0, 'misses': 0, 'changes': 0, 'invalidations': 0}
+_config_subscribers = []
+
+def _config_file_signature():
+    """(inode, mtime_ns, size) of the config file, None if it does not exist."""
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _parse_config_file():
+    """Parse CONFIG_FILE over DEFAULT_CONFIG (types coerced, legacy keys mapped)."""
     config = DEFAULT_CONFIG.copy()
     
     if not os.path.exists(CONFIG_FILE):
@@ -102,6 +129,133 @@ def load_config():
     
     return config
 
+
+def get_config_snapshot():
+    """
+    Get the current configuration as a read-only mapping.
+    
+    The file is parsed again only when its (inode, mtime, size) changes or
+    after save_config; otherwise the same snapshot is returned (no copy).
+    Subscribers are notified when a reload changes any value.
+    
+    Returns:
+        MappingProxyType: Configuration (use load_config() for a mutable copy)
+    """
+    signature = _config_file_signature()
+    with _config_cache_lock:
+        if _config_cache['snapshot'] is not None and _config_cache['signature'] == signature:
+            _config_cache_stats['hits'] += 1
+            return _config_cache['snapshot']
+    
+    snapshot = MappingProxyType(_parse_config_file())
+    with _config_cache_lock:
+        _config_cache_stats['misses'] += 1
+        previous = _config_cache['snapshot']
+        _config_cache['signature'] = signature
+        _config_cache['snapshot'] = snapshot
+        subscribers = list(_config_subscribers)
+    
+    if previous is not None:
+        changed = frozenset(
+            key for key in set(previous) | set(snapshot)
+            if previous.get(key) != snapshot.get(key)
+        )
+        if changed:
+            with _config_cache_lock:
+                _config_cache_stats['changes'] += 1
+            for callback in subscribers:
+                try:
+                    callback(changed, snapshot)
+                except Exception as e:
+                    logger.warning(f"Config change subscriber failed: {e}")
+    return snapshot
+
+def load_config():
+    """
+    Load configuration from the config file.
+    
+    Handles VIDEOIN_*/VIDEOOUT_* with fallback to legacy VIDEO_*/OUTPUT_*.
+    Also provides VIDEO_* aliases from VIDEOIN_* for template compatibility.
+    
+    Returns:
+        dict: Configuration dictionary with all settings (a copy, safe to modify)
+    """
+    return get_config_snapshot().copy()
+
+def invalidate_config_cache():
+    """Force the next load_config() to re-read the file (for writers other than save_config)."""
+    with _config_cache_lock:
+        _config_cache['signature'] = _INVALIDATED
+        _config_cache_stats['invalidations'] += 1
+
+def subscribe_config_changes(callback):
+    """
+    Register callback(changed_keys, snapshot), called after a reload that changed values.
+    
+    Changes are detected when the config is next read (load_config,
+    get_config_snapshot, wait_for_config_change) or saved in this process.
+    
+    Returns:
+        The callback (pass it to unsubscribe_config_changes)
+    """
+    with _config_cache_lock:
+        _config_subscribers.append(callback)
+    return callback
+
+def unsubscribe_config_changes(callback):
+    """Remove a callback registered with subscribe_config_changes."""
+    with _config_cache_lock:
+        if callback in _config_subscribers:
+            _config_subscribers.remove(callback)
+
+def wait_for_config_change(timeout, keys=None, stop_event=None):
+    """
+    Block until the config changes, instead of sleeping a whole polling period.
+    
+    Args:
+        timeout: Maximum wait in seconds
+        keys: Only wake up for changes of these keys (None = any key)
+        stop_event: threading.Event ending the wait early
+    
+    Returns:
+        frozenset: Changed keys (empty on timeout or stop)
+    """
+    keys = frozenset(keys) if keys else None
+    changed = set()
+    woken = threading.Event()
+    
+    def on_change(changed_keys, _snapshot):
+        relevant = changed_keys if keys is None else changed_keys & keys
+        if relevant:
+            changed.update(relevant)
+            woken.set()
+    
+    subscribe_config_changes(on_change)
+    try:
+        deadline = time.monotonic() + timeout
+        while not woken.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (stop_event and stop_event.is_set()):
+                break
+            if stop_event:
+                stop_event.wait(min(CONFIG_POLL_INTERVAL, remaining))
+            else:
+                woken.wait(min(CONFIG_POLL_INTERVAL, remaining))
+            # A stat() per poll picks up edits made by other processes
+            get_config_snapshot()
+    finally:
+        unsubscribe_config_changes(on_change)
+    return frozenset(changed)
+
+def get_config_cache_stats():
+    """Hit/miss counters of the parsed config cache."""
+    with _config_cache_lock:
+        stats = dict(_config_cache_stats)
+        stats['subscribers'] = len(_config_subscribers)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+    return stats
+
 def save_config(config):
     """
     Save configuration to the config file.
@@ -162,6 +316,10 @@ def save_config(config):
         
         os.rename(temp_file, CONFIG_FILE)
         
+        # Reload now so subscribers see the change without waiting for a reader
+        invalidate_config_cache()
+        get_config_snapshot()
+        
         return {'success': True, 'message': 'Configuration saved'}
     except Exception as e:
         return {'success': False, 'message': str(e)}
@@ -225,10 +383,33 @@ def validate_config(config):
 # SERVICE MANAGEMENT
 # ============================================================================
 
+def _status_from_unit_state(state):
+    """get_service_status result from a system_health_service.get_unit_states entry."""
+    active_state = state['active_state']
+    active = active_state == 'active'
+    result = {
+        # `systemctl is-active` output only reached callers when the unit was active
+        'active': active,
+        'status': active_state if active_state in ('active', 'reloading') else 'inactive',
+        'since': None,
+        'memory': None,
+        'cpu': None,
+        'pid': None
+    }
+    if active:
+        result['since'] = state['since']
+        if state['memory_bytes'] is not None:
+            result['memory'] = f"{state['memory_bytes'] / 1024 / 1024:.1f} MB"
+        result['pid'] = str(state['main_pid'] or 0)
+    return result
+
 def get_service_status(service_name=None):
     """
     Get the status of a systemd service.
     
+    Reads the unit over the systemd D-Bus API (no fork), falling back to
+    systemctl when the system bus is not reachable.
+    
     Args:
         service_name: Name of the service (default: main RTSP service)
     
@@ -237,7 +418,13 @@ def get_service_status(service_name=None):
     """
     if service_name is None:
         service_name = SERVICE_NAME
-    
+    try:
+        return _status_from_unit_state(get_unit_states([service_name])[service_name])
+    except (OSError, SystemBusError):
+        return _get_service_status_systemctl(service_name)
+
+def _get_service_status_systemctl(service_name):
+    """get_service_status through `systemctl is-active` / `systemctl show` (fallback)."""
     result = {
         'active': False,
         'status': 'unknown',
@@ -377,6 +564,8 @@ def get_all_services_status():
     """
     Get status of all RTSP-related services.
     
+    All units are read in one D-Bus round trip (systemctl fallback).
+    
     Returns:
         dict: {service_name: status_dict} for all services
     """
@@ -393,9 +582,15 @@ def get_all_services_status():
         if svc_name not in services:
             services[svc_name] = svc_info.get('description', svc_name)
     
+    try:
+        states = get_unit_states(list(services))
+        statuses = {name: _status_from_unit_state(states[name]) for name in services}
+    except (OSError, SystemBusError):
+        statuses = {name: _get_service_status_systemctl(name) for name in services}
+    
     result = {}
     for svc_name, description in services.items():
-        status = get_service_status(svc_name)
+        status = statuses[svc_name]
         status['description'] = description
         result[svc_name] = status
     
@@ -4,7 +4,11 @@
 i18n Service - Internationalization Service for RTSP Recorder Web Manager
 Handles language detection, translation loading, and custom translation upload.
 
-Version: 1.0.0
+Version: 1.1.0
+
+Changes in 1.1.0:
+- Merged translations are shared between Gunicorn workers (shared_state_service),
+  and saving/deleting a custom translation invalidates every worker's copy
 """
 
 import os
@@ -13,6 +17,8 @@ import logging
 from pathlib import Path
 from typing import Dict, Optional, List, Any
 
+from . import shared_state_service as shared_state
+
 logger = logging.getLogger(__name__)
 
 # ============================================================================
@@ -31,8 +37,12 @@ BUILT_IN_LANGUAGES = ['fr', 'en']
 # Default language
 DEFAULT_LANGUAGE = 'fr'
 
-# Cache for loaded translations
-_translations_cache: Dict[str, Dict] = {}
+# Cache for loaded translations: lang -> (generation, translation)
+_translations_cache: Dict[str, tuple] = {}
+
+# Shared cache (multi-worker): keys 'i18n:<generation>:<lang>', bumped on upload/delete
+SHARED_CACHE_PREFIX = 'i18n:'
+GENERATION_COUNTER = 'i18n:generation'
 
 # ============================================================================
 # TRANSLATION LOADING
@@ -110,10 +120,21 @@ def load_translation(lang_code: str, force_reload: bool = False) -> Dict:
     global _translations_cache
     
     cache_key = lang_code
-    
-    # Check cache
-    if not force_reload and cache_key in _translations_cache:
-        return _translations_cache[cache_key]
+    shared = shared_state.is_election_running()
+    generation = shared_state.get_counter(GENERATION_COUNTER) if shared else 0
+    shared_key = f"{SHARED_CACHE_PREFIX}{generation}:{lang_code}"
+    
+    # Check cache (local copy valid until any worker changes a custom translation)
+    cached = _translations_cache.get(cache_key)
+    if not force_reload and cached and cached[0] == generation:
+        return cached[1]
+    
+    # Another worker may already have merged it
+    if shared and not force_reload:
+        translation = shared_state.get(shared_key)
+        if translation:
+            _translations_cache[cache_key] = (generation, translation)
+            return translation
     
     translation = {}
     
@@ -144,7 +165,9 @@ def load_translation(lang_code: str, force_reload: bool = False) -> Dict:
         return load_translation(DEFAULT_LANGUAGE, force_reload)
     
     # Cache it
-    _translations_cache[cache_key] = translation
+    _translations_cache[cache_key] = (generation, translation)
+    if shared:
+        shared_state.set(shared_key, translation)
     
     return translation
 
@@ -197,6 +220,13 @@ def get_translation(lang_code: str, key: str, default: str = None) -> str:
         return default or key
 
 
+def _invalidate_translation(lang_code: str):
+    """Drop cached copies of a translation in this worker and in the shared cache."""
+    _translations_cache.pop(lang_code, None)
+    if shared_state.is_election_running():
+        shared_state.incr(GENERATION_COUNTER)
+        shared_state.delete_prefix(SHARED_CACHE_PREFIX)
+
 # ============================================================================
 # CUSTOM TRANSLATION MANAGEMENT
 # ============================================================================
@@ -212,8 +242,6 @@ def save_custom_translation(lang_code: str, data: Dict) -> Dict[str, Any]:
     Returns:
         Dict with 'success', 'message', and optionally 'error'
     """
-    global _translations_cache
-    
     try:
         # Validate translation data
         validation = validate_translation(data)
@@ -232,9 +260,8 @@ def save_custom_translation(lang_code: str, data: Dict) -> Dict[str, Any]:
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=4)
         
-        # Clear cache for this language
-        if lang_code in _translations_cache:
-            del _translations_cache[lang_code]
+        # Clear cache for this language (all workers)
+        _invalidate_translation(lang_code)
         
         logger.info(f"Saved custom translation for {lang_code}")
         
@@ -262,8 +289,6 @@ def delete_custom_translation(lang_code: str) -> Dict[str, Any]:
     Returns:
         Dict with 'success' and 'message'
     """
-    global _translations_cache
-    
     try:
         file_path = CUSTOM_LOCALES_DIR / f'{lang_code}.json'
         
@@ -278,9 +303,8 @@ def delete_custom_translation(lang_code: str) -> Dict[str, Any]:
         
         os.remove(file_path)
         
-        # Clear cache
-        if lang_code in _translations_cache:
-            del _translations_cache[lang_code]
+        # Clear cache (all workers)
+        _invalidate_translation(lang_code)
         
         logger.info(f"Deleted custom translation for {lang_code}")
         
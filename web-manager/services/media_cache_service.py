@@ -1,29 +1,95 @@
 # -*- coding: utf-8 -*-
 """
 Media Cache Service - SQLite-based caching for recordings metadata and thumbnails
-Version: 1.0.1
+Version: 1.8.1
 
 This service optimizes the recordings gallery by:
 1. Caching video metadata (duration, resolution, codec) in SQLite
 2. Managing thumbnail generation with background workers
 3. Invalidating cache entries when files change
 4. Reducing SD card wear by minimizing ffprobe calls
+5. Keeping a persistent recordings index (name/size/mtime) up to date via inotify,
+   so listings are SQL queries instead of a glob + stat of every segment
+
+Changes in 1.8.1:
+- ThumbnailWorker: extra workers parked by the load/temperature gate wait on
+  their own condition, so an enqueue() notify always reaches a worker able
+  to take the job instead of being consumed by a gated one
+
+Changes in 1.8.0:
+- Recordings index (schema v3): listings break sort ties on relative_path
+  instead of filename, which repeats across date subdirectories; keyset
+  cursors carry (sort_key, relative_path) and the sort indexes follow
+
+Changes in 1.7.1:
+- Every thumbnail priority class is bounded (THUMBNAIL_QUEUE_LIMITS): a full
+  'visible' class drops its oldest entry (page no longer viewed), a full
+  'fresh' / 'backfill' class drops the new job
+
+Changes in 1.7.0:
+- Multi-worker (Gunicorn) aware through shared_state_service: only the leader
+  worker runs the thumbnail pool and the recordings indexer; followers queue
+  thumbnail jobs for the leader, read its published worker/index status and
+  share the index generation so their aggregates caches are invalidated too
+
+Changes in 1.6.0:
+- get_db_connection reuses one connection per thread (PRAGMAs once, sqlite3
+  statement cache) instead of opening one per call
+- Added get_cached_metadata_many (IN query / temp table join) and
+  cache_metadata_many (executemany, batched transactions);
+  scan_and_cache_directory and cleanup_stale_cache use them
+
+Changes in 1.5.0:
+- ThumbnailWorker: priority scheduler (visible > fresh > backfill, promotion of
+  queued files), pool of THUMBNAIL_WORKERS threads whose extra workers pause
+  under high load / SoC temperature, per-class depth and latency metrics
+
+Changes in 1.4.0:
+- Thumbnails of .ts recordings are decoded from the first IDR access unit
+  (ts_probe_service.extract_first_idr) by one long-lived ffmpeg fed over a
+  pipe (ThumbnailDecoder) instead of one ffmpeg process + seek per file;
+  per-file ffmpeg kept as fallback
+
+Changes in 1.3.0:
+- extract_video_metadata probes .ts recordings natively (ts_probe_service:
+  PAT/PMT, SPS, first/last PTS) and only forks ffprobe for other containers
+  or streams the native probe cannot describe; counters in get_cache_stats
+
+Changes in 1.2.0:
+- Added invalidate_cache_many (one transaction for batch deletions)
+
+Changes in 1.1.0:
+- Added recordings_index table (schema v2) and RecordingsIndexer (inotify watcher)
+- Added query_recordings_index / get_recordings_index_aggregates
+- Keyset (cursor) queries, server-side date/extension/size/duration filters,
+  cached aggregates invalidated on index changes
 """
 
 import os
 import sys
 import json
+import time
+import errno
+import select
+import struct
 import sqlite3
+import heapq
 import hashlib
+import itertools
 import threading
 import subprocess
 import shutil
+import ctypes
+import ctypes.util
 from datetime import datetime
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
 from typing import Optional, Dict, List, Any
 from contextlib import contextmanager
 
-from config import THUMBNAIL_CACHE_DIR
+from config import THUMBNAIL_CACHE_DIR, THUMBNAIL_WORKERS
+from .ts_probe_service import is_ts_file, probe_ts_file, extract_first_idr
+from .preview_service import JpegFrameSplitter
+from . import shared_state_service as shared_state
 
 # ============================================================================
 # CONFIGURATION
@@ -38,9 +104,27 @@ THUMBNAIL_QUALITY = 3  # ffmpeg quality (1-31, lower is better)
 THUMBNAIL_SEEK_TIME = 2  # seconds into video
 
 # Background worker settings
-MAX_QUEUE_SIZE = 100
+MAX_QUEUE_SIZE = 100  # pending backfill jobs beyond this are dropped
+THUMBNAIL_PRIORITY_CLASSES = ('visible', 'fresh', 'backfill')  # highest first
+THUMBNAIL_QUEUE_LIMITS = (200, 200, MAX_QUEUE_SIZE)  # max pending jobs per class (same order)
+THUMBNAIL_MAX_LOAD_PER_CPU = 1.0  # 1-min load average per core above which extra workers pause
+THUMBNAIL_MAX_TEMP_C = 70.0  # SoC temperature above which extra workers pause
+THUMBNAIL_LOAD_CHECK_INTERVAL = 5  # seconds between load/temperature samples
+SOC_TEMPERATURE_PATH = '/sys/class/thermal/thermal_zone0/temp'
 WORKER_TIMEOUT = 30  # seconds per thumbnail generation
 
+# Shared state keys (multi-worker: the leader owns the pool and the indexer)
+THUMBNAIL_JOB_QUEUE = 'thumbnails'
+WORKER_STATUS_KEY = 'media_cache:worker_status'
+INDEX_STATUS_KEY = 'media_cache:index_status'
+INDEX_GENERATION_COUNTER = 'media_cache:index_generation'
+
+# Long-lived thumbnail decoder (first IDR of each .ts fed over a pipe)
+THUMBNAIL_DECODER_TIMEOUT = 5  # seconds to wait for the decoded JPEG
+THUMBNAIL_DECODER_IDLE_TIMEOUT = 120  # stop the decoder after this long unused
+THUMBNAIL_DECODER_MAX_FAILURES = 3  # consecutive failures before per-file ffmpeg only
+H264_AUD = b'\x00\x00\x00\x01\x09\xf0'  # ends the access unit for the ffmpeg parser
+
 # ============================================================================
 # PROCESS PRIORITIES (CPU/IO FRIENDLY)
 # ============================================================================
@@ -69,7 +153,7 @@ def _wrap_low_priority(cmd: List[str]) -> List[str]:
 # DATABASE SCHEMA
 # ============================================================================
 
-SCHEMA_VERSION = 1
+SCHEMA_VERSION = 3
 SCHEMA_SQL = """
 -- Media metadata cache
 CREATE TABLE IF NOT EXISTS media_cache (
@@ -105,30 +189,92 @@ CREATE TABLE IF NOT EXISTS schema_version (
 );
 """
 
+# Schema v2: persistent recordings index (kept current by RecordingsIndexer)
+RECORDINGS_INDEX_SQL = """
+CREATE TABLE IF NOT EXISTS recordings_index (
+    filepath TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    relative_path TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    file_mtime REAL NOT NULL,
+    file_ctime REAL NOT NULL,
+    indexed_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_recidx_mtime_path ON recordings_index(file_mtime, relative_path);
+CREATE INDEX IF NOT EXISTS idx_recidx_name_path ON recordings_index(filename, relative_path);
+CREATE INDEX IF NOT EXISTS idx_recidx_size_path ON recordings_index(file_size, relative_path);
+CREATE INDEX IF NOT EXISTS idx_recidx_ext ON recordings_index(extension);
+"""
+
+# Schema v3: sort ties broken on relative_path (unique) instead of filename
+RECORDINGS_INDEX_V3_SQL = """
+DROP INDEX IF EXISTS idx_recidx_mtime;
+DROP INDEX IF EXISTS idx_recidx_name;
+DROP INDEX IF EXISTS idx_recidx_size;
+"""
+
 # ============================================================================
 # DATABASE CONNECTION MANAGEMENT
 # ============================================================================
 
 _db_lock = threading.Lock()
+_db_local = threading.local()
+
+# Statements kept compiled per pooled connection (sqlite3 statement cache)
+DB_CACHED_STATEMENTS = 256
+# Lookups above this many paths go through a temp table join instead of IN (...)
+DB_IN_CLAUSE_MAX = 500
+# Rows per transaction for batched upserts
+DB_WRITE_BATCH_SIZE = 500
+
+def _open_db_connection() -> sqlite3.Connection:
+    """Open and configure a connection (PRAGMAs issued once per connection)."""
+    db_dir = os.path.dirname(MEDIA_CACHE_DB)
+    os.makedirs(db_dir, exist_ok=True)
+    
+    conn = sqlite3.connect(MEDIA_CACHE_DB, timeout=10, cached_statements=DB_CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    # Enable WAL mode for better concurrent access
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
 
 @contextmanager
 def get_db_connection():
-    """Thread-safe database connection context manager."""
-    conn = None
+    """
+    Per-thread pooled database connection context manager.
+    
+    Each thread reuses one connection (re-opened after a fork or if the
+    database path changes). Nested uses share it; when the outermost block
+    exits, a transaction left open is rolled back, like closing the
+    connection used to do.
+    """
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and (_db_local.pid != os.getpid() or _db_local.path != MEDIA_CACHE_DB):
+        conn = None
+    if conn is None:
+        conn = _open_db_connection()
+        _db_local.conn = conn
+        _db_local.pid = os.getpid()
+        _db_local.path = MEDIA_CACHE_DB
+    
+    _db_local.depth = getattr(_db_local, 'depth', 0) + 1
     try:
-        # Ensure directory exists
-        db_dir = os.path.dirname(MEDIA_CACHE_DB)
-        os.makedirs(db_dir, exist_ok=True)
-        
-        conn = sqlite3.connect(MEDIA_CACHE_DB, timeout=10)
-        conn.row_factory = sqlite3.Row
-        # Enable WAL mode for better concurrent access
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA synchronous=NORMAL")
         yield conn
+    except sqlite3.DatabaseError:
+        # Broken connection (e.g. database file replaced): reopen next time
+        _db_local.conn = None
+        raise
     finally:
-        if conn:
-            conn.close()
+        _db_local.depth -= 1
+        if _db_local.depth == 0 and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                _db_local.conn = None
 
 def init_database():
     """Initialize the database schema."""
@@ -141,6 +287,7 @@ def init_database():
             if not cursor.fetchone():
                 # Fresh install - create schema
                 conn.executescript(SCHEMA_SQL)
+                conn.executescript(RECORDINGS_INDEX_SQL)
                 conn.execute("INSERT INTO schema_version (version) VALUES (?)", (SCHEMA_VERSION,))
                 conn.commit()
                 print(f"[MediaCache] Database initialized (version {SCHEMA_VERSION})")
@@ -151,7 +298,13 @@ def init_database():
                 current_version = row['version'] if row else 0
                 
                 if current_version < SCHEMA_VERSION:
-                    # Run migrations here if needed
+                    # v1 -> v2: recordings index
+                    if current_version < 2:
+                        conn.executescript(RECORDINGS_INDEX_SQL)
+                    # v2 -> v3: (sort column, relative_path) indexes
+                    if current_version < 3:
+                        conn.executescript(RECORDINGS_INDEX_V3_SQL)
+                        conn.executescript(RECORDINGS_INDEX_SQL)
                     conn.execute("UPDATE schema_version SET version = ?", (SCHEMA_VERSION,))
                     conn.commit()
                     print(f"[MediaCache] Database migrated to version {SCHEMA_VERSION}")
@@ -160,9 +313,12 @@ def init_database():
 # METADATA EXTRACTION
 # ============================================================================
 
+# Metadata extraction counters (native TS probe vs ffprobe)
+_probe_stats = {'native': 0, 'ffprobe': 0, 'native_fallbacks': 0}
+
 def extract_video_metadata(filepath: str) -> Optional[Dict[str, Any]]:
     """
-    Extract video metadata using ffprobe.
+    Extract video metadata (native probe for .ts, ffprobe otherwise).
     
     Args:
         filepath: Path to video file
@@ -173,6 +329,27 @@ def extract_video_metadata(filepath: str) -> Optional[Dict[str, Any]]:
     if not os.path.exists(filepath):
         return None
     
+    if is_ts_file(filepath):
+        metadata = probe_ts_file(filepath)
+        if metadata:
+            _probe_stats['native'] += 1
+            metadata['duration_human'] = format_duration(metadata['duration'])
+            return metadata
+        _probe_stats['native_fallbacks'] += 1
+    
+    return _extract_metadata_ffprobe(filepath)
+
+def _extract_metadata_ffprobe(filepath: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract video metadata using ffprobe (low CPU/IO priority).
+    
+    Args:
+        filepath: Path to video file
+        
+    Returns:
+        Dict with metadata or None on error
+    """
+    _probe_stats['ffprobe'] += 1
     try:
         # Use shorter timeout (10s) and only read first few seconds of file
         result = subprocess.run(
@@ -218,6 +395,7 @@ def extract_video_metadata(filepath: str) -> Optional[Dict[str, Any]]:
             
             if codec_type == 'video' and metadata['codec'] is None:
                 metadata['codec'] = stream.get('codec_name')
+                metadata['profile'] = stream.get('profile')
                 metadata['width'] = stream.get('width')
                 metadata['height'] = stream.get('height')
                 
@@ -273,14 +451,180 @@ def get_thumbnail_path(filename: str) -> str:
     thumb_name = f"{safe_name}.jpg"
     return os.path.join(THUMBNAIL_CACHE_DIR, thumb_name)
 
+class ThumbnailDecoder:
+    """
+    Long-lived ffmpeg turning H.264 access units into scaled JPEG thumbnails.
+
+    Each request writes one IDR access unit (SPS/PPS included) followed by an
+    access unit delimiter to ffmpeg's stdin and reads one JPEG back from its
+    stdout, so a thumbnail costs a single decode instead of a process spawn,
+    a container open and a seek. Requests are serialized.
+    """
+    
+    def __init__(self):
+        self.process = None
+        self._frames = Queue(maxsize=2)
+        self._lock = threading.Lock()
+        self._last_used = 0.0
+        self._consecutive_failures = 0
+        self.decoded_count = 0
+        self.failure_count = 0
+        self.start_count = 0
+    
+    @property
+    def disabled(self) -> bool:
+        """True after repeated failures: callers use per-file ffmpeg instead."""
+        return self._consecutive_failures >= THUMBNAIL_DECODER_MAX_FAILURES
+    
+    def _build_command(self) -> List[str]:
+        return _wrap_low_priority([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            # Decode each access unit as soon as it is complete
+            '-fflags', 'nobuffer', '-flags', 'low_delay',
+            '-probesize', '32', '-analyzeduration', '0', '-threads', '1',
+            '-f', 'h264', '-i', 'pipe:0',
+            '-vf', f'scale={THUMBNAIL_WIDTH}:-1',
+            '-q:v', str(THUMBNAIL_QUALITY),
+            '-vsync', '0', '-flush_packets', '1',
+            '-f', 'image2pipe', '-c:v', 'mjpeg', 'pipe:1'
+        ])
+    
+    def _reader_loop(self, process):
+        """Forward every JPEG produced by ffmpeg to the waiting request."""
+        try:
+            for frame in JpegFrameSplitter(process.stdout):
+                try:
+                    self._frames.put_nowait(frame)
+                except Full:
+                    pass
+        except (OSError, ValueError):
+            pass
+    
+    def _ensure_started(self) -> bool:
+        if self.process and self.process.poll() is None:
+            return True
+        try:
+            self.process = subprocess.Popen(
+                self._build_command(),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0
+            )
+        except OSError as e:
+            print(f"[MediaCache] Cannot start thumbnail decoder: {e}")
+            self.process = None
+            return False
+        self.start_count += 1
+        threading.Thread(target=self._reader_loop, args=(self.process,), daemon=True).start()
+        return True
+    
+    def _stop_locked(self):
+        process, self.process = self.process, None
+        if not process:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    
+    def decode(self, access_unit: bytes) -> Optional[bytes]:
+        """
+        Decode one IDR access unit to a JPEG thumbnail.
+        
+        Args:
+            access_unit: Annex B access unit (SPS/PPS + IDR slices)
+            
+        Returns:
+            JPEG bytes, or None on failure (the decoder is restarted)
+        """
+        with self._lock:
+            if self.disabled or not self._ensure_started():
+                return None
+            
+            while not self._frames.empty():
+                self._frames.get_nowait()
+            
+            try:
+                self.process.stdin.write(access_unit + H264_AUD)
+                frame = self._frames.get(timeout=THUMBNAIL_DECODER_TIMEOUT)
+            except (OSError, Empty):
+                frame = None
+            
+            self._last_used = time.time()
+            if frame is None:
+                self.failure_count += 1
+                self._consecutive_failures += 1
+                self._stop_locked()
+                if self.disabled:
+                    print("[MediaCache] Thumbnail decoder disabled after repeated failures, "
+                          "using per-file ffmpeg")
+                return None
+            
+            self.decoded_count += 1
+            self._consecutive_failures = 0
+            return frame
+    
+    def stop_if_idle(self):
+        """Stop ffmpeg when no thumbnail was requested for a while."""
+        if self.process and time.time() - self._last_used > THUMBNAIL_DECODER_IDLE_TIMEOUT:
+            with self._lock:
+                self._stop_locked()
+    
+    def stop(self):
+        """Stop the decoder process."""
+        with self._lock:
+            self._stop_locked()
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get decoder status."""
+        return {
+            'running': bool(self.process and self.process.poll() is None),
+            'disabled': self.disabled,
+            'decoded': self.decoded_count,
+            'failures': self.failure_count,
+            'starts': self.start_count
+        }
+
+# Global decoder instance
+_thumbnail_decoder = None
+
+def get_thumbnail_decoder() -> ThumbnailDecoder:
+    """Get or create the global thumbnail decoder."""
+    global _thumbnail_decoder
+    if _thumbnail_decoder is None:
+        _thumbnail_decoder = ThumbnailDecoder()
+    return _thumbnail_decoder
+
+def _write_thumbnail(thumb_path: str, jpeg: bytes) -> bool:
+    """Write a thumbnail atomically (readers never see a partial JPEG)."""
+    tmp_path = f"{thumb_path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(jpeg)
+        os.replace(tmp_path, thumb_path)
+        return True
+    except OSError as e:
+        print(f"[MediaCache] Error writing thumbnail {thumb_path}: {e}")
+        return False
+
 def generate_thumbnail(video_path: str, thumb_path: str, seek_time: int = THUMBNAIL_SEEK_TIME) -> bool:
     """
     Generate a thumbnail from a video file.
     
+    .ts recordings use their first IDR frame (long-lived decoder); other
+    files, or when that fails, use one ffmpeg process seeking to seek_time.
+    
     Args:
         video_path: Path to source video
         thumb_path: Path to save thumbnail
-        seek_time: Seconds to seek before capturing frame
+        seek_time: Seconds to seek before capturing frame (ffmpeg fallback)
         
     Returns:
         True if successful
@@ -288,6 +632,28 @@ def generate_thumbnail(video_path: str, thumb_path: str, seek_time: int = THUMBN
     if not os.path.exists(video_path):
         return False
     
+    decoder = get_thumbnail_decoder()
+    if is_ts_file(video_path) and not decoder.disabled:
+        access_unit = extract_first_idr(video_path)
+        if access_unit:
+            jpeg = decoder.decode(access_unit)
+            if jpeg and _write_thumbnail(thumb_path, jpeg):
+                return True
+    
+    return _generate_thumbnail_ffmpeg(video_path, thumb_path, seek_time)
+
+def _generate_thumbnail_ffmpeg(video_path: str, thumb_path: str, seek_time: int = THUMBNAIL_SEEK_TIME) -> bool:
+    """
+    Generate a thumbnail with one ffmpeg process (seek + decode + scale).
+    
+    Args:
+        video_path: Path to source video
+        thumb_path: Path to save thumbnail
+        seek_time: Seconds to seek before capturing frame
+        
+    Returns:
+        True if successful
+    """
     try:
         # Create directory if needed
         os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
@@ -313,7 +679,7 @@ def generate_thumbnail(video_path: str, thumb_path: str, seek_time: int = THUMBN
         
         # If seeking failed (short video), try at frame 0
         if seek_time > 0:
-            return generate_thumbnail(video_path, thumb_path, seek_time=0)
+            return _generate_thumbnail_ffmpeg(video_path, thumb_path, seek_time=0)
         
         return False
         
@@ -361,60 +727,130 @@ def get_cached_metadata(filepath: str) -> Optional[Dict[str, Any]]:
         print(f"[MediaCache] Error getting cached metadata: {e}")
         return None
 
-def cache_metadata(filepath: str, metadata: Dict[str, Any]) -> bool:
+def get_cached_metadata_many(filepaths: List[str]) -> Dict[str, Dict[str, Any]]:
     """
-    Store metadata in cache.
+    Get cached metadata for many files in one query.
     
     Args:
-        filepath: Path to video file
-        metadata: Metadata dict to cache
+        filepaths: Paths to video files
         
     Returns:
-        True if successful
+        Dict filepath -> metadata for files with a valid (fresh) cache entry
     """
-    if not os.path.exists(filepath):
-        return False
+    mtimes = {}
+    for filepath in filepaths:
+        try:
+            mtimes[filepath] = os.stat(filepath).st_mtime
+        except OSError:
+            continue
+    if not mtimes:
+        return {}
     
     try:
-        stat = os.stat(filepath)
-        filename = os.path.basename(filepath)
-        thumb_path = get_thumbnail_path(filename)
-        
+        paths = list(mtimes)
         with get_db_connection() as conn:
-            with _db_lock:
-                conn.execute("""
-                    INSERT OR REPLACE INTO media_cache (
-                        filepath, filename, file_size, file_mtime,
-                        duration, duration_human, resolution, width, height,
-                        codec, bitrate, fps, has_audio, thumbnail_path,
-                        thumbnail_generated, metadata_json, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    filepath,
-                    filename,
-                    stat.st_size,
-                    stat.st_mtime,
-                    metadata.get('duration'),
-                    metadata.get('duration_human'),
-                    metadata.get('resolution'),
-                    metadata.get('width'),
-                    metadata.get('height'),
-                    metadata.get('codec'),
-                    metadata.get('bitrate'),
-                    metadata.get('fps'),
-                    1 if metadata.get('has_audio') else 0,
-                    thumb_path,
-                    1 if os.path.exists(thumb_path) else 0,
-                    json.dumps(metadata),
-                    datetime.now().isoformat()
-                ))
+            if len(paths) <= DB_IN_CLAUSE_MAX:
+                rows = conn.execute(
+                    f"SELECT * FROM media_cache WHERE filepath IN ({','.join('?' * len(paths))})",
+                    paths
+                ).fetchall()
+            else:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_paths (filepath TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM lookup_paths")
+                conn.executemany("INSERT OR IGNORE INTO lookup_paths (filepath) VALUES (?)",
+                                 ((p,) for p in paths))
+                rows = conn.execute(
+                    "SELECT m.* FROM lookup_paths l JOIN media_cache m ON m.filepath = l.filepath"
+                ).fetchall()
+                conn.execute("DELETE FROM lookup_paths")
                 conn.commit()
         
-        return True
+        return {
+            row['filepath']: dict(row)
+            for row in rows
+            if row['file_mtime'] >= mtimes[row['filepath']]
+        }
+        
+    except Exception as e:
+        print(f"[MediaCache] Error getting cached metadata: {e}")
+        return {}
+
+def _metadata_row(filepath: str, metadata: Dict[str, Any], stat: os.stat_result, now: str) -> tuple:
+    filename = os.path.basename(filepath)
+    thumb_path = get_thumbnail_path(filename)
+    return (
+        filepath,
+        filename,
+        stat.st_size,
+        stat.st_mtime,
+        metadata.get('duration'),
+        metadata.get('duration_human'),
+        metadata.get('resolution'),
+        metadata.get('width'),
+        metadata.get('height'),
+        metadata.get('codec'),
+        metadata.get('bitrate'),
+        metadata.get('fps'),
+        1 if metadata.get('has_audio') else 0,
+        thumb_path,
+        1 if os.path.exists(thumb_path) else 0,
+        json.dumps(metadata),
+        now
+    )
+
+def cache_metadata_many(items: List[tuple]) -> int:
+    """
+    Store metadata for many files, DB_WRITE_BATCH_SIZE rows per transaction.
+    
+    Args:
+        items: List of (filepath, metadata) tuples
+        
+    Returns:
+        Number of rows written (files that vanished are skipped)
+    """
+    now = datetime.now().isoformat()
+    rows = []
+    for filepath, metadata in items:
+        try:
+            rows.append(_metadata_row(filepath, metadata, os.stat(filepath), now))
+        except OSError:
+            continue
+    if not rows:
+        return 0
+    
+    try:
+        with get_db_connection() as conn:
+            for start in range(0, len(rows), DB_WRITE_BATCH_SIZE):
+                with _db_lock:
+                    conn.executemany("""
+                        INSERT OR REPLACE INTO media_cache (
+                            filepath, filename, file_size, file_mtime,
+                            duration, duration_human, resolution, width, height,
+                            codec, bitrate, fps, has_audio, thumbnail_path,
+                            thumbnail_generated, metadata_json, updated_at
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, rows[start:start + DB_WRITE_BATCH_SIZE])
+                    conn.commit()
+        _bump_index_generation()
+        
+        return len(rows)
         
     except Exception as e:
         print(f"[MediaCache] Error caching metadata: {e}")
-        return False
+        return 0
+
+def cache_metadata(filepath: str, metadata: Dict[str, Any]) -> bool:
+    """
+    Store metadata in cache.
+    
+    Args:
+        filepath: Path to video file
+        metadata: Metadata dict to cache
+        
+    Returns:
+        True if successful
+    """
+    return cache_metadata_many([(filepath, metadata)]) == 1
 
 def get_or_extract_metadata(filepath: str) -> Optional[Dict[str, Any]]:
     """
@@ -440,12 +876,14 @@ def get_or_extract_metadata(filepath: str) -> Optional[Dict[str, Any]]:
     return None
 
 def invalidate_cache(filepath: str) -> bool:
-    """Remove a file from cache (e.g., when deleted)."""
+    """Remove a file from cache and recordings index (e.g., when deleted)."""
     try:
         with get_db_connection() as conn:
             with _db_lock:
                 conn.execute("DELETE FROM media_cache WHERE filepath = ?", (filepath,))
+                conn.execute("DELETE FROM recordings_index WHERE filepath = ?", (filepath,))
                 conn.commit()
+        _bump_index_generation()
         
         # Also remove thumbnail
         filename = os.path.basename(filepath)
@@ -459,6 +897,30 @@ def invalidate_cache(filepath: str) -> bool:
         print(f"[MediaCache] Error invalidating cache: {e}")
         return False
 
+def invalidate_cache_many(filepaths: List[str]) -> bool:
+    """Remove several files from cache and recordings index in one transaction."""
+    if not filepaths:
+        return True
+    try:
+        params = [(path,) for path in filepaths]
+        with get_db_connection() as conn:
+            with _db_lock:
+                conn.executemany("DELETE FROM media_cache WHERE filepath = ?", params)
+                conn.executemany("DELETE FROM recordings_index WHERE filepath = ?", params)
+                conn.commit()
+        _bump_index_generation()
+        
+        for path in filepaths:
+            thumb_path = get_thumbnail_path(os.path.basename(path))
+            if os.path.exists(thumb_path):
+                os.remove(thumb_path)
+        
+        return True
+        
+    except Exception as e:
+        print(f"[MediaCache] Error invalidating cache: {e}")
+        return False
+
 def get_all_cached() -> List[Dict[str, Any]]:
     """Get all cached entries (for bulk listing)."""
     try:
@@ -476,129 +938,283 @@ def get_all_cached() -> List[Dict[str, Any]]:
 # ============================================================================
 
 class ThumbnailWorker:
-    """Background worker for generating thumbnails and extracting metadata without blocking requests."""
+    """
+    Background pool generating thumbnails and extracting metadata without blocking requests.
+
+    Jobs are scheduled by class (THUMBNAIL_PRIORITY_CLASSES): thumbnails of the
+    page being viewed first, then freshly completed segments, then directory
+    backfill. Worker 0 always runs; the extra workers of the pool only take
+    jobs while the CPU load and SoC temperature are below their limits.
+
+    The ThumbnailDecoder serializes its requests, so extra workers do not add
+    .ts decodes: they overlap metadata probes, the SQLite updates and the
+    per-file ffmpeg fallback (.mp4/.mkv, decoder disabled) with them.
+    """
     
-    def __init__(self):
-        self.queue = Queue(maxsize=MAX_QUEUE_SIZE)
-        self.worker_thread = None
+    def __init__(self, pool_size: int = THUMBNAIL_WORKERS):
+        self.pool_size = max(1, int(pool_size))
+        self.worker_threads = []
         self.running = False
         self.processed_count = 0
         self.metadata_count = 0
         self.error_count = 0
         self._lock = threading.Lock()
-        self._enqueued = set()
+        self._cond = threading.Condition(self._lock)  # jobs available
+        self._gate_cond = threading.Condition(self._lock)  # extra workers paused by the load gate
+        self._heap = []
+        self._seq = itertools.count()
+        self._enqueued = {}  # video_path -> heap entry (rank, seq, enqueued_at, path)
+        self._depth = [0] * len(THUMBNAIL_PRIORITY_CLASSES)  # pending entries per class
         self._in_progress = set()
+        self._class_stats = [
+            {'enqueued': 0, 'processed': 0, 'dropped': 0,
+             'wait_total': 0.0, 'wait_max': 0.0, 'process_total': 0.0}
+            for _ in THUMBNAIL_PRIORITY_CLASSES
+        ]
+        self._load = {'checked_at': 0.0, 'allow_extra': True,
+                      'load_per_cpu': None, 'temperature_c': None}
     
     def start(self):
-        """Start the background worker thread."""
+        """Start the background worker threads."""
         if self.running:
             return
         
         self.running = True
-        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
-        self.worker_thread.start()
-        print("[MediaCache] Thumbnail worker started")
+        self.worker_threads = [
+            threading.Thread(target=self._worker_loop, args=(index,), daemon=True)
+            for index in range(self.pool_size)
+        ]
+        for thread in self.worker_threads:
+            thread.start()
+        print(f"[MediaCache] Thumbnail worker started ({self.pool_size} thread(s))")
+        if shared_state.is_election_running():
+            # Jobs queued by followers while no leader was running
+            self.drain_shared_jobs()
     
     def stop(self):
-        """Stop the background worker."""
-        self.running = False
-        if self.worker_thread and self.worker_thread.is_alive():
-            self.worker_thread.join(timeout=5)
+        """Stop the background workers."""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+            self._gate_cond.notify_all()
+        for thread in self.worker_threads:
+            if thread.is_alive():
+                thread.join(timeout=5)
+        get_thumbnail_decoder().stop()
         print("[MediaCache] Thumbnail worker stopped")
     
-    def enqueue(self, video_path: str, priority: bool = False):
+    @staticmethod
+    def _priority_rank(priority) -> int:
+        """Map a class name (or the legacy bool) to its rank, 0 = highest."""
+        if priority is True:
+            priority = 'visible'
+        if priority in THUMBNAIL_PRIORITY_CLASSES:
+            return THUMBNAIL_PRIORITY_CLASSES.index(priority)
+        return len(THUMBNAIL_PRIORITY_CLASSES) - 1
+    
+    def enqueue(self, video_path: str, priority='backfill'):
         """
         Add a video to the thumbnail generation queue.
         
         Args:
             video_path: Path to video file
-            priority: If True, process sooner (not implemented yet)
+            priority: 'visible' (page being viewed), 'fresh' (segment just
+                      completed) or 'backfill' (directory scans). A queued
+                      file re-requested with a higher class is promoted.
         """
+        rank = self._priority_rank(priority)
+        if shared_state.is_follower() and \
+                shared_state.push_job(THUMBNAIL_JOB_QUEUE, video_path, rank):
+            # One pool for all workers: the leader picks the job up
+            shared_state.send_signal(THUMBNAIL_JOB_QUEUE)
+            return
+        
         if not self.running:
             self.start()
         
-        try:
-            with self._lock:
-                if video_path in self._enqueued or video_path in self._in_progress:
+        with self._cond:
+            if video_path in self._in_progress:
+                return
+            current = self._enqueued.get(video_path)
+            if current is not None and current[0] <= rank:
+                return
+            if self._depth[rank] >= THUMBNAIL_QUEUE_LIMITS[rank]:
+                if rank > 0:
+                    # Class full - skip, the job is rescheduled by the next scan/listing
+                    if current is None:
+                        self._class_stats[rank]['dropped'] += 1
                     return
-                self._enqueued.add(video_path)
-            self.queue.put_nowait(video_path)
-        except:
-            # Queue full - skip
-            with self._lock:
-                self._enqueued.discard(video_path)
+                # Visible class full - the oldest entry belongs to a page no longer viewed
+                oldest = min((e for e in self._enqueued.values() if e[0] == 0), key=lambda e: e[1])
+                del self._enqueued[oldest[3]]
+                self._depth[0] -= 1
+                self._class_stats[0]['dropped'] += 1
+            entry = (rank, next(self._seq), time.monotonic(), video_path)
+            # A promoted entry leaves its old heap slot behind (skipped when popped)
+            if current is not None:
+                self._depth[current[0]] -= 1
+            self._enqueued[video_path] = entry
+            self._depth[rank] += 1
+            heapq.heappush(self._heap, entry)
+            self._class_stats[rank]['enqueued'] += 1
+            self._cond.notify()
     
-    def _worker_loop(self):
-        """Main worker loop - extracts metadata and generates thumbnails."""
+    def drain_shared_jobs(self) -> int:
+        """Move thumbnail jobs queued by follower workers into the local queue (leader)."""
+        jobs = shared_state.pop_jobs(THUMBNAIL_JOB_QUEUE)
+        for video_path, rank, _enqueued_at in jobs:
+            self.enqueue(video_path, THUMBNAIL_PRIORITY_CLASSES[min(rank, len(THUMBNAIL_PRIORITY_CLASSES) - 1)])
+        return len(jobs)
+    
+    def _extra_workers_allowed(self) -> bool:
+        """Sample load average / SoC temperature (cached) for the extra workers."""
+        now = time.monotonic()
+        if now - self._load['checked_at'] < THUMBNAIL_LOAD_CHECK_INTERVAL:
+            return self._load['allow_extra']
+        
+        load_per_cpu = None
+        temperature = None
+        try:
+            load_per_cpu = round(os.getloadavg()[0] / (os.cpu_count() or 1), 2)
+        except OSError:
+            pass
+        try:
+            with open(SOC_TEMPERATURE_PATH, 'r') as f:
+                temperature = int(f.read().strip()) / 1000.0
+        except (OSError, ValueError):
+            pass
+        
+        allow = (load_per_cpu is None or load_per_cpu < THUMBNAIL_MAX_LOAD_PER_CPU) and \
+                (temperature is None or temperature < THUMBNAIL_MAX_TEMP_C)
+        if allow != self._load['allow_extra'] and self.pool_size > 1:
+            print(f"[MediaCache] Thumbnail pool {'resumed' if allow else 'reduced to 1 worker'} "
+                  f"(load/cpu={load_per_cpu}, temp={temperature}C)")
+        self._load.update(checked_at=now, allow_extra=allow,
+                          load_per_cpu=load_per_cpu, temperature_c=temperature)
+        return allow
+    
+    def _next_job(self, index: int):
+        """Highest-priority pending entry, or None after a 1 s idle wait."""
+        with self._cond:
+            if not self.running:
+                return None
+            if index > 0 and not self._extra_workers_allowed():
+                # Not on _cond: a notify() for a new job must wake a worker that can run it
+                self._gate_cond.wait(timeout=THUMBNAIL_LOAD_CHECK_INTERVAL)
+                return None
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                if self._enqueued.get(entry[3]) is entry:
+                    del self._enqueued[entry[3]]
+                    self._depth[entry[0]] -= 1
+                    self._in_progress.add(entry[3])
+                    return entry
+            self._cond.wait(timeout=1)
+            return None
+    
+    def _process(self, video_path: str):
+        """Extract metadata and generate the thumbnail. Returns (metadata, thumbnail) flags."""
+        if not os.path.exists(video_path):
+            return False, False
+        
+        filename = os.path.basename(video_path)
+        thumb_path = get_thumbnail_path(filename)
+        video_mtime = os.path.getmtime(video_path)
+        
+        # Check if metadata needs extraction
+        extracted = False
+        cached = get_cached_metadata(video_path)
+        if not cached:
+            metadata = extract_video_metadata(video_path)
+            if metadata:
+                cache_metadata(video_path, metadata)
+                extracted = True
+        
+        # Check if thumbnail already exists and is fresh
+        if os.path.exists(thumb_path) and os.path.getmtime(thumb_path) >= video_mtime:
+            return extracted, False
+        
+        if not generate_thumbnail(video_path, thumb_path):
+            raise RuntimeError(f"thumbnail generation failed for {filename}")
+        
+        # Update cache to mark thumbnail as generated
+        with get_db_connection() as conn:
+            conn.execute(
+                "UPDATE media_cache SET thumbnail_generated = 1 WHERE filepath = ?",
+                (video_path,)
+            )
+            conn.commit()
+        return extracted, True
+    
+    def _worker_loop(self, index: int):
+        """Worker loop - extracts metadata and generates thumbnails, best class first."""
         while self.running:
-            try:
-                video_path = self.queue.get(timeout=1)
-                with self._lock:
-                    self._enqueued.discard(video_path)
-                    self._in_progress.add(video_path)
-                
-                if not os.path.exists(video_path):
-                    continue
-                
-                filename = os.path.basename(video_path)
-                thumb_path = get_thumbnail_path(filename)
-                video_mtime = os.path.getmtime(video_path)
-                
-                # Check if metadata needs extraction
-                cached = get_cached_metadata(video_path)
-                if not cached:
-                    metadata = extract_video_metadata(video_path)
-                    if metadata:
-                        cache_metadata(video_path, metadata)
-                        self.metadata_count += 1
-                
-                # Check if thumbnail already exists and is fresh
-                need_thumbnail = True
-                if os.path.exists(thumb_path):
-                    thumb_mtime = os.path.getmtime(thumb_path)
-                    if thumb_mtime >= video_mtime:
-                        need_thumbnail = False
-                
-                # Generate thumbnail if needed
-                if need_thumbnail:
-                    if generate_thumbnail(video_path, thumb_path):
-                        self.processed_count += 1
-                        
-                        # Update cache to mark thumbnail as generated
-                        with get_db_connection() as conn:
-                            conn.execute(
-                                "UPDATE media_cache SET thumbnail_generated = 1 WHERE filepath = ?",
-                                (video_path,)
-                            )
-                            conn.commit()
-                    else:
-                        self.error_count += 1
-                
-            except Empty:
+            entry = self._next_job(index)
+            if entry is None:
+                if index == 0:
+                    get_thumbnail_decoder().stop_if_idle()
                 continue
+            
+            rank, _seq, enqueued_at, video_path = entry
+            started = time.monotonic()
+            extracted = generated = failed = False
+            try:
+                extracted, generated = self._process(video_path)
             except Exception as e:
                 print(f"[MediaCache] Worker error: {e}")
-                self.error_count += 1
+                failed = True
             finally:
-                try:
-                    with self._lock:
-                        self._in_progress.discard(video_path)
-                except Exception:
-                    pass
+                finished = time.monotonic()
+                with self._cond:
+                    self._in_progress.discard(video_path)
+                    self.metadata_count += extracted
+                    self.processed_count += generated
+                    self.error_count += failed
+                    stats = self._class_stats[rank]
+                    stats['processed'] += 1
+                    stats['wait_total'] += started - enqueued_at
+                    stats['wait_max'] = max(stats['wait_max'], started - enqueued_at)
+                    stats['process_total'] += finished - started
     
     def get_status(self) -> Dict[str, Any]:
-        """Get worker status."""
+        """Get worker status (pool, load gate and per-class queue metrics)."""
+        now = time.monotonic()
         with self._lock:
-            queued_unique = len(self._enqueued)
+            depth = [0] * len(THUMBNAIL_PRIORITY_CLASSES)
+            oldest = [0.0] * len(THUMBNAIL_PRIORITY_CLASSES)
+            for rank, _seq, enqueued_at, _path in self._enqueued.values():
+                depth[rank] += 1
+                oldest[rank] = max(oldest[rank], now - enqueued_at)
+            classes = {}
+            for rank, name in enumerate(THUMBNAIL_PRIORITY_CLASSES):
+                stats = self._class_stats[rank]
+                done = stats['processed']
+                classes[name] = {
+                    'depth': depth[rank],
+                    'oldest_wait_ms': round(oldest[rank] * 1000),
+                    'enqueued': stats['enqueued'],
+                    'processed': done,
+                    'dropped': stats['dropped'],
+                    'avg_wait_ms': round(stats['wait_total'] / done * 1000) if done else 0,
+                    'max_wait_ms': round(stats['wait_max'] * 1000),
+                    'avg_process_ms': round(stats['process_total'] / done * 1000) if done else 0
+                }
+            queued = len(self._enqueued)
             in_progress = len(self._in_progress)
         return {
             'running': self.running,
-            'queue_size': self.queue.qsize(),
-            'queue_unique': queued_unique,
+            'queue_size': queued,
+            'queue_unique': queued,
             'in_progress': in_progress,
+            'pool_size': self.pool_size,
+            'extra_workers_allowed': self._load['allow_extra'],
+            'load_per_cpu': self._load['load_per_cpu'],
+            'temperature_c': self._load['temperature_c'],
+            'classes': classes,
             'thumbnails_generated': self.processed_count,
             'metadata_extracted': self.metadata_count,
-            'errors': self.error_count
+            'errors': self.error_count,
+            'decoder': get_thumbnail_decoder().get_status()
         }
 
 # Global worker instance
@@ -645,12 +1261,22 @@ def scan_and_cache_directory(record_dir: str, pattern: str = '*.ts') -> Dict[str
     if not worker.running:
         worker.start()
     
+    # One query for the whole directory, then extract only what is missing
+    cached = get_cached_metadata_many(files)
+    pending = []
+    
     for filepath in files:
         results['scanned'] += 1
         
         try:
-            # Get or extract metadata
-            metadata = get_or_extract_metadata(filepath)
+            metadata = cached.get(filepath)
+            if not metadata:
+                metadata = extract_video_metadata(filepath)
+                if metadata:
+                    pending.append((filepath, metadata))
+                    if len(pending) >= DB_WRITE_BATCH_SIZE:
+                        cache_metadata_many(pending)
+                        pending = []
             if metadata:
                 results['cached'] += 1
                 
@@ -658,7 +1284,7 @@ def scan_and_cache_directory(record_dir: str, pattern: str = '*.ts') -> Dict[str
                 filename = os.path.basename(filepath)
                 thumb_path = get_thumbnail_path(filename)
                 if not os.path.exists(thumb_path):
-                    worker.enqueue(filepath)
+                    worker.enqueue(filepath, priority='backfill')
                     results['thumbnails_queued'] += 1
             else:
                 results['errors'] += 1
@@ -667,6 +1293,9 @@ def scan_and_cache_directory(record_dir: str, pattern: str = '*.ts') -> Dict[str
             print(f"[MediaCache] Error processing {filepath}: {e}")
             results['errors'] += 1
     
+    if pending:
+        cache_metadata_many(pending)
+    
     return results
 
 def cleanup_stale_cache(record_dir: str) -> Dict[str, Any]:
@@ -690,6 +1319,7 @@ def cleanup_stale_cache(record_dir: str) -> Dict[str, Any]:
             cursor = conn.execute("SELECT filepath, thumbnail_path FROM media_cache")
             rows = cursor.fetchall()
             
+            removed = []
             for row in rows:
                 results['checked'] += 1
                 filepath = row['filepath']
@@ -697,11 +1327,7 @@ def cleanup_stale_cache(record_dir: str) -> Dict[str, Any]:
                 
                 if not os.path.exists(filepath):
                     # File no longer exists - remove from cache
-                    with _db_lock:
-                        conn.execute(
-                            "DELETE FROM media_cache WHERE filepath = ?",
-                            (filepath,)
-                        )
+                    removed.append((filepath,))
                     results['removed'] += 1
                     
                     # Remove orphaned thumbnail
@@ -712,7 +1338,10 @@ def cleanup_stale_cache(record_dir: str) -> Dict[str, Any]:
                         except:
                             pass
             
-            conn.commit()
+            if removed:
+                with _db_lock:
+                    conn.executemany("DELETE FROM media_cache WHERE filepath = ?", removed)
+                    conn.commit()
         
     except Exception as e:
         print(f"[MediaCache] Error cleaning stale cache: {e}")
@@ -750,7 +1379,13 @@ def get_cache_stats() -> Dict[str, Any]:
                     if os.path.isfile(fpath):
                         thumb_size += os.path.getsize(fpath)
         
-        worker = get_thumbnail_worker()
+        if shared_state.is_follower():
+            # Pool and indexer run in the leader worker
+            worker_status = shared_state.get(WORKER_STATUS_KEY) or {'running': False}
+            index_status = shared_state.get(INDEX_STATUS_KEY) or {'running': False, 'ready': False}
+        else:
+            worker_status = get_thumbnail_worker().get_status()
+            index_status = get_recordings_indexer().get_status()
         
         return {
             'total_entries': total,
@@ -762,7 +1397,9 @@ def get_cache_stats() -> Dict[str, Any]:
             'database_size_human': format_size(db_size),
             'thumbnail_cache_size': thumb_size,
             'thumbnail_cache_size_human': format_size(thumb_size),
-            'worker_status': worker.get_status()
+            'worker_status': worker_status,
+            'probe_stats': dict(_probe_stats),
+            'index_status': index_status
         }
         
     except Exception as e:
@@ -777,12 +1414,612 @@ def format_size(size_bytes: int) -> str:
         size_bytes /= 1024
     return f"{size_bytes:.1f} To"
 
+# ============================================================================
+# RECORDINGS INDEX (inotify-driven)
+# ============================================================================
+
+# Index settings
+INDEX_FLUSH_INTERVAL = 2.0  # seconds - coalesce IN_MODIFY bursts of the segment being written
+INDEX_RESYNC_INTERVAL = 900  # seconds - full reconciliation (safety net for missed events)
+INDEX_POLL_INTERVAL = 30  # seconds - resync period when inotify is unavailable
+INDEX_BATCH_SIZE = 500
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_INDEX_WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+_libc = None
+
+def _get_libc():
+    """Load libc for inotify syscalls (None if unavailable, e.g. non-Linux)."""
+    global _libc
+    if _libc is None:
+        try:
+            lib = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            lib.inotify_init1.argtypes = [ctypes.c_int]
+            lib.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            lib.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            _libc = lib
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+class _Inotify:
+    """Minimal inotify wrapper (ctypes, no external dependency)."""
+
+    def __init__(self):
+        libc = _get_libc()
+        if libc is None:
+            raise OSError(errno.ENOSYS, 'inotify not available')
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read_events(self, timeout: float):
+        """Wait up to timeout seconds and return a list of (wd, mask, name)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def _index_row_from_stat(filepath: str, root: str, stat: os.stat_result) -> tuple:
+    """Build a recordings_index row tuple."""
+    filename = os.path.basename(filepath)
+    return (
+        filepath,
+        filename,
+        os.path.relpath(filepath, root),
+        os.path.splitext(filename)[1].lower().lstrip('.'),
+        stat.st_size,
+        stat.st_mtime,
+        stat.st_ctime,
+        time.time()
+    )
+
+_INDEX_UPSERT_SQL = """
+    INSERT OR REPLACE INTO recordings_index (
+        filepath, filename, relative_path, extension,
+        file_size, file_mtime, file_ctime, indexed_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+class RecordingsIndexer:
+    """
+    Background watcher keeping recordings_index in sync with the recordings directory.
+
+    A full reconciliation runs at startup (and periodically as a safety net); afterwards
+    inotify events update single rows. The segment currently being written generates a
+    stream of IN_MODIFY events, which are coalesced and flushed every INDEX_FLUSH_INTERVAL.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.worker_thread = None
+        self.running = False
+        self.ready = False
+        self.using_inotify = False
+        self.last_sync = None
+        self.last_sync_duration = None
+        self.events_processed = 0
+        self.error_count = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._resync_event = threading.Event()
+        self._dirty = set()
+
+    def start(self, record_dir: str):
+        """Start watching record_dir (restarts the watcher if the directory changed)."""
+        record_dir = os.path.abspath(record_dir)
+        with self._lock:
+            if self.running and self.root == record_dir:
+                return
+        if self.running:
+            self.stop()
+
+        with self._lock:
+            self.root = record_dir
+            self.ready = False
+            self.running = True
+            self._stop_event.clear()
+            self.worker_thread = threading.Thread(
+                target=self._worker_loop, daemon=True, name='recordings-indexer'
+            )
+            self.worker_thread.start()
+        print(f"[MediaCache] Recordings indexer started for {record_dir}")
+
+    def stop(self):
+        """Stop the watcher thread."""
+        self.running = False
+        self._stop_event.set()
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=5)
+        print("[MediaCache] Recordings indexer stopped")
+
+    def is_ready_for(self, record_dir: str) -> bool:
+        """True if the index is complete and covers record_dir."""
+        return self.ready and self.running and self.root == os.path.abspath(record_dir)
+
+    def request_resync(self):
+        """Ask the worker to run a full reconciliation on its next iteration."""
+        self._resync_event.set()
+
+    def sync(self) -> Dict[str, Any]:
+        """
+        Reconcile recordings_index with the directory contents in one pass.
+
+        Returns:
+            Dict with added/updated/removed counts
+        """
+        root = self.root
+        started = time.monotonic()
+        results = {'scanned': 0, 'upserted': 0, 'removed': 0}
+
+        on_disk = {}
+        if os.path.isdir(root):
+            for filepath, stat in _walk_recordings(root):
+                on_disk[filepath] = stat
+        results['scanned'] = len(on_disk)
+
+        with get_db_connection() as conn:
+            cursor = conn.execute("SELECT filepath, file_size, file_mtime FROM recordings_index")
+            indexed = {row['filepath']: (row['file_size'], row['file_mtime']) for row in cursor}
+
+            upserts = []
+            for filepath, stat in on_disk.items():
+                if indexed.get(filepath) != (stat.st_size, stat.st_mtime):
+                    upserts.append(_index_row_from_stat(filepath, root, stat))
+            removed = [(path,) for path in indexed if path not in on_disk]
+
+            with _db_lock:
+                for i in range(0, len(upserts), INDEX_BATCH_SIZE):
+                    conn.executemany(_INDEX_UPSERT_SQL, upserts[i:i + INDEX_BATCH_SIZE])
+                if removed:
+                    conn.executemany("DELETE FROM recordings_index WHERE filepath = ?", removed)
+                conn.commit()
+        if upserts or removed:
+            _bump_index_generation()
+
+        results['upserted'] = len(upserts)
+        results['removed'] = len(removed)
+        self.last_sync = datetime.now().isoformat()
+        self.last_sync_duration = round(time.monotonic() - started, 3)
+        return results
+
+    def _apply_changes(self, paths):
+        """Re-stat a set of paths and upsert/delete their index rows."""
+        root = self.root
+        upserts = []
+        removed = []
+        for filepath in paths:
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                removed.append((filepath,))
+                continue
+            except OSError:
+                continue
+            if os.path.isfile(filepath):
+                upserts.append(_index_row_from_stat(filepath, root, stat))
+
+        if not upserts and not removed:
+            return
+        with get_db_connection() as conn:
+            with _db_lock:
+                if upserts:
+                    conn.executemany(_INDEX_UPSERT_SQL, upserts)
+                if removed:
+                    conn.executemany("DELETE FROM recordings_index WHERE filepath = ?", removed)
+                conn.commit()
+        _bump_index_generation()
+
+    def _remove_tree(self, dirpath: str):
+        """Drop all rows below a directory that was deleted or moved away."""
+        prefix = dirpath.rstrip(os.sep) + os.sep
+        with get_db_connection() as conn:
+            with _db_lock:
+                conn.execute(
+                    "DELETE FROM recordings_index WHERE substr(filepath, 1, ?) = ?",
+                    (len(prefix), prefix)
+                )
+                conn.commit()
+        _bump_index_generation()
+
+    def _add_watches(self, inotify: '_Inotify', watches: Dict[int, str], top: str):
+        """Watch top and every non-hidden subdirectory."""
+        for dirpath, dirnames, _ in os.walk(top):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            try:
+                wd = inotify.add_watch(dirpath, _INDEX_WATCH_MASK)
+                watches[wd] = dirpath
+            except OSError as e:
+                print(f"[MediaCache] Cannot watch {dirpath}: {e}")
+
+    def _worker_loop(self):
+        """Main loop - initial sync, then apply inotify events."""
+        inotify = None
+        watches = {}
+        try:
+            while self.running and not os.path.isdir(self.root):
+                if self._stop_event.wait(INDEX_POLL_INTERVAL):
+                    return
+
+            try:
+                inotify = _Inotify()
+                self._add_watches(inotify, watches, self.root)
+                self.using_inotify = True
+            except OSError as e:
+                print(f"[MediaCache] inotify unavailable ({e}), falling back to periodic rescan")
+                inotify = None
+                self.using_inotify = False
+
+            # Watches are in place before the initial sync, so nothing is missed in between
+            results = self.sync()
+            self.ready = True
+            shared_state.publish_now(INDEX_STATUS_KEY)
+            print(f"[MediaCache] Recordings index synced: {results} "
+                  f"in {self.last_sync_duration}s")
+
+            resync_interval = INDEX_RESYNC_INTERVAL if inotify else INDEX_POLL_INTERVAL
+            next_resync = time.monotonic() + resync_interval
+            next_flush = time.monotonic() + INDEX_FLUSH_INTERVAL
+
+            while self.running:
+                if inotify:
+                    events = inotify.read_events(timeout=1.0)
+                else:
+                    events = []
+                    self._stop_event.wait(1.0)
+
+                for wd, mask, name in events:
+                    self.events_processed += 1
+                    if mask & IN_Q_OVERFLOW:
+                        self._resync_event.set()
+                        continue
+                    dirpath = watches.get(wd)
+                    if mask & IN_IGNORED:
+                        watches.pop(wd, None)
+                        if dirpath == self.root:
+                            # Root removed or replaced - rebuild watches and index
+                            self._resync_event.set()
+                        continue
+                    if dirpath is None or not name or name.startswith('.'):
+                        continue
+
+                    path = os.path.join(dirpath, name)
+                    if mask & IN_ISDIR:
+                        if mask & (IN_CREATE | IN_MOVED_TO):
+                            self._add_watches(inotify, watches, path)
+                            self._resync_event.set()
+                        elif mask & (IN_DELETE | IN_MOVED_FROM):
+                            self._remove_tree(path)
+                        continue
+
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        self._dirty.discard(path)
+                        self._apply_changes([path])
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        # Final size known - apply immediately
+                        self._dirty.discard(path)
+                        self._apply_changes([path])
+                    else:
+                        self._dirty.add(path)
+
+                now = time.monotonic()
+                if self._dirty and now >= next_flush:
+                    dirty, self._dirty = self._dirty, set()
+                    self._apply_changes(dirty)
+                    next_flush = now + INDEX_FLUSH_INTERVAL
+
+                if self._resync_event.is_set() or now >= next_resync:
+                    self._resync_event.clear()
+                    if inotify and self.root not in watches.values() and os.path.isdir(self.root):
+                        self._add_watches(inotify, watches, self.root)
+                    self.sync()
+                    next_resync = time.monotonic() + resync_interval
+
+        except Exception as e:
+            print(f"[MediaCache] Recordings indexer error: {e}")
+            self.error_count += 1
+            self.ready = False
+        finally:
+            if inotify:
+                inotify.close()
+            self.running = False
+            shared_state.publish_now(INDEX_STATUS_KEY)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get indexer status."""
+        return {
+            'running': self.running,
+            'ready': self.ready,
+            'root': self.root,
+            'inotify': self.using_inotify,
+            'pending_changes': len(self._dirty),
+            'events_processed': self.events_processed,
+            'last_sync': self.last_sync,
+            'last_sync_duration': self.last_sync_duration,
+            'errors': self.error_count
+        }
+
+def _walk_recordings(root: str):
+    """Yield (filepath, stat) for every non-hidden regular file below root."""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+# Global indexer instance
+_recordings_indexer = None
+
+def get_recordings_indexer() -> RecordingsIndexer:
+    """Get or create the global recordings indexer."""
+    global _recordings_indexer
+    if _recordings_indexer is None:
+        _recordings_indexer = RecordingsIndexer()
+    return _recordings_indexer
+
+def ensure_recordings_index(record_dir: str) -> bool:
+    """
+    Make sure the indexer watches record_dir.
+
+    Returns:
+        True if the index is ready to be queried for record_dir
+    """
+    if shared_state.is_follower():
+        # The leader's indexer maintains the table, followers only query it
+        status = shared_state.get(INDEX_STATUS_KEY) or {}
+        return bool(status.get('ready') and status.get('running')
+                    and status.get('root') == os.path.abspath(record_dir))
+    indexer = get_recordings_indexer()
+    if not indexer.running or indexer.root != os.path.abspath(record_dir):
+        indexer.start(record_dir)
+    return indexer.is_ready_for(record_dir)
+
+_INDEX_SORT_COLUMNS = {
+    'date': 'r.file_mtime',
+    'name': 'r.filename',
+    'size': 'r.file_size',
+}
+
+# Aggregates cache (count/size/duration per filter set), invalidated on index changes
+AGGREGATES_CACHE_TTL = 30  # seconds - bounds staleness of durations filled in by the worker
+AGGREGATES_CACHE_MAX = 64
+
+_index_generation = 0
+_aggregates_cache = {}
+_aggregates_lock = threading.Lock()
+
+def _bump_index_generation():
+    """Mark cached aggregates as stale after a write to the index or metadata."""
+    global _index_generation
+    with _aggregates_lock:
+        _index_generation += 1
+    if shared_state.is_election_running():
+        shared_state.incr(INDEX_GENERATION_COUNTER)
+
+def _current_index_generation():
+    """Local generation, plus the shared one when other workers write to the index."""
+    if shared_state.is_election_running():
+        return (_index_generation, shared_state.get_counter(INDEX_GENERATION_COUNTER))
+    return _index_generation
+
+def _index_where(pattern: str = '*.*', search: str = '',
+                 filters: Optional[Dict[str, Any]] = None) -> tuple:
+    """
+    Build WHERE clause and params shared by index queries.
+
+    Supported filters: extensions (list), mtime_from / mtime_to (epoch seconds),
+    min_size / max_size (bytes), min_duration / max_duration (seconds, only
+    recordings with fresh cached metadata can match).
+    """
+    clauses = []
+    params = []
+    filters = filters or {}
+    if pattern and pattern != '*':
+        # SQLite GLOB uses the same syntax as glob.glob basename matching
+        clauses.append("r.filename GLOB ?")
+        params.append(pattern)
+    if search:
+        clauses.append("instr(lower(r.filename), ?) > 0")
+        params.append(search.lower())
+
+    extensions = filters.get('extensions')
+    if extensions:
+        clauses.append(f"r.extension IN ({','.join('?' * len(extensions))})")
+        params.extend(ext.lower().lstrip('.') for ext in extensions)
+
+    for key, expr in (
+        ('mtime_from', "r.file_mtime >= ?"),
+        ('mtime_to', "r.file_mtime <= ?"),
+        ('min_size', "r.file_size >= ?"),
+        ('max_size', "r.file_size <= ?"),
+        ('min_duration', "(m.file_mtime >= r.file_mtime AND m.duration >= ?)"),
+        ('max_duration', "(m.file_mtime >= r.file_mtime AND m.duration <= ?)"),
+    ):
+        if filters.get(key) is not None:
+            clauses.append(expr)
+            params.append(filters[key])
+
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    return where, params
+
+def _index_after_clause(sort_by: str, reverse: bool, after: tuple) -> tuple:
+    """
+    Keyset condition for rows strictly after the cursor (sort_key, relative_path).
+
+    Uses SQLite row values so the (sort column, relative_path) indexes can be
+    walked directly instead of scanning and skipping OFFSET rows. The relative
+    path is the tiebreak: file names repeat across date subdirectories.
+    """
+    op = '<' if reverse else '>'
+    key, relative_path = after
+    column = _INDEX_SORT_COLUMNS.get(sort_by, 'r.file_mtime')
+    return f"({column}, r.relative_path) {op} (?, ?)", [key, relative_path]
+
+def query_recordings_index(pattern: str = '*.*', sort_by: str = 'date', reverse: bool = True,
+                           search: str = '', limit: Optional[int] = None,
+                           offset: int = 0, filters: Optional[Dict[str, Any]] = None,
+                           after: Optional[tuple] = None) -> List[Dict[str, Any]]:
+    """
+    Query the recordings index joined with cached metadata.
+
+    Args:
+        pattern: Glob pattern on filename
+        sort_by: Sort field ('date', 'name', 'size')
+        reverse: Descending order if True
+        search: Case-insensitive substring filter on filename
+        limit: Max rows (None = all)
+        offset: Rows to skip (ignored when after is given)
+        filters: Extra filters (see _index_where)
+        after: Keyset cursor (sort_key, relative_path) - return rows after this one
+
+    Returns:
+        List of row dicts (index columns + duration/resolution/codec when cached and fresh)
+    """
+    column = _INDEX_SORT_COLUMNS.get(sort_by, 'r.file_mtime')
+    direction = 'DESC' if reverse else 'ASC'
+    where, params = _index_where(pattern, search, filters)
+
+    if after is not None:
+        clause, after_params = _index_after_clause(sort_by, reverse, after)
+        where = f"{where} AND {clause}" if where else f" WHERE {clause}"
+        params += after_params
+        offset = 0
+
+    sql = f"""
+        SELECT r.filepath, r.filename, r.relative_path, r.extension,
+               r.file_size, r.file_mtime, r.file_ctime,
+               CASE WHEN m.file_mtime >= r.file_mtime THEN 1 ELSE 0 END AS metadata_valid,
+               m.duration, m.resolution, m.codec
+        FROM recordings_index r
+        LEFT JOIN media_cache m ON m.filepath = r.filepath
+        {where}
+        ORDER BY {column} {direction}, r.relative_path {direction}
+    """
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [int(limit), max(0, int(offset))]
+
+    with get_db_connection() as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+def get_recordings_index_aggregates(pattern: str = '*.*', search: str = '',
+                                    filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Compute count / total size / total duration of indexed recordings in SQL.
+
+    Results are cached per filter set until the index changes (or AGGREGATES_CACHE_TTL).
+
+    Returns:
+        Dict with count, total_size, total_duration
+    """
+    cache_key = (pattern, search, tuple(sorted(
+        (k, tuple(v) if isinstance(v, list) else v) for k, v in (filters or {}).items()
+    )))
+    now = time.monotonic()
+    generation = _current_index_generation()
+    with _aggregates_lock:
+        cached = _aggregates_cache.get(cache_key)
+        if cached and cached[0] == generation and now - cached[1] < AGGREGATES_CACHE_TTL:
+            return dict(cached[2])
+
+    where, params = _index_where(pattern, search, filters)
+    sql = f"""
+        SELECT COUNT(*) AS count,
+               COALESCE(SUM(r.file_size), 0) AS total_size,
+               COALESCE(SUM(m.duration), 0) AS total_duration
+        FROM recordings_index r
+        LEFT JOIN media_cache m ON m.filepath = r.filepath
+        {where}
+    """
+    with get_db_connection() as conn:
+        row = conn.execute(sql, params).fetchone()
+        result = {
+            'count': row['count'],
+            'total_size': row['total_size'],
+            'total_duration': row['total_duration']
+        }
+
+    with _aggregates_lock:
+        if len(_aggregates_cache) >= AGGREGATES_CACHE_MAX:
+            _aggregates_cache.clear()
+        _aggregates_cache[cache_key] = (generation, now, result)
+    return dict(result)
+
 # ============================================================================
 # INITIALIZATION
 # ============================================================================
 
-def init_media_cache():
-    """Initialize the media cache system."""
+def _publish_worker_status():
+    return get_thumbnail_worker().get_status()
+
+def _publish_index_status():
+    return get_recordings_indexer().get_status()
+
+# Leader side of the multi-worker setup (only used once an election runs)
+shared_state.register_signal(THUMBNAIL_JOB_QUEUE, lambda: get_thumbnail_worker().drain_shared_jobs())
+shared_state.register_publisher(WORKER_STATUS_KEY, _publish_worker_status)
+shared_state.register_publisher(INDEX_STATUS_KEY, _publish_index_status)
+
+def init_media_cache(record_dir: Optional[str] = None):
+    """Initialize the media cache system (leader worker when running under Gunicorn)."""
     try:
         init_database()
         
@@ -790,6 +2027,10 @@ def init_media_cache():
         worker = get_thumbnail_worker()
         worker.start()
         
+        # Start recordings index watcher
+        if record_dir:
+            get_recordings_indexer().start(record_dir)
+        
         print("[MediaCache] Media cache system initialized")
         return True
         
@@ -1,7 +1,23 @@
 # -*- coding: utf-8 -*-
 """
 Meeting Service - Meeting API integration and heartbeat
-Version: 2.30.23
+Version: 2.32.0
+
+Changes in 2.32.0:
+- Delta-encoded heartbeats (telemetry_service): only the fields that changed
+  since the last acknowledged beat, full snapshot every heartbeat_full_interval
+  seconds (default 600) and after a failure
+- Metrics of failed beats kept in a bounded on-disk spool (telemetry_spool_max,
+  default 1440) and uploaded as one compressed telemetry_batch once the API is
+  reachable again
+- save_meeting_config keeps public_ip_ttl / heartbeat_full_interval /
+  telemetry_spool_max; compact JSON request bodies, SSL context of
+  meeting_api_request built once
+
+Changes in 2.31.0:
+- Heartbeat network fields come from the cached network identity
+  (network_identity_service): no `ip` forks, public IP looked up in the
+  background every public_ip_ttl seconds (default 900) and on route changes
 
 Conforms to Meeting API integration guide (docs/MEETING - integration.md):
 - Heartbeat: POST /api/devices/{device_key}/online (v1.8.0+ network fields)
@@ -10,6 +26,14 @@ Conforms to Meeting API integration guide (docs/MEETING - integration.md):
 - Meeting SSH pubkey: GET /api/ssh/pubkey
 
 Note: Services are managed by Meeting admin only (not sent in heartbeat).
+
+Changes in 2.30.25:
+- Direct writes to config.env invalidate config_service's parsed config cache
+
+Changes in 2.30.24:
+- Multi-worker (Gunicorn): the heartbeat runs in the leader worker only; the
+  other workers relay immediate-heartbeat/start/stop requests to it and report
+  the state it publishes (shared_state_service)
 """
 
 import os
@@ -26,7 +50,8 @@ import urllib.error
 from datetime import datetime
 
 from .platform_service import run_command
-from .config_service import set_hostname
+from .config_service import set_hostname, invalidate_config_cache
+from . import shared_state_service as shared_state
 from config import MEETING_CONFIG_FILE, CONFIG_FILE
 
 # Logger for debug
@@ -58,6 +83,12 @@ _heartbeat_stop_event = threading.Event()
 _immediate_heartbeat_event = threading.Event()
 _last_known_connectivity_state = None  # Track connectivity changes
 
+# Shared state (multi-worker): snapshot published by the leader, relayed requests
+MEETING_STATE_KEY = 'meeting:state'
+SIGNAL_IMMEDIATE_HEARTBEAT = 'meeting:heartbeat'
+SIGNAL_START_HEARTBEAT = 'meeting:start_heartbeat'
+SIGNAL_STOP_HEARTBEAT = 'meeting:stop_heartbeat'
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -81,6 +112,9 @@ def load_meeting_config():
         'device_key': '',  # Will be auto-generated if empty
         'token_code': '',
         'heartbeat_interval': 60,  # Per Meeting API spec: 60s recommended interval
+        'public_ip_ttl': 900,  # Seconds between public IP lookups (also on route change)
+        'heartbeat_full_interval': 600,  # Seconds between full heartbeat snapshots (deltas otherwise)
+        'telemetry_spool_max': 1440,  # Samples kept while offline (24 h at 60 s)
         'auto_connect': True,
         'provisioned': False
     }
@@ -123,6 +157,11 @@ def load_meeting_config():
                                     default_config['heartbeat_interval'] = int(value)
                                 except:
                                     pass
+                            elif key == 'MEETING_PUBLIC_IP_TTL':
+                                try:
+                                    default_config['public_ip_ttl'] = int(value)
+                                except ValueError:
+                                    pass
                             elif key == 'MEETING_PROVISIONED':
                                 default_config['provisioned'] = value.lower() in ('yes', 'true', '1')
             except Exception as e:
@@ -164,6 +203,9 @@ def save_meeting_config(config):
             'api_url': config.get('api_url', ''),
             'device_key': config.get('device_key', ''),
             'heartbeat_interval': config.get('heartbeat_interval', 30),
+            'public_ip_ttl': config.get('public_ip_ttl', 900),
+            'heartbeat_full_interval': config.get('heartbeat_full_interval', 600),
+            'telemetry_spool_max': config.get('telemetry_spool_max', 1440),
             'auto_connect': config.get('auto_connect', True),
             'provisioned': config.get('provisioned', False)
         }
@@ -196,13 +238,21 @@ def get_meeting_status():
     api_url = config.get('api_url', '')
     device_key = config.get('device_key', '')
     
-    # Start with local state
+    # Start with local state (the leader's snapshot in a follower worker)
     with meeting_state['lock']:
         last_hb = meeting_state['last_heartbeat']
         connected = meeting_state['connected']
         last_error = meeting_state['last_error']
         device_info = meeting_state['device_info']
         thread_running = meeting_state['thread_running']
+    if shared_state.is_follower():
+        snapshot = shared_state.get(MEETING_STATE_KEY)
+        if snapshot:
+            last_hb = snapshot['last_heartbeat']
+            connected = snapshot['connected']
+            last_error = snapshot['last_error']
+            device_info = snapshot['device_info']
+            thread_running = snapshot['thread_running']
     
     last_hb_ago = None
     
@@ -284,6 +334,23 @@ def _build_api_url(base_url, endpoint):
     
     return base_url + endpoint
 
+_api_ssl_context = None
+
+def _get_api_ssl_context():
+    """
+    SSL context that doesn't verify (for self-signed certs), built once.
+    
+    create_default_context() loads the system CA bundle: tens of ms of CPU
+    per heartbeat on a Pi when done per request.
+    """
+    global _api_ssl_context
+    if _api_ssl_context is None:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        _api_ssl_context = context
+    return _api_ssl_context
+
 def meeting_api_request(endpoint, method='GET', data=None, timeout=10):
     """
     Make a request to the Meeting API.
@@ -313,7 +380,7 @@ def meeting_api_request(endpoint, method='GET', data=None, timeout=10):
         headers['X-Token-Code'] = config['token_code']
     
     try:
-        req_data = json.dumps(data).encode('utf-8') if data else None
+        req_data = json.dumps(data, separators=(',', ':')).encode('utf-8') if data else None
         
         request = urllib.request.Request(
             url,
@@ -322,13 +389,7 @@ def meeting_api_request(endpoint, method='GET', data=None, timeout=10):
             method=method
         )
         
-        # Create SSL context that doesn't verify (for self-signed certs)
-        import ssl
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
-        with urllib.request.urlopen(request, timeout=timeout, context=ssl_context) as response:
+        with urllib.request.urlopen(request, timeout=timeout, context=_get_api_ssl_context()) as response:
             response_data = response.read().decode('utf-8')
             
             if response_data:
@@ -927,6 +988,29 @@ def get_meeting_authorized_services():
             'error': str(e)
         }
 
+def _get_heartbeat_network(config):
+    """
+    Addresses for the heartbeat from the network identity cache.
+    
+    The public IP is refreshed in the background every public_ip_ttl seconds
+    and on default route changes (network_identity_service).
+    
+    Args:
+        config: Meeting configuration (public_ip_ttl)
+    
+    Returns:
+        tuple: (local_ip, ip_lan, ip_public or None, primary_mac or None)
+    """
+    try:
+        from .network_identity_service import get_network_identity
+        identity = get_network_identity().snapshot(ttl=config.get('public_ip_ttl'))
+    except Exception as e:
+        import sys
+        print(f"[Meeting] Warning: Failed to get network info: {e}", file=sys.stderr)
+        return '127.0.0.1', '127.0.0.1', None, None
+    local_ip = identity['preferred_ip'] or '127.0.0.1'
+    return local_ip, identity['ip_lan'] or local_ip, identity['ip_public'], identity['mac']
+
 def get_heartbeat_payload():
     """
     Build and return the heartbeat payload without sending it.
@@ -944,38 +1028,14 @@ def get_heartbeat_payload():
         # Collect system info
         try:
             from .config_service import get_system_info, get_device_description
-            from .network_service import get_preferred_ip
             sys_info = get_system_info()
-            local_ip = get_preferred_ip()
             device_description = get_device_description()
         except Exception as e:
             sys_info = {'uptime': '', 'cpu': {'load_1m': 0}, 'memory': {'percent': 0}, 'disk': {'percent': 0}, 'network': {}}
-            local_ip = '127.0.0.1'
             device_description = 'RTSP Recorder'
         
-        # Get network info for v1.8.0+ fields
-        ip_lan = local_ip
-        ip_public = None
-        primary_mac = None
-        
-        try:
-            from .network_service import get_network_interfaces, get_public_ip
-            interfaces = get_network_interfaces()
-            
-            # Find primary interface (has gateway) for MAC
-            for iface in interfaces:
-                if iface.get('gateway') or iface.get('is_default'):
-                    primary_mac = iface.get('mac', '').upper().replace('-', ':')
-                    if iface.get('ip'):
-                        ip_lan = iface['ip']
-                    break
-            
-            # Get public IP
-            ip_public = get_public_ip()
-            
-        except Exception as e:
-            import sys
-            print(f"[Meeting] Warning: Failed to get network info: {e}", file=sys.stderr)
+        # Network info for v1.8.0+ fields (cached, never waits for the network)
+        local_ip, ip_lan, ip_public, primary_mac = _get_heartbeat_network(config)
         
         # Build heartbeat payload per Meeting API spec (v1.8.0+)
         heartbeat_data = {
@@ -997,9 +1057,16 @@ def get_heartbeat_payload():
         # Remove None values (API may not like them)
         heartbeat_data = {k: v for k, v in heartbeat_data.items() if v is not None}
         
+        try:
+            from .telemetry_service import get_telemetry_status
+            telemetry = get_telemetry_status()
+        except Exception as e:
+            telemetry = {'error': str(e)}
+        
         return {
             'success': True,
             'payload': heartbeat_data,
+            'telemetry': telemetry,
             'endpoint': f"/api/devices/{config['device_key']}/online",
             'api_url': config.get('api_url', 'https://meeting.ygsoft.fr/api'),
             'device_key': config.get('device_key'),
@@ -1008,7 +1075,7 @@ def get_heartbeat_payload():
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def send_heartbeat():
+def send_heartbeat(force_full=False):
     """
     Send a heartbeat to the Meeting API.
     
@@ -1025,9 +1092,15 @@ def send_heartbeat():
     Note: 
     - Services are managed by Meeting admin, NOT sent by device.
     - The server ignores unknown fields (cpu_load, memory, etc.) but they don't hurt.
+    - Between full snapshots only the changed fields are sent ("delta": true);
+      metrics of failed beats are spooled and sent later as "telemetry_batch"
+      (telemetry_service).
+    
+    Args:
+        force_full: send a full snapshot even if a delta is due (manual heartbeat)
     
     Returns:
-        dict: {success: bool, message: str}
+        dict: {success: bool, message: str, payload_type: 'full'|'delta', payload_bytes: int}
     """
     global meeting_state
     
@@ -1043,43 +1116,20 @@ def send_heartbeat():
         # Get system info for heartbeat payload with error handling
         try:
             from .config_service import get_system_info, get_device_description
-            from .network_service import get_preferred_ip
             
             sys_info = get_system_info()
-            local_ip = get_preferred_ip()
             device_description = get_device_description()
         except Exception as e:
             # Fallback: send minimal heartbeat if system info collection fails
             import sys
             print(f"[Meeting] Warning: Failed to collect system info: {e}", file=sys.stderr)
             sys_info = {'uptime': '', 'cpu': {'load_1m': 0}, 'memory': {'percent': 0}, 'disk': {'percent': 0}, 'network': {}}
-            local_ip = '127.0.0.1'
             device_description = 'RTSP Recorder'
         
-        # Get network info for v1.8.0+ fields
-        try:
-            from .network_service import get_network_interfaces, get_public_ip
-            interfaces = get_network_interfaces()
-            
-            # Find primary interface (has gateway) for MAC
-            primary_mac = None
-            ip_lan = local_ip
-            for iface in interfaces:
-                if iface.get('gateway') or iface.get('is_default'):
-                    primary_mac = iface.get('mac', '').upper().replace('-', ':')
-                    if iface.get('ip'):
-                        ip_lan = iface['ip']
-                    break
-            
-            # Get public IP (may be same as local if not behind NAT)
-            ip_public = get_public_ip() or local_ip
-            
-        except Exception as e:
-            import sys
-            print(f"[Meeting] Warning: Failed to get network info: {e}", file=sys.stderr)
-            primary_mac = None
-            ip_lan = local_ip
-            ip_public = local_ip
+        # Network info for v1.8.0+ fields (cached, never waits for the network)
+        local_ip, ip_lan, ip_public, primary_mac = _get_heartbeat_network(config)
+        # Public IP may be same as local if not behind NAT (and unknown until the first lookup)
+        ip_public = ip_public or local_ip
         
         # Build heartbeat data per Meeting API integration guide (v1.8.0+)
         # Note: services are managed by Meeting admin, NOT sent by device
@@ -1102,9 +1152,39 @@ def send_heartbeat():
         if primary_mac:
             heartbeat_data['mac'] = primary_mac
         
+        # Only the changes since the last acknowledged beat, plus spooled samples
+        from .telemetry_service import (get_heartbeat_encoder, get_telemetry_spool,
+                                        sample_from_payload, encode_batch)
+        encoder = get_heartbeat_encoder()
+        spool = get_telemetry_spool(config.get('telemetry_spool_max'))
+        target = (config.get('api_url'), config['device_key'])
+        body, is_full = encoder.encode(heartbeat_data, target=target,
+                                       full_interval=config.get('heartbeat_full_interval', 600),
+                                       force_full=force_full)
+        # No batch while the API is unreachable: each retry would re-read and re-compress it
+        with meeting_state['lock']:
+            reachable = meeting_state['connected']
+        samples = spool.peek() if reachable else []
+        if samples:
+            body['telemetry_batch'] = encode_batch(samples)
+        
         # Send heartbeat
         endpoint = f"/api/devices/{config['device_key']}/online"
-        result = meeting_api_request(endpoint, method='POST', data=heartbeat_data)
+        result = meeting_api_request(endpoint, method='POST', data=body)
+        result['payload_type'] = 'full' if is_full else 'delta'
+        result['payload_bytes'] = len(json.dumps(body, separators=(',', ':')))
+        
+        if result['success']:
+            encoder.commit(body, is_full, target=target, size=result['payload_bytes'])
+            pending = spool.acknowledge(samples[-1]['ts']) if samples else spool.pending()
+            if samples:
+                print(f"[Meeting] Uploaded {len(samples)} spooled telemetry sample(s), {pending} pending")
+            if pending:
+                _immediate_heartbeat_event.set()  # next batch right away
+        else:
+            # Keep the metrics of this beat; the server may also have lost our state
+            encoder.reset()
+            spool.append(sample_from_payload(heartbeat_data))
         
         with meeting_state['lock']:
             if result['success']:
@@ -1249,6 +1329,11 @@ def start_heartbeat_thread():
     """
     global _heartbeat_thread, _heartbeat_stop_event, meeting_state
     
+    if shared_state.is_follower():
+        # The heartbeat thread lives in the leader worker
+        shared_state.send_signal(SIGNAL_START_HEARTBEAT)
+        return False
+    
     with meeting_state['lock']:
         if meeting_state['thread_running']:
             return False  # Already running
@@ -1278,6 +1363,9 @@ def stop_heartbeat_thread():
     """
     global _heartbeat_stop_event, meeting_state
     
+    if shared_state.is_follower():
+        shared_state.send_signal(SIGNAL_STOP_HEARTBEAT)
+    
     _heartbeat_stop_event.set()
     
     with meeting_state['lock']:
@@ -1319,6 +1407,11 @@ def trigger_immediate_heartbeat():
     """
     global _immediate_heartbeat_event
     
+    if shared_state.is_follower():
+        # Relayed to the leader, which runs the heartbeat loop
+        print("[Meeting] Immediate heartbeat requested from leader worker")
+        return shared_state.send_signal(SIGNAL_IMMEDIATE_HEARTBEAT)
+    
     if not _immediate_heartbeat_event.is_set():
         _immediate_heartbeat_event.set()
         print("[Meeting] Immediate heartbeat triggered by event")
@@ -1326,6 +1419,17 @@ def trigger_immediate_heartbeat():
     
     return False
 
+def _publish_meeting_state():
+    with meeting_state['lock']:
+        return {key: meeting_state[key] for key in
+                ('enabled', 'connected', 'last_heartbeat', 'last_error', 'device_info', 'thread_running')}
+
+# Leader side of the multi-worker setup (only used once an election runs)
+shared_state.register_signal(SIGNAL_IMMEDIATE_HEARTBEAT, trigger_immediate_heartbeat)
+shared_state.register_signal(SIGNAL_START_HEARTBEAT, start_heartbeat_thread)
+shared_state.register_signal(SIGNAL_STOP_HEARTBEAT, stop_heartbeat_thread)
+shared_state.register_publisher(MEETING_STATE_KEY, _publish_meeting_state)
+
 # ============================================================================
 # SSH KEY MANAGEMENT (per Meeting API integration guide)
 # ============================================================================
@@ -1951,6 +2055,7 @@ def _save_to_config_env(api_url, device_key, token_code):
         
         with open(CONFIG_FILE, 'w') as f:
             f.writelines(new_lines)
+        invalidate_config_cache()
     
     except Exception as e:
         print(f"Error saving to config.env: {e}")
@@ -2093,6 +2198,7 @@ def master_reset(master_code):
             
             with open(CONFIG_FILE, 'w') as f:
                 f.writelines(new_lines)
+            invalidate_config_cache()
         
         # Reset in-memory state
         with meeting_state['lock']:
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+Network Identity Service - Cached LAN/public addresses for Meeting heartbeats
+Version: 1.0.1
+
+The heartbeat used to run `ip` once per interface plus `ip -4 addr` and
+`ip route`, then query up to three public-IP services sequentially (5 s
+timeout each) on every beat. NetworkIdentity keeps that answer in memory:
+- local part (interfaces, MAC, IPv4/prefix, default routes, preferred IP)
+  read from /sys/class/net, SIOCGIFADDR/SIOCGIFNETMASK and /proc/net/route,
+  rebuilt only after a rtnetlink link/address/route event (30 s TTL when
+  rtnetlink is not available),
+- public IP refreshed by a background thread every `ttl` seconds, right
+  away when the default routes change (failover, new uplink), and retried
+  after PUBLIC_IP_RETRY_INTERVAL when all services fail (the last known
+  value is kept meanwhile).
+
+snapshot() never waits for the network: building a heartbeat costs the
+same whether ipify answers in 50 ms or not at all.
+
+Changes in 1.0.1:
+- Multi-worker (Gunicorn): follower workers start neither the rtnetlink
+  watcher nor the public IP refresher (local state re-read after
+  LOCAL_TTL_WITHOUT_NETLINK); only the leader, which sends the heartbeats,
+  queries the public IP services. snapshot(public=False) (get_preferred_ip)
+  never starts the refresher, whatever the worker
+"""
+
+import errno
+import fcntl
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+PUBLIC_IP_TTL_DEFAULT = 900  # seconds (meeting.json public_ip_ttl)
+PUBLIC_IP_TTL_MIN = 60
+PUBLIC_IP_RETRY_INTERVAL = 60  # seconds after a failed lookup
+LOCAL_TTL_WITHOUT_NETLINK = 30  # seconds, when rtnetlink events are unavailable
+EVENT_DEBOUNCE = 0.5  # seconds - a failover emits bursts of link/addr/route events
+
+DEFAULT_INTERFACE_PRIORITY = ['eth0', 'wlan1', 'wlan0', 'enp0s3', 'end0']
+
+SYS_CLASS_NET = '/sys/class/net'
+PROC_NET_ROUTE = '/proc/net/route'
+ARPHRD_ETHER = 1
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891B
+RTF_UP = 0x0001
+RTF_GATEWAY = 0x0002
+
+# rtnetlink multicast groups
+RTMGRP_LINK = 0x01
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+# ============================================================================
+# LOCAL INTERFACES (no fork)
+# ============================================================================
+
+def _read_sys(name: str, attribute: str) -> Optional[str]:
+    try:
+        with open(os.path.join(SYS_CLASS_NET, name, attribute), 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _interface_type(name: str) -> str:
+    """Same classification as network_service.get_network_interfaces."""
+    if name.startswith(('eth', 'enp', 'end')):
+        return 'ethernet'
+    if name.startswith(('wlan', 'wlp')):
+        return 'wifi'
+    if name.startswith(('docker', 'br-')):
+        return 'bridge'
+    if name.startswith('veth'):
+        return 'virtual'
+    return 'unknown'
+
+def _ipv4_of(sock, name: str):
+    """(address, prefix length) of an interface, (None, None) without IPv4."""
+    request = struct.pack('256s', name.encode('utf-8')[:15])
+    try:
+        address = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24])
+        netmask = fcntl.ioctl(sock.fileno(), SIOCGIFNETMASK, request)[20:24]
+    except OSError:
+        return None, None
+    return address, str(bin(int.from_bytes(netmask, 'big')).count('1'))
+
+def read_default_routes() -> List[Dict[str, Any]]:
+    """IPv4 default routes from /proc/net/route, lowest metric first."""
+    routes = []
+    try:
+        with open(PROC_NET_ROUTE, 'r') as f:
+            next(f, None)
+            for line in f:
+                fields = line.split()
+                if len(fields) < 8 or fields[1] != '00000000' or fields[7] != '00000000':
+                    continue
+                flags = int(fields[3], 16)
+                if not flags & RTF_UP:
+                    continue
+                gateway = socket.inet_ntoa(struct.pack('<I', int(fields[2], 16))) if flags & RTF_GATEWAY else None
+                routes.append({'interface': fields[0], 'gateway': gateway, 'metric': int(fields[6])})
+    except OSError:
+        pass
+    routes.sort(key=lambda r: r['metric'])
+    return routes
+
+def read_interfaces() -> List[Dict[str, Any]]:
+    """
+    Network interfaces in the get_network_interfaces format (without forking `ip`).
+
+    Returns:
+        list: [{name, state, type, ip, prefix, mac, gateway, is_default?}] in ifindex order, lo excluded
+    """
+    try:
+        names = [n for n in os.listdir(SYS_CLASS_NET) if n != 'lo']
+    except OSError:
+        return []
+    names.sort(key=lambda n: int(_read_sys(n, 'ifindex') or 0))
+
+    interfaces = []
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for name in names:
+            ip, prefix = _ipv4_of(sock, name)
+            iface = {
+                'name': name,
+                'state': (_read_sys(name, 'operstate') or 'unknown').lower(),
+                'type': _interface_type(name),
+                'ip': ip,
+                'mac': _read_sys(name, 'address') if _read_sys(name, 'type') == str(ARPHRD_ETHER) else None,
+                'gateway': None
+            }
+            if prefix is not None:
+                iface['prefix'] = prefix
+            interfaces.append(iface)
+    finally:
+        sock.close()
+
+    for route in read_default_routes():
+        for iface in interfaces:
+            if iface['name'] == route['interface'] and iface['gateway'] is None:
+                iface['gateway'] = route['gateway']
+                iface['is_default'] = True
+    return interfaces
+
+# ============================================================================
+# NETWORK IDENTITY
+# ============================================================================
+
+class NetworkIdentity:
+    """Cached network identity of the device (LAN addresses, MAC, public IP)."""
+
+    def __init__(self, public_ip_fetcher=None, priority_loader=None):
+        if public_ip_fetcher is None:
+            from .network_service import get_public_ip
+            public_ip_fetcher = get_public_ip
+        self._fetch_public_ip = public_ip_fetcher
+        self._load_priority = priority_loader or self._priority_from_config
+        self._cond = threading.Condition()
+        self._local = None
+        self._local_built = 0.0  # time.monotonic()
+        self._local_stale = True
+        self._route_signature = None
+        self._public_ip = None
+        self._public_checked = None  # time.monotonic() of the last successful lookup
+        self._public_due = 0.0  # time.monotonic() of the next lookup
+        self._ttl = PUBLIC_IP_TTL_DEFAULT
+        self._netlink = False
+        self._watching = False
+        self._refreshing = False
+        self.stats = {'snapshots': 0, 'local_refreshes': 0, 'netlink_events': 0,
+                      'public_lookups': 0, 'public_failures': 0, 'route_changes': 0}
+
+    @staticmethod
+    def _priority_from_config() -> List[str]:
+        from .config_service import get_config_snapshot
+        custom = get_config_snapshot().get('NETWORK_INTERFACE_PRIORITY', '')
+        return [i.strip() for i in custom.split(',') if i.strip()] if custom else DEFAULT_INTERFACE_PRIORITY
+
+    # ------------------------------------------------------------------
+    # Threads
+    # ------------------------------------------------------------------
+
+    def start(self, public: bool = True):
+        """
+        Start the rtnetlink watcher and, if public, the public IP refresher (idempotent).
+
+        Follower workers start nothing: one process per device watches
+        rtnetlink and queries the public IP services. A follower promoted to
+        leader starts them on its next snapshot().
+        """
+        from . import shared_state_service as shared_state
+        if shared_state.is_follower():
+            return
+        with self._cond:
+            watch = not self._watching
+            refresh = public and not self._refreshing
+            self._watching = True
+            self._refreshing = self._refreshing or public
+        if watch:
+            threading.Thread(target=self._watch, daemon=True, name='netid-netlink').start()
+        if refresh:
+            threading.Thread(target=self._refresh_public_loop, daemon=True, name='netid-public-ip').start()
+
+    def _watch(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        except (OSError, AttributeError) as e:
+            print(f"[NetIdentity] rtnetlink unavailable ({e}), local addresses re-read every "
+                  f"{LOCAL_TTL_WITHOUT_NETLINK} s")
+            return
+        self._netlink = True
+        while True:
+            try:
+                sock.recv(65536)
+                # A failover is a burst of events: wait for it to settle, then rebuild once
+                sock.settimeout(EVENT_DEBOUNCE)
+                try:
+                    while True:
+                        sock.recv(65536)
+                except socket.timeout:
+                    pass
+                finally:
+                    sock.settimeout(None)
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:  # event overflow: state unknown, rebuild anyway
+                    pass
+                else:
+                    print(f"[NetIdentity] rtnetlink watcher stopped: {e}")
+                    self._netlink = False
+                    return
+            with self._cond:
+                self.stats['netlink_events'] += 1
+                self._local_stale = True
+            self._local_snapshot()  # detects default route changes right away
+
+    def _refresh_public_loop(self):
+        while True:
+            with self._cond:
+                while time.monotonic() < self._public_due:
+                    self._cond.wait(self._public_due - time.monotonic())
+                self._public_due = float('inf')  # until this lookup finishes
+            ip = None
+            try:
+                ip = self._fetch_public_ip()
+            except Exception as e:
+                print(f"[NetIdentity] Public IP lookup error: {e}")
+            with self._cond:
+                self.stats['public_lookups'] += 1
+                if ip:
+                    if ip != self._public_ip and self._public_ip is not None:
+                        print(f"[NetIdentity] Public IP changed: {self._public_ip} -> {ip}")
+                    self._public_ip = ip
+                    self._public_checked = time.monotonic()
+                    delay = self._ttl
+                else:
+                    self.stats['public_failures'] += 1
+                    delay = PUBLIC_IP_RETRY_INTERVAL
+                # a route change during the lookup already asked for a new one
+                if self._public_due == float('inf'):
+                    self._public_due = time.monotonic() + delay
+                self._cond.notify_all()
+
+    def invalidate(self, public: bool = True):
+        """Forget the cached local state (and public IP) - e.g. after a failover."""
+        with self._cond:
+            self._local_stale = True
+            if public:
+                self._public_due = 0.0
+                self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
+
+    def _local_snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            fresh = not self._local_stale and self._local is not None and (
+                self._netlink or time.monotonic() - self._local_built < LOCAL_TTL_WITHOUT_NETLINK)
+            if fresh:
+                return self._local
+            self._local_stale = False
+
+        interfaces = read_interfaces()
+        routes = read_default_routes()
+        local = self._build_local(interfaces, routes)
+        signature = tuple((r['interface'], r['gateway'], r['metric']) for r in routes)
+        with self._cond:
+            self._local = local
+            self._local_built = time.monotonic()
+            self.stats['local_refreshes'] += 1
+            if self._route_signature is not None and signature != self._route_signature:
+                # New uplink: the public address probably changed too
+                self.stats['route_changes'] += 1
+                print(f"[NetIdentity] Default route changed: {self._route_signature} -> {signature}")
+                self._public_due = 0.0
+                self._cond.notify_all()
+            self._route_signature = signature
+        return local
+
+    @staticmethod
+    def _build_local(interfaces, routes) -> Dict[str, Any]:
+        primary = next((i for i in interfaces if routes and i['name'] == routes[0]['interface']), None)
+        return {
+            'interfaces': interfaces,
+            'default_interface': primary['name'] if primary else None,
+            'gateway': routes[0]['gateway'] if routes else None,
+            'ip_lan': primary['ip'] if primary else None,
+            'mac': primary['mac'].upper().replace('-', ':') if primary and primary.get('mac') else None
+        }
+
+    def _preferred_ip(self, interfaces) -> Optional[str]:
+        """IP of the first interface of NETWORK_INTERFACE_PRIORITY (then any) with a global IPv4."""
+        # scope global only, like `ip -4 addr` parsing did (no loopback / link-local)
+        usable = {i['name']: i['ip'] for i in interfaces
+                  if i['ip'] and not i['ip'].startswith(('127.', '169.254.'))}
+        for name in self._load_priority():
+            if name in usable:
+                return usable[name]
+        return next(iter(usable.values()), None)
+
+    def snapshot(self, ttl: Optional[float] = None, public: bool = True) -> Dict[str, Any]:
+        """
+        Current network identity, without waiting for any network I/O.
+
+        Args:
+            ttl: public IP refresh interval in seconds (default PUBLIC_IP_TTL_DEFAULT)
+            public: start the public IP refresher if needed (False: local
+                    addresses only, ip_public is the last known value)
+
+        Returns:
+            dict: {interfaces, default_interface, gateway, ip_lan, mac, preferred_ip,
+                   ip_public (None until the first lookup succeeds), ip_public_age}
+        """
+        self.start(public=public)
+        if ttl:
+            with self._cond:
+                ttl = max(PUBLIC_IP_TTL_MIN, float(ttl))
+                if ttl != self._ttl and self._public_checked is not None and self._public_due != float('inf'):
+                    self._public_due = self._public_checked + ttl
+                    self._cond.notify_all()
+                self._ttl = ttl
+        local = self._local_snapshot()
+        preferred_ip = self._preferred_ip(local['interfaces'])
+        with self._cond:
+            self.stats['snapshots'] += 1
+            age = time.monotonic() - self._public_checked if self._public_checked is not None else None
+            return {
+                **local,
+                'ip_lan': local['ip_lan'] or preferred_ip,
+                'preferred_ip': preferred_ip,
+                'ip_public': self._public_ip,
+                'ip_public_age': round(age, 1) if age is not None else None
+            }
+
+    def wait_for_public_ip(self, timeout: float) -> Optional[str]:
+        """Block until a public IP is known (first lookup), at most timeout seconds."""
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._public_ip is None and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return self._public_ip
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'netlink': self._netlink,
+                'ttl': self._ttl,
+                'ip_public': self._public_ip,
+                **self.stats
+            }
+
+# Global provider instance
+_network_identity = None
+_network_identity_lock = threading.Lock()
+
+def get_network_identity() -> NetworkIdentity:
+    """Get or create the global network identity provider."""
+    global _network_identity
+    with _network_identity_lock:
+        if _network_identity is None:
+            _network_identity = NetworkIdentity()
+        return _network_identity
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
 """
 Network Service - Network interfaces, WiFi, and AP mode management
-Version: 2.30.18
+Version: 2.31.1
+
+Changes in 2.31.1:
+- get_preferred_ip uses a local-only identity snapshot: no public IP
+  refresher started (and no ipify/ipinfo queries) by the workers serving it
+
+Changes in 2.31.0:
+- get_preferred_ip reads the network identity cache (no `ip -4 addr` fork)
+- Public IP services / timeout exposed as PUBLIC_IP_SERVICES / PUBLIC_IP_TIMEOUT;
+  a failover invalidates the cached network identity
 
 Changes in 2.30.16:
 - Added get_public_ip() for Meeting API heartbeat v1.8.0+ ip_public field
@@ -42,9 +51,11 @@ def _trigger_heartbeat_on_failover(action):
     """
     try:
         from .meeting_service import trigger_immediate_heartbeat
+        from .network_identity_service import get_network_identity
         
         # Only trigger for actual network changes, not for "no change" statuses
         if action in ['failover_to_wlan1', 'failover_to_wlan0', 'eth0_priority']:
+            get_network_identity().invalidate()
             logger.info(f"[Network] Triggering immediate heartbeat due to failover: {action}")
             trigger_immediate_heartbeat()
     except Exception as e:
@@ -65,33 +76,37 @@ def get_local_ip():
     except:
         return "127.0.0.1"
 
+# Plain-text "what is my IP" services, tried in order
+PUBLIC_IP_SERVICES = [
+    'https://api.ipify.org',
+    'https://ipinfo.io/ip',
+    'https://checkip.amazonaws.com',
+]
+PUBLIC_IP_TIMEOUT = 5
+
 def get_public_ip():
     """
     Get public IP address by querying external services.
     Used for Meeting API heartbeat (v1.8.0+ ip_public field).
     
+    Blocking (up to len(PUBLIC_IP_SERVICES) x PUBLIC_IP_TIMEOUT seconds): the
+    heartbeat reads the cached value of network_identity_service instead.
+    
     Returns:
         str: Public IP address or None if detection fails
     """
     import urllib.request
     import ssl
     
-    # List of services that return plain text IP
-    services = [
-        'https://api.ipify.org',
-        'https://ipinfo.io/ip',
-        'https://checkip.amazonaws.com',
-    ]
-    
     # SSL context that doesn't verify (some services have cert issues)
     ssl_context = ssl.create_default_context()
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE
     
-    for service in services:
+    for service in PUBLIC_IP_SERVICES:
         try:
             request = urllib.request.Request(service, headers={'User-Agent': 'curl/7.64.0'})
-            with urllib.request.urlopen(request, timeout=5, context=ssl_context) as response:
+            with urllib.request.urlopen(request, timeout=PUBLIC_IP_TIMEOUT, context=ssl_context) as response:
                 ip = response.read().decode('utf-8').strip()
                 # Validate IP format
                 if re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', ip):
@@ -106,50 +121,18 @@ def get_preferred_ip():
     
     Priority: eth0 (Ethernet) > wlan1 (USB WiFi) > wlan0 (built-in WiFi)
     Configurable via NETWORK_INTERFACE_PRIORITY in config.env
-    """
-    # Default priority order - Ethernet first, then WiFi interfaces
-    priority_order = ['eth0', 'wlan1', 'wlan0', 'enp0s3', 'end0']
-    
-    # Try to read custom priority from config file
-    try:
-        config = load_config()
-        custom_priority = config.get('NETWORK_INTERFACE_PRIORITY', '')
-        if custom_priority:
-            priority_order = [iface.strip() for iface in custom_priority.split(',')]
-    except:
-        pass
     
-    # Get all interface IPs
-    interface_ips = {}
+    Served from the network identity cache (rebuilt on rtnetlink events),
+    local addresses only: never starts the public IP lookups.
+    """
     try:
-        result = subprocess.run(['ip', '-4', 'addr'], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            current_iface = None
-            for line in result.stdout.split('\n'):
-                # Match interface line: "2: eth0: <BROADCAST,MULTICAST,UP,..."
-                if ': ' in line and not line.startswith(' '):
-                    parts = line.split(': ')
-                    if len(parts) >= 2:
-                        current_iface = parts[1].split('@')[0]  # Handle eth0@if2 format
-                # Match IP line: "    inet 192.168.1.191/24 ..."
-                elif current_iface and 'inet ' in line and 'scope global' in line:
-                    parts = line.strip().split()
-                    if len(parts) >= 2:
-                        ip = parts[1].split('/')[0]
-                        if not ip.startswith('127.'):
-                            interface_ips[current_iface] = ip
+        from .network_identity_service import get_network_identity
+        preferred_ip = get_network_identity().snapshot(public=False)['preferred_ip']
+        if preferred_ip:
+            return preferred_ip
     except Exception as e:
         print(f"[get_preferred_ip] Error getting interfaces: {e}")
     
-    # Return IP of highest priority interface
-    for iface in priority_order:
-        if iface in interface_ips:
-            return interface_ips[iface]
-    
-    # Fallback: any non-loopback IP
-    for ip in interface_ips.values():
-        return ip
-    
     # Ultimate fallback: socket method
     return get_local_ip()
 
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+Preview Service - Shared MJPEG preview hub
+Version: 1.1.1
+
+A single ffmpeg decoder per (source, width, height, fps) is shared by every
+browser watching /api/video/preview/stream:
+1. The first viewer starts the decoder, later viewers subscribe to it
+2. Frames are published into a small ring buffer with sequence numbers
+3. Each subscriber reads at its own pace; a subscriber lagging more than
+   PREVIEW_MAX_LAG frames jumps to the newest frame (frames dropped for it only)
+4. The decoder is stopped PREVIEW_IDLE_TIMEOUT seconds after the last viewer leaves
+
+Changes in 1.1.1:
+- The idle teardown checks the viewer count under the hub lock: a viewer
+  subscribing while the idle timer fires no longer gets a decoder that is
+  being stopped
+
+Changes in 1.1.0:
+- JpegFrameSplitter: frames are split out of a preallocated buffer filled with
+  readinto() (no more quadratic buffer += chunk / re-slicing per frame)
+"""
+
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, List, Any, Tuple
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+PREVIEW_RING_SIZE = 4  # frames kept for subscribers that are momentarily slow
+PREVIEW_MAX_LAG = 2  # beyond this many frames behind, skip to the newest frame
+PREVIEW_IDLE_TIMEOUT = 5.0  # seconds without viewers before the decoder stops
+PREVIEW_FRAME_TIMEOUT = 10.0  # seconds without any frame before a viewer gives up
+PREVIEW_JPEG_QUALITY = 5  # ffmpeg -q:v (2-31, lower is better)
+PREVIEW_READ_SIZE = 64 * 1024  # bytes per read from the ffmpeg pipe
+PREVIEW_BUFFER_SIZE = 1024 * 1024  # initial splitter buffer (several 100-300 KB frames)
+PREVIEW_MAX_FRAME_SIZE = 8 * 1024 * 1024  # larger "frames" are treated as garbage
+
+# ============================================================================
+# FFMPEG COMMAND / FRAME PARSING
+# ============================================================================
+
+def build_preview_command(source_type: str, rtsp_url: Optional[str], device: str,
+                          width: int, height: int, fps: int) -> List[str]:
+    """Build the ffmpeg command producing an MJPEG stream on stdout."""
+    if source_type == 'rtsp' and rtsp_url:
+        # Stream from RTSP source (relay the existing RTSP stream)
+        return [
+            'ffmpeg',
+            '-rtsp_transport', 'tcp',
+            '-i', rtsp_url,
+            '-f', 'mjpeg',
+            '-q:v', str(PREVIEW_JPEG_QUALITY),
+            '-r', str(fps),
+            '-s', f'{width}x{height}',
+            '-an',  # No audio
+            '-'
+        ]
+
+    # Stream directly from camera device
+    return [
+        'ffmpeg',
+        '-f', 'v4l2',
+        '-input_format', 'mjpeg',
+        '-video_size', f'{width}x{height}',
+        '-framerate', str(fps),
+        '-i', device,
+        '-f', 'mjpeg',
+        '-q:v', str(PREVIEW_JPEG_QUALITY),
+        '-r', str(fps),
+        '-'
+    ]
+
+class JpegFrameSplitter:
+    """
+    Split a byte stream into JPEG frames (SOI FFD8 ... EOI FFD9).
+
+    Data is read with readinto() into a preallocated bytearray and markers are
+    searched in place, resuming where the previous scan stopped. Per frame, the
+    only copies are the frame itself (handed out as immutable bytes) and the
+    occasional move of a partial frame back to the start of the buffer.
+    """
+
+    SOI = b'\xff\xd8'
+    EOI = b'\xff\xd9'
+
+    def __init__(self, stream, read_size: int = PREVIEW_READ_SIZE,
+                 buffer_size: int = PREVIEW_BUFFER_SIZE,
+                 max_frame_size: int = PREVIEW_MAX_FRAME_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.max_frame_size = max_frame_size
+        self._buf = bytearray(max(buffer_size, read_size * 2))
+        self._view = memoryview(self._buf)
+        self._readinto = getattr(stream, 'readinto1', None) or stream.readinto
+        self._start = 0  # first unconsumed byte
+        self._end = 0  # end of valid data
+        self._scan = 0  # where the next marker search resumes
+        self._soi = -1  # start of the frame being assembled
+        self.frames = 0
+        self.bytes_read = 0
+        self.bytes_copied = 0
+        self.bytes_discarded = 0
+
+    def __iter__(self):
+        while True:
+            frame = self._next_frame()
+            if frame is not None:
+                yield frame
+            elif not self._fill():
+                return
+
+    def _next_frame(self) -> Optional[bytes]:
+        """Return the next complete frame from the buffer, or None if more data is needed."""
+        buf = self._buf
+        if self._soi < 0:
+            soi = buf.find(self.SOI, self._scan, self._end)
+            if soi < 0:
+                # No frame start: drop the data but keep a trailing 0xFF (split marker)
+                keep = 1 if self._end > self._start and buf[self._end - 1] == 0xFF else 0
+                self.bytes_discarded += self._end - keep - self._start
+                self._start = self._scan = self._end - keep
+                return None
+            self.bytes_discarded += soi - self._start
+            self._soi = self._start = soi
+            self._scan = soi + 2
+
+        eoi = buf.find(self.EOI, self._scan, self._end)
+        if eoi < 0:
+            # Resume one byte back in case the marker is split across reads
+            self._scan = max(self._soi + 2, self._end - 1)
+            return None
+
+        frame = bytes(self._view[self._soi:eoi + 2])
+        self.bytes_copied += len(frame)
+        self.frames += 1
+        self._start = self._scan = eoi + 2
+        self._soi = -1
+        return frame
+
+    def _fill(self) -> bool:
+        """Read more data, compacting or growing the buffer first if needed."""
+        if len(self._buf) - self._end < self.read_size:
+            pending = self._end - self._start
+            if self._start > 0:
+                # Move the partial frame to the front (memmove, no new object)
+                self._view[:pending] = self._view[self._start:self._end]
+                self.bytes_copied += pending
+                self._scan -= self._start
+                if self._soi >= 0:
+                    self._soi -= self._start
+                self._start, self._end = 0, pending
+            if len(self._buf) - self._end < self.read_size:
+                if pending + self.read_size > self.max_frame_size:
+                    # No EOI in sight: resynchronise on the next SOI
+                    self.bytes_discarded += pending
+                    self._start = self._end = self._scan = 0
+                    self._soi = -1
+                else:
+                    self._view.release()
+                    self._buf.extend(bytes(len(self._buf)))
+                    self._view = memoryview(self._buf)
+
+        n = self._readinto(self._view[self._end:self._end + self.read_size])
+        if not n:
+            return False
+        self._end += n
+        self.bytes_read += n
+        return True
+
+def iter_jpeg_frames(stream):
+    """
+    Yield complete JPEG frames (SOI FFD8 ... EOI FFD9) read from a byte stream.
+    """
+    return iter(JpegFrameSplitter(stream))
+
+# ============================================================================
+# SHARED SOURCE
+# ============================================================================
+
+class PreviewSource:
+    """One ffmpeg decoder whose frames are fanned out to any number of subscribers."""
+
+    def __init__(self, hub: 'PreviewHub', key: Tuple, cmd: List[str]):
+        self.hub = hub
+        self.key = key
+        self.cmd = cmd
+        self.process = None
+        self.reader_thread = None
+        self.running = False
+        self.started_at = None
+        self.frames_published = 0
+        self.subscribers = 0
+        self._cond = threading.Condition()
+        self._frames = deque(maxlen=PREVIEW_RING_SIZE)  # (seq, jpeg bytes)
+        self._seq = 0
+        self._idle_timer = None
+
+    def start(self):
+        """Start the decoder process and its reader thread."""
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,  # Suppress ffmpeg logs
+            bufsize=0  # Unbuffered: readinto() returns what the pipe has, no extra copy
+        )
+        self.running = True
+        self.started_at = time.time()
+        self.reader_thread = threading.Thread(
+            target=self._reader_loop, daemon=True, name=f'preview-{self.key[0]}-{self.key[2]}x{self.key[3]}'
+        )
+        self.reader_thread.start()
+        print(f"[Preview] Decoder started for {self.key[0]} {self.key[2]}x{self.key[3]}@{self.key[4]}")
+
+    def stop(self):
+        """Stop the decoder and wake up all subscribers."""
+        with self._cond:
+            if not self.running and self.process is None:
+                return
+            self.running = False
+            if self._idle_timer:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            self._cond.notify_all()
+
+        process, self.process = self.process, None
+        if process:
+            process.terminate()
+            try:
+                process.wait(timeout=2)
+            except Exception:
+                process.kill()
+        print(f"[Preview] Decoder stopped for {self.key[0]} {self.key[2]}x{self.key[3]}@{self.key[4]}")
+
+    def _reader_loop(self):
+        """Read frames from ffmpeg and publish them into the ring buffer."""
+        process = self.process
+        try:
+            for frame in iter_jpeg_frames(process.stdout):
+                with self._cond:
+                    if not self.running:
+                        break
+                    self._seq += 1
+                    self._frames.append((self._seq, frame))
+                    self.frames_published += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            print(f"[Preview] Error in MJPEG reader: {e}")
+        finally:
+            # Decoder ended (error, camera unplugged...) - release viewers and the hub slot
+            self.hub._discard(self)
+            self.stop()
+
+    # ------------------------------------------------------------------
+    # Subscriptions
+    # ------------------------------------------------------------------
+
+    def _add_subscriber(self):
+        with self._cond:
+            self.subscribers += 1
+            if self._idle_timer:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+
+    def _remove_subscriber(self):
+        with self._cond:
+            self.subscribers = max(0, self.subscribers - 1)
+            if self.subscribers == 0 and self.running:
+                self._idle_timer = threading.Timer(PREVIEW_IDLE_TIMEOUT, self._idle_check)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+
+    def _idle_check(self):
+        """Stop the decoder if nobody re-subscribed during the idle delay."""
+        # Hub lock first (as in subscribe()): no subscriber can join between
+        # the count check and the removal from the hub
+        with self.hub._lock:
+            with self._cond:
+                if self.subscribers > 0 or not self.running:
+                    return
+                self._idle_timer = None
+                self.running = False
+                self._cond.notify_all()
+            self.hub._discard_locked(self)
+        self.stop()
+
+    def next_frame(self, last_seq: int, timeout: float) -> Tuple[Optional[int], Optional[bytes], int]:
+        """
+        Wait for the frame following last_seq.
+
+        Returns:
+            (seq, frame, dropped) - seq is None on timeout or when the source stopped
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.running and (not self._frames or self._frames[-1][0] <= last_seq):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, None, 0
+                self._cond.wait(remaining)
+
+            if not self._frames or self._frames[-1][0] <= last_seq:
+                return None, None, 0
+
+            newest_seq = self._frames[-1][0]
+            oldest_seq = self._frames[0][0]
+            wanted = last_seq + 1
+            if last_seq == 0 or newest_seq - last_seq > PREVIEW_MAX_LAG or wanted < oldest_seq:
+                # New or slow subscriber: jump to the newest frame
+                seq, frame = self._frames[-1]
+                dropped = max(0, seq - wanted) if last_seq else 0
+                return seq, frame, dropped
+
+            seq, frame = self._frames[wanted - oldest_seq]
+            return seq, frame, 0
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'source': self.key[0],
+                'width': self.key[2],
+                'height': self.key[3],
+                'fps': self.key[4],
+                'running': self.running,
+                'subscribers': self.subscribers,
+                'frames_published': self.frames_published,
+                'uptime': round(time.time() - self.started_at, 1) if self.started_at else 0
+            }
+
+class PreviewSubscription:
+    """Iterator over the frames of a shared source for one viewer."""
+
+    def __init__(self, source: PreviewSource):
+        self.source = source
+        self.last_seq = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self._closed:
+            raise StopIteration
+        seq, frame, dropped = self.source.next_frame(self.last_seq, PREVIEW_FRAME_TIMEOUT)
+        if seq is None:
+            self.close()
+            raise StopIteration
+        self.last_seq = seq
+        self.frames_dropped += dropped
+        self.frames_sent += 1
+        return frame
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.source._remove_subscriber()
+
+# ============================================================================
+# HUB
+# ============================================================================
+
+class PreviewHub:
+    """Registry of shared preview sources keyed by (source, input, width, height, fps)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources: Dict[Tuple, PreviewSource] = {}
+        self.decoders_started = 0
+
+    def subscribe(self, source_type: str, rtsp_url: Optional[str], device: str,
+                  width: int, height: int, fps: int) -> PreviewSubscription:
+        """
+        Subscribe to a preview, starting the shared decoder if needed.
+
+        Raises:
+            OSError: if ffmpeg cannot be started
+        """
+        source_input = rtsp_url if (source_type == 'rtsp' and rtsp_url) else device
+        key = (source_type, source_input, int(width), int(height), int(fps))
+
+        with self._lock:
+            source = self._sources.get(key)
+            if source is None or not source.running:
+                cmd = build_preview_command(source_type, rtsp_url, device, width, height, fps)
+                source = PreviewSource(self, key, cmd)
+                source.start()
+                self._sources[key] = source
+                self.decoders_started += 1
+            source._add_subscriber()
+
+        return PreviewSubscription(source)
+
+    def _discard(self, source: PreviewSource):
+        with self._lock:
+            self._discard_locked(source)
+
+    def _discard_locked(self, source: PreviewSource):
+        if self._sources.get(source.key) is source:
+            del self._sources[source.key]
+
+    def stop_all(self):
+        """Stop every decoder (e.g. on shutdown or camera reconfiguration)."""
+        with self._lock:
+            sources = list(self._sources.values())
+            self._sources.clear()
+        for source in sources:
+            source.stop()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            sources = list(self._sources.values())
+        return {
+            'decoders': len(sources),
+            'decoders_started': self.decoders_started,
+            'viewers': sum(s.subscribers for s in sources),
+            'sources': [s.get_status() for s in sources]
+        }
+
+# Global hub instance
+_preview_hub = None
+_preview_hub_lock = threading.Lock()
+
+def get_preview_hub() -> PreviewHub:
+    """Get or create the global preview hub."""
+    global _preview_hub
+    with _preview_hub_lock:
+        if _preview_hub is None:
+            _preview_hub = PreviewHub()
+        return _preview_hub
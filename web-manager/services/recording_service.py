@@ -1,16 +1,64 @@
 # -*- coding: utf-8 -*-
 """
 Recording Service - Recording management and disk usage
-Version: 2.30.2
+Version: 2.39.1
+
+Changes in 2.39.1:
+- cleanup_recordings: max_size_gb caps the recordings total (retention
+  max_recordings_mb); .part files and thumbnails in the folder no longer
+  count against it, remaining_size is the recordings total again
+
+Changes in 2.39.0:
+- Keyset cursors and sort ties use the relative path ("<sort key>,<relative
+  path>"): file names are not unique across recording subdirectories
+
+Changes in 2.38.1:
+- Only the recordings actually returned to the client are queued with the
+  'visible' priority; full listings and scans queue missing metadata as
+  'backfill'. get_recordings_list accepts a limit (the returned page)
+
+Changes in 2.38.0:
+- get_recording_dir reads the cached config snapshot instead of copying it
+
+Changes in 2.37.0:
+- Scan fallback of get_recordings_list reads cached metadata with one bulk query
+  (get_cached_metadata_many) instead of one query per file
+
+Changes in 2.36.0:
+- Metadata/thumbnail jobs queued from listings use the 'visible' priority class
+
+Changes in 2.35.0:
+- get_video_metadata uses the native TS probe (ts_probe_service) for .ts
+  recordings; ffprobe only for other containers or unsupported streams
+
+Changes in 2.34.0:
+- delete_old_recordings / cleanup_recordings use retention_service (one scan,
+  one sorted candidate list, batch delete) and report duration_ms
+
+Changes in 2.33.0:
+- Added request_event_clip / get_clip_recorder_status (pre/post-roll event clips
+  served by rtsp_segmenter.py when RECORDER_MODE=segmenter)
+
+Changes in 2.32.0:
+- Added get_recordings_after (keyset/cursor pagination) and server-side filters
+  (date range, extensions, size, duration) for paged listings
+
+Changes in 2.31.0:
+- Listings, pagination and disk aggregates are served from the persistent
+  recordings index (media_cache_service) when it is ready; glob fallback otherwise
 """
 
 import os
 import re
 import json
 import glob
+import urllib.request
+import urllib.error
 from datetime import datetime
 
 from .platform_service import run_command
+from .retention_service import apply_retention
+from .ts_probe_service import is_ts_file, probe_ts_file
 from config import DEFAULT_CONFIG
 
 # Lazy import to avoid circular dependency
@@ -42,8 +90,8 @@ def get_recording_dir(config=None):
         str: Path to recording directory
     """
     if config is None:
-        from .config_service import load_config
-        config = load_config()
+        from .config_service import get_config_snapshot
+        config = get_config_snapshot()
     
     return config.get('RECORD_DIR', DEFAULT_CONFIG.get('RECORD_DIR', '/var/recordings'))
 
@@ -79,11 +127,304 @@ def ensure_recording_dir(config=None):
 # RECORDING LISTING
 # ============================================================================
 
-def get_recordings_list(config=None, pattern='*.ts', sort_by='date', reverse=True, skip_metadata=False):
+def _get_ready_index(record_dir):
+    """Return the media cache module if its recordings index covers record_dir, else None."""
+    media_cache = _get_media_cache()
+    if not media_cache:
+        return None
+    try:
+        if media_cache.ensure_recordings_index(record_dir):
+            return media_cache
+    except Exception as e:
+        print(f"Recordings index unavailable: {e}")
+    return None
+
+def _recording_from_index_row(row, media_cache=None, skip_metadata=False, priority='backfill'):
+    """
+    Convert a recordings_index row into the recording dict returned by listings.
+    
+    Recordings without cached metadata are queued for background extraction
+    with the given thumbnail priority class ('visible' for a returned page).
+    """
+    recording = {
+        'name': row['filename'],
+        'path': row['filepath'],
+        'relative_path': row['relative_path'],
+        'size': row['file_size'],
+        'size_human': format_size(row['file_size']),
+        'created': datetime.fromtimestamp(row['file_ctime']).isoformat(),
+        'modified': datetime.fromtimestamp(row['file_mtime']).isoformat(),
+        'duration': None,
+        'resolution': None
+    }
+    
+    if skip_metadata:
+        return recording
+    
+    if row['metadata_valid']:
+        recording['duration'] = row['duration']
+        recording['duration_human'] = format_duration(row['duration'])
+        recording['resolution'] = row['resolution']
+        recording['codec'] = row['codec']
+    elif media_cache:
+        # Queue for background extraction, don't block
+        media_cache.get_thumbnail_worker().enqueue(row['filepath'], priority=priority)
+    
+    return recording
+
+def _queue_visible(recordings):
+    """Promote the recordings of a returned page still missing metadata (scan fallback)."""
+    media_cache = _get_media_cache()
+    if not media_cache:
+        return
+    worker = media_cache.get_thumbnail_worker()
+    for recording in recordings:
+        if 'codec' not in recording:
+            worker.enqueue(recording['path'], priority='visible')
+
+def _matches_filters(recording, filters):
+    """Python equivalent of the index filters, used by the scan fallback."""
+    if not filters:
+        return True
+    
+    extensions = filters.get('extensions')
+    if extensions:
+        ext = os.path.splitext(recording['name'])[1].lower().lstrip('.')
+        if ext not in [e.lower().lstrip('.') for e in extensions]:
+            return False
+    
+    mtime = datetime.fromisoformat(recording['modified']).timestamp()
+    if filters.get('mtime_from') is not None and mtime < filters['mtime_from']:
+        return False
+    if filters.get('mtime_to') is not None and mtime > filters['mtime_to']:
+        return False
+    if filters.get('min_size') is not None and recording['size'] < filters['min_size']:
+        return False
+    if filters.get('max_size') is not None and recording['size'] > filters['max_size']:
+        return False
+    
+    duration = recording.get('duration')
+    if filters.get('min_duration') is not None and (duration is None or duration < filters['min_duration']):
+        return False
+    if filters.get('max_duration') is not None and (duration is None or duration > filters['max_duration']):
+        return False
+    
+    return True
+
+def _filtered_scan(config, pattern, sort_by, reverse, search, filters):
+    """Full listing filtered in Python (fallback when the index is not ready)."""
+    recordings = get_recordings_list(config, pattern, sort_by, reverse)
+    if search:
+        search_lower = search.lower()
+        recordings = [r for r in recordings if search_lower in r['name'].lower()]
+    if filters:
+        recordings = [r for r in recordings if _matches_filters(r, filters)]
+    return recordings
+
+def get_recordings_page(config=None, pattern='*.*', sort_by='date', reverse=True,
+                        search='', offset=0, limit=20, filters=None):
+    """
+    Get one page of recordings plus aggregates over the whole filtered set.
+    
+    Served by an indexed SQL query when the recordings index is ready,
+    otherwise falls back to a full listing sliced in Python.
+    
+    Args:
+        config: Configuration dict
+        pattern: Glob pattern for files
+        sort_by: Sort field ('date', 'name', 'size')
+        reverse: Reverse sort order
+        search: Case-insensitive substring filter on file name
+        offset: Index of the first recording to return (clamped to the last page)
+        limit: Number of recordings to return
+        filters: Optional dict (extensions, mtime_from, mtime_to, min_size,
+            max_size, min_duration, max_duration)
+    
+    Returns:
+        dict: {recordings: list, total: int, total_size: int, offset: int}
+    """
+    def clamp_offset(total):
+        if limit <= 0 or total == 0:
+            return 0
+        return min(max(0, offset), ((total - 1) // limit) * limit)
+    
+    record_dir = get_recording_dir(config)
+    media_cache = _get_ready_index(record_dir)
+    
+    if media_cache:
+        try:
+            aggregates = media_cache.get_recordings_index_aggregates(pattern, search, filters)
+            start = clamp_offset(aggregates['count'])
+            rows = media_cache.query_recordings_index(
+                pattern, sort_by, reverse, search, limit=limit, offset=start, filters=filters
+            )
+            return {
+                'recordings': [_recording_from_index_row(r, media_cache, priority='visible') for r in rows],
+                'total': aggregates['count'],
+                'total_size': aggregates['total_size'],
+                'offset': start
+            }
+        except Exception as e:
+            print(f"Recordings index query failed, falling back to scan: {e}")
+    
+    recordings = _filtered_scan(config, pattern, sort_by, reverse, search, filters)
+    
+    start = clamp_offset(len(recordings))
+    page = recordings[start:start + limit]
+    _queue_visible(page)
+    return {
+        'recordings': page,
+        'total': len(recordings),
+        'total_size': sum(r.get('size', 0) for r in recordings),
+        'offset': start
+    }
+
+def _cursor_key(recording, sort_by):
+    """Sort key of a recording as used in keyset cursors."""
+    if sort_by == 'size':
+        return recording['size']
+    if sort_by == 'name':
+        return recording['name']
+    return datetime.fromisoformat(recording['modified']).timestamp()
+
+def encode_recordings_cursor(recording, sort_by='date', mtime=None):
+    """
+    Build the cursor string pointing after a recording.
+    
+    Format is "<sort key>,<relative path>" (e.g. "1737552000.25,2026-01-22/rec_143000.ts"),
+    or just "<relative path>" when sorting by name (the key is its file name).
+    """
+    if sort_by == 'name':
+        return recording['relative_path']
+    key = mtime if (sort_by == 'date' and mtime is not None) else _cursor_key(recording, sort_by)
+    return f"{key!r},{recording['relative_path']}"
+
+def parse_recordings_cursor(cursor, sort_by='date'):
+    """
+    Parse a cursor built by encode_recordings_cursor.
+    
+    Returns:
+        tuple: (sort_key, relative_path) or None if the cursor is malformed
+    """
+    if not cursor:
+        return None
+    if sort_by == 'name':
+        return (os.path.basename(cursor), cursor)
+    key, sep, relative_path = cursor.partition(',')
+    if not sep or not relative_path:
+        return None
+    try:
+        return (int(key) if sort_by == 'size' else float(key), relative_path)
+    except ValueError:
+        return None
+
+def get_recordings_after(config=None, after=None, pattern='*.*', sort_by='date', reverse=True,
+                         search='', limit=20, filters=None):
+    """
+    Get one page of recordings using keyset (cursor) pagination.
+    
+    Unlike offset paging, the cost does not grow with the page depth: the index is
+    walked from the cursor position and only limit + 1 rows are read.
+    
+    Args:
+        config: Configuration dict
+        after: Cursor tuple (sort_key, relative_path) from parse_recordings_cursor, None = first page
+        pattern: Glob pattern for files
+        sort_by: Sort field ('date', 'name', 'size')
+        reverse: Reverse sort order
+        search: Case-insensitive substring filter on file name
+        limit: Number of recordings to return
+        filters: Optional filters (see get_recordings_page)
+    
+    Returns:
+        dict: {recordings, next_cursor, has_next, total, total_size, total_duration}
+    """
+    record_dir = get_recording_dir(config)
+    media_cache = _get_ready_index(record_dir)
+    limit = max(1, limit)
+    
+    if media_cache:
+        try:
+            rows = media_cache.query_recordings_index(
+                pattern, sort_by, reverse, search, limit=limit + 1,
+                filters=filters, after=after
+            )
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            aggregates = media_cache.get_recordings_index_aggregates(pattern, search, filters)
+            recordings = [_recording_from_index_row(r, media_cache, priority='visible') for r in rows]
+            next_cursor = None
+            if has_next and rows:
+                next_cursor = encode_recordings_cursor(recordings[-1], sort_by, rows[-1]['file_mtime'])
+            return {
+                'recordings': recordings,
+                'next_cursor': next_cursor,
+                'has_next': has_next,
+                'total': aggregates['count'],
+                'total_size': aggregates['total_size'],
+                'total_duration': aggregates['total_duration']
+            }
+        except Exception as e:
+            print(f"Recordings index query failed, falling back to scan: {e}")
+    
+    recordings = _filtered_scan(config, pattern, sort_by, reverse, search, filters)
+    total = len(recordings)
+    total_size = sum(r.get('size', 0) for r in recordings)
+    total_duration = sum(r.get('duration') or 0 for r in recordings)
+    
+    recordings.sort(key=lambda r: (_cursor_key(r, sort_by), r['relative_path']), reverse=reverse)
+    if after is not None:
+        def is_after(rec):
+            key = (_cursor_key(rec, sort_by), rec['relative_path'])
+            return key < after if reverse else key > after
+        recordings = [r for r in recordings if is_after(r)]
+    
+    has_next = len(recordings) > limit
+    recordings = recordings[:limit]
+    _queue_visible(recordings)
+    return {
+        'recordings': recordings,
+        'next_cursor': encode_recordings_cursor(recordings[-1], sort_by) if has_next else None,
+        'has_next': has_next,
+        'total': total,
+        'total_size': total_size,
+        'total_duration': total_duration
+    }
+
+def get_recordings_summary(config=None, pattern='*.*'):
+    """
+    Get count, total size and total duration of recordings.
+    
+    Args:
+        config: Configuration dict
+        pattern: Glob pattern for files
+    
+    Returns:
+        dict: {count: int, total_size: int, total_duration: float}
+    """
+    record_dir = get_recording_dir(config)
+    media_cache = _get_ready_index(record_dir)
+    
+    if media_cache:
+        try:
+            return media_cache.get_recordings_index_aggregates(pattern)
+        except Exception as e:
+            print(f"Recordings index query failed, falling back to scan: {e}")
+    
+    recordings = get_recordings_list(config, pattern)
+    return {
+        'count': len(recordings),
+        'total_size': sum(r['size'] for r in recordings),
+        'total_duration': sum(r.get('duration') or 0 for r in recordings)
+    }
+
+def get_recordings_list(config=None, pattern='*.ts', sort_by='date', reverse=True, skip_metadata=False,
+                        limit=None):
     """
     Get list of all recordings.
     
-    Uses SQLite cache for metadata to reduce ffprobe calls and SD card wear.
+    Uses the persistent recordings index (when ready) instead of globbing and
+    stat-ing every file, and the SQLite cache for metadata to reduce ffprobe calls.
     
     Args:
         config: Configuration dict
@@ -91,6 +432,8 @@ def get_recordings_list(config=None, pattern='*.ts', sort_by='date', reverse=Tru
         sort_by: Sort field ('date', 'name', 'size')
         reverse: Reverse sort order (newest first by default)
         skip_metadata: If True, only return basic file info (faster)
+        limit: Max recordings to return (None = all). Missing metadata of the
+            returned page is queued as 'visible', of a full listing as 'backfill'
     
     Returns:
         list: List of recording dicts with name, path, size, date, duration
@@ -98,15 +441,30 @@ def get_recordings_list(config=None, pattern='*.ts', sort_by='date', reverse=Tru
     record_dir = get_recording_dir(config)
     recordings = []
     
+    priority = 'backfill' if limit is None else 'visible'
+    
     if not os.path.exists(record_dir):
         return recordings
     
+    # Fast path: indexed SQL query
+    media_cache = _get_ready_index(record_dir)
+    if media_cache:
+        try:
+            rows = media_cache.query_recordings_index(pattern, sort_by, reverse, limit=limit)
+            return [_recording_from_index_row(r, media_cache, skip_metadata, priority) for r in rows]
+        except Exception as e:
+            print(f"Recordings index query failed, falling back to scan: {e}")
+    
     # Find all matching files
     search_pattern = os.path.join(record_dir, '**', pattern)
     files = glob.glob(search_pattern, recursive=True)
     
     # Get media cache service (if available)
     media_cache = _get_media_cache()
+    cached_metadata = {}
+    missing = []
+    if media_cache and not skip_metadata:
+        cached_metadata = media_cache.get_cached_metadata_many(files)
     
     for filepath in files:
         try:
@@ -129,13 +487,12 @@ def get_recordings_list(config=None, pattern='*.ts', sort_by='date', reverse=Tru
             if not skip_metadata:
                 if media_cache:
                     # Try cache first (fast), only extract if not in cache
-                    cached = media_cache.get_cached_metadata(filepath)
+                    cached = cached_metadata.get(filepath)
                     if cached:
                         metadata = cached
                     else:
-                        # Queue for background extraction, don't block
-                        worker = media_cache.get_thumbnail_worker()
-                        worker.enqueue(filepath)
+                        # Queued for background extraction once sorted, don't block
+                        missing.append(recording)
                 else:
                     metadata = get_video_metadata(filepath)
             
@@ -159,6 +516,14 @@ def get_recordings_list(config=None, pattern='*.ts', sort_by='date', reverse=Tru
     elif sort_by == 'size':
         recordings.sort(key=lambda x: x['size'], reverse=reverse)
     
+    if limit is not None:
+        recordings = recordings[:limit]
+    if missing:
+        worker = media_cache.get_thumbnail_worker()
+        returned = {id(r) for r in recordings} if limit is not None else ()
+        for recording in missing:
+            worker.enqueue(recording['path'], priority='visible' if id(recording) in returned else 'backfill')
+    
     return recordings
 
 def get_recording_info(filepath):
@@ -198,7 +563,7 @@ def get_recording_info(filepath):
 
 def get_video_metadata(filepath):
     """
-    Extract video metadata using ffprobe.
+    Extract video metadata (native probe for .ts, ffprobe otherwise).
     
     Args:
         filepath: Path to video file
@@ -206,6 +571,11 @@ def get_video_metadata(filepath):
     Returns:
         dict: Video metadata or None
     """
+    if is_ts_file(filepath):
+        metadata = probe_ts_file(filepath)
+        if metadata:
+            return metadata
+    
     result = run_command(
         f'ffprobe -v quiet -print_format json -show_format -show_streams "{filepath}"',
         timeout=30
@@ -312,6 +682,12 @@ def delete_recording(filepath, config=None):
             'message': str(e)
         }
 
+def _invalidate_deleted(paths):
+    """Drop cache/index entries and thumbnails of a batch of deleted recordings."""
+    media_cache = _get_media_cache()
+    if media_cache:
+        media_cache.invalidate_cache_many(paths)
+
 def delete_old_recordings(max_age_days=30, config=None):
     """
     Delete recordings older than a specified age.
@@ -321,36 +697,23 @@ def delete_old_recordings(max_age_days=30, config=None):
         config: Configuration dict
     
     Returns:
-        dict: {success: bool, deleted_count: int, freed_space: int}
+        dict: {success: bool, deleted_count: int, freed_space: int, duration_ms: float}
     """
-    from datetime import timedelta
-    
     record_dir = get_recording_dir(config)
-    cutoff = datetime.now() - timedelta(days=max_age_days)
-    
-    deleted_count = 0
-    freed_space = 0
+    result = apply_retention(record_dir, max_age_days=float(max_age_days),
+                             on_deleted=_invalidate_deleted)
+    if 'scanned' not in result:
+        return result
     
-    recordings = get_recordings_list(config)
-    
-    for rec in recordings:
-        try:
-            modified = datetime.fromisoformat(rec['modified'])
-            if modified < cutoff:
-                size = rec['size']
-                result = delete_recording(rec['path'], config)
-                if result['success']:
-                    deleted_count += 1
-                    freed_space += size
-        except Exception as e:
-            print(f"Error processing {rec['name']}: {e}")
-            continue
+    for error in result['errors']:
+        print(f"[Recordings] Retention delete failed: {error}")
     
     return {
-        'success': True,
-        'deleted_count': deleted_count,
-        'freed_space': freed_space,
-        'freed_space_human': format_size(freed_space)
+        'success': result['success'],
+        'deleted_count': result['deleted_count'],
+        'freed_space': result['freed_space'],
+        'freed_space_human': format_size(result['freed_space']),
+        'duration_ms': result['duration_ms']
     }
 
 def cleanup_recordings(max_size_gb=None, max_count=None, config=None):
@@ -365,49 +728,112 @@ def cleanup_recordings(max_size_gb=None, max_count=None, config=None):
     Returns:
         dict: Cleanup results
     """
-    recordings = get_recordings_list(config, sort_by='date', reverse=False)  # Oldest first
-    
-    if not recordings:
+    record_dir = get_recording_dir(config)
+    # The limit covers the recordings, not .part files or thumbnails next to them
+    max_recordings_mb = int(float(max_size_gb) * 1024) if max_size_gb else 0
+    result = apply_retention(record_dir, max_recordings_mb=max_recordings_mb, max_count=int(max_count or 0),
+                             on_deleted=_invalidate_deleted)
+    if 'scanned' not in result:
+        return result
+    
+    if not result['scanned']:
         return {'success': True, 'deleted_count': 0, 'message': 'No recordings found'}
     
-    deleted_count = 0
-    freed_space = 0
+    for error in result['errors']:
+        print(f"[Recordings] Retention delete failed: {error}")
+    
+    return {
+        'success': result['success'],
+        'deleted_count': result['deleted_count'],
+        'freed_space': result['freed_space'],
+        'freed_space_human': format_size(result['freed_space']),
+        'remaining_count': result['remaining_count'],
+        'remaining_size': result['recordings_after'],
+        'remaining_size_human': format_size(result['recordings_after']),
+        'duration_ms': result['duration_ms']
+    }
+
+# ============================================================================
+# EVENT CLIPS (rtsp_segmenter.py, RECORDER_MODE=segmenter)
+# ============================================================================
+
+def _clip_api_url(config, path):
+    port = config.get('CLIP_CONTROL_PORT', DEFAULT_CONFIG.get('CLIP_CONTROL_PORT', '8086'))
+    return f"http://127.0.0.1:{port}{path}"
+
+def request_event_clip(pre_seconds=10, post_seconds=10, config=None):
+    """
+    Save an event clip: pre-roll from the segmenter's in-memory GOP buffer
+    plus post-roll from the live stream (no extra RTSP client).
+    
+    The clip is written asynchronously as clip_YYYYMMDD_HHMMSS.ts in the
+    recordings directory once the post-roll has elapsed.
     
-    # Calculate current totals
-    total_size = sum(r['size'] for r in recordings)
-    total_count = len(recordings)
+    Args:
+        pre_seconds: Seconds before now (clamped to CLIP_PREROLL_MAX_SECONDS)
+        post_seconds: Seconds after now
+        config: Configuration dict
     
-    # Delete oldest recordings if over limit
-    max_size_bytes = (max_size_gb * 1024 * 1024 * 1024) if max_size_gb else None
+    Returns:
+        dict: {success, message, filename, pre_seconds, post_seconds}
+    """
+    if config is None:
+        from .config_service import load_config
+        config = load_config()
     
-    for rec in recordings:
-        should_delete = False
-        
-        if max_size_bytes and total_size > max_size_bytes:
-            should_delete = True
-        
-        if max_count and total_count > max_count:
-            should_delete = True
-        
-        if not should_delete:
-            break
-        
-        result = delete_recording(rec['path'], config)
-        if result['success']:
-            deleted_count += 1
-            freed_space += rec['size']
-            total_size -= rec['size']
-            total_count -= 1
+    if config.get('RECORDER_MODE', 'ffmpeg') != 'segmenter':
+        return {
+            'success': False,
+            'message': 'Event clips require RECORDER_MODE=segmenter'
+        }
     
-    return {
-        'success': True,
-        'deleted_count': deleted_count,
-        'freed_space': freed_space,
-        'freed_space_human': format_size(freed_space),
-        'remaining_count': total_count,
-        'remaining_size': total_size,
-        'remaining_size_human': format_size(total_size)
-    }
+    payload = json.dumps({
+        'pre_seconds': pre_seconds,
+        'post_seconds': post_seconds
+    }).encode()
+    req = urllib.request.Request(
+        _clip_api_url(config, '/clip'), data=payload, method='POST',
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=5) as response:
+            result = json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        try:
+            result = json.loads(e.read() or b'{}')
+        except ValueError:
+            result = {}
+        result.setdefault('success', False)
+        result.setdefault('message', f'Segmenter returned HTTP {e.code}')
+        return result
+    except (urllib.error.URLError, OSError) as e:
+        return {
+            'success': False,
+            'message': f'Segmenter not reachable (is the recorder running?): {e}'
+        }
+    
+    result.setdefault('message', 'Clip scheduled')
+    return result
+
+def get_clip_recorder_status(config=None):
+    """
+    Get the segmenter status (pre-roll buffer, clips in progress).
+    
+    Returns:
+        dict: {available: bool, ...segmenter status}
+    """
+    if config is None:
+        from .config_service import load_config
+        config = load_config()
+    
+    if config.get('RECORDER_MODE', 'ffmpeg') != 'segmenter':
+        return {'available': False, 'message': 'RECORDER_MODE is not segmenter'}
+    
+    try:
+        with urllib.request.urlopen(_clip_api_url(config, '/status'), timeout=3) as response:
+            return {'available': True, **json.loads(response.read() or b'{}')}
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return {'available': False, 'message': str(e)}
 
 # ============================================================================
 # DISK USAGE
@@ -449,9 +875,9 @@ def get_disk_usage(config=None):
                 disk_info['percent'] = int(parts[4].rstrip('%')) if '%' in parts[4] else 0
     
     # Calculate recordings size
-    recordings = get_recordings_list(config)
-    disk_info['recordings_count'] = len(recordings)
-    disk_info['recordings_size'] = sum(r['size'] for r in recordings)
+    summary = get_recordings_summary(config, pattern='*.ts')
+    disk_info['recordings_count'] = summary['count']
+    disk_info['recordings_size'] = summary['total_size']
     
     # Add human-readable sizes
     disk_info['total_human'] = format_size(disk_info['total'])
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Retention Service - Recordings retention engine (disk space / folder size / age / count)
+Version: 1.0.1
+
+Shared by the web manager (recording_service.cleanup_recordings,
+delete_old_recordings) and rtsp_recorder.sh (prune loop, run as a script):
+
+    python3 retention_service.py --record-dir DIR --min-free-mb N --max-dir-mb M
+
+One pass over the recordings tree (os.scandir, one stat per file) builds the
+candidate list, sorted once oldest first. Every limit (MIN_FREE_DISK_MB,
+MAX_DISK_MB, max size, max count, max age) selects a prefix of that list, so
+the exact set to delete is the longest of those prefixes. Files are then
+unlinked in a batch, without re-running find/ls/du/df after each deletion.
+
+Stdlib only, no package-relative imports: this file must also run standalone.
+
+Changes in 1.0.1:
+- max_recordings_mb: cap on the recordings themselves (web manager
+  max_size_gb). MAX_DISK_MB stays a cap on the whole folder, like du; files
+  that are not recordings (.part, thumbnails) no longer force deleting every
+  recording when the web manager limit is checked
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+RECORDING_EXTENSIONS = ('.ts', '.mp4', '.mkv')
+
+# Never delete a file modified this recently (segment being written)
+ACTIVE_FILE_GRACE_SECONDS = 10
+
+# ============================================================================
+# SCAN / PLAN
+# ============================================================================
+
+def _allocated_bytes(st):
+    """Bytes actually used on disk (what df/du see), fallback to st_size."""
+    blocks = getattr(st, 'st_blocks', None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+def scan_recordings(record_dir, extensions=RECORDING_EXTENSIONS):
+    """
+    Walk the recordings directory once.
+
+    Args:
+        record_dir: Recordings root directory
+        extensions: Extensions eligible for deletion
+
+    Returns:
+        tuple: (candidates, dir_bytes) - candidates is a list of
+               (mtime, allocated_bytes, size, path) sorted oldest first,
+               dir_bytes is the allocated size of the whole tree (like du)
+    """
+    candidates = []
+    dir_bytes = 0
+    stack = [record_dir]
+    extensions = tuple(e.lower() for e in extensions)
+
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    allocated = _allocated_bytes(st)
+                    dir_bytes += allocated
+                    if entry.name.lower().endswith(extensions):
+                        candidates.append((st.st_mtime, allocated, st.st_size, entry.path))
+        except OSError:
+            continue
+
+    candidates.sort()
+    return candidates, dir_bytes
+
+def plan_retention(candidates, free_bytes=None, dir_bytes=0, min_free_bytes=0,
+                   max_dir_bytes=0, max_count=0, older_than=None, now=None,
+                   max_recordings_bytes=0):
+    """
+    Compute the exact set of recordings to delete (oldest first).
+
+    Each limit needs the oldest k files removed; the result is the longest
+    of those prefixes, so every limit holds after deletion.
+
+    Args:
+        candidates: Sorted list from scan_recordings()
+        free_bytes: Current free space on the filesystem (None = ignore min_free)
+        dir_bytes: Current recordings folder size
+        min_free_bytes: Free space to maintain (0 = no limit)
+        max_dir_bytes: Maximum folder size (0 = no limit)
+        max_count: Maximum number of recordings (0 = no limit)
+        older_than: Delete every recording with mtime < this timestamp
+        now: Current time (for the active-file grace period)
+        max_recordings_bytes: Maximum total size of the candidates only,
+                              other files in the folder excluded (0 = no limit)
+
+    Returns:
+        tuple: (to_delete, bytes_to_free, unmet) - unmet lists the limits
+               that cannot be reached even after deleting every candidate
+    """
+    now = time.time() if now is None else now
+    # The segment being written is never a candidate
+    eligible = [c for c in candidates if now - c[0] >= ACTIVE_FILE_GRACE_SECONDS]
+
+    need_bytes = 0
+    if min_free_bytes and free_bytes is not None:
+        need_bytes = max(need_bytes, min_free_bytes - free_bytes)
+    if max_dir_bytes:
+        need_bytes = max(need_bytes, dir_bytes - max_dir_bytes)
+    recordings_bytes = sum(c[1] for c in candidates)
+    if max_recordings_bytes:
+        need_bytes = max(need_bytes, recordings_bytes - max_recordings_bytes)
+
+    count = 0
+    if need_bytes > 0:
+        freed = 0
+        while count < len(eligible) and freed < need_bytes:
+            freed += eligible[count][1]
+            count += 1
+
+    if max_count and len(candidates) > max_count:
+        count = max(count, min(len(eligible), len(candidates) - max_count))
+
+    if older_than is not None:
+        aged = 0
+        while aged < len(eligible) and eligible[aged][0] < older_than:
+            aged += 1
+        count = max(count, aged)
+
+    to_delete = eligible[:count]
+    bytes_to_free = sum(c[1] for c in to_delete)
+
+    unmet = []
+    if need_bytes > bytes_to_free:
+        if min_free_bytes and free_bytes is not None and free_bytes + bytes_to_free < min_free_bytes:
+            unmet.append('min_free')
+        if max_dir_bytes and dir_bytes - bytes_to_free > max_dir_bytes:
+            unmet.append('max_dir')
+        if max_recordings_bytes and recordings_bytes - bytes_to_free > max_recordings_bytes:
+            unmet.append('max_recordings')
+    if max_count and len(candidates) - count > max_count:
+        unmet.append('max_count')
+
+    return to_delete, bytes_to_free, unmet
+
+# ============================================================================
+# APPLY
+# ============================================================================
+
+def get_free_bytes(path):
+    """Free space available to the recorder on the filesystem holding path."""
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+def apply_retention(record_dir, min_free_mb=0, max_dir_mb=0, max_count=0,
+                    max_age_days=None, extensions=RECORDING_EXTENSIONS,
+                    dry_run=False, on_deleted=None, max_recordings_mb=0):
+    """
+    Enforce all retention limits in a single scan / plan / batch delete.
+
+    Args:
+        record_dir: Recordings root directory
+        min_free_mb: Minimum free disk space to keep (0 = no limit)
+        max_dir_mb: Maximum recordings folder size (0 = no limit)
+        max_count: Maximum number of recordings (0 = no limit)
+        max_age_days: Delete recordings older than this (None = no limit)
+        extensions: Extensions eligible for deletion
+        dry_run: Only compute the plan
+        on_deleted: Optional callback(list_of_paths) after the batch delete
+        max_recordings_mb: Maximum total size of the recordings, other
+                           files excluded (0 = no limit)
+
+    Returns:
+        dict: {success, deleted_count, freed_space, deleted, errors,
+               free_before/after, dir_before/after, recordings_before/after,
+               unmet, scanned, duration_ms}
+    """
+    started = time.monotonic()
+    if not os.path.isdir(record_dir):
+        return {'success': False, 'message': f'Directory not found: {record_dir}'}
+
+    candidates, dir_bytes = scan_recordings(record_dir, extensions)
+    free_bytes = get_free_bytes(record_dir) if min_free_mb else None
+    older_than = time.time() - max_age_days * 86400 if max_age_days is not None else None
+
+    to_delete, bytes_to_free, unmet = plan_retention(
+        candidates,
+        free_bytes=free_bytes,
+        dir_bytes=dir_bytes,
+        min_free_bytes=int(min_free_mb) * 1024 * 1024,
+        max_dir_bytes=int(max_dir_mb) * 1024 * 1024,
+        max_count=int(max_count or 0),
+        older_than=older_than,
+        max_recordings_bytes=int(max_recordings_mb) * 1024 * 1024
+    )
+    recordings_bytes = sum(c[1] for c in candidates)
+
+    deleted = []
+    errors = []
+    freed = 0
+    if not dry_run:
+        for _mtime, allocated, _size, path in to_delete:
+            try:
+                os.unlink(path)
+                deleted.append(path)
+                freed += allocated
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                errors.append(f"{os.path.basename(path)}: {e}")
+        if deleted and on_deleted:
+            on_deleted(deleted)
+    else:
+        deleted = [c[3] for c in to_delete]
+        freed = bytes_to_free
+
+    return {
+        'success': not errors,
+        'dry_run': dry_run,
+        'scanned': len(candidates),
+        'deleted_count': len(deleted),
+        'deleted': deleted,
+        'freed_space': freed,
+        'errors': errors,
+        'unmet': unmet,
+        'free_before': free_bytes,
+        'free_after': get_free_bytes(record_dir) if free_bytes is not None else None,
+        'dir_before': dir_bytes,
+        'dir_after': dir_bytes - freed,
+        'recordings_before': recordings_bytes,
+        'recordings_after': recordings_bytes - freed,
+        'remaining_count': len(candidates) - len(deleted),
+        'duration_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+# ============================================================================
+# CLI (rtsp_recorder.sh prune loop)
+# ============================================================================
+
+def _mb(value):
+    return value // (1024 * 1024) if value is not None else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recordings retention engine')
+    parser.add_argument('--record-dir', required=True)
+    parser.add_argument('--min-free-mb', type=int, default=0)
+    parser.add_argument('--max-dir-mb', type=int, default=0)
+    parser.add_argument('--max-count', type=int, default=0)
+    parser.add_argument('--max-age-days', type=float, default=None)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--json', action='store_true', help='Print the full result as JSON')
+    args = parser.parse_args(argv)
+
+    result = apply_retention(
+        args.record_dir,
+        min_free_mb=args.min_free_mb,
+        max_dir_mb=args.max_dir_mb,
+        max_count=args.max_count,
+        max_age_days=args.max_age_days,
+        dry_run=args.dry_run
+    )
+
+    if args.json:
+        print(json.dumps(result))
+    elif 'scanned' not in result:
+        print(f"Retention: {result.get('message')}")
+    else:
+        for path in result['deleted']:
+            print(f"Deleted: {path}")
+        for error in result['errors']:
+            print(f"Delete failed: {error}")
+        summary = (
+            f"Retention: {'would delete' if args.dry_run else 'deleted'} {result['deleted_count']}"
+            f"/{result['scanned']} recordings, freed {_mb(result['freed_space'])}MB "
+            f"in {result['duration_ms']}ms (folder {_mb(result['dir_after'])}MB"
+        )
+        if result['free_after'] is not None:
+            summary += f", free {_mb(result['free_after'])}MB"
+        print(summary + ")")
+        if result['unmet']:
+            print(f"Retention: limits still exceeded after pruning: {', '.join(result['unmet'])}")
+
+    if not result.get('success'):
+        return 1
+    return 2 if result['unmet'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,686 @@
+# -*- coding: utf-8 -*-
+"""
+RTSP Probe Service - In-process RTSP client measuring the real stream health
+Version: 1.1.0
+
+Connects to the local RTSP server like an NVR would and measures what the
+clients actually receive, instead of only checking that the port listens:
+1. DESCRIBE (Digest or Basic auth on 401), SDP parsed for the video track
+2. SETUP with a transport allowed by RTSP_PROTOCOLS: RTP/AVP/TCP interleaved
+   first (no UDP ports to open), unicast UDP when TCP is disabled or refused
+   (461 Unsupported Transport), then PLAY
+3. RTP read for RTSP_PROBE_DURATION seconds, then TEARDOWN
+
+Reported: time to first RTP packet, frame rate (RTP timestamps), bitrate,
+keyframe interval / GOP length (H.264 IDR/SPS, H.265 IRAP/VPS/SPS, also
+inside FU/STAP aggregation units) and lost packets (sequence gaps).
+
+The last result is kept in memory and in RTSP_PROBE_STATE_FILE so that the
+watchdog loop, /api/system/health, the other gunicorn workers and the ONVIF
+server share one probe instead of each running its own checks. Concurrent
+callers wait for the probe already in flight (single-flight).
+
+Stdlib only.
+
+Changes in 1.1.0:
+- Transport chosen from RTSP_PROTOCOLS (udp,tcp,udp-mcast) with a UDP
+  fallback on 461; a server refusing every unicast transport is reported as
+  alive but not probed (healthy, probed: False) instead of unhealthy, so the
+  watchdog no longer restarts a working multicast-only server
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import socket
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+from urllib.parse import urlsplit, unquote
+
+from config import RTSP_PROBE_STATE_FILE
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+RTSP_PROBE_DURATION = 3.0  # seconds of RTP read after PLAY
+RTSP_PROBE_TIMEOUT = 5.0  # connect / RTSP response / first frame timeout
+RTSP_PROBE_MAX_AGE = 20.0  # cached results younger than this are reused
+RTSP_PROBE_MIN_FPS = 1.0  # below this the stream is considered stalled
+RTSP_PROBE_MAX_RESPONSE = 64 * 1024  # RTSP headers + SDP
+RTSP_USER_AGENT = 'RpiCam-HealthProbe/1.0'
+
+RTP_TIMESTAMP_WRAP = 1 << 32
+RTP_SEQ_WRAP = 1 << 16
+
+H264_KEYFRAME_NALS = (5, 7)  # IDR slice, SPS
+H265_KEYFRAME_NALS = (16, 17, 18, 19, 20, 21, 32, 33)  # IRAP slices, VPS, SPS
+
+RTSP_PROBE_TRANSPORTS = ('tcp', 'udp')  # tried in this order when allowed
+RTSP_STATUS_UNSUPPORTED_TRANSPORT = 461
+UDP_PORT_ATTEMPTS = 10  # tries to get an even RTP port with a free RTCP port above
+
+# ============================================================================
+# RTSP CLIENT
+# ============================================================================
+
+def probe_transports(protocols) -> Tuple[str, ...]:
+    """
+    Unicast transports to try for an RTSP_PROTOCOLS value ('udp,tcp,udp-mcast').
+
+    udp-mcast alone maps to unicast UDP: the server may still accept it, and
+    refuses it with 461 otherwise.
+    """
+    allowed = {p.strip().lower() for p in (protocols or '').split(',') if p.strip()}
+    if not allowed:
+        return RTSP_PROBE_TRANSPORTS
+    if 'udp-mcast' in allowed:
+        allowed.add('udp')
+    return tuple(t for t in RTSP_PROBE_TRANSPORTS if t in allowed) or RTSP_PROBE_TRANSPORTS
+
+def _bind_rtp_pair() -> Tuple[socket.socket, socket.socket]:
+    """UDP sockets on an even RTP port and the RTCP port right above it."""
+    for _ in range(UDP_PORT_ATTEMPTS):
+        rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtp.bind(('', 0))
+        port = rtp.getsockname()[1]
+        if port % 2 == 0:
+            rtcp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                rtcp.bind(('', port + 1))
+                return rtp, rtcp
+            except OSError:
+                rtcp.close()
+        rtp.close()
+    raise RtspProbeError('No free UDP port pair for RTP/RTCP')
+
+class RtspProbeError(Exception):
+    """RTSP session failure (connection, status code, missing track)."""
+
+def _parse_auth_params(value: str) -> Dict[str, str]:
+    """key=value / key="value" pairs of a WWW-Authenticate challenge."""
+    return {k.lower(): quoted or plain
+            for k, quoted, plain in re.findall(r'(\w+)\s*=\s*(?:"([^"]*)"|([^,\s]*))', value)}
+
+def _md5(text: str) -> str:
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def is_keyframe_payload(payload: bytes, codec: str) -> bool:
+    """
+    True if an RTP payload carries (the start of) an IDR/IRAP frame or parameter sets.
+
+    Args:
+        payload: RTP payload (RFC 6184 for H.264, RFC 7798 for H.265)
+        codec: 'h264' or 'h265'
+    """
+    if not payload:
+        return False
+    if codec == 'h265':
+        if len(payload) < 3:
+            return False
+        nal_type = (payload[0] >> 1) & 0x3F
+        if nal_type == 49:  # FU: start fragment only
+            return bool(payload[2] & 0x80) and (payload[2] & 0x3F) in H265_KEYFRAME_NALS
+        if nal_type == 48:  # AP: 2-byte header, then 16-bit size + NAL unit
+            pos = 2
+            while pos + 2 < len(payload):
+                size = struct.unpack_from('!H', payload, pos)[0]
+                if ((payload[pos + 2] >> 1) & 0x3F) in H265_KEYFRAME_NALS:
+                    return True
+                pos += 2 + size
+            return False
+        return nal_type in H265_KEYFRAME_NALS
+
+    nal_type = payload[0] & 0x1F
+    if nal_type == 28:  # FU-A: start fragment only
+        return len(payload) > 1 and bool(payload[1] & 0x80) and (payload[1] & 0x1F) in H264_KEYFRAME_NALS
+    if nal_type == 24:  # STAP-A: 16-bit size + NAL unit
+        pos = 1
+        while pos + 2 < len(payload):
+            size = struct.unpack_from('!H', payload, pos)[0]
+            if (payload[pos + 2] & 0x1F) in H264_KEYFRAME_NALS:
+                return True
+            pos += 2 + size
+        return False
+    return nal_type in H264_KEYFRAME_NALS
+
+class RtspTransportRefused(RtspProbeError):
+    """The server answered but refused every allowed transport."""
+
+class RtspProbe:
+    """One RTSP session: DESCRIBE/SETUP/PLAY, RTP statistics, TEARDOWN."""
+
+    def __init__(self, url: str, username: str = '', password: str = '',
+                 timeout: float = RTSP_PROBE_TIMEOUT, transports=RTSP_PROBE_TRANSPORTS):
+        parts = urlsplit(url)
+        if parts.scheme != 'rtsp' or not parts.hostname:
+            raise ValueError(f'Not an RTSP URL: {url}')
+        self.host = parts.hostname
+        self.port = parts.port or 554
+        self.username = username or unquote(parts.username or '')
+        self.password = password or unquote(parts.password or '')
+        netloc = f'[{self.host}]' if ':' in self.host else self.host
+        self.url = f"rtsp://{netloc}:{self.port}{parts.path or '/'}"
+        if parts.query:
+            self.url += f'?{parts.query}'
+        self.timeout = timeout
+        self.transports = tuple(transports) or RTSP_PROBE_TRANSPORTS
+        self.transport = None  # transport of the session ('tcp' / 'udp')
+        self._sock = None
+        self._channel = 0  # interleaved RTP channel (tcp)
+        self._udp = None  # (rtp socket, rtcp socket) (udp)
+        self._buffer = bytearray()
+        self._cseq = 0
+        self._session = None
+        self._challenge = None  # (scheme, params)
+        self._nonce_count = 0
+
+    # ------------------------------------------------------------------
+    # RTSP requests
+    # ------------------------------------------------------------------
+
+    def _authorization(self, method: str, uri: str) -> Optional[str]:
+        if not self._challenge or not self.username:
+            return None
+        scheme, params = self._challenge
+        if scheme == 'basic':
+            token = base64.b64encode(f'{self.username}:{self.password}'.encode('utf-8')).decode('ascii')
+            return f'Basic {token}'
+
+        realm = params.get('realm', '')
+        nonce = params.get('nonce', '')
+        ha1 = _md5(f'{self.username}:{realm}:{self.password}')
+        ha2 = _md5(f'{method}:{uri}')
+        fields = [f'username="{self.username}"', f'realm="{realm}"', f'nonce="{nonce}"', f'uri="{uri}"']
+        qop = params.get('qop', '')
+        if 'auth' in [q.strip() for q in qop.split(',')]:
+            self._nonce_count += 1
+            nc = f'{self._nonce_count:08x}'
+            cnonce = os.urandom(8).hex()
+            fields.append(f'response="{_md5(f"{ha1}:{nonce}:{nc}:{cnonce}:auth:{ha2}")}"')
+            fields += ['qop=auth', f'nc={nc}', f'cnonce="{cnonce}"']
+        else:
+            fields.append(f'response="{_md5(f"{ha1}:{nonce}:{ha2}")}"')
+        if 'opaque' in params:
+            fields.append(f'opaque="{params["opaque"]}"')
+        if params.get('algorithm'):
+            fields.append(f'algorithm={params["algorithm"]}')
+        return 'Digest ' + ', '.join(fields)
+
+    def _select_challenge(self, values):
+        """Prefer Digest over Basic among the WWW-Authenticate headers."""
+        challenges = {}
+        for value in values:
+            scheme, _, rest = value.strip().partition(' ')
+            challenges[scheme.lower()] = _parse_auth_params(rest)
+        for scheme in ('digest', 'basic'):
+            if scheme in challenges:
+                return scheme, challenges[scheme]
+        return None
+
+    def request(self, method: str, uri: str, headers: Optional[Dict[str, str]] = None):
+        """
+        Send a request, retrying once with credentials on 401.
+
+        Returns:
+            (status, headers, body) - header names lower-cased, repeated headers as lists
+        """
+        for attempt in range(2):
+            self._cseq += 1
+            lines = [f'{method} {uri} RTSP/1.0', f'CSeq: {self._cseq}', f'User-Agent: {RTSP_USER_AGENT}']
+            authorization = self._authorization(method, uri)
+            if authorization:
+                lines.append(f'Authorization: {authorization}')
+            if self._session:
+                lines.append(f'Session: {self._session}')
+            lines += [f'{k}: {v}' for k, v in (headers or {}).items()]
+            self._sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+
+            status, response_headers, body = self._read_response()
+            if status == 401 and attempt == 0 and self.username:
+                challenge = self._select_challenge(response_headers.get('www-authenticate', []))
+                if challenge:
+                    self._challenge = challenge
+                    continue
+            return status, response_headers, body
+        return status, response_headers, body
+
+    def _recv(self):
+        data = self._sock.recv(65536)
+        if not data:
+            raise RtspProbeError('Connection closed by server')
+        self._buffer += data
+
+    def _read_response(self):
+        """Read one RTSP response, skipping interleaved RTP that arrives first."""
+        while True:
+            self._skip_interleaved()
+            end = self._buffer.find(b'\r\n\r\n')
+            if end >= 0 and self._buffer[:1] != b'$':
+                break
+            if len(self._buffer) > RTSP_PROBE_MAX_RESPONSE:
+                raise RtspProbeError('RTSP response too large')
+            self._recv()
+
+        head = bytes(self._buffer[:end]).decode('utf-8', 'replace').split('\r\n')
+        del self._buffer[:end + 4]
+        status_line = head[0].split(' ', 2)
+        if len(status_line) < 2 or not status_line[0].startswith('RTSP/'):
+            raise RtspProbeError(f'Invalid RTSP response: {head[0][:80]}')
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            if name == 'www-authenticate':
+                headers.setdefault(name, []).append(value)
+            else:
+                headers[name] = value
+
+        length = int(headers.get('content-length', '0') or 0)
+        if length > RTSP_PROBE_MAX_RESPONSE:
+            raise RtspProbeError('RTSP response too large')
+        while len(self._buffer) < length:
+            self._recv()
+        body = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        return int(status_line[1]), headers, body
+
+    def _skip_interleaved(self):
+        """Drop complete interleaved frames at the head of the buffer."""
+        while len(self._buffer) >= 4 and self._buffer[0] == 0x24:
+            size = struct.unpack_from('!H', self._buffer, 2)[0]
+            if len(self._buffer) < 4 + size:
+                return
+            del self._buffer[:4 + size]
+
+    # ------------------------------------------------------------------
+    # Session
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def parse_sdp(sdp: str) -> Dict[str, Any]:
+        """First video track of an SDP: {control, payload_type, codec, clock_rate}."""
+        track = None
+        for line in sdp.splitlines():
+            line = line.strip()
+            if line.startswith('m='):
+                if track is not None:
+                    break
+                fields = line[2:].split()
+                if fields and fields[0] == 'video':
+                    payload_type = int(fields[3]) if len(fields) > 3 and fields[3].isdigit() else None
+                    track = {'control': None, 'payload_type': payload_type, 'codec': None, 'clock_rate': 90000}
+            elif track is not None and line.startswith('a=control:'):
+                track['control'] = line[len('a=control:'):]
+            elif track is not None and line.startswith('a=rtpmap:'):
+                match = re.match(r'a=rtpmap:(\d+)\s+([\w.-]+)/(\d+)', line)
+                if match and int(match.group(1)) == track['payload_type']:
+                    name = match.group(2).upper()
+                    track['codec'] = {'H264': 'h264', 'H265': 'h265', 'HEVC': 'h265'}.get(name, name.lower())
+                    track['clock_rate'] = int(match.group(3))
+        return track
+
+    @staticmethod
+    def _resolve_control(base: str, control: Optional[str]) -> str:
+        if not control or control == '*':
+            return base
+        if control.startswith('rtsp://'):
+            return control
+        return base.rstrip('/') + '/' + control.lstrip('/')
+
+    def run(self, duration: float = RTSP_PROBE_DURATION) -> Dict[str, Any]:
+        """
+        Open a session, read RTP for `duration` seconds and compute the stream metrics.
+
+        Returns:
+            dict: metrics (see probe_rtsp_stream)
+
+        Raises:
+            RtspProbeError / OSError on connection or protocol failure
+        """
+        started = time.monotonic()
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            status, headers, body = self.request('DESCRIBE', self.url, {'Accept': 'application/sdp'})
+            if status != 200:
+                raise RtspProbeError(f'DESCRIBE failed: RTSP {status}')
+            track = self.parse_sdp(body.decode('utf-8', 'replace'))
+            if not track:
+                raise RtspProbeError('No video track in SDP')
+            base = headers.get('content-base') or headers.get('content-location') or self.url
+
+            self._setup(self._resolve_control(base, track['control']))
+
+            status, _, _ = self.request('PLAY', base, {'Range': 'npt=0.000-'})
+            if status != 200:
+                raise RtspProbeError(f'PLAY failed: RTSP {status}')
+            play_at = time.monotonic()
+
+            metrics = self._read_rtp(track, duration)
+            metrics['setup_ms'] = round((play_at - started) * 1000, 1)
+            if metrics['first_packet_at'] is not None:
+                metrics['first_frame_ms'] = round((metrics['first_packet_at'] - started) * 1000, 1)
+            else:
+                metrics['first_frame_ms'] = None
+            del metrics['first_packet_at']
+            metrics['codec'] = track['codec']
+            metrics['transport'] = self.transport
+            return metrics
+        finally:
+            self.close()
+
+    def _setup(self, uri: str):
+        """SETUP the video track with the first allowed transport the server accepts."""
+        refused = []
+        for transport in self.transports:
+            if transport == 'udp':
+                self._udp = _bind_rtp_pair()
+                rtp_port = self._udp[0].getsockname()[1]
+                header = f'RTP/AVP;unicast;client_port={rtp_port}-{rtp_port + 1}'
+            else:
+                header = 'RTP/AVP/TCP;unicast;interleaved=0-1'
+            status, headers, _ = self.request('SETUP', uri, {'Transport': header})
+            if status == 200:
+                self.transport = transport
+                self._session = headers.get('session', '').split(';')[0].strip() or None
+                match = re.search(r'interleaved=(\d+)', headers.get('transport', ''))
+                if match:
+                    self._channel = int(match.group(1))
+                return
+            self._close_udp()
+            if status != RTSP_STATUS_UNSUPPORTED_TRANSPORT:
+                raise RtspProbeError(f'SETUP failed: RTSP {status}')
+            refused.append(transport)
+        raise RtspTransportRefused(f"transport refused ({'/'.join(refused)}): RTSP {RTSP_STATUS_UNSUPPORTED_TRANSPORT}")
+
+    def _next_packet(self, timeout: float) -> Optional[bytes]:
+        """Next RTP packet of the video track, None if nothing arrived within timeout."""
+        if self._udp is not None:
+            self._udp[0].settimeout(timeout)
+            try:
+                return self._udp[0].recv(65536)
+            except socket.timeout:
+                return None
+        while True:
+            if len(self._buffer) >= 4 and self._buffer[0] == 0x24:
+                size = struct.unpack_from('!H', self._buffer, 2)[0]
+                if len(self._buffer) >= 4 + size:
+                    frame_channel = self._buffer[1]
+                    packet = bytes(self._buffer[4:4 + size])
+                    del self._buffer[:4 + size]
+                    if frame_channel == self._channel:
+                        return packet
+                    continue
+            elif self._buffer and self._buffer[0] != 0x24:
+                # RTSP message (server keep-alive / ANNOUNCE) or garbage: resync on the next '$'
+                if not (self._buffer.startswith(b'RTSP/') and b'\r\n\r\n' not in self._buffer):
+                    next_frame = self._buffer.find(b'$', 1)
+                    del self._buffer[:next_frame if next_frame > 0 else len(self._buffer)]
+                    continue
+            self._sock.settimeout(timeout)
+            try:
+                self._recv()
+            except socket.timeout:
+                return None
+
+    def _read_rtp(self, track: Dict[str, Any], duration: float) -> Dict[str, Any]:
+        codec = track['codec'] or 'h264'
+        clock_rate = track['clock_rate'] or 90000
+        stats = {'packets': 0, 'bytes': 0, 'frames': 0, 'keyframes': 0, 'lost_packets': 0,
+                 'first_packet_at': None}
+        last_seq = None
+        last_ts = None
+        elapsed_ts = 0  # unwrapped RTP timestamp span since the first packet
+        keyframe_ts = []  # unwrapped timestamps of keyframes
+        keyframe_frames = []  # frame index of keyframes
+        last_keyframe_ts = None
+
+        deadline = time.monotonic() + duration
+        first_frame_deadline = time.monotonic() + self.timeout
+        while True:
+            now = time.monotonic()
+            if now >= deadline and stats['packets']:
+                break
+            if now >= max(deadline, first_frame_deadline):
+                break
+            packet = self._next_packet(max(0.05, min(0.5, max(deadline, first_frame_deadline) - now)))
+            if packet is None or len(packet) < 12 or packet[0] >> 6 != 2:
+                continue
+
+            if stats['first_packet_at'] is None:
+                stats['first_packet_at'] = time.monotonic()
+            seq, timestamp = struct.unpack_from('!HI', packet, 2)
+            offset = 12 + 4 * (packet[0] & 0x0F)
+            if packet[0] & 0x10 and len(packet) >= offset + 4:
+                offset += 4 + 4 * struct.unpack_from('!H', packet, offset + 2)[0]
+            end = len(packet)
+            if packet[0] & 0x20 and end > offset:
+                end -= packet[-1]
+            payload = packet[offset:end]
+
+            stats['packets'] += 1
+            stats['bytes'] += len(payload)
+            if last_seq is not None:
+                gap = (seq - last_seq - 1) % RTP_SEQ_WRAP
+                if gap < RTP_SEQ_WRAP // 2:
+                    stats['lost_packets'] += gap
+            last_seq = seq
+
+            if last_ts is None or timestamp != last_ts:
+                if last_ts is not None:
+                    elapsed_ts += (timestamp - last_ts) % RTP_TIMESTAMP_WRAP
+                last_ts = timestamp
+                stats['frames'] += 1
+            if is_keyframe_payload(payload, codec) and last_keyframe_ts != elapsed_ts:
+                last_keyframe_ts = elapsed_ts
+                keyframe_ts.append(elapsed_ts)
+                keyframe_frames.append(stats['frames'])
+                stats['keyframes'] += 1
+
+        span = elapsed_ts / clock_rate
+        stats['duration'] = round(span, 3)
+        # frames counted over the timestamp span: the last frame's duration is not known
+        stats['fps'] = round((stats['frames'] - 1) / span, 2) if stats['frames'] > 1 and span > 0 else 0.0
+        stats['bitrate_kbps'] = round(stats['bytes'] * 8 / span / 1000, 1) if span > 0 else 0.0
+        if len(keyframe_ts) > 1:
+            intervals = [b - a for a, b in zip(keyframe_ts, keyframe_ts[1:])]
+            stats['keyframe_interval'] = round(sum(intervals) / len(intervals) / clock_rate, 3)
+            gops = [b - a for a, b in zip(keyframe_frames, keyframe_frames[1:])]
+            stats['gop_frames'] = round(sum(gops) / len(gops), 1)
+        else:
+            stats['keyframe_interval'] = None
+            stats['gop_frames'] = None
+        return stats
+
+    def _close_udp(self):
+        if self._udp is not None:
+            for sock in self._udp:
+                sock.close()
+            self._udp = None
+
+    def close(self):
+        self._close_udp()
+        if self._sock is None:
+            return
+        try:
+            if self._session:
+                self._cseq += 1
+                lines = [f'TEARDOWN {self.url} RTSP/1.0', f'CSeq: {self._cseq}', f'Session: {self._session}',
+                         f'User-Agent: {RTSP_USER_AGENT}']
+                authorization = self._authorization('TEARDOWN', self.url)
+                if authorization:
+                    lines.append(f'Authorization: {authorization}')
+                self._sock.settimeout(1)
+                self._sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            self._sock.close()
+            self._sock = None
+
+# ============================================================================
+# PROBE
+# ============================================================================
+
+def _safe_url(url: str) -> str:
+    """URL without credentials (for logs and API output)."""
+    parts = urlsplit(url)
+    if parts.username is None:
+        return url
+    return url.replace(parts.netloc, parts.netloc.rsplit('@', 1)[1], 1)
+
+def probe_rtsp_stream(rtsp_url: str, username: str = '', password: str = '',
+                      duration: float = RTSP_PROBE_DURATION,
+                      timeout: float = RTSP_PROBE_TIMEOUT,
+                      protocols: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Probe an RTSP stream.
+
+    Args:
+        rtsp_url: rtsp:// URL (credentials may be embedded)
+        username: RTSP user (overrides the URL)
+        password: RTSP password (overrides the URL)
+        duration: seconds of RTP to read
+        timeout: connect / response / first frame timeout
+        protocols: RTSP_PROTOCOLS of the server (None = try TCP then UDP)
+
+    Returns:
+        dict: {healthy, probed, message, latency, first_frame_ms, fps, bitrate_kbps,
+               keyframe_interval, gop_frames, frames, keyframes, packets,
+               lost_packets, codec, transport, duration, url, checked_at}
+    """
+    result = {
+        'healthy': False,
+        'probed': False,
+        'url': _safe_url(rtsp_url),
+        'checked_at': datetime.now().isoformat(),
+        'checked_ts': time.time()
+    }
+    started = time.monotonic()
+    try:
+        metrics = RtspProbe(rtsp_url, username, password, timeout, probe_transports(protocols)).run(duration)
+    except RtspTransportRefused as e:
+        # The server is up and answered DESCRIBE: not a reason to restart it
+        result.update({
+            'healthy': True,
+            'probed': False,
+            'message': f'RTSP server alive, stream not probed ({e})',
+            'latency': round(time.monotonic() - started, 3)
+        })
+        return result
+    except (RtspProbeError, OSError, ValueError) as e:
+        result.update({
+            'message': f'RTSP probe failed: {e}',
+            'latency': round(time.monotonic() - started, 3)
+        })
+        return result
+
+    result.update(metrics)
+    result['probed'] = True
+    first_frame_ms = metrics['first_frame_ms']
+    result['latency'] = round(first_frame_ms / 1000, 3) if first_frame_ms is not None else None
+    if not metrics['packets']:
+        result['message'] = 'RTSP session opened but no RTP received'
+    elif metrics['frames'] > 1 and metrics['fps'] < RTSP_PROBE_MIN_FPS:
+        result['message'] = f"Stream stalled ({metrics['fps']} fps)"
+    else:
+        result['healthy'] = True
+        result['message'] = (f"{metrics['codec'] or 'video'} {metrics['fps']} fps, "
+                             f"{metrics['bitrate_kbps']:.0f} kb/s, first frame {first_frame_ms:.0f} ms")
+    return result
+
+# ============================================================================
+# SHARED RESULT (memory + state file)
+# ============================================================================
+
+_probe_lock = threading.Lock()  # single-flight: one probe at a time per process
+_last_result = None
+
+def _local_stream_url(config) -> Tuple[str, str, str]:
+    rtsp_port = config.get('RTSP_PORT', '8554')
+    rtsp_path = (config.get('RTSP_PATH', 'stream') or 'stream').lstrip('/')
+    return (f"rtsp://127.0.0.1:{rtsp_port}/{rtsp_path}",
+            config.get('RTSP_USER', '') or '', config.get('RTSP_PASSWORD', '') or '')
+
+def _result_age(result) -> float:
+    return time.time() - result.get('checked_ts', 0) if result else float('inf')
+
+def get_cached_stream_health() -> Optional[Dict[str, Any]]:
+    """
+    Latest probe result of any process (memory, then RTSP_PROBE_STATE_FILE).
+
+    Returns:
+        dict with an extra 'age' key (seconds), or None if never probed
+    """
+    result = _last_result
+    try:
+        with open(RTSP_PROBE_STATE_FILE, 'r') as f:
+            stored = json.load(f)
+        if _result_age(stored) < _result_age(result):
+            result = stored
+    except (OSError, ValueError):
+        pass
+    if result is None:
+        return None
+    return {**result, 'age': round(max(0.0, _result_age(result)), 1)}
+
+def _store_result(result):
+    global _last_result
+    _last_result = result
+    temp_path = f"{RTSP_PROBE_STATE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(temp_path, RTSP_PROBE_STATE_FILE)
+    except OSError as e:
+        print(f"[RTSPProbe] Cannot write {RTSP_PROBE_STATE_FILE}: {e}")
+
+def get_stream_health(max_age: float = RTSP_PROBE_MAX_AGE, force: bool = False) -> Dict[str, Any]:
+    """
+    Health of the local RTSP stream, probing only if the shared result is too old.
+
+    Args:
+        max_age: reuse a result (of any process) younger than this many seconds
+        force: always probe
+
+    Returns:
+        dict: probe result (see probe_rtsp_stream) with 'age'
+    """
+    if not force:
+        cached = get_cached_stream_health()
+        if cached and cached['age'] < max_age:
+            return cached
+
+    checked_before = _result_age(_last_result)
+    with _probe_lock:
+        # Another thread finished a probe while we were waiting: reuse it
+        if _result_age(_last_result) < checked_before:
+            return get_cached_stream_health()
+        from .config_service import get_config_snapshot
+        config = get_config_snapshot()
+        url, username, password = _local_stream_url(config)
+        result = probe_rtsp_stream(url, username, password, protocols=config.get('RTSP_PROTOCOLS'))
+        _store_result(result)
+        if not result['healthy']:
+            print(f"[RTSPProbe] {result['url']}: {result['message']}")
+    return {**result, 'age': 0.0}
+
+def refresh_stream_health_async(max_age: float = RTSP_PROBE_MAX_AGE) -> bool:
+    """
+    Start a background probe if the shared result is older than max_age.
+
+    Returns:
+        bool: True if a probe was started
+    """
+    cached = get_cached_stream_health()
+    if (cached and cached['age'] < max_age) or _probe_lock.locked():
+        return False
+    threading.Thread(target=get_stream_health, kwargs={'max_age': max_age},
+                     daemon=True, name='rtsp-probe').start()
+    return True
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+Shared State Service - State shared by the Gunicorn workers of the web manager
+Version: 1.0.2
+
+The web manager runs under `gunicorn --workers N`: every module-level cache and
+every background thread exists once per worker. This service gives the workers:
+1. Leader election (flock on a lock file): exactly one worker runs the
+   background tasks (thumbnail pool, recordings indexer, watchdogs, heartbeat,
+   scheduler). When it dies, the kernel drops the lock and another worker takes
+   over within LEADER_RETRY_INTERVAL.
+2. A small key/value store with TTL (SQLite in WAL mode on tmpfs) for hot
+   read-mostly data: merged translations, snapshots published by the leader.
+3. Counters (cache generations) and a job queue (thumbnail requests received
+   by a follower are handed to the leader instead of starting a second pool).
+4. Signals: a follower asks the leader to run a registered callback (e.g. an
+   immediate Meeting heartbeat); the leader's relay thread applies them in
+   the order they were sent.
+
+Outside Gunicorn (development server, CLI tools, tests) no election is started
+and is_follower() is False, so services keep their single-process behaviour.
+Every call degrades to a local default if the store cannot be used.
+
+Changes in 1.0.2:
+- Signals go through an ordered log (signals table, AUTOINCREMENT seq)
+  instead of one counter per name: a stop_heartbeat then start_heartbeat
+  sent within one RELAY_POLL_INTERVAL is applied in that order, not in
+  handler registration order. Consecutive repeats of a signal still run
+  its handler once per poll
+
+Changes in 1.0.1:
+- The leader's relay seeds its signal counters when it starts: counters kept
+  on tmpfs across restarts / failover no longer replay old signals (e.g. a
+  stale Meeting stop_heartbeat) on the new leader
+"""
+
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Runtime directory (tmpfs: no SD card wear, cleared on reboot)
+SHARED_STATE_DIRS = ('/run/rpi-cam', os.path.join(tempfile.gettempdir(), f'rpi-cam-{os.getuid()}'))
+SHARED_STATE_DB_NAME = 'shared_state.db'
+LEADER_LOCK_NAME = 'leader.lock'
+
+LEADER_RETRY_INTERVAL = 5  # seconds between lock attempts of the followers
+RELAY_POLL_INTERVAL = 0.5  # seconds between signal checks of the leader
+DB_BUSY_TIMEOUT = 5  # seconds
+EXPIRED_PURGE_INTERVAL = 300  # seconds between purges of expired keys (leader)
+
+# ============================================================================
+# STORAGE
+# ============================================================================
+
+_state_dir = None
+_db_local = threading.local()
+_stats = {'hits': 0, 'misses': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    queue TEXT NOT NULL,
+    key TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    PRIMARY KEY (queue, key)
+);
+CREATE TABLE IF NOT EXISTS signals (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    sent_at REAL NOT NULL
+);
+"""
+
+def get_state_dir() -> str:
+    """Return (and create) the first writable runtime directory."""
+    global _state_dir
+    if _state_dir is None:
+        override = os.environ.get('RPI_CAM_SHARED_STATE_DIR')
+        for candidate in ((override,) if override else SHARED_STATE_DIRS):
+            try:
+                os.makedirs(candidate, mode=0o700, exist_ok=True)
+                if os.access(candidate, os.W_OK):
+                    _state_dir = candidate
+                    break
+            except OSError:
+                continue
+        else:
+            raise OSError("no writable directory for shared state")
+    return _state_dir
+
+def _get_conn() -> sqlite3.Connection:
+    """One connection per thread (and per process: never reused across fork)."""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and _db_local.pid == os.getpid():
+        return conn
+    path = os.path.join(get_state_dir(), SHARED_STATE_DB_NAME)
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")  # tmpfs, state is rebuilt on restart
+    conn.executescript(SCHEMA_SQL)
+    _db_local.conn = conn
+    _db_local.pid = os.getpid()
+    return conn
+
+def _execute(sql: str, params: tuple = (), default=None, fetch: str = None):
+    """Run one statement; on error count it, drop the connection and return default."""
+    try:
+        cursor = _get_conn().execute(sql, params)
+        if fetch == 'one':
+            return cursor.fetchone()
+        if fetch == 'all':
+            return cursor.fetchall()
+        return cursor
+    except (sqlite3.Error, OSError) as e:
+        return _execute_failed(e, default)
+
+def _execute_failed(error: Exception, default):
+    """Count a store error (logged once), drop the thread's connection, return default."""
+    with _stats_lock:
+        _stats['errors'] += 1
+        first = _stats['errors'] == 1
+    if first:
+        print(f"[SharedState] Store unavailable, using local state: {error}")
+    _db_local.conn = None
+    return default
+
+def _transaction(fn: Callable[[sqlite3.Connection], Any], default=None):
+    """Run fn(conn) in one write transaction (read-modify-write without RETURNING)."""
+    try:
+        conn = _get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    except (sqlite3.Error, OSError) as e:
+        return _execute_failed(e, default)
+
+# ============================================================================
+# KEY/VALUE STORE
+# ============================================================================
+
+_MISSING = object()
+
+def get(key: str, default: Any = None) -> Any:
+    """
+    Get a JSON value from the shared store.
+
+    Args:
+        key: Key name (namespaced by the caller, e.g. 'i18n:fr')
+        default: Returned if the key is missing, expired or unreadable
+
+    Returns:
+        Stored value or default
+    """
+    row = _execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,), fetch='one')
+    found = row is not None and (row[1] is None or row[1] > time.time())
+    with _stats_lock:
+        _stats['hits' if found else 'misses'] += 1
+    if not found:
+        return default
+    try:
+        return json.loads(row[0])
+    except ValueError:
+        return default
+
+def set(key: str, value: Any, ttl: Optional[float] = None) -> bool:
+    """
+    Store a JSON-serializable value.
+
+    Args:
+        key: Key name
+        value: Value (must be JSON-serializable)
+        ttl: Seconds before the value expires (None = until deleted/reboot)
+
+    Returns:
+        True if stored
+    """
+    now = time.time()
+    cursor = _execute(
+        "INSERT OR REPLACE INTO kv (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+        (key, json.dumps(value, separators=(',', ':')), now + ttl if ttl else None, now)
+    )
+    return cursor is not None
+
+def delete(key: str) -> bool:
+    """Remove a key. Returns True if the store was reachable."""
+    return _execute("DELETE FROM kv WHERE key = ?", (key,)) is not None
+
+def delete_prefix(prefix: str) -> bool:
+    """Remove every key starting with prefix."""
+    return _execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)) is not None
+
+def get_or_set(key: str, factory: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+    """
+    Return the shared value for key, computing and storing it on a miss.
+
+    Two workers missing at the same time both compute the value (last write
+    wins); callers use it for deterministic values such as merged files.
+    """
+    value = get(key, _MISSING)
+    if value is _MISSING:
+        value = factory()
+        set(key, value, ttl)
+    return value
+
+def purge_expired() -> int:
+    """Delete expired keys. Returns the number of rows removed."""
+    cursor = _execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+    return cursor.rowcount if cursor is not None else 0
+
+# ============================================================================
+# COUNTERS
+# ============================================================================
+
+def get_counter(name: str) -> int:
+    """Current value of a shared counter (0 if unset or unreadable)."""
+    row = _execute("SELECT value FROM counters WHERE name = ?", (name,), fetch='one')
+    return row[0] if row else 0
+
+def incr(name: str) -> int:
+    """Atomically increment a shared counter. Returns the new value (0 on error)."""
+    def increment(conn):
+        conn.execute("INSERT INTO counters (name, value) VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+        return conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+    return _transaction(increment, default=0)
+
+# ============================================================================
+# JOB QUEUE
+# ============================================================================
+
+def push_job(queue: str, key: str, rank: int = 0) -> bool:
+    """
+    Queue a job for the leader. A key already queued keeps its best (lowest) rank.
+
+    Returns:
+        True if queued
+    """
+    cursor = _execute(
+        "INSERT INTO jobs (queue, key, rank, enqueued_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(queue, key) DO UPDATE SET rank = MIN(rank, excluded.rank)",
+        (queue, key, int(rank), time.time())
+    )
+    return cursor is not None
+
+def pop_jobs(queue: str, limit: int = 500) -> List[tuple]:
+    """
+    Take up to limit jobs (best rank first) out of a queue.
+
+    Returns:
+        List of (key, rank, enqueued_at) tuples
+    """
+    def take(conn):
+        rows = conn.execute(
+            "SELECT rowid, key, rank, enqueued_at FROM jobs WHERE queue = ? "
+            "ORDER BY rank, enqueued_at LIMIT ?", (queue, int(limit))
+        ).fetchall()
+        conn.executemany("DELETE FROM jobs WHERE rowid = ?", [(row[0],) for row in rows])
+        return [row[1:] for row in rows]
+    return _transaction(take, default=[])
+
+# ============================================================================
+# LEADER ELECTION
+# ============================================================================
+
+_election = {
+    'started': False,
+    'leader': False,
+    'pid': None,
+    'since': None,
+    'lock_fd': None,
+    'on_elected': None
+}
+_election_lock = threading.Lock()
+
+def _try_acquire() -> bool:
+    """Take the leader lock without blocking."""
+    path = os.path.join(get_state_dir(), LEADER_LOCK_NAME)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    _election.update(leader=True, pid=os.getpid(), since=time.time(), lock_fd=fd)
+    return True
+
+def is_leader() -> bool:
+    """True if this process holds the leader lock (or no election is running)."""
+    if not _election['started']:
+        return True
+    return _election['leader'] and _election['pid'] == os.getpid()
+
+def is_election_running() -> bool:
+    """True if this process takes part in a leader election (multi-worker mode)."""
+    return _election['started']
+
+def is_follower() -> bool:
+    """True if an election runs in this process and another worker is the leader."""
+    return _election['started'] and not is_leader()
+
+def _become_leader():
+    print(f"[SharedState] Worker {os.getpid()} elected leader")
+    set('leader', {'pid': os.getpid(), 'since': _election['since']})
+    _start_relay()
+    callback = _election['on_elected']
+    if callback:
+        callback()
+
+def _election_loop():
+    while True:
+        time.sleep(LEADER_RETRY_INTERVAL)
+        try:
+            with _election_lock:
+                acquired = _try_acquire()
+        except OSError as e:
+            print(f"[SharedState] Leader lock error: {e}")
+            continue
+        if acquired:
+            _become_leader()
+            return
+
+def start_leader_election(on_elected: Callable[[], None]) -> bool:
+    """
+    Join the election. on_elected runs once, in the process that wins.
+
+    A process that loses keeps retrying in a daemon thread, so it takes over
+    (and runs on_elected) when the current leader exits.
+
+    Args:
+        on_elected: Callback starting the leader-only background tasks
+
+    Returns:
+        True if this process is the leader now
+    """
+    with _election_lock:
+        if _election['started'] and _election['pid'] in (None, os.getpid()):
+            return is_leader()
+        _election.update(started=True, leader=False, pid=None, on_elected=on_elected)
+        try:
+            acquired = _try_acquire()
+        except OSError as e:
+            # No runtime directory: behave as a single process
+            print(f"[SharedState] Leader election unavailable ({e}), running as leader")
+            _election['started'] = False
+            acquired = None
+    if acquired is None:
+        on_elected()
+        return True
+    if acquired:
+        _become_leader()
+        return True
+    threading.Thread(target=_election_loop, daemon=True, name='leader-election').start()
+    print(f"[SharedState] Worker {os.getpid()} is a follower")
+    return False
+
+# ============================================================================
+# SIGNALS AND PUBLISHED SNAPSHOTS (relay thread of the leader)
+# ============================================================================
+
+_signal_handlers: Dict[str, Callable[[], None]] = {}
+_publishers: Dict[str, tuple] = {}
+_relay = {'thread': None, 'published_at': {}}
+
+def register_signal(name: str, handler: Callable[[], None]):
+    """Register a leader-side callback run when any worker calls send_signal(name)."""
+    _signal_handlers[name] = handler
+
+def send_signal(name: str) -> bool:
+    """
+    Ask the leader to run the handler registered for name.
+
+    The leader (or a single process) runs it directly; a follower appends it
+    to the signals log, applied in order by the leader's relay thread within
+    RELAY_POLL_INTERVAL.
+
+    Returns:
+        True if the handler ran or the signal was queued
+    """
+    if is_leader():
+        handler = _signal_handlers.get(name)
+        if handler:
+            handler()
+            return True
+        return False
+    return _execute("INSERT INTO signals (name, sent_at) VALUES (?, ?)", (name, time.time())) is not None
+
+def _pending_signals(after: int) -> List[tuple]:
+    """(seq, name) of the signals logged after seq, oldest first; the older ones are deleted."""
+    def take(conn):
+        rows = conn.execute("SELECT seq, name FROM signals WHERE seq > ? ORDER BY seq", (after,)).fetchall()
+        conn.execute("DELETE FROM signals WHERE seq <= ?", (rows[-1][0] if rows else after,))
+        return rows
+    return _transaction(take, default=[])
+
+def register_publisher(key: str, producer: Callable[[], Any], interval: float = 5.0):
+    """
+    Have the leader store producer() under key every interval seconds.
+
+    Followers read it with get(key); a snapshot older than 3 intervals expires,
+    so a dead leader does not leave stale state behind.
+    """
+    _publishers[key] = (producer, interval)
+
+def publish_now(key: str):
+    """Refresh one published snapshot immediately (leader of an election only)."""
+    if key in _publishers and _election['started'] and is_leader():
+        producer, interval = _publishers[key]
+        try:
+            set(key, producer(), ttl=interval * 3)
+        except Exception as e:
+            print(f"[SharedState] Publisher {key} failed: {e}")
+        _relay['published_at'][key] = time.monotonic()
+
+def _relay_loop():
+    last_purge = time.monotonic()
+    # The log outlives the leader (tmpfs): only signals sent after this relay
+    # started are for it (no stale stop_heartbeat replayed after a failover).
+    row = _execute("SELECT MAX(seq) FROM signals", fetch='one')
+    last_seq = row[0] if row and row[0] is not None else 0
+    while is_leader():
+        previous = None
+        for seq, name in _pending_signals(last_seq):
+            last_seq = seq
+            handler = _signal_handlers.get(name)
+            if handler is None or name == previous:
+                continue
+            previous = name
+            try:
+                handler()
+            except Exception as e:
+                print(f"[SharedState] Signal {name} handler failed: {e}")
+        now = time.monotonic()
+        for key, (_producer, interval) in list(_publishers.items()):
+            if now - _relay['published_at'].get(key, 0) >= interval:
+                publish_now(key)
+        if now - last_purge >= EXPIRED_PURGE_INTERVAL:
+            purge_expired()
+            last_purge = now
+        time.sleep(RELAY_POLL_INTERVAL)
+
+def _start_relay():
+    if _relay['thread'] is None or not _relay['thread'].is_alive():
+        _relay['thread'] = threading.Thread(target=_relay_loop, daemon=True, name='shared-state-relay')
+        _relay['thread'].start()
+
+# ============================================================================
+# STATUS
+# ============================================================================
+
+def get_shared_state_status() -> Dict[str, Any]:
+    """Election role, store location and hit/miss counters of this worker."""
+    row = _execute("SELECT COUNT(*) FROM kv", fetch='one')
+    jobs = _execute("SELECT COUNT(*) FROM jobs", fetch='one')
+    signals = _execute("SELECT COUNT(*) FROM signals", fetch='one')
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    try:
+        directory = get_state_dir()
+    except OSError:
+        directory = None
+    return {
+        'pid': os.getpid(),
+        'election_started': _election['started'],
+        'is_leader': is_leader(),
+        'leader': get('leader') if _election['started'] else None,
+        'state_dir': directory,
+        'keys': row[0] if row else None,
+        'pending_jobs': jobs[0] if jobs else None,
+        'pending_signals': signals[0] if signals else None,
+        'hits': stats['hits'],
+        'misses': stats['misses'],
+        'hit_ratio': round(stats['hits'] / lookups, 3) if lookups else None,
+        'errors': stats['errors'],
+        'signals': sorted(_signal_handlers),
+        'publishers': sorted(_publishers)
+    }
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot Service - Latest JPEG cache fed by the running video pipeline
+Version: 1.0.2
+
+/api/video/snapshot (and the ONVIF GetSnapshotUri that NVRs poll every few
+seconds) is served from memory instead of spawning fswebcam/ffmpeg on the
+camera device, which fails or steals the device while the RTSP server owns it:
+1. The first request starts a feeder thread that keeps the latest JPEG:
+   - CSI camera: GET /snapshot.jpg on the CSI RTSP server control API
+     (Picamera2 capture while the H.264 encoder keeps running),
+   - otherwise: a low-rate subscription to the shared preview hub, decoding
+     the local RTSP stream (or the camera device when the RTSP service is stopped)
+2. The cache is refreshed at most SNAPSHOT_MAX_FPS times per second
+3. Requests return the cached JPEG immediately with an ETag (If-None-Match -> 304)
+4. The feeder stops SNAPSHOT_IDLE_TIMEOUT seconds after the last request
+5. Multi-worker (Gunicorn): only the leader worker runs the feeder and writes
+   each frame to SNAPSHOT_SHARED_FILE in the shared state directory (tmpfs);
+   followers signal the leader that snapshots are wanted and serve that file
+
+Changes in 1.0.2:
+- Feeder in the leader worker only: followers read the latest JPEG from a
+  tmpfs file (ETag from its content, captured_at from its mtime) instead of
+  starting a second preview hub decoder per worker
+
+Changes in 1.0.1:
+- Frames are considered stalled after three feed intervals (at least
+  SNAPSHOT_MAX_AGE seconds) so low SNAPSHOT_MAX_FPS values still serve cached frames
+"""
+
+import hashlib
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Optional, Dict, Any
+
+from .preview_service import get_preview_hub
+from . import shared_state_service as shared_state
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SNAPSHOT_MAX_FPS_DEFAULT = 1.0  # config.env SNAPSHOT_MAX_FPS
+SNAPSHOT_WIDTH = 1280
+SNAPSHOT_HEIGHT = 720
+SNAPSHOT_IDLE_TIMEOUT = 60.0  # seconds without requests before the feeder stops
+SNAPSHOT_WAIT_TIMEOUT = 8.0  # cold start: time allowed for the first frame
+SNAPSHOT_MAX_AGE = 10.0  # minimum age of a frame not served anymore (feeder stalled)
+CSI_SNAPSHOT_URL = 'http://127.0.0.1:8085/snapshot.jpg'
+CSI_RETRY_INTERVAL = 30.0  # seconds before trying the CSI API again after a failure
+
+# Multi-worker: frames shared by the leader through the state directory (tmpfs)
+SNAPSHOT_SHARED_FILE = 'snapshot.jpg'
+SNAPSHOT_SOURCE_KEY = 'snapshot:source'
+SNAPSHOT_SIGNAL = 'snapshot:request'
+SNAPSHOT_SIGNAL_INTERVAL = SNAPSHOT_IDLE_TIMEOUT / 3  # follower keep-alive of the leader's feeder
+SNAPSHOT_SHARED_POLL = 0.1  # seconds between reads of the shared file while waiting
+
+# ============================================================================
+# SNAPSHOT CACHE
+# ============================================================================
+
+def get_snapshot_max_fps(config) -> float:
+    """SNAPSHOT_MAX_FPS from config.env, clamped to 0.1-10."""
+    try:
+        return max(0.1, min(10.0, float(config.get('SNAPSHOT_MAX_FPS') or SNAPSHOT_MAX_FPS_DEFAULT)))
+    except (TypeError, ValueError):
+        return SNAPSHOT_MAX_FPS_DEFAULT
+
+def get_snapshot_max_age(max_fps: float) -> float:
+    """Age beyond which a cached frame means a stalled feeder: three feed intervals."""
+    return max(SNAPSHOT_MAX_AGE, 3.0 / max_fps)
+
+def _resolve_pipeline_source(config):
+    """
+    Pick the preview hub input for snapshots.
+
+    Returns:
+        (source_type, rtsp_url, device) - source_type None if no camera
+    """
+    from .config_service import get_service_status
+
+    status = get_service_status()
+    if isinstance(status, dict) and status.get('status') == 'active':
+        rtsp_port = config.get('RTSP_PORT', '8554')
+        rtsp_path = config.get('RTSP_PATH', 'stream')
+        rtsp_user = config.get('RTSP_USER', '')
+        rtsp_pass = config.get('RTSP_PASSWORD', '')
+        auth = f"{rtsp_user}:{rtsp_pass}@" if rtsp_user and rtsp_pass else ''
+        return 'rtsp', f"rtsp://{auth}127.0.0.1:{rtsp_port}/{rtsp_path}", None
+
+    from .camera_service import find_camera_device
+    device = find_camera_device()
+    return ('camera', None, device) if device else (None, None, None)
+
+class SnapshotCache:
+    """Latest JPEG of the camera, refreshed by a feeder thread while requested."""
+
+    def __init__(self, config_loader=None, fetch_csi=None, hub=None):
+        if config_loader is None:
+            from .config_service import get_config_snapshot
+            config_loader = get_config_snapshot
+        self._load_config = config_loader
+        self._fetch_csi = fetch_csi or self._fetch_csi_snapshot
+        self._hub = hub
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._etag = None
+        self._captured_at = 0.0  # time.time()
+        self._captured_mono = 0.0  # time.monotonic()
+        self._last_request = 0.0
+        self._feeder = None
+        self._source = None
+        self._csi_failed_at = None
+        self._shared = None  # follower: (mtime_ns, size, frame dict) of the last file read
+        self._shared_source = None  # leader: source stored under SNAPSHOT_SOURCE_KEY
+        self._signalled_at = None  # follower: time.monotonic() of the last leader signal
+        self.stats = {'requests': 0, 'served_cached': 0, 'waited': 0, 'unavailable': 0,
+                      'frames': 0, 'feeder_starts': 0, 'served_shared': 0}
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+
+    def get(self, timeout: float = SNAPSHOT_WAIT_TIMEOUT) -> Dict[str, Any]:
+        """
+        Latest snapshot, waiting for the first frame after a cold start.
+
+        Returns:
+            dict: {success, jpeg, etag, captured_at, age, source} or {success: False, message}
+        """
+        deadline = time.monotonic() + timeout
+        max_age = get_snapshot_max_age(get_snapshot_max_fps(self._load_config()))
+        if shared_state.is_follower():
+            try:
+                return self._get_from_leader(deadline, max_age)
+            except OSError as e:
+                print(f"[Snapshot] Shared snapshot unavailable, feeding locally: {e}")
+        with self._cond:
+            self.stats['requests'] += 1
+            self._last_request = time.monotonic()
+            started = self._ensure_feeder()
+
+            waited = False
+            while self._jpeg is None or time.monotonic() - self._captured_mono > max_age:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['unavailable'] += 1
+                    return {'success': False, 'message': 'No snapshot available (camera or stream not running)'}
+                if not self._feeder.is_alive():
+                    # Feeder went idle just before this request, or found no source
+                    if started:
+                        self.stats['unavailable'] += 1
+                        return {'success': False, 'message': 'No snapshot available (camera or stream not running)'}
+                    started = self._ensure_feeder()
+                waited = True
+                self._cond.wait(remaining)
+
+            self.stats['waited' if waited else 'served_cached'] += 1
+            return {
+                'success': True,
+                'jpeg': self._jpeg,
+                'etag': self._etag,
+                'captured_at': self._captured_at,
+                'age': round(time.monotonic() - self._captured_mono, 3),
+                'source': self._source
+            }
+
+    def keep_alive(self):
+        """A follower served a snapshot: keep (or start) the feeder as if requested here."""
+        with self._cond:
+            self._last_request = time.monotonic()
+            self._ensure_feeder()
+
+    def _get_from_leader(self, deadline: float, max_age: float) -> Dict[str, Any]:
+        """Follower: latest frame written by the leader's feeder, waiting for a fresh one."""
+        with self._cond:
+            self.stats['requests'] += 1
+        waited = False
+        while True:
+            frame = self._read_shared()
+            fresh = frame is not None and time.time() - frame['captured_at'] <= max_age
+            now = time.monotonic()
+            if self._signalled_at is None or now - self._signalled_at >= SNAPSHOT_SIGNAL_INTERVAL \
+                    or (not fresh and not waited):
+                shared_state.send_signal(SNAPSHOT_SIGNAL)
+                self._signalled_at = now
+            if fresh:
+                break
+            if now >= deadline:
+                with self._cond:
+                    self.stats['unavailable'] += 1
+                return {'success': False, 'message': 'No snapshot available (camera or stream not running)'}
+            waited = True
+            time.sleep(min(SNAPSHOT_SHARED_POLL, max(0.0, deadline - now)))
+
+        with self._cond:
+            self.stats['served_shared'] += 1
+            self.stats['waited' if waited else 'served_cached'] += 1
+        return {
+            **frame,
+            'success': True,
+            'age': round(max(0.0, time.time() - frame['captured_at']), 3)
+        }
+
+    @staticmethod
+    def _shared_path() -> str:
+        return os.path.join(shared_state.get_state_dir(), SNAPSHOT_SHARED_FILE)
+
+    def _read_shared(self) -> Optional[Dict[str, Any]]:
+        """Frame of the shared file, re-read and re-hashed only when it changed."""
+        try:
+            st = os.stat(self._shared_path())
+        except FileNotFoundError:
+            return None
+        if self._shared and self._shared[:2] == (st.st_mtime_ns, st.st_size):
+            return self._shared[2]
+        try:
+            with open(self._shared_path(), 'rb') as f:
+                jpeg = f.read()
+        except FileNotFoundError:
+            return None
+        frame = {
+            'jpeg': jpeg,
+            'etag': hashlib.blake2b(jpeg, digest_size=8).hexdigest(),
+            'captured_at': st.st_mtime,
+            'source': shared_state.get(SNAPSHOT_SOURCE_KEY)
+        }
+        self._shared = (st.st_mtime_ns, st.st_size, frame)
+        return frame
+
+    def _write_shared(self, jpeg: bytes, source: str):
+        """Leader: replace the shared file atomically (followers never read a partial JPEG)."""
+        try:
+            path = self._shared_path()
+            if source != self._shared_source:
+                shared_state.set(SNAPSHOT_SOURCE_KEY, source)
+                self._shared_source = source
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(jpeg)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[Snapshot] Cannot share snapshot: {e}")
+
+    def _ensure_feeder(self) -> bool:
+        """Start the feeder thread if needed (caller holds the lock). Returns True if started."""
+        if self._feeder is not None and self._feeder.is_alive():
+            return False
+        self._feeder = threading.Thread(target=self._feed, daemon=True, name='snapshot-feeder')
+        self._feeder.start()
+        self.stats['feeder_starts'] += 1
+        return True
+
+    def publish(self, jpeg: bytes, source: str):
+        """Store a new frame and wake up waiting requests."""
+        etag = hashlib.blake2b(jpeg, digest_size=8).hexdigest()
+        with self._cond:
+            self._jpeg = jpeg
+            self._etag = etag
+            self._captured_at = time.time()
+            self._captured_mono = time.monotonic()
+            self._source = source
+            self.stats['frames'] += 1
+            self._cond.notify_all()
+        if shared_state.is_election_running():
+            self._write_shared(jpeg, source)
+
+    def _idle(self) -> bool:
+        return time.monotonic() - self._last_request > SNAPSHOT_IDLE_TIMEOUT
+
+    # ------------------------------------------------------------------
+    # Feeder
+    # ------------------------------------------------------------------
+
+    def _feed(self):
+        """Refresh the cache until nobody asked for a snapshot for SNAPSHOT_IDLE_TIMEOUT."""
+        try:
+            while not self._idle():
+                config = self._load_config()
+                interval = 1.0 / get_snapshot_max_fps(config)
+                if self._feed_from_csi(config, interval):
+                    continue
+                if not self._feed_from_pipeline(config, interval):
+                    return
+        except Exception as e:
+            print(f"[Snapshot] Feeder error: {e}")
+        finally:
+            with self._cond:
+                self._cond.notify_all()
+
+    def _feed_from_csi(self, config, interval) -> bool:
+        """Poll the CSI server snapshot endpoint. Returns False if it is not usable."""
+        camera_type = (config.get('CAMERA_TYPE') or '').lower()
+        if camera_type not in ('csi', 'auto', ''):
+            return False
+        if self._csi_failed_at and time.monotonic() - self._csi_failed_at < CSI_RETRY_INTERVAL:
+            return False
+        polled = False
+        while not self._idle():
+            started = time.monotonic()
+            jpeg = self._fetch_csi()
+            if not jpeg:
+                self._csi_failed_at = time.monotonic()
+                return polled
+            polled = True
+            self.publish(jpeg, 'csi')
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        return True
+
+    @staticmethod
+    def _fetch_csi_snapshot() -> Optional[bytes]:
+        try:
+            with urllib.request.urlopen(CSI_SNAPSHOT_URL, timeout=3) as response:
+                if response.status == 200:
+                    return response.read()
+        except (urllib.error.URLError, OSError):
+            pass
+        return None
+
+    def _feed_from_pipeline(self, config, interval) -> bool:
+        """
+        Keep the newest preview hub frame, at most one per interval.
+
+        Returns:
+            False if there is no source or the decoder ended without any frame
+        """
+        source_type, rtsp_url, device = _resolve_pipeline_source(config)
+        if source_type is None:
+            return False
+        hub = self._hub or get_preview_hub()
+        fps = max(1, int(round(1.0 / interval)))
+        try:
+            subscription = hub.subscribe(source_type, rtsp_url, device, SNAPSHOT_WIDTH, SNAPSHOT_HEIGHT, fps)
+        except OSError as e:
+            print(f"[Snapshot] Cannot start {source_type} decoder: {e}")
+            return False
+        frames = 0
+        try:
+            last_published = 0.0
+            for frame in subscription:
+                frames += 1
+                if time.monotonic() - last_published >= interval:
+                    self.publish(frame, source_type)
+                    last_published = time.monotonic()
+                if self._idle():
+                    break
+        finally:
+            subscription.close()
+        return frames > 0
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'feeder_running': bool(self._feeder and self._feeder.is_alive()),
+                'source': self._source,
+                'age': round(time.monotonic() - self._captured_mono, 1) if self._jpeg else None,
+                'size': len(self._jpeg) if self._jpeg else 0,
+                **self.stats
+            }
+
+# Global cache instance
+_snapshot_cache = None
+_snapshot_cache_lock = threading.Lock()
+
+def get_snapshot_cache() -> SnapshotCache:
+    """Get or create the global snapshot cache."""
+    global _snapshot_cache
+    with _snapshot_cache_lock:
+        if _snapshot_cache is None:
+            _snapshot_cache = SnapshotCache()
+        return _snapshot_cache
+
+# Leader side of the multi-worker setup (only used once an election runs)
+shared_state.register_signal(SNAPSHOT_SIGNAL, lambda: get_snapshot_cache().keep_alive())
@@ -0,0 +1,594 @@
+# -*- coding: utf-8 -*-
+"""
+System Health Service - Fork-free health primitives for the watchdog and status pages
+Version: 1.0.0
+
+Replaces the shell commands run on every watchdog iteration and status poll
+(`systemctl is-active` + `systemctl show` per service, `ss | grep`,
+`pgrep -f`, `v4l2-ctl --info` / `rpicam-hello --list-cameras`):
+- systemd units: org.freedesktop.systemd1 properties over the system D-Bus
+  socket (minimal stdlib client, one persistent connection, all the property
+  reads of a sweep pipelined in a single round trip),
+- listening sockets: /proc/net/tcp and /proc/net/tcp6,
+- processes: /proc/<pid>/cmdline and /proc/<pid>/stat,
+- cameras: VIDIOC_QUERYCAP ioctl on /dev/video* (+ sensor name from sysfs).
+
+Every function returns None (or raises SystemBusError for D-Bus) when the
+information is not available so that callers fall back to the commands.
+
+Stdlib only.
+"""
+
+import fcntl
+import functools
+import os
+import re
+import socket
+import struct
+import threading
+import time
+from typing import Optional, Dict, Any, List, Iterable
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SYSTEM_BUS_SOCKET = '/run/dbus/system_bus_socket'
+DBUS_TIMEOUT = 2.0
+DBUS_RETRY_INTERVAL = 60.0  # seconds before trying the bus again after a failure
+SYSTEMD_BUS_NAME = 'org.freedesktop.systemd1'
+SYSTEMD_UNIT_PATH = '/org/freedesktop/systemd1/unit/'
+SYSTEMD_UNIT_IFACE = 'org.freedesktop.systemd1.Unit'
+SYSTEMD_SERVICE_IFACE = 'org.freedesktop.systemd1.Service'
+DBUS_PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+SYSTEMD_UINT64_UNSET = (1 << 64) - 1  # MemoryCurrent without memory accounting
+
+PROC_NET_TCP = ('/proc/net/tcp', '/proc/net/tcp6')
+TCP_LISTEN_STATE = '0A'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+VIDIOC_QUERYCAP = 0x80685600  # _IOR('V', 0, struct v4l2_capability)
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_VIDEO_CAPTURE_MPLANE = 0x00001000
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+CSI_RECEIVER_DRIVERS = ('unicam', 'rp1-cfe')
+NON_CAMERA_DRIVERS = ('bcm2835-isp', 'bcm2835-codec', 'pispbe', 'rpivid', 'hevc-dec')
+
+# ============================================================================
+# D-BUS (systemd unit state)
+# ============================================================================
+
+class SystemBusError(Exception):
+    """D-Bus connection, authentication or method call failure."""
+
+_ALIGNMENT = {'y': 1, 'b': 4, 'n': 2, 'q': 2, 'i': 4, 'u': 4, 'x': 8, 't': 8, 'd': 8, 'h': 4,
+              's': 4, 'o': 4, 'g': 1, 'a': 4, '(': 8, '{': 8, 'v': 1}
+_FIXED_FORMATS = {'y': 'B', 'b': 'I', 'n': 'h', 'q': 'H', 'i': 'i', 'u': 'I', 'x': 'q', 't': 'Q',
+                  'd': 'd', 'h': 'I'}
+
+def _type_end(signature: str, pos: int) -> int:
+    """Index after the single complete type starting at signature[pos]."""
+    code = signature[pos]
+    if code == 'a':
+        return _type_end(signature, pos + 1)
+    if code in '({':
+        close = ')' if code == '(' else '}'
+        pos += 1
+        while signature[pos] != close:
+            pos = _type_end(signature, pos)
+        return pos + 1
+    return pos + 1
+
+@functools.lru_cache(maxsize=64)
+def _split_signature(signature: str) -> tuple:
+    types, pos = [], 0
+    while pos < len(signature):
+        end = _type_end(signature, pos)
+        types.append(signature[pos:end])
+        pos = end
+    return tuple(types)
+
+class _Marshaller:
+    """D-Bus wire format writer (little endian)."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def align(self, boundary: int):
+        self.buffer += b'\x00' * (-len(self.buffer) % boundary)
+
+    def write(self, signature: str, value):
+        code = signature[0]
+        if code in _FIXED_FORMATS:
+            self.align(_ALIGNMENT[code])
+            self.buffer += struct.pack('<' + _FIXED_FORMATS[code], int(value) if code == 'b' else value)
+        elif code in 'so':
+            data = value.encode('utf-8')
+            self.align(4)
+            self.buffer += struct.pack('<I', len(data)) + data + b'\x00'
+        elif code == 'g':
+            data = value.encode('ascii')
+            self.buffer += bytes([len(data)]) + data + b'\x00'
+        elif code == 'v':
+            inner_signature, inner_value = value
+            self.write('g', inner_signature)
+            self.write(inner_signature, inner_value)
+        elif code == 'a':
+            element = signature[1:]
+            self.align(4)
+            length_at = len(self.buffer)
+            self.buffer += b'\x00\x00\x00\x00'
+            self.align(_ALIGNMENT[element[0]])
+            start = len(self.buffer)
+            items = value.items() if element[0] == '{' else value
+            for item in items:
+                self.write(element, item)
+            struct.pack_into('<I', self.buffer, length_at, len(self.buffer) - start)
+        elif code in '({':
+            self.align(8)
+            for field_signature, field in zip(_split_signature(signature[1:-1]), value):
+                self.write(field_signature, field)
+        else:
+            raise SystemBusError(f'Unsupported D-Bus type: {signature}')
+
+class _Unmarshaller:
+    """D-Bus wire format reader (either endianness)."""
+
+    def __init__(self, data: bytes, pos: int = 0, endian: str = '<'):
+        self.data = data
+        self.pos = pos
+        self.endian = endian
+
+    def align(self, boundary: int):
+        self.pos += -self.pos % boundary
+
+    def read(self, signature: str):
+        code = signature[0]
+        if code in _FIXED_FORMATS:
+            self.align(_ALIGNMENT[code])
+            fmt = self.endian + _FIXED_FORMATS[code]
+            value = struct.unpack_from(fmt, self.data, self.pos)[0]
+            self.pos += struct.calcsize(fmt)
+            return bool(value) if code == 'b' else value
+        if code in 'so':
+            self.align(4)
+            length = struct.unpack_from(self.endian + 'I', self.data, self.pos)[0]
+            value = self.data[self.pos + 4:self.pos + 4 + length].decode('utf-8', 'replace')
+            self.pos += 5 + length
+            return value
+        if code == 'g':
+            length = self.data[self.pos]
+            value = self.data[self.pos + 1:self.pos + 1 + length].decode('ascii')
+            self.pos += 2 + length
+            return value
+        if code == 'v':
+            return self.read(self.read('g'))
+        if code == 'a':
+            element = signature[1:]
+            self.align(4)
+            length = struct.unpack_from(self.endian + 'I', self.data, self.pos)[0]
+            self.pos += 4
+            self.align(_ALIGNMENT[element[0]])
+            end = self.pos + length
+            items = []
+            while self.pos < end:
+                items.append(self.read(element))
+            return dict(items) if element[0] == '{' else items
+        if code in '({':
+            self.align(8)
+            return tuple(self.read(field) for field in _split_signature(signature[1:-1]))
+        raise SystemBusError(f'Unsupported D-Bus type: {signature}')
+
+    def read_all(self, signature: str) -> tuple:
+        return tuple(self.read(field) for field in _split_signature(signature))
+
+# Message types and header fields
+DBUS_METHOD_CALL = 1
+DBUS_METHOD_RETURN = 2
+DBUS_ERROR = 3
+DBUS_SIGNAL = 4
+_HEADER_FIELDS = {1: 'path', 2: 'interface', 3: 'member', 4: 'error_name', 5: 'reply_serial',
+                  6: 'destination', 7: 'sender', 8: 'signature'}
+_HEADER_CODES = {name: (code, 'o' if name == 'path' else 'u' if name == 'reply_serial'
+                        else 'g' if name == 'signature' else 's')
+                 for code, name in _HEADER_FIELDS.items()}
+
+def encode_message(message_type: int, serial: int, body_signature: str = '', body: Iterable = (),
+                   **fields) -> bytes:
+    """
+    Encode a D-Bus message.
+
+    Args:
+        message_type: DBUS_METHOD_CALL, DBUS_METHOD_RETURN, ...
+        serial: message serial (non-zero)
+        body_signature: signature of the body arguments
+        body: body arguments
+        **fields: header fields (path, interface, member, destination, reply_serial, ...)
+    """
+    payload = _Marshaller()
+    for field_signature, value in zip(_split_signature(body_signature), body):
+        payload.write(field_signature, value)
+    if body_signature:
+        fields['signature'] = body_signature
+
+    header = _Marshaller()
+    header.buffer += struct.pack('<cBBBII', b'l', message_type, 0, 1, len(payload.buffer), serial)
+    header.write('a(yv)', [(_HEADER_CODES[name][0], (_HEADER_CODES[name][1], value))
+                           for name, value in fields.items() if value is not None])
+    header.align(8)
+    return bytes(header.buffer + payload.buffer)
+
+@functools.lru_cache(maxsize=256)
+def _encode_method_call(destination, path, interface, member, signature, args) -> bytes:
+    """Method call with serial 0 (patched at offset 8): a sweep repeats the same calls."""
+    return encode_message(DBUS_METHOD_CALL, 0, signature, args, path=path, interface=interface,
+                          member=member, destination=destination)
+
+class SystemBus:
+    """Minimal D-Bus client: EXTERNAL auth, pipelined method calls, no signals."""
+
+    def __init__(self, address: Optional[str] = None, timeout: float = DBUS_TIMEOUT):
+        self.address = address or os.environ.get('DBUS_SYSTEM_BUS_ADDRESS') or f'unix:path={SYSTEM_BUS_SOCKET}'
+        self.timeout = timeout
+        self.unique_name = None
+        self._sock = None
+        self._buffer = bytearray()
+        self._serial = 0
+
+    def _socket_address(self):
+        for part in self.address.split(';'):
+            transport, _, params = part.partition(':')
+            if transport != 'unix':
+                continue
+            options = dict(p.split('=', 1) for p in params.split(',') if '=' in p)
+            if 'path' in options:
+                return options['path']
+            if 'abstract' in options:
+                return '\0' + options['abstract']
+        raise SystemBusError(f'Unsupported D-Bus address: {self.address}')
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self._socket_address())
+            uid = str(os.getuid()).encode('ascii').hex()
+            sock.sendall(b'\x00AUTH EXTERNAL ' + uid.encode('ascii') + b'\r\n')
+            reply = b''
+            while not reply.endswith(b'\r\n'):
+                chunk = sock.recv(256)
+                if not chunk:
+                    raise SystemBusError('D-Bus closed during authentication')
+                reply += chunk
+            if not reply.startswith(b'OK '):
+                raise SystemBusError(f'D-Bus authentication refused: {reply.strip().decode(errors="replace")}')
+            sock.sendall(b'BEGIN\r\n')
+        except (OSError, SystemBusError):
+            sock.close()
+            raise
+        self._sock = sock
+        self._buffer = bytearray()
+        self.unique_name = self.call('org.freedesktop.DBus', '/org/freedesktop/DBus',
+                                     'org.freedesktop.DBus', 'Hello')[0]
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def next_serial(self) -> int:
+        self._serial = self._serial % 0xFFFFFFFF + 1
+        return self._serial
+
+    def send(self, data: bytes):
+        self._sock.sendall(data)
+
+    def read_message(self) -> Dict[str, Any]:
+        """Next message: {type, serial, fields..., body (tuple)}."""
+        while True:
+            if len(self._buffer) >= 16:
+                endian = '<' if self._buffer[0:1] == b'l' else '>'
+                body_length, serial, fields_length = struct.unpack_from(endian + 'III', self._buffer, 4)
+                header_length = 16 + fields_length + (-(16 + fields_length) % 8)
+                total = header_length + body_length
+                if len(self._buffer) >= total:
+                    data = bytes(self._buffer[:total])
+                    del self._buffer[:total]
+                    break
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                raise SystemBusError('D-Bus connection closed')
+            self._buffer += chunk
+
+        reader = _Unmarshaller(data, 12, endian)
+        message = {'type': data[1], 'serial': serial}
+        for code, value in reader.read('a(yv)'):
+            if code in _HEADER_FIELDS:
+                message[_HEADER_FIELDS[code]] = value
+        signature = message.get('signature', '')
+        message['body'] = _Unmarshaller(data, header_length, endian).read_all(signature) if signature else ()
+        return message
+
+    def call_many(self, calls: List[tuple]) -> List[Any]:
+        """
+        Send several method calls at once and collect the replies.
+
+        Args:
+            calls: (destination, path, interface, member, signature, args) tuples
+
+        Returns:
+            list: reply body tuple per call, or a SystemBusError instance for error replies
+        """
+        if self._sock is None:
+            self.connect()
+        pending = {}
+        data = bytearray()
+        for index, call in enumerate(calls):
+            serial = self.next_serial()
+            pending[serial] = index
+            offset = len(data)
+            data += _encode_method_call(*call)
+            struct.pack_into('<I', data, offset + 8, serial)
+        results = [None] * len(calls)
+        try:
+            self.send(bytes(data))
+            while pending:
+                message = self.read_message()
+                index = pending.pop(message.get('reply_serial'), None)
+                if index is None:
+                    continue  # signal (NameAcquired, ...) or stale reply
+                if message['type'] == DBUS_ERROR:
+                    detail = message['body'][0] if message['body'] else ''
+                    results[index] = SystemBusError(f"{message.get('error_name')}: {detail}")
+                else:
+                    results[index] = message['body']
+        except (OSError, SystemBusError):
+            self.close()
+            raise
+        return results
+
+    def call(self, destination: str, path: str, interface: str, member: str,
+             signature: str = '', *args) -> tuple:
+        result = self.call_many([(destination, path, interface, member, signature, args)])[0]
+        if isinstance(result, SystemBusError):
+            raise result
+        return result
+
+def systemd_unit_path(unit: str) -> str:
+    """Object path of a unit (sd_bus label escaping: non-alphanumerics -> _xx)."""
+    escaped = ''.join(c if c.isascii() and c.isalnum() and not (i == 0 and c.isdigit()) else f'_{ord(c):02x}'
+                      for i, c in enumerate(unit))
+    return SYSTEMD_UNIT_PATH + (escaped or '_')
+
+_bus = None
+_bus_failed_at = None
+_bus_lock = threading.Lock()
+
+def _format_timestamp(usec: int) -> Optional[str]:
+    """systemctl show timestamp format ("Tue 2026-01-06 10:00:00 CET")."""
+    if not usec:
+        return None
+    return time.strftime('%a %Y-%m-%d %H:%M:%S %Z', time.localtime(usec / 1e6))
+
+def get_unit_states(units: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    ActiveState, ActiveEnterTimestamp, MainPID and MemoryCurrent of systemd units.
+
+    All property reads go out in one pipelined batch on a persistent connection.
+
+    Args:
+        units: unit names ('.service' appended when there is no suffix)
+
+    Returns:
+        dict: {unit: {active_state, since, main_pid, memory_bytes}}
+
+    Raises:
+        SystemBusError / OSError if the system bus is not reachable
+    """
+    global _bus, _bus_failed_at
+    names = [u if '.' in u else f'{u}.service' for u in units]
+    calls = []
+    for name in names:
+        path = systemd_unit_path(name)
+        for interface, prop in ((SYSTEMD_UNIT_IFACE, 'ActiveState'),
+                                (SYSTEMD_UNIT_IFACE, 'ActiveEnterTimestamp'),
+                                (SYSTEMD_SERVICE_IFACE, 'MainPID'),
+                                (SYSTEMD_SERVICE_IFACE, 'MemoryCurrent')):
+            calls.append((SYSTEMD_BUS_NAME, path, DBUS_PROPERTIES_IFACE, 'Get', 'ss', (interface, prop)))
+
+    with _bus_lock:
+        if _bus_failed_at is not None and time.monotonic() - _bus_failed_at < DBUS_RETRY_INTERVAL:
+            raise SystemBusError('System bus unavailable')
+        if _bus is None:
+            _bus = SystemBus()
+        try:
+            try:
+                replies = _bus.call_many(calls)
+            except (OSError, SystemBusError):
+                if not _bus.unique_name:
+                    raise
+                # One reconnect (dbus/systemd restarted since the last sweep)
+                _bus.unique_name = None
+                replies = _bus.call_many(calls)
+        except (OSError, SystemBusError):
+            _bus_failed_at = time.monotonic()
+            raise
+        _bus_failed_at = None
+
+    states = {}
+    for unit, offset in zip(units, range(0, len(replies), 4)):
+        values = [None if isinstance(r, SystemBusError) else r[0] for r in replies[offset:offset + 4]]
+        if values[0] is None:
+            raise replies[offset]
+        memory = values[3]
+        states[unit] = {
+            'active_state': values[0],
+            'since': _format_timestamp(values[1]),
+            'main_pid': values[2] or None,
+            'memory_bytes': memory if memory is not None and memory != SYSTEMD_UINT64_UNSET else None
+        }
+    return states
+
+# ============================================================================
+# /proc (sockets and processes)
+# ============================================================================
+
+def get_listening_ports() -> Optional[set]:
+    """TCP ports in LISTEN state (IPv4 and IPv6), None if /proc/net is not readable."""
+    ports = set()
+    readable = False
+    for path in PROC_NET_TCP:
+        try:
+            with open(path, 'r') as f:
+                next(f, None)
+                for line in f:
+                    fields = line.split(None, 4)
+                    if len(fields) > 3 and fields[3] == TCP_LISTEN_STATE:
+                        ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+            readable = True
+        except OSError:
+            continue
+    return ports if readable else None
+
+def is_port_listening(port) -> Optional[bool]:
+    """True if a TCP socket listens on port (any address), None if unknown."""
+    ports = get_listening_ports()
+    return None if ports is None else int(port) in ports
+
+def find_pids(pattern: str) -> List[int]:
+    """PIDs whose command line matches the regex pattern (pgrep -f)."""
+    regex = re.compile(pattern)
+    own_pid = os.getpid()
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == own_pid:
+            continue
+        try:
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\x00', b' ').decode('utf-8', 'replace').strip()
+        except OSError:
+            continue
+        if cmdline and regex.search(cmdline):
+            pids.append(int(entry))
+    return pids
+
+def _boot_time() -> float:
+    with open('/proc/stat', 'r') as f:
+        for line in f:
+            if line.startswith('btime '):
+                return float(line.split()[1])
+    return 0.0
+
+def read_process_stat(pid) -> Optional[Dict[str, Any]]:
+    """
+    /proc/<pid>/stat of a process.
+
+    Returns:
+        dict: {pid, name, state, ppid, cpu_seconds, rss_bytes, uptime} or None if gone
+    """
+    try:
+        with open(f'/proc/{int(pid)}/stat', 'r') as f:
+            data = f.read()
+        with open('/proc/uptime', 'r') as f:
+            system_uptime = float(f.read().split()[0])
+    except (OSError, ValueError):
+        return None
+    # comm may contain spaces and parentheses: split around the last ')'
+    name_start, name_end = data.find('('), data.rfind(')')
+    fields = data[name_end + 2:].split()
+    return {
+        'pid': int(pid),
+        'name': data[name_start + 1:name_end],
+        'state': fields[0],
+        'ppid': int(fields[1]),
+        'cpu_seconds': round((int(fields[11]) + int(fields[12])) / CLOCK_TICKS, 2),
+        'rss_bytes': int(fields[21]) * PAGE_SIZE,
+        'uptime': round(system_uptime - int(fields[19]) / CLOCK_TICKS, 1)
+    }
+
+def is_process_running(pid) -> bool:
+    """True if pid exists and is not a zombie / dead task."""
+    stat = read_process_stat(pid) if pid else None
+    return bool(stat) and stat['state'] not in ('Z', 'X', 'x')
+
+# ============================================================================
+# V4L2 (camera presence)
+# ============================================================================
+
+def query_video_devices() -> Optional[List[Dict[str, Any]]]:
+    """
+    VIDIOC_QUERYCAP of every /dev/video* node.
+
+    Returns:
+        list: [{device, driver, card, capture}] or None if /dev is not readable
+    """
+    try:
+        names = sorted((n for n in os.listdir('/dev') if re.fullmatch(r'video\d+', n)), key=lambda n: int(n[5:]))
+    except OSError:
+        return None
+    devices = []
+    for name in names:
+        device = f'/dev/{name}'
+        try:
+            fd = os.open(device, os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            continue
+        try:
+            buffer = bytearray(104)
+            fcntl.ioctl(fd, VIDIOC_QUERYCAP, buffer)
+        except OSError:
+            continue
+        finally:
+            os.close(fd)
+        driver, card = (bytes(buffer[o:o + n]).split(b'\x00', 1)[0].decode('utf-8', 'replace')
+                        for o, n in ((0, 16), (16, 32)))
+        capabilities, device_caps = struct.unpack_from('<II', buffer, 84)
+        caps = device_caps if capabilities & V4L2_CAP_DEVICE_CAPS else capabilities
+        devices.append({
+            'device': device,
+            'driver': driver,
+            'card': card,
+            'capture': bool(caps & (V4L2_CAP_VIDEO_CAPTURE | V4L2_CAP_VIDEO_CAPTURE_MPLANE))
+        })
+    return devices
+
+def _csi_sensor_name() -> Optional[str]:
+    """Sensor name from the V4L2 subdevices (e.g. 'imx708' from 'imx708 10-001a')."""
+    try:
+        entries = sorted(os.listdir('/sys/class/video4linux'))
+    except OSError:
+        return None
+    for entry in entries:
+        if not entry.startswith('v4l-subdev'):
+            continue
+        try:
+            with open(f'/sys/class/video4linux/{entry}/name', 'r') as f:
+                name = f.read().strip()
+        except OSError:
+            continue
+        if name and not re.search(r'unicam|csi2|rp1|pisp|isp', name):
+            return name.split()[0]
+    return None
+
+def detect_camera() -> Optional[Dict[str, Any]]:
+    """
+    Fork-free camera detection with the detect_camera_type result format.
+
+    Returns:
+        dict: {type: 'libcamera'|'usb'|'none', device, name, driver}, or None if
+              V4L2 nodes cannot be queried (caller falls back to detect_camera_type)
+    """
+    devices = query_video_devices()
+    if devices is None:
+        return None
+    if any(d['driver'] in CSI_RECEIVER_DRIVERS for d in devices):
+        return {'type': 'libcamera', 'device': '0', 'name': _csi_sensor_name() or 'csi', 'driver': 'libcamera'}
+    for d in devices:
+        if d['capture'] and d['driver'] not in NON_CAMERA_DRIVERS:
+            return {'type': 'usb', 'device': d['device'], 'name': d['card'] or 'Unknown', 'driver': d['driver']}
+    return {'type': 'none', 'device': None, 'name': None, 'driver': None}
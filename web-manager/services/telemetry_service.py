@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Telemetry Service - Delta-encoded Meeting heartbeats and offline sample spool
+Version: 1.0.0
+
+The heartbeat used to post the full payload every heartbeat_interval and to
+lose the cpu/memory/temperature/disk values of every beat that failed.
+
+- HeartbeatEncoder: after a full snapshot acknowledged by the server, a beat
+  only carries the fields that changed (numeric metrics beyond a small
+  tolerance), plus ip_address (the server falls back to REMOTE_ADDR when it
+  is absent) and timestamp, with "delta": true. A full snapshot is sent every
+  heartbeat_full_interval seconds, after any failed beat and when the API
+  URL / device key change.
+- TelemetrySpool: the metrics of each failed beat are appended to a bounded
+  JSON-lines file (oldest samples dropped beyond spool_max_samples). Pending
+  samples ride along the next heartbeats as one gzip-compressed columnar
+  batch ("telemetry_batch", ignored by servers that do not know it) and are
+  removed once the server acknowledged them.
+"""
+
+import base64
+import fcntl
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+from config import MEETING_TELEMETRY_SPOOL_FILE
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+FULL_SNAPSHOT_INTERVAL_DEFAULT = 600  # seconds (meeting.json heartbeat_full_interval)
+SPOOL_MAX_SAMPLES_DEFAULT = 1440  # 24 h of 60 s heartbeats (meeting.json telemetry_spool_max)
+SPOOL_BATCH_MAX = 720  # samples per heartbeat upload
+
+# Sent in every heartbeat, full or delta
+ALWAYS_SENT_FIELDS = ('ip_address', 'timestamp')
+# Informative fields that change every beat: full snapshots only
+FULL_ONLY_FIELDS = ('uptime',)
+# Changes smaller than this are not worth a delta
+DELTA_TOLERANCES = {
+    'cpu_load': 0.05,
+    'memory_percent': 1.0,
+    'disk_percent': 0.5,
+    'temperature': 0.5
+}
+
+# Metrics kept while the Meeting API is unreachable
+SAMPLE_FIELDS = ('cpu_load', 'memory_percent', 'temperature', 'disk_percent')
+BATCH_ENCODING = 'gzip+base64'
+
+# ============================================================================
+# DELTA ENCODING
+# ============================================================================
+
+def _changed(field: str, value, previous) -> bool:
+    tolerance = DELTA_TOLERANCES.get(field)
+    if (tolerance is not None and isinstance(value, (int, float)) and isinstance(previous, (int, float))
+            and not isinstance(value, bool)):
+        return abs(value - previous) >= tolerance
+    return value != previous
+
+class HeartbeatEncoder:
+    """Turns full heartbeat payloads into deltas against the last acknowledged state."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._acked = None  # server-side view of the device (merged acknowledged bodies)
+        self._last_full = 0.0  # time.monotonic()
+        self._target = None
+        self.stats = {'full': 0, 'delta': 0, 'bytes_full': 0, 'bytes_delta': 0, 'resets': 0}
+
+    def encode(self, payload: Dict[str, Any], target=None, full_interval: float = FULL_SNAPSHOT_INTERVAL_DEFAULT,
+               force_full: bool = False) -> Tuple[Dict[str, Any], bool]:
+        """
+        Body to post for this heartbeat.
+
+        Args:
+            payload: complete heartbeat payload
+            target: (api_url, device_key) - a change forces a full snapshot
+            full_interval: seconds between two full snapshots
+            force_full: send a full snapshot anyway (manual heartbeat)
+
+        Returns:
+            tuple: (body, is_full)
+        """
+        with self._lock:
+            full = (force_full or self._acked is None or target != self._target
+                    or time.monotonic() - self._last_full >= full_interval)
+            if full:
+                return dict(payload), True
+            body = {k: v for k, v in payload.items()
+                    if k in ALWAYS_SENT_FIELDS
+                    or (k not in FULL_ONLY_FIELDS and (k not in self._acked or _changed(k, v, self._acked[k])))}
+            body['delta'] = True
+            return body, False
+
+    def commit(self, body: Dict[str, Any], is_full: bool, target=None, size: int = 0):
+        """Record a body the server acknowledged."""
+        with self._lock:
+            acked = {k: v for k, v in body.items() if k not in ('delta', 'telemetry_batch')}
+            if is_full or self._acked is None:
+                self._acked = acked
+                self._last_full = time.monotonic()
+                self._target = target
+            else:
+                self._acked.update(acked)
+            kind = 'full' if is_full else 'delta'
+            self.stats[kind] += 1
+            self.stats['bytes_' + kind] += size
+
+    def reset(self):
+        """Forget the acknowledged state: the next heartbeat is a full snapshot."""
+        with self._lock:
+            if self._acked is not None:
+                self.stats['resets'] += 1
+            self._acked = None
+
+# ============================================================================
+# OFFLINE SPOOL
+# ============================================================================
+
+def sample_from_payload(payload: Dict[str, Any], ts: Optional[float] = None) -> Dict[str, Any]:
+    """Metrics of a heartbeat payload as a spool sample ({'ts': epoch seconds, ...})."""
+    sample = {'ts': int(ts if ts is not None else time.time())}
+    for field in SAMPLE_FIELDS:
+        if payload.get(field) is not None:
+            sample[field] = payload[field]
+    return sample
+
+def encode_batch(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Compress spooled samples for one upload.
+
+    The data is gzip(JSON) of a columnar object, timestamps delta-encoded:
+    {"ts0": first ts, "dts": [0, 60, 60, ...], "cpu_load": [...], ...}
+    (null where a sample lacks the metric).
+
+    Args:
+        samples: spool samples, oldest first
+
+    Returns:
+        dict: {encoding, count, first_ts, last_ts, fields, data}
+    """
+    timestamps = [s['ts'] for s in samples]
+    columns = {
+        'ts0': timestamps[0],
+        'dts': [b - a for a, b in zip([timestamps[0]] + timestamps, timestamps)]
+    }
+    fields = [f for f in SAMPLE_FIELDS if any(f in s for s in samples)]
+    for field in fields:
+        columns[field] = [s.get(field) for s in samples]
+    raw = json.dumps(columns, separators=(',', ':')).encode('utf-8')
+    return {
+        'encoding': BATCH_ENCODING,
+        'count': len(samples),
+        'first_ts': timestamps[0],
+        'last_ts': timestamps[-1],
+        'fields': fields,
+        'data': base64.b64encode(gzip.compress(raw, compresslevel=9, mtime=0)).decode('ascii')
+    }
+
+def decode_batch(batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Inverse of encode_batch (reference for the receiving side)."""
+    if batch.get('encoding') != BATCH_ENCODING:
+        raise ValueError(f"Unsupported telemetry batch encoding: {batch.get('encoding')}")
+    columns = json.loads(gzip.decompress(base64.b64decode(batch['data'])))
+    samples = []
+    ts = columns['ts0']
+    for i, delta in enumerate(columns['dts']):
+        ts += delta
+        sample = {'ts': ts}
+        for field in batch['fields']:
+            if columns[field][i] is not None:
+                sample[field] = columns[field][i]
+        samples.append(sample)
+    return samples
+
+class TelemetrySpool:
+    """
+    Bounded on-disk FIFO of heartbeat samples (JSON lines).
+
+    All operations take an exclusive flock on the file: every gunicorn
+    worker can spool a failed manual heartbeat.
+    """
+
+    def __init__(self, path: str = MEETING_TELEMETRY_SPOOL_FILE, max_samples: int = SPOOL_MAX_SAMPLES_DEFAULT):
+        self.path = path
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.stats = {'spooled': 0, 'uploaded': 0, 'dropped': 0}
+
+    def _open_locked(self, mode: str):
+        f = open(self.path, mode)
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    @staticmethod
+    def _parse(lines) -> List[Dict[str, Any]]:
+        samples = []
+        for line in lines:
+            try:
+                sample = json.loads(line)
+            except ValueError:
+                continue  # torn write (power loss)
+            if isinstance(sample, dict) and isinstance(sample.get('ts'), int):
+                samples.append(sample)
+        return samples
+
+    def _rewrite(self, f, samples: List[Dict[str, Any]]):
+        """Replace the content of the locked spool file (in place: the lock stays valid)."""
+        f.seek(0)
+        f.truncate()
+        f.write(''.join(json.dumps(s, separators=(',', ':')) + '\n' for s in samples))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def append(self, sample: Dict[str, Any]) -> int:
+        """
+        Spool one sample, dropping the oldest ones beyond max_samples.
+
+        Returns:
+            int: samples pending after the append
+        """
+        line = json.dumps(sample, separators=(',', ':')) + '\n'
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with self._open_locked('a+') as f:
+                    f.write(line)
+                    f.flush()
+                    f.seek(0)
+                    content = f.read()
+                    count = content.count('\n')
+                    if count > self.max_samples:
+                        samples = self._parse(content.splitlines())
+                        self.stats['dropped'] += max(0, len(samples) - self.max_samples)
+                        samples = samples[-self.max_samples:]
+                        self._rewrite(f, samples)
+                        count = len(samples)
+                    self.stats['spooled'] += 1
+                    return count
+            except OSError as e:
+                print(f"[Telemetry] Spool write failed: {e}")
+                return 0
+
+    def peek(self, limit: int = SPOOL_BATCH_MAX) -> List[Dict[str, Any]]:
+        """Oldest pending samples (at most limit)."""
+        with self._lock:
+            try:
+                with self._open_locked('r') as f:
+                    return self._parse(f)[:limit]
+            except FileNotFoundError:
+                return []
+            except OSError as e:
+                print(f"[Telemetry] Spool read failed: {e}")
+                return []
+
+    def acknowledge(self, last_ts: int) -> int:
+        """
+        Remove the samples uploaded up to last_ts (inclusive).
+
+        Samples spooled meanwhile by another worker are kept.
+
+        Returns:
+            int: samples still pending
+        """
+        with self._lock:
+            try:
+                with self._open_locked('r+') as f:
+                    samples = self._parse(f)
+                    remaining = [s for s in samples if s['ts'] > last_ts]
+                    self.stats['uploaded'] += len(samples) - len(remaining)
+                    self._rewrite(f, remaining)
+                    return len(remaining)
+            except FileNotFoundError:
+                return 0
+            except OSError as e:
+                print(f"[Telemetry] Spool update failed: {e}")
+                return 0
+
+    def pending(self) -> int:
+        return len(self.peek(limit=None))
+
+# ============================================================================
+# GLOBAL INSTANCES
+# ============================================================================
+
+_encoder = None
+_spool = None
+_telemetry_lock = threading.Lock()
+
+def get_heartbeat_encoder() -> HeartbeatEncoder:
+    """Get or create the global heartbeat encoder."""
+    global _encoder
+    with _telemetry_lock:
+        if _encoder is None:
+            _encoder = HeartbeatEncoder()
+        return _encoder
+
+def get_telemetry_spool(max_samples: Optional[int] = None) -> TelemetrySpool:
+    """
+    Get or create the global telemetry spool.
+
+    Args:
+        max_samples: spool bound (meeting.json telemetry_spool_max), applied on every call
+    """
+    global _spool
+    with _telemetry_lock:
+        if _spool is None:
+            _spool = TelemetrySpool()
+        if max_samples:
+            _spool.max_samples = max(1, int(max_samples))
+        return _spool
+
+def get_telemetry_status() -> Dict[str, Any]:
+    """Encoder / spool counters (heartbeat preview)."""
+    spool = get_telemetry_spool()
+    return {
+        'encoder': dict(get_heartbeat_encoder().stats),
+        'spool': {'path': spool.path, 'pending': spool.pending(), 'max_samples': spool.max_samples,
+                  **spool.stats}
+    }
@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+"""
+TS Probe Service - Native MPEG-TS metadata probe (replaces ffprobe for .ts)
+Version: 1.1.0
+
+Reads a few hundred KB of a recording instead of forking ffprobe:
+- head: PAT -> PMT (video/audio streams, PCR PID), first H.264 SPS
+  (width/height/profile/level, VUI timing) and the first video PTS values
+  (frame rate from the median PTS step),
+- tail (seek to end of file): last video PTS (or PCR) for the duration.
+
+Returns the same keys as media_cache_service.extract_video_metadata so the
+result can be cached as-is. Returns None whenever the file cannot be fully
+described (not TS, codec other than H.264, no SPS, no timestamps): the caller
+then falls back to ffprobe.
+
+extract_first_idr() returns the first IDR access unit (with SPS/PPS) of a
+recording, for the long-lived thumbnail decoder of media_cache_service.
+
+Stdlib only.
+
+Changes in 1.1.0:
+- Added extract_first_idr (first complete IDR access unit, Annex B)
+"""
+
+import os
+from typing import Optional, Dict, List, Any
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+TS_EXTENSIONS = ('.ts',)
+
+PROBE_HEAD_BYTES = 512 * 1024
+PROBE_TAIL_BYTES = 256 * 1024
+
+# Bytes of each video PES scanned for the SPS (AUD/SPS/PPS precede the slice)
+SPS_SEARCH_BYTES = 4096
+# First IDR search for thumbnails (one re-read up to this size)
+IDR_SEARCH_MAX_BYTES = 4 * 1024 * 1024
+# Video PTS values collected from the head for the frame rate
+FPS_SAMPLE_FRAMES = 48
+
+PTS_CLOCK = 90000
+PTS_WRAP = 1 << 33
+
+VIDEO_STREAM_TYPES = {
+    0x01: 'mpeg1video',
+    0x02: 'mpeg2video',
+    0x10: 'mpeg4',
+    0x1B: 'h264',
+    0x24: 'hevc',
+}
+AUDIO_STREAM_TYPES = {
+    0x03: 'mp2',
+    0x04: 'mp2',
+    0x0F: 'aac',
+    0x11: 'aac_latm',
+    0x81: 'ac3',
+    0x87: 'eac3',
+}
+
+H264_PROFILES = {
+    66: 'Baseline',
+    77: 'Main',
+    88: 'Extended',
+    100: 'High',
+    110: 'High 10',
+    122: 'High 4:2:2',
+    244: 'High 4:4:4 Predictive',
+}
+# Profiles whose SPS carries chroma format / bit depth / scaling matrices
+H264_HIGH_PROFILES = (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135)
+
+# ============================================================================
+# TS PACKETS
+# ============================================================================
+
+def _find_sync(data: bytes, start: int = 0) -> int:
+    """Offset of the first packet boundary (3 consecutive sync bytes), or -1."""
+    pos = data.find(b'\x47', start)
+    while pos != -1 and pos + 2 * TS_PACKET_SIZE < len(data):
+        if data[pos + TS_PACKET_SIZE] == TS_SYNC_BYTE and data[pos + 2 * TS_PACKET_SIZE] == TS_SYNC_BYTE:
+            return pos
+        pos = data.find(b'\x47', pos + 1)
+    return -1
+
+def _iter_packets(data: bytes):
+    """
+    Yield (offset, pid, unit_start, payload_offset) for each packet.
+
+    payload_offset is -1 for packets without payload. Lost sync (truncated
+    write, corrupted packet) is recovered by searching the next boundary.
+    """
+    pos = _find_sync(data)
+    end = len(data) - TS_PACKET_SIZE
+    while 0 <= pos <= end:
+        if data[pos] != TS_SYNC_BYTE:
+            pos = _find_sync(data, pos)
+            continue
+        pid = ((data[pos + 1] & 0x1F) << 8) | data[pos + 2]
+        afc = (data[pos + 3] >> 4) & 0x03
+        payload = pos + 4
+        if afc & 0x02:
+            payload += 1 + data[pos + 4]
+        if not afc & 0x01 or payload >= pos + TS_PACKET_SIZE:
+            payload = -1
+        yield pos, pid, bool(data[pos + 1] & 0x40), payload
+        pos += TS_PACKET_SIZE
+
+def _packet_pcr(data: bytes, pos: int) -> Optional[int]:
+    """PCR base (90 kHz) carried in the adaptation field, if any."""
+    if not (data[pos + 3] & 0x20) or data[pos + 4] < 7 or not (data[pos + 5] & 0x10):
+        return None
+    return ((data[pos + 6] << 25) | (data[pos + 7] << 17) | (data[pos + 8] << 9)
+            | (data[pos + 9] << 1) | (data[pos + 10] >> 7))
+
+def _psi_section(data: bytes, pos: int, payload: int) -> Optional[bytes]:
+    """PSI section starting in this packet (single-packet sections only)."""
+    start = payload + 1 + data[payload]
+    packet_end = pos + TS_PACKET_SIZE
+    if start + 3 > packet_end:
+        return None
+    section_end = start + 3 + (((data[start + 1] & 0x0F) << 8) | data[start + 2])
+    if section_end > packet_end:
+        return None
+    return data[start:section_end]
+
+def _parse_pat(section: bytes) -> Optional[int]:
+    """PMT PID of the first program."""
+    if section[0] != 0x00:
+        return None
+    for i in range(8, len(section) - 4, 4):
+        program = (section[i] << 8) | section[i + 1]
+        if program != 0:
+            return ((section[i + 2] & 0x1F) << 8) | section[i + 3]
+    return None
+
+def _parse_pmt(section: bytes) -> Optional[Dict[str, Any]]:
+    """PCR PID and elementary streams [(pid, stream_type)] of a PMT section."""
+    if section[0] != 0x02 or len(section) < 16:
+        return None
+    pcr_pid = ((section[8] & 0x1F) << 8) | section[9]
+    pos = 12 + (((section[10] & 0x0F) << 8) | section[11])
+    streams = []
+    while pos + 5 <= len(section) - 4:
+        stream_type = section[pos]
+        pid = ((section[pos + 1] & 0x1F) << 8) | section[pos + 2]
+        streams.append((pid, stream_type))
+        pos += 5 + (((section[pos + 3] & 0x0F) << 8) | section[pos + 4])
+    return {'pcr_pid': pcr_pid, 'streams': streams}
+
+def _pes_header(data: bytes, payload: int, packet_end: int):
+    """(pts or None, elementary stream offset) of a PES starting at payload."""
+    if payload + 9 > packet_end or data[payload:payload + 3] != b'\x00\x00\x01':
+        return None, -1
+    es_start = payload + 9 + data[payload + 8]
+    pts = None
+    if data[payload + 7] & 0x80 and payload + 14 <= packet_end:
+        p = payload + 9
+        pts = (((data[p] >> 1) & 0x07) << 30) | (data[p + 1] << 22) | ((data[p + 2] >> 1) << 15) \
+            | (data[p + 3] << 7) | (data[p + 4] >> 1)
+    return pts, min(es_start, packet_end)
+
+# ============================================================================
+# H.264 SPS
+# ============================================================================
+
+class _BitReader:
+    """MSB-first bit reader with Exp-Golomb codes (H.264 RBSP)."""
+
+    def __init__(self, data: bytes):
+        self.value = int.from_bytes(data, 'big')
+        self.remaining = len(data) * 8
+
+    def u(self, bits: int) -> int:
+        if bits > self.remaining:
+            raise ValueError('SPS truncated')
+        self.remaining -= bits
+        return (self.value >> self.remaining) & ((1 << bits) - 1)
+
+    def ue(self) -> int:
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+            if zeros > 31:
+                raise ValueError('Invalid Exp-Golomb code')
+        return (1 << zeros) - 1 + (self.u(zeros) if zeros else 0)
+
+    def se(self) -> int:
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+def _skip_scaling_list(reader: _BitReader, size: int):
+    last = next_scale = 8
+    for _ in range(size):
+        if next_scale:
+            next_scale = (last + reader.se() + 256) % 256
+        last = next_scale or last
+
+def parse_h264_sps(nal: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Decode the fields of an H.264 SPS NAL unit needed for the metadata.
+
+    Args:
+        nal: SPS NAL unit, header byte included, without start code
+
+    Returns:
+        dict: width, height, profile, level, fps (VUI timing, may be None),
+              or None if the SPS cannot be parsed
+    """
+    rbsp = nal[1:].replace(b'\x00\x00\x03', b'\x00\x00')
+    try:
+        r = _BitReader(rbsp)
+        profile_idc = r.u(8)
+        constraints = r.u(8)
+        level_idc = r.u(8)
+        r.ue()  # seq_parameter_set_id
+
+        chroma_format_idc = 1
+        separate_colour_plane = 0
+        if profile_idc in H264_HIGH_PROFILES:
+            chroma_format_idc = r.ue()
+            if chroma_format_idc == 3:
+                separate_colour_plane = r.u(1)
+            r.ue()  # bit_depth_luma_minus8
+            r.ue()  # bit_depth_chroma_minus8
+            r.u(1)  # qpprime_y_zero_transform_bypass_flag
+            if r.u(1):  # seq_scaling_matrix_present_flag
+                for i in range(8 if chroma_format_idc != 3 else 12):
+                    if r.u(1):
+                        _skip_scaling_list(r, 16 if i < 6 else 64)
+
+        r.ue()  # log2_max_frame_num_minus4
+        poc_type = r.ue()
+        if poc_type == 0:
+            r.ue()  # log2_max_pic_order_cnt_lsb_minus4
+        elif poc_type == 1:
+            r.u(1)
+            r.se()
+            r.se()
+            for _ in range(r.ue()):
+                r.se()
+        r.ue()  # max_num_ref_frames
+        r.u(1)  # gaps_in_frame_num_value_allowed_flag
+        width_mbs = r.ue() + 1
+        height_map_units = r.ue() + 1
+        frame_mbs_only = r.u(1)
+        if not frame_mbs_only:
+            r.u(1)  # mb_adaptive_frame_field_flag
+        r.u(1)  # direct_8x8_inference_flag
+
+        crop = (0, 0, 0, 0)
+        if r.u(1):  # frame_cropping_flag
+            crop = (r.ue(), r.ue(), r.ue(), r.ue())
+
+        fps = None
+        if r.u(1):  # vui_parameters_present_flag
+            if r.u(1):  # aspect_ratio_info_present_flag
+                if r.u(8) == 255:
+                    r.u(32)
+            if r.u(1):  # overscan_info_present_flag
+                r.u(1)
+            if r.u(1):  # video_signal_type_present_flag
+                r.u(4)
+                if r.u(1):
+                    r.u(24)
+            if r.u(1):  # chroma_loc_info_present_flag
+                r.ue()
+                r.ue()
+            if r.u(1):  # timing_info_present_flag
+                num_units_in_tick = r.u(32)
+                time_scale = r.u(32)
+                if num_units_in_tick:
+                    fps = round(time_scale / (2 * num_units_in_tick), 2)
+    except ValueError:
+        return None
+
+    chroma_array_type = 0 if separate_colour_plane else chroma_format_idc
+    crop_x = 1 if chroma_array_type in (0, 3) else 2
+    crop_y = (1 if chroma_array_type in (0, 2, 3) else 2) * (2 - frame_mbs_only)
+
+    profile = H264_PROFILES.get(profile_idc, str(profile_idc))
+    if profile_idc == 66 and constraints & 0x40:
+        profile = 'Constrained Baseline'
+
+    return {
+        'width': width_mbs * 16 - crop_x * (crop[0] + crop[1]),
+        'height': (2 - frame_mbs_only) * height_map_units * 16 - crop_y * (crop[2] + crop[3]),
+        'profile': profile,
+        'level': level_idc / 10,
+        'fps': fps
+    }
+
+def _find_sps(es: bytes) -> Optional[Dict[str, Any]]:
+    """Parse the first SPS NAL found in an Annex B byte stream chunk."""
+    pos = es.find(b'\x00\x00\x01')
+    while pos != -1 and pos + 3 < len(es):
+        start = pos + 3
+        nxt = es.find(b'\x00\x00\x01', start)
+        if es[start] & 0x1F == 7:
+            nal = es[start:nxt if nxt != -1 else len(es)]
+            return parse_h264_sps(nal.rstrip(b'\x00'))
+        pos = nxt
+    return None
+
+# ============================================================================
+# PROBE
+# ============================================================================
+
+def _scan_head(data: bytes) -> Optional[Dict[str, Any]]:
+    """PAT/PMT, SPS, first video PTS values and first PCR from the file head."""
+    pmt_pid = None
+    pmt = None
+    video_pid = None
+    sps = None
+    es = bytearray()
+    pts_values: List[int] = []
+    first_pcr = None
+
+    for pos, pid, unit_start, payload in _iter_packets(data):
+        if pmt and first_pcr is None and pid == pmt['pcr_pid']:
+            first_pcr = _packet_pcr(data, pos)
+
+        if payload < 0:
+            continue
+        packet_end = pos + TS_PACKET_SIZE
+
+        if pid == 0 and pmt_pid is None and unit_start:
+            section = _psi_section(data, pos, payload)
+            pmt_pid = _parse_pat(section) if section else None
+        elif pid == pmt_pid and pmt is None and unit_start:
+            section = _psi_section(data, pos, payload)
+            pmt = _parse_pmt(section) if section else None
+            if pmt:
+                video = [s for s in pmt['streams'] if s[1] in VIDEO_STREAM_TYPES]
+                if not video or VIDEO_STREAM_TYPES[video[0][1]] != 'h264':
+                    return {'pmt': pmt, 'supported': False}
+                video_pid = video[0][0]
+        elif pid == video_pid:
+            if unit_start:
+                if sps is None and es:
+                    sps = _find_sps(bytes(es))
+                es.clear()
+                pts, es_start = _pes_header(data, payload, packet_end)
+                if pts is not None and len(pts_values) < FPS_SAMPLE_FRAMES:
+                    pts_values.append(pts)
+                payload = es_start
+            if sps is None and 0 <= payload and len(es) < SPS_SEARCH_BYTES:
+                es += data[payload:packet_end]
+
+        if sps and len(pts_values) >= FPS_SAMPLE_FRAMES and first_pcr is not None:
+            break
+
+    if sps is None and es:
+        sps = _find_sps(bytes(es))
+    if pmt is None:
+        return None
+    return {
+        'pmt': pmt,
+        'supported': True,
+        'video_pid': video_pid,
+        'sps': sps,
+        'pts_values': pts_values,
+        'first_pcr': first_pcr
+    }
+
+def _scan_tail(data: bytes, video_pid: int, pcr_pid: int):
+    """Last video PTS and last PCR found in the file tail."""
+    last_pts = None
+    last_pcr = None
+    for pos, pid, unit_start, payload in _iter_packets(data):
+        if pid == pcr_pid:
+            pcr = _packet_pcr(data, pos)
+            if pcr is not None:
+                last_pcr = pcr
+        if pid == video_pid and unit_start and payload >= 0:
+            pts, _ = _pes_header(data, payload, pos + TS_PACKET_SIZE)
+            if pts is not None and (last_pts is None or (pts - last_pts) % PTS_WRAP < PTS_WRAP // 2):
+                last_pts = pts
+    return last_pts, last_pcr
+
+def _frame_interval(pts_values: List[int]) -> Optional[int]:
+    """Median PTS step between consecutive frames (display order)."""
+    ordered = sorted(set(pts_values))
+    steps = sorted(b - a for a, b in zip(ordered, ordered[1:]) if 0 < b - a < PTS_CLOCK)
+    return steps[len(steps) // 2] if steps else None
+
+def is_ts_file(filepath: str) -> bool:
+    """True if the native probe handles this file extension."""
+    return filepath.lower().endswith(TS_EXTENSIONS)
+
+def probe_ts_file(filepath: str, head_bytes: int = PROBE_HEAD_BYTES,
+                  tail_bytes: int = PROBE_TAIL_BYTES) -> Optional[Dict[str, Any]]:
+    """
+    Extract recording metadata from an MPEG-TS file without ffprobe.
+
+    Args:
+        filepath: Path to the .ts file
+        head_bytes: Bytes read from the start (PAT/PMT, SPS, first PTS)
+        tail_bytes: Bytes read from the end (last PTS/PCR)
+
+    Returns:
+        dict: duration, resolution, width, height, codec, bitrate, fps,
+              has_audio, profile, level - or None if unsupported/incomplete
+    """
+    try:
+        with open(filepath, 'rb') as handle:
+            size = os.fstat(handle.fileno()).st_size
+            head = handle.read(head_bytes)
+            if size > head_bytes + tail_bytes:
+                handle.seek(size - tail_bytes)
+                tail = handle.read(tail_bytes)
+            else:
+                tail = head + handle.read()
+    except OSError:
+        return None
+
+    info = _scan_head(head)
+    if not info or not info['supported'] or not info['sps']:
+        return None
+    pmt = info['pmt']
+    sps = info['sps']
+
+    interval = _frame_interval(info['pts_values'])
+    fps = round(PTS_CLOCK / interval, 2) if interval else sps['fps']
+
+    last_pts, last_pcr = _scan_tail(tail, info['video_pid'], pmt['pcr_pid'])
+    duration = None
+    if info['pts_values'] and last_pts is not None:
+        span = (last_pts - min(info['pts_values'])) % PTS_WRAP
+        duration = (span + (interval or 0)) / PTS_CLOCK
+    elif info['first_pcr'] is not None and last_pcr is not None:
+        duration = ((last_pcr - info['first_pcr']) % PTS_WRAP) / PTS_CLOCK
+    if not duration or duration <= 0:
+        return None
+
+    width = sps['width']
+    height = sps['height']
+    return {
+        'duration': round(duration, 3),
+        'resolution': f"{width}x{height}",
+        'width': width,
+        'height': height,
+        'codec': 'h264',
+        'bitrate': int(size * 8 / duration),
+        'fps': fps,
+        'has_audio': any(s[1] in AUDIO_STREAM_TYPES for s in pmt['streams']),
+        'profile': sps['profile'],
+        'level': sps['level']
+    }
+
+# ============================================================================
+# FIRST IDR ACCESS UNIT (thumbnails)
+# ============================================================================
+
+def _iter_nals(es: bytes):
+    """Yield (nal_type, start, end) of the NAL units of an Annex B chunk."""
+    pos = es.find(b'\x00\x00\x01')
+    while pos != -1 and pos + 3 < len(es):
+        start = pos + 3
+        nxt = es.find(b'\x00\x00\x01', start)
+        end = len(es) if nxt == -1 else nxt
+        yield es[start] & 0x1F, start, end
+        pos = nxt
+
+def _first_idr_access_unit(data: bytes, video_pid: int) -> Optional[bytes]:
+    """Annex B access unit of the first complete video PES holding an IDR."""
+    parameter_sets = {}
+    pes = None
+    for pos, pid, unit_start, payload in _iter_packets(data):
+        if pid != video_pid or payload < 0:
+            continue
+        packet_end = pos + TS_PACKET_SIZE
+        if unit_start:
+            if pes:
+                es = bytes(pes)
+                types = set()
+                for nal_type, start, end in _iter_nals(es):
+                    types.add(nal_type)
+                    if nal_type in (7, 8):
+                        parameter_sets[nal_type] = es[start:end].rstrip(b'\x00')
+                if 5 in types:
+                    # SPS/PPS sent out of band (earlier PES): prepend them
+                    missing = [parameter_sets[t] for t in (7, 8) if t not in types and t in parameter_sets]
+                    if 7 not in types and 7 not in parameter_sets:
+                        return None
+                    return b''.join(b'\x00\x00\x00\x01' + nal for nal in missing) + es
+            _, es_start = _pes_header(data, payload, packet_end)
+            pes = bytearray()
+            payload = es_start
+        if pes is not None and payload >= 0:
+            pes += data[payload:packet_end]
+    return None
+
+def extract_first_idr(filepath: str, max_bytes: int = IDR_SEARCH_MAX_BYTES) -> Optional[bytes]:
+    """
+    Extract the first IDR access unit of an H.264 MPEG-TS recording.
+
+    Args:
+        filepath: Path to the .ts file
+        max_bytes: Give up if no complete IDR is found in this many bytes
+
+    Returns:
+        bytes: Annex B access unit (SPS/PPS included) ready to feed a
+               decoder, or None if not found / not H.264
+    """
+    read_size = min(PROBE_HEAD_BYTES, max_bytes)
+    try:
+        with open(filepath, 'rb') as handle:
+            data = handle.read(read_size)
+            info = _scan_head(data)
+            if not info or not info['supported'] or info['video_pid'] is None:
+                return None
+            while True:
+                access_unit = _first_idr_access_unit(data, info['video_pid'])
+                if access_unit or len(data) < read_size or read_size >= max_bytes:
+                    return access_unit
+                # Large IDR (high bitrate): read further, once
+                read_size = max_bytes
+                data += handle.read(read_size - len(data))
+    except OSError:
+        return None
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 """
 Watchdog Service - RTSP service monitoring and WiFi failover
-Version: 2.30.7
+Version: 2.32.0
 
 Changelog:
+  - 2.32.0: Fork-free checks: camera via V4L2 ioctls, RTSP port via /proc/net/tcp,
+            main PID via /proc/<pid>/stat, service state over D-Bus (config_service)
+  - 2.31.0: RTSP stream health from a real RTSP session (frames, fps, bitrate,
+            first-frame latency) shared through rtsp_probe_service instead of ss/pgrep
+  - 2.30.8: RTSP health check reads the cached config snapshot (no file parse per check)
   - 2.30.6: Fix health check to detect CSI mode (python3 rpi_csi_rtsp_server.py)
 """
 
@@ -20,7 +25,9 @@ from .network_service import (
     get_network_interfaces, get_current_wifi, connect_wifi,
     get_wifi_failover_config, manage_network_failover
 )
-from .config_service import load_config
+from .config_service import get_config_snapshot
+from .system_health_service import detect_camera, is_port_listening, read_process_stat, is_process_running
+from .rtsp_probe_service import probe_rtsp_stream, get_stream_health, RTSP_PROBE_MAX_AGE
 from config import (
     SERVICE_NAME, WATCHDOG_STATE_FILE,
     WIFI_FAILOVER_CONFIG_FILE
@@ -59,10 +66,14 @@ def check_camera_available():
     """
     Check if a camera device is available.
     
+    Uses V4L2 ioctls (no fork), falling back to find_camera_device
+    (rpicam-hello / v4l2-ctl) when the video nodes cannot be queried.
+    
     Returns:
         dict: {available: bool, device: str, message: str}
     """
-    device = find_camera_device()
+    camera = detect_camera()
+    device = camera['device'] if camera is not None else find_camera_device()
     
     if device:
         return {
@@ -87,54 +98,35 @@ def check_rtsp_service_status():
     from .config_service import get_service_status
     return get_service_status(SERVICE_NAME)
 
-def check_rtsp_stream_health(rtsp_url=None, timeout=5):
+def check_rtsp_stream_health(rtsp_url=None, timeout=5, max_age=RTSP_PROBE_MAX_AGE):
     """
-    Check if the RTSP stream is actually working.
+    Check if the RTSP stream is actually delivering video.
     
-    Uses port check instead of ffprobe because ffprobe doesn't support
-    Digest authentication well, which is used by our RTSP server.
+    Opens an RTSP session (Digest auth supported) and reads RTP for a few
+    seconds, see rtsp_probe_service. The local stream result is shared
+    with the other workers, /api/system/health and the ONVIF server, and
+    reused while younger than max_age.
     
     Args:
         rtsp_url: RTSP URL to check (default: local stream with auth from config)
         timeout: Connection timeout in seconds
+        max_age: Reuse a local stream probe younger than this (seconds)
     
     Returns:
-        dict: {healthy: bool, message: str, latency: float}
+        dict: {healthy: bool, message: str, latency: float, fps, bitrate_kbps,
+               first_frame_ms, keyframe_interval, ...}
     """
-    start_time = time.time()
-    
-    # Get RTSP port from config
-    config = load_config()
-    rtsp_port = config.get('RTSP_PORT', '8554')
-    
-    # Method 1: Check if port is listening (most reliable)
-    port_check = run_command(
-        f'ss -tuln | grep -q ":{rtsp_port}" && echo "OK"',
-        timeout=3
-    )
-    
-    latency = time.time() - start_time
-    
-    if port_check['success'] and 'OK' in port_check.get('stdout', ''):
-        # Port is open, also verify RTSP process is running
-        # Check for test-launch (USB mode) or rpi_csi_rtsp_server.py (CSI mode)
-        process_check = run_command(
-            'pgrep -f "test-launch|rpi_csi_rtsp_server" >/dev/null && echo "OK"',
-            timeout=2
-        )
-        
-        if process_check['success'] and 'OK' in process_check.get('stdout', ''):
-            return {
-                'healthy': True,
-                'message': f'RTSP server listening on port {rtsp_port}',
-                'latency': round(latency, 3)
-            }
-    
-    return {
-        'healthy': False,
-        'message': f'RTSP port {rtsp_port} not responding',
-        'latency': round(latency, 3)
-    }
+    if rtsp_url:
+        return probe_rtsp_stream(rtsp_url, timeout=timeout)
+    # Nothing listening: no RTSP session to open (read from /proc/net/tcp)
+    rtsp_port = get_config_snapshot().get('RTSP_PORT', '8554')
+    if is_port_listening(rtsp_port) is False:
+        return {
+            'healthy': False,
+            'message': f'RTSP port {rtsp_port} not listening',
+            'latency': 0.0
+        }
+    return get_stream_health(max_age=max_age)
 
 def check_rtsp_service_health():
     """
@@ -151,6 +143,13 @@ def check_rtsp_service_health():
         'stream': {'healthy': False, 'message': 'Not checked'}
     }
     
+    # Main process state from /proc/<pid>/stat (zombie / stopped main PID)
+    main_pid = int(health['service'].get('pid') or 0)
+    if health['service']['active'] and main_pid > 0:
+        health['service']['process'] = read_process_stat(main_pid)
+        if not is_process_running(main_pid):
+            health['service']['active'] = False
+    
     # Check stream only if service is running
     if health['service']['active']:
         health['stream'] = check_rtsp_stream_health()
@@ -164,7 +163,7 @@ def check_rtsp_service_health():
         health['message'] = 'Service not running'
     elif not health['stream']['healthy']:
         health['overall'] = 'warning'
-        health['message'] = 'Stream not accessible'
+        health['message'] = f"Stream not accessible ({health['stream']['message']})"
     else:
         health['overall'] = 'healthy'
         health['message'] = 'All systems operational'
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 RTSP-Full Meeting Tunnel Agent
-Version: 1.4.2
+Version: 1.5.0
 
 Agent de tunnel inversé pour Meeting API.
 Maintient une connexion TCP persistante vers le serveur proxy Meeting
@@ -14,8 +14,19 @@ Protocol:
 - Types: N (New stream), D (Data), C (Close)
 
 v1.4.2: Auto-configure SSH keys on startup (install Meeting pubkey, generate device key if needed)
+
+v1.5.0: Vectored, buffered I/O and per-stream flow control
+- Proxy socket read through a preallocated buffer (recv_into), sent with
+  sendmsg() scatter/gather batches from a single writer thread
+- Local sockets served by one selector thread (no thread per stream),
+  forwarded in 64 KB D frames
+- Per-stream windows (STREAM_WINDOW bytes queued per direction): a bulk
+  download stops reading its local socket when its window is full, and the
+  writer round-robins one frame per stream, so an interactive SSH stream
+  is not stuck behind a 2 GB recording
 """
 
+import selectors
 import socket
 import ssl
 import struct
@@ -25,7 +36,8 @@ import logging
 import time
 import os
 import sys
-from typing import Dict, Optional, Tuple
+from collections import deque
+from typing import Dict, Optional, Tuple, List
 from dataclasses import dataclass, field
 
 # Configuration
@@ -36,14 +48,123 @@ RECONNECT_DELAY_MAX = 60
 HEARTBEAT_INTERVAL = 30  # seconds, keep connection alive
 SOCKET_TIMEOUT = 120  # seconds
 
+# I/O sizing
+READ_BUFFER_SIZE = 256 * 1024  # proxy socket receive buffer (recv_into)
+FORWARD_CHUNK = 64 * 1024  # local socket read forwarded as one D frame
+STREAM_WINDOW = 256 * 1024  # max bytes queued per stream and direction
+SEND_BATCH_MAX = 256 * 1024  # bytes gathered into one sendmsg() call
+SEND_IOV_MAX = 512  # buffers per sendmsg() call (kernel limit: IOV_MAX = 1024)
+# Unsent bytes allowed in the proxy socket: keeps the kernel queue short so
+# that a frame scheduled for an interactive stream is not behind megabytes
+TUNNEL_NOTSENT_LOWAT = 128 * 1024
+TCP_NOTSENT_LOWAT = getattr(socket, 'TCP_NOTSENT_LOWAT', 25)
+
 # Frame types
 FRAME_NEW = ord('N')
 FRAME_DATA = ord('D')
 FRAME_CLOSE = ord('C')
 
+# 1 byte type + 4 bytes streamId (BE) + 4 bytes payloadLength (BE)
+FRAME_HEADER = struct.Struct('>BII')
+
 logger = logging.getLogger("TunnelAgent")
 
 
+class FrameReader:
+    """
+    Buffered reader for the proxy socket.
+    
+    Frames are parsed in place from a preallocated buffer filled with
+    recv_into(); a frame is consumed only once complete, so a socket
+    timeout in the middle of a frame loses nothing.
+    """
+    
+    def __init__(self, sock: socket.socket, size: int = READ_BUFFER_SIZE):
+        self.sock = sock
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+    
+    def _fill(self, size: int) -> bool:
+        """Receive until `size` bytes are buffered (size <= buffer size). False on EOF."""
+        while self._end - self._start < size:
+            if self._start == self._end:
+                self._start = self._end = 0
+            elif len(self._buf) - self._start < size:
+                # Not enough room after the pending bytes: move them to the front
+                pending = self._end - self._start
+                self._view[:pending] = self._view[self._start:self._end]
+                self._start, self._end = 0, pending
+            received = self.sock.recv_into(self._view[self._end:])
+            if not received:
+                return False
+            self._end += received
+        return True
+    
+    def read_exact(self, size: int) -> Optional[bytes]:
+        """Read exactly `size` bytes, None if the connection closed first."""
+        if size <= len(self._buf):
+            if not self._fill(size):
+                return None
+            data = bytes(self._view[self._start:self._start + size])
+            self._start += size
+            return data
+        # Larger than the buffer: buffered bytes, then straight into the result
+        data = bytearray(size)
+        view = memoryview(data)
+        received = self._end - self._start
+        view[:received] = self._view[self._start:self._end]
+        self._start = self._end = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:])
+            if not count:
+                return None
+            received += count
+        return bytes(data)
+    
+    def read_line(self, limit: int = 4096) -> Optional[bytes]:
+        """Read one newline-terminated line (without the newline); what follows stays buffered."""
+        while True:
+            newline = self._buf.find(b'\n', self._start, self._end)
+            if newline >= 0:
+                line = bytes(self._view[self._start:newline])
+                self._start = newline + 1
+                return line
+            if self._end - self._start >= limit:
+                line = bytes(self._view[self._start:self._end])
+                self._start = self._end
+                return line
+            if not self._fill(self._end - self._start + 1):
+                return None
+    
+    def read_frame(self) -> Optional[Tuple[int, int, memoryview]]:
+        """
+        Read one frame.
+        
+        Returns:
+            (frame_type, stream_id, payload) or None if the connection closed.
+            The payload is a view into the buffer, valid until the next read.
+        """
+        if not self._fill(FRAME_HEADER.size):
+            return None
+        frame_type, stream_id, length = FRAME_HEADER.unpack_from(self._buf, self._start)
+        total = FRAME_HEADER.size + length
+        if total > len(self._buf):
+            self._start += FRAME_HEADER.size
+            payload = self.read_exact(length)
+            if payload is None:
+                return None
+            return frame_type, stream_id, memoryview(payload)
+        if not self._fill(total):
+            received = self._end - self._start
+            logger.warning(f"Connection closed mid-frame: received {received}/{total} bytes")
+            return None
+        payload = self._view[self._start + FRAME_HEADER.size:self._start + total]
+        self._start += total
+        return frame_type, stream_id, payload
+
+
 @dataclass
 class LocalStream:
     """Represents a local TCP connection for a stream."""
@@ -51,7 +172,12 @@ class LocalStream:
     local_socket: socket.socket
     local_port: int
     closed: bool = False
-    read_thread: Optional[threading.Thread] = None
+    remote_closed: bool = False  # C received: close once `inbound` is written
+    inbound: deque = field(default_factory=deque)  # proxy -> local, not yet written
+    inbound_bytes: int = 0
+    outbound: deque = field(default_factory=deque)  # (header, payload) frames -> proxy
+    outbound_bytes: int = 0
+    scheduled: bool = False  # in the writer's round-robin
 
 
 class TunnelAgent:
@@ -64,6 +190,10 @@ class TunnelAgent:
     - Multiplexed streams (N/D/C protocol)
     - Local connections to SSH (22), HTTP (5000), VNC (5900), etc.
     - Automatic reconnection with exponential backoff
+    
+    Threads per connection: the proxy reader (calling thread), one writer
+    (round-robin over the streams' frame queues, sendmsg batches) and one
+    selector loop for all local sockets.
     """
     
     def __init__(
@@ -83,14 +213,22 @@ class TunnelAgent:
         self.proxy_socket: Optional[socket.socket] = None
         self.streams: Dict[int, LocalStream] = {}
         self.streams_lock = threading.Lock()
+        # Stream queues/windows and the writer's round-robin share streams_lock
+        self._io_cond = threading.Condition(self.streams_lock)
+        self._ready: deque = deque()  # streams with outbound frames, round-robin order
+        self._control: deque = deque()  # frames for streams that no longer exist
+        self._closing: deque = deque()  # closed streams whose socket the I/O loop releases
         
         self.running = False
         self.connected = False
         self.reconnect_delay = RECONNECT_DELAY_MIN
         
-        self._reader_thread: Optional[threading.Thread] = None
+        self._reader: Optional[FrameReader] = None
+        self._writer_thread: Optional[threading.Thread] = None
+        self._io_thread: Optional[threading.Thread] = None
+        self._wake_r: Optional[socket.socket] = None
+        self._wake_w: Optional[socket.socket] = None
         self._writer_lock = threading.Lock()
-        self._pending_byte: Optional[bytes] = None  # For handling binary frames during handshake
         
         logger.info(f"TunnelAgent initialized for device {device_key[:8]}... -> {proxy_host}:{proxy_port}")
     
@@ -117,14 +255,12 @@ class TunnelAgent:
         """Stop the tunnel agent."""
         logger.info("Stopping tunnel agent...")
         self.running = False
-        self._close_all_streams()
+        self.connected = False
+        self._wake_io_threads()
         self._close_proxy_socket()
     
     def _connect_and_run(self):
         """Connect to proxy and handle messages until disconnection."""
-        # Reset state
-        self._pending_byte = None
-        
         # Create socket
         raw_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         raw_socket.settimeout(SOCKET_TIMEOUT)
@@ -142,20 +278,30 @@ class TunnelAgent:
             logger.info(f"Connecting to {self.proxy_host}:{self.proxy_port}...")
             self.proxy_socket.connect((self.proxy_host, self.proxy_port))
             logger.info("Connected to proxy server")
+            try:
+                self.proxy_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.proxy_socket.setsockopt(socket.IPPROTO_TCP, TCP_NOTSENT_LOWAT, TUNNEL_NOTSENT_LOWAT)
+            except OSError as e:
+                logger.debug(f"Proxy socket options not applied: {e}")
+            self._reader = FrameReader(self.proxy_socket)
             
             # Perform handshake
             self._handshake()
             
             self.connected = True
             self.reconnect_delay = RECONNECT_DELAY_MIN  # Reset on successful connection
+            self._start_io_threads()
             
             # Read frames until disconnection
             self._read_loop()
             
         finally:
             self.connected = False
-            self._close_all_streams()
+            self._wake_io_threads()
             self._close_proxy_socket()
+            self._stop_io_threads()
+            self._close_all_streams()
+            self._release_closed_streams()
     
     def _handshake(self):
         """
@@ -175,15 +321,10 @@ class TunnelAgent:
         self.proxy_socket.sendall(handshake_line.encode('utf-8'))
         logger.info("Handshake sent, waiting for response...")
         
-        # Read response (JSON line terminated by \n)
-        response_buffer = b''
-        while len(response_buffer) < 4096:
-            chunk = self.proxy_socket.recv(1)
-            if not chunk:
-                raise ConnectionError("Connection closed during handshake")
-            if chunk == b'\n':
-                break
-            response_buffer += chunk
+        # Read response (JSON line terminated by \n); frames sent right after it stay buffered
+        response_buffer = self._reader.read_line(4096)
+        if response_buffer is None:
+            raise ConnectionError("Connection closed during handshake")
         
         if response_buffer:
             try:
@@ -224,49 +365,19 @@ class TunnelAgent:
                 logger.debug(traceback.format_exc())
                 break
     
-    def _read_frame(self) -> Optional[Tuple[int, int, bytes]]:
+    def _read_frame(self) -> Optional[Tuple[int, int, memoryview]]:
         """
         Read a single frame from the proxy.
         Returns (frame_type, stream_id, payload) or None if connection closed.
+        The payload is only valid until the next read.
         """
-        # Read header: 1 byte type + 4 bytes streamId + 4 bytes length = 9 bytes
-        header = self._recv_exact(9)
-        if header is None:
-            return None
-        
-        frame_type = header[0]
-        stream_id = struct.unpack('>I', header[1:5])[0]
-        payload_length = struct.unpack('>I', header[5:9])[0]
-        
-        # Read payload
-        if payload_length > 0:
-            payload = self._recv_exact(payload_length)
-            if payload is None:
-                return None
-        else:
-            payload = b''
-        
-        return (frame_type, stream_id, payload)
+        return self._reader.read_frame()
     
     def _recv_exact(self, size: int) -> Optional[bytes]:
         """Read exactly `size` bytes from proxy socket."""
-        data = b''
-        
-        # Check for pending byte from handshake
-        if self._pending_byte:
-            data = self._pending_byte
-            self._pending_byte = None
-        
-        while len(data) < size:
-            chunk = self.proxy_socket.recv(size - len(data))
-            if not chunk:
-                if len(data) > 0:
-                    logger.warning(f"Connection closed mid-frame: received {len(data)}/{size} bytes, partial: {data[:20]!r}")
-                return None
-            data += chunk
-        return data
+        return self._reader.read_exact(size)
     
-    def _handle_frame(self, frame_type: int, stream_id: int, payload: bytes):
+    def _handle_frame(self, frame_type: int, stream_id: int, payload: memoryview):
         """Handle a received frame."""
         if frame_type == FRAME_NEW:
             self._handle_new_stream(stream_id, payload)
@@ -277,7 +388,7 @@ class TunnelAgent:
         else:
             logger.warning(f"Unknown frame type: {frame_type}")
     
-    def _handle_new_stream(self, stream_id: int, payload: bytes):
+    def _handle_new_stream(self, stream_id: int, payload: memoryview):
         """Handle N (New stream) frame - open local connection."""
         if len(payload) < 2:
             logger.error(f"Invalid N frame payload length: {len(payload)}")
@@ -292,7 +403,7 @@ class TunnelAgent:
             local_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             local_sock.settimeout(10)
             local_sock.connect(('127.0.0.1', local_port))
-            local_sock.settimeout(None)
+            local_sock.setblocking(False)  # served by the local I/O loop
             
             # Create stream entry
             stream = LocalStream(
@@ -303,15 +414,7 @@ class TunnelAgent:
             
             with self.streams_lock:
                 self.streams[stream_id] = stream
-            
-            # Start reader thread for local socket
-            thread = threading.Thread(
-                target=self._local_read_loop,
-                args=(stream_id,),
-                daemon=True
-            )
-            stream.read_thread = thread
-            thread.start()
+            self._wake_io_threads()
             
             logger.info(f"Stream {stream_id} connected to local port {local_port}")
             
@@ -319,65 +422,251 @@ class TunnelAgent:
             logger.error(f"Failed to connect stream {stream_id} to port {local_port}: {e}")
             self._send_close(stream_id)
     
-    def _handle_data(self, stream_id: int, payload: bytes):
-        """Handle D (Data) frame - forward data to local socket."""
-        with self.streams_lock:
-            stream = self.streams.get(stream_id)
-        
-        if stream is None or stream.closed:
-            logger.debug(f"Data for unknown/closed stream {stream_id}, ignoring")
-            return
+    def _handle_data(self, stream_id: int, payload: memoryview):
+        """
+        Handle D (Data) frame - forward data to local socket.
         
-        try:
-            stream.local_socket.sendall(payload)
-        except Exception as e:
-            logger.error(f"Error sending data to local socket for stream {stream_id}: {e}")
+        Written right away when the socket accepts it, otherwise queued for
+        the local I/O loop. Beyond STREAM_WINDOW queued bytes the proxy reader
+        waits for this stream to drain (the N/D/C protocol cannot pause a
+        single stream on the proxy side).
+        """
+        with self._io_cond:
+            stream = self.streams.get(stream_id)
+            if stream is None or stream.closed:
+                logger.debug(f"Data for unknown/closed stream {stream_id}, ignoring")
+                return
+            
+            sent = 0
+            if not stream.inbound:
+                try:
+                    sent = stream.local_socket.send(payload)
+                except BlockingIOError:
+                    sent = 0
+                except OSError as e:
+                    logger.error(f"Error sending data to local socket for stream {stream_id}: {e}")
+                    sent = None
+            if sent is not None and sent < len(payload):
+                stream.inbound.append(bytes(payload[sent:]))  # the frame buffer is reused
+                stream.inbound_bytes += len(payload) - sent
+        
+        if sent is None:
             self._close_stream(stream_id)
+            return
+        if stream.inbound:
+            self._wake_io_threads()
+            with self._io_cond:
+                while stream.inbound_bytes > STREAM_WINDOW and not stream.closed and self.connected:
+                    self._io_cond.wait(1.0)
     
     def _handle_close(self, stream_id: int):
-        """Handle C (Close) frame - close local connection."""
+        """Handle C (Close) frame - close local connection (once queued data is written)."""
         logger.info(f"Close received for stream {stream_id}")
+        with self._io_cond:
+            stream = self.streams.get(stream_id)
+            if stream is not None and stream.inbound:
+                stream.remote_closed = True
+                stream.outbound.clear()  # the proxy is done with this stream
+                stream.outbound_bytes = 0
+                return
         self._close_stream(stream_id, send_close=False)
     
-    def _local_read_loop(self, stream_id: int):
-        """Read data from local socket and forward to proxy."""
-        with self.streams_lock:
-            stream = self.streams.get(stream_id)
-        
-        if stream is None:
-            return
+    # ------------------------------------------------------------------
+    # Local sockets (single selector loop)
+    # ------------------------------------------------------------------
+    
+    def _local_io_loop(self):
+        """Read local sockets (while their window is open) and write queued proxy data."""
+        selector = selectors.DefaultSelector()
+        selector.register(self._wake_r, selectors.EVENT_READ, None)
+        registered: Dict[int, Tuple[LocalStream, int]] = {}
         
         try:
-            while self.running and self.connected and not stream.closed:
-                try:
-                    data = stream.local_socket.recv(4096)
-                    if not data:
-                        logger.info(f"Local socket closed for stream {stream_id}")
-                        break
-                    
-                    self._send_data(stream_id, data)
-                    
-                except socket.timeout:
-                    continue
-                except Exception as e:
-                    logger.error(f"Error reading from local socket for stream {stream_id}: {e}")
-                    break
+            while self.running and self.connected:
+                self._release_closed_streams(selector, registered)
+                with self._io_cond:
+                    streams = list(self.streams.values())
+                    wanted = {}
+                    for stream in streams:
+                        events = 0
+                        if stream.outbound_bytes < STREAM_WINDOW and not stream.remote_closed:
+                            events |= selectors.EVENT_READ
+                        if stream.inbound:
+                            events |= selectors.EVENT_WRITE
+                        wanted[stream.stream_id] = events
+                
+                for stream in streams:
+                    events = wanted[stream.stream_id]
+                    current = registered.get(stream.stream_id, (None, 0))[1]
+                    if events == current:
+                        continue
+                    if not events:
+                        selector.unregister(stream.local_socket)
+                        del registered[stream.stream_id]
+                    elif current:
+                        selector.modify(stream.local_socket, events, stream)
+                        registered[stream.stream_id] = (stream, events)
+                    else:
+                        selector.register(stream.local_socket, events, stream)
+                        registered[stream.stream_id] = (stream, events)
+                
+                for key, mask in selector.select(timeout=1.0):
+                    stream = key.data
+                    if stream is None:
+                        try:
+                            while self._wake_r.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        continue
+                    if stream.closed:
+                        continue
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush_inbound(stream)
+                    if mask & selectors.EVENT_READ and not stream.closed:
+                        self._local_read_loop(stream)
+        except Exception as e:
+            logger.error(f"Error in local I/O loop: {type(e).__name__}: {e}")
+            self.connected = False
         finally:
-            self._close_stream(stream_id)
+            selector.close()
     
-    def _send_frame(self, frame_type: int, stream_id: int, payload: bytes = b''):
-        """Send a frame to the proxy."""
-        header = bytes([frame_type])
-        header += struct.pack('>I', stream_id)
-        header += struct.pack('>I', len(payload))
-        
+    def _local_read_loop(self, stream: LocalStream):
+        """Forward what a local socket has to read (FORWARD_CHUNK per D frame) to the proxy."""
+        while stream.outbound_bytes < STREAM_WINDOW:
+            try:
+                data = stream.local_socket.recv(FORWARD_CHUNK)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logger.error(f"Error reading from local socket for stream {stream.stream_id}: {e}")
+                self._close_stream(stream.stream_id)
+                return
+            if not data:
+                logger.info(f"Local socket closed for stream {stream.stream_id}")
+                self._close_stream(stream.stream_id)
+                return
+            if stream.closed:  # closed by the proxy meanwhile
+                return
+            self._send_data(stream.stream_id, data)
+            if len(data) < FORWARD_CHUNK:
+                return  # drained, back to select
+    
+    def _flush_inbound(self, stream: LocalStream):
+        """Write queued proxy data to a local socket (non-blocking)."""
+        while stream.inbound:
+            buffer = stream.inbound[0]
+            try:
+                sent = stream.local_socket.send(buffer)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logger.error(f"Error sending data to local socket for stream {stream.stream_id}: {e}")
+                self._close_stream(stream.stream_id)
+                return
+            with self._io_cond:
+                if sent < len(buffer):
+                    stream.inbound[0] = memoryview(buffer)[sent:]
+                else:
+                    stream.inbound.popleft()
+                stream.inbound_bytes -= sent
+                self._io_cond.notify_all()
+            if sent < len(buffer):
+                return
+        if stream.remote_closed:
+            self._close_stream(stream.stream_id, send_close=False)
+    
+    # ------------------------------------------------------------------
+    # Proxy writer (round-robin, sendmsg batches)
+    # ------------------------------------------------------------------
+    
+    def _write_loop(self):
+        """Send queued frames: one frame per stream per round, batched into sendmsg() calls."""
+        while True:
+            buffers: List[bytes] = []
+            sent_streams: List[Tuple[LocalStream, int]] = []
+            with self._io_cond:
+                while self.connected and not self._control and not self._ready:
+                    self._io_cond.wait(1.0)
+                if not self.connected:
+                    return
+                while self._control and len(buffers) < SEND_IOV_MAX:
+                    buffers.extend(self._control.popleft())
+                batch = 0
+                while self._ready and batch < SEND_BATCH_MAX and len(buffers) < SEND_IOV_MAX:
+                    stream = self._ready.popleft()
+                    if not stream.outbound:
+                        stream.scheduled = False
+                        continue
+                    header, payload = stream.outbound.popleft()
+                    buffers.append(header)
+                    if payload:
+                        buffers.append(payload)
+                    batch += len(header) + len(payload)
+                    sent_streams.append((stream, len(payload)))
+                    if stream.outbound:
+                        self._ready.append(stream)
+                    else:
+                        stream.scheduled = False
+            
+            if buffers and not self._write_buffers(buffers):
+                return
+            
+            reopened = False
+            with self._io_cond:
+                for stream, size in sent_streams:
+                    full = stream.outbound_bytes >= STREAM_WINDOW
+                    stream.outbound_bytes = max(0, stream.outbound_bytes - size)
+                    reopened |= full and stream.outbound_bytes < STREAM_WINDOW
+            if reopened:
+                self._wake_io_threads()  # the I/O loop stopped reading these streams
+    
+    def _write_buffers(self, buffers: List[bytes]) -> bool:
+        """Write buffers to the proxy socket in as few syscalls as possible."""
         with self._writer_lock:
+            sock = self.proxy_socket
+            if sock is None:
+                return False
             try:
-                if self.proxy_socket:
-                    self.proxy_socket.sendall(header + payload)
+                if isinstance(sock, ssl.SSLSocket):
+                    sock.sendall(b''.join(buffers))  # no sendmsg() on TLS sockets
+                    return True
+                views = [memoryview(b) for b in buffers]
+                first = 0
+                while first < len(views):
+                    sent = sock.sendmsg(views[first:first + SEND_IOV_MAX])
+                    while first < len(views) and sent >= views[first].nbytes:
+                        sent -= views[first].nbytes
+                        first += 1
+                    if sent:
+                        views[first] = views[first][sent:]
+                return True
             except Exception as e:
                 logger.error(f"Error sending frame: {e}")
                 self.connected = False
+                self._wake_io_threads()
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)  # unblock the proxy reader
+                except OSError:
+                    pass
+                return False
+    
+    def _send_frame(self, frame_type: int, stream_id: int, payload: bytes = b''):
+        """Queue a frame for the proxy (after the stream's pending frames)."""
+        frame = (FRAME_HEADER.pack(frame_type, stream_id, len(payload)), payload)
+        with self._io_cond:
+            if not self.connected:
+                return
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                self._control.append(frame)
+            else:
+                stream.outbound.append(frame)
+                stream.outbound_bytes += len(payload)
+                if not stream.scheduled:
+                    stream.scheduled = True
+                    self._ready.append(stream)
+            self._io_cond.notify_all()
     
     def _send_data(self, stream_id: int, data: bytes):
         """Send D (Data) frame to proxy."""
@@ -387,26 +676,71 @@ class TunnelAgent:
         """Send C (Close) frame to proxy."""
         self._send_frame(FRAME_CLOSE, stream_id)
     
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    
+    def _start_io_threads(self):
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._writer_thread = threading.Thread(target=self._write_loop, daemon=True, name='tunnel-writer')
+        self._io_thread = threading.Thread(target=self._local_io_loop, daemon=True, name='tunnel-local-io')
+        self._writer_thread.start()
+        self._io_thread.start()
+    
+    def _wake_io_threads(self):
+        with self._io_cond:
+            self._io_cond.notify_all()
+        wake = self._wake_w
+        if wake is not None:
+            try:
+                wake.send(b'\0')
+            except OSError:
+                pass  # already woken (buffer full) or closing
+    
+    def _stop_io_threads(self):
+        for thread in (self._writer_thread, self._io_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout=5)
+        self._writer_thread = self._io_thread = None
+        for sock in (self._wake_r, self._wake_w):
+            if sock is not None:
+                sock.close()
+        self._wake_r = self._wake_w = None
+        with self._io_cond:
+            self._ready.clear()
+            self._control.clear()
+    
     def _close_stream(self, stream_id: int, send_close: bool = True):
-        """Close a stream and clean up."""
-        with self.streams_lock:
-            stream = self.streams.pop(stream_id, None)
-        
-        if stream is None:
-            return
-        
-        stream.closed = True
-        
-        try:
-            stream.local_socket.close()
-        except:
-            pass
-        
+        """Close a stream and clean up (the socket itself is closed by the local I/O loop)."""
         if send_close:
-            self._send_close(stream_id)
+            self._send_close(stream_id)  # after the data already queued for this stream
+        
+        with self._io_cond:
+            stream = self.streams.pop(stream_id, None)
+            if stream is None:
+                return
+            stream.closed = True
+            stream.inbound.clear()
+            stream.inbound_bytes = 0
+            self._closing.append(stream)
+            self._io_cond.notify_all()
+        self._wake_io_threads()
         
         logger.info(f"Stream {stream_id} closed")
     
+    def _release_closed_streams(self, selector=None, registered=None):
+        """Unregister and close the sockets of closed streams."""
+        while self._closing:
+            stream = self._closing.popleft()
+            if registered is not None and registered.pop(stream.stream_id, (None,))[0] is stream:
+                selector.unregister(stream.local_socket)
+            try:
+                stream.local_socket.close()
+            except:
+                pass
+    
     def _close_all_streams(self):
         """Close all active streams."""
         with self.streams_lock:
@@ -417,12 +751,17 @@ class TunnelAgent:
     
     def _close_proxy_socket(self):
         """Close the proxy socket."""
-        if self.proxy_socket:
+        with self._writer_lock:
+            sock, self.proxy_socket = self.proxy_socket, None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             try:
-                self.proxy_socket.close()
+                sock.close()
             except:
                 pass
-            self.proxy_socket = None
 
 
 def load_config() -> Optional[dict]: